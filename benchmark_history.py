@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""
+Benchmark History Store for Cube metric timings
+
+Appends every test_metrics.py run (serial or --load) to a local SQLite
+database keyed by run timestamp, git commit of model/ and test_id, and
+compares two runs to flag latency regressions and pre-aggregation misses.
+
+Usage:
+    python3 benchmark_history.py list
+    python3 benchmark_history.py compare                 # last two runs
+    python3 benchmark_history.py compare 12 15           # run 12 (base) vs run 15
+    python3 benchmark_history.py import high_risk_test_results.json
+
+The database path defaults to benchmark_history.sqlite next to this script
+(override with --db or BENCHMARK_HISTORY_DB). `compare` exits with status 1
+when it flags a regression, so it can gate a model change.
+"""
+
+import os
+import sys
+import json
+import math
+import sqlite3
+import argparse
+import subprocess
+from typing import Dict, Any, List, Optional, Tuple
+from datetime import datetime
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DB = os.environ.get('BENCHMARK_HISTORY_DB', os.path.join(REPO_DIR, 'benchmark_history.sqlite'))
+
+# Regression thresholds
+ALPHA = 0.05               # significance level for the Mann-Whitney U test
+MIN_SLOWDOWN = 1.2         # median must also be at least 20% slower...
+MIN_DELTA_SECONDS = 0.5    # ...and at least half a second slower
+SINGLE_SAMPLE_SLOWDOWN = 1.5  # serial runs (one sample per test) can't be tested, use a fixed ratio
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id        INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_at        TEXT NOT NULL,
+    model_commit  TEXT,
+    model_dirty   INTEGER NOT NULL DEFAULT 0,
+    mode          TEXT NOT NULL,
+    api_url       TEXT,
+    source        TEXT
+);
+
+CREATE TABLE IF NOT EXISTS samples (
+    run_id            INTEGER NOT NULL REFERENCES runs(run_id),
+    test_id           TEXT NOT NULL,
+    phase             TEXT NOT NULL,
+    status            TEXT NOT NULL,
+    latency           REAL,
+    first_response    REAL,
+    polls             INTEGER,
+    pre_aggregations  TEXT,
+    error             TEXT
+);
+
+CREATE INDEX IF NOT EXISTS idx_samples_run_test ON samples (run_id, test_id);
+CREATE INDEX IF NOT EXISTS idx_runs_commit ON runs (model_commit, run_at);
+"""
+
+
+def connect(db_path: str = DEFAULT_DB) -> sqlite3.Connection:
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def model_commit() -> Tuple[Optional[str], bool]:
+    """Last commit touching model/ and whether model/ has uncommitted changes"""
+    try:
+        commit = subprocess.run(
+            ['git', 'log', '-1', '--format=%H', '--', 'model/'],
+            cwd=REPO_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip() or None
+        dirty = subprocess.run(
+            ['git', 'status', '--porcelain', '--', 'model/'],
+            cwd=REPO_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip() != ''
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, False
+
+
+def record_run(results: List[Dict[str, Any]], mode: str, api_url: Optional[str] = None,
+               db_path: str = DEFAULT_DB, run_at: Optional[str] = None,
+               commit: Optional[str] = None, source: Optional[str] = None) -> int:
+    """
+    Append one run to the history store
+
+    results are MetricTester.results (serial) or LoadTester.samples (load);
+    serial results are stored with phase 'serial'. Returns the new run_id.
+    """
+    dirty = False
+    if commit is None:
+        commit, dirty = model_commit()
+
+    conn = connect(db_path)
+    with conn:
+        cursor = conn.execute(
+            "INSERT INTO runs (run_at, model_commit, model_dirty, mode, api_url, source) VALUES (?, ?, ?, ?, ?, ?)",
+            (run_at or datetime.now().isoformat(), commit, int(dirty), mode, api_url, source),
+        )
+        run_id = cursor.lastrowid
+        conn.executemany(
+            "INSERT INTO samples (run_id, test_id, phase, status, latency, first_response, polls, pre_aggregations, error) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [(
+                run_id,
+                r['test_id'],
+                r.get('phase', 'serial'),
+                r['status'],
+                r.get('latency', r.get('duration')),
+                r.get('first_response'),
+                r.get('polls'),
+                json.dumps(r['pre_aggregations']) if 'pre_aggregations' in r else None,
+                r.get('error'),
+            ) for r in results],
+        )
+    conn.close()
+    return run_id
+
+
+def import_results_file(filename: str, db_path: str = DEFAULT_DB, commit: Optional[str] = None) -> int:
+    """Import a JSON file written by MetricTester.save_results / LoadTester.save_results"""
+    with open(filename) as f:
+        payload = json.load(f)
+    mode = payload.get('mode', 'serial')
+    results = payload['samples'] if mode == 'load' else payload['results']
+    # An imported snapshot has no reliable model commit unless one is given
+    return record_run(results, mode, db_path=db_path, run_at=payload.get('timestamp'),
+                      commit=commit or '', source=os.path.basename(filename))
+
+
+def mann_whitney_p(a: List[float], b: List[float]) -> float:
+    """
+    One-sided p-value that b tends to be larger (slower) than a
+
+    Mann-Whitney U with the normal approximation and tie correction; good
+    enough for the sample sizes a load run produces and needs no SciPy.
+    """
+    n1, n2 = len(a), len(b)
+    combined = sorted([(v, 0) for v in a] + [(v, 1) for v in b])
+
+    # Average ranks over ties
+    ranks = [0.0] * len(combined)
+    tie_term = 0.0
+    i = 0
+    while i < len(combined):
+        j = i
+        while j + 1 < len(combined) and combined[j + 1][0] == combined[i][0]:
+            j += 1
+        for k in range(i, j + 1):
+            ranks[k] = (i + j) / 2.0 + 1
+        t = j - i + 1
+        tie_term += t ** 3 - t
+        i = j + 1
+
+    rank_sum_b = sum(r for r, (_, group) in zip(ranks, combined) if group == 1)
+    u_b = rank_sum_b - n2 * (n2 + 1) / 2.0
+    mean_u = n1 * n2 / 2.0
+    n = n1 + n2
+    var_u = n1 * n2 / 12.0 * ((n + 1) - tie_term / (n * (n - 1)))
+    if var_u <= 0:
+        return 1.0
+    z = (u_b - mean_u - 0.5) / math.sqrt(var_u)  # continuity correction
+    return 0.5 * math.erfc(z / math.sqrt(2))
+
+
+def median(values: List[float]) -> float:
+    ordered = sorted(values)
+    mid = len(ordered) // 2
+    return ordered[mid] if len(ordered) % 2 else (ordered[mid - 1] + ordered[mid]) / 2.0
+
+
+def _load_samples(conn: sqlite3.Connection, run_id: int) -> Dict[Tuple[str, str], List[sqlite3.Row]]:
+    groups: Dict[Tuple[str, str], List[sqlite3.Row]] = {}
+    for row in conn.execute("SELECT * FROM samples WHERE run_id = ?", (run_id,)):
+        groups.setdefault((row['test_id'], row['phase']), []).append(row)
+    return groups
+
+
+def _hit_rate(rows: List[sqlite3.Row]) -> Optional[float]:
+    """Share of passed samples served by a pre-aggregation (None if not recorded)"""
+    recorded = [r for r in rows if r['status'] == 'PASSED' and r['pre_aggregations'] is not None]
+    if not recorded:
+        return None
+    return sum(1 for r in recorded if json.loads(r['pre_aggregations'])) / len(recorded)
+
+
+def compare_runs(base_id: int, new_id: int, db_path: str = DEFAULT_DB) -> List[Dict[str, Any]]:
+    """Compare two runs per (test_id, phase) and return one finding per group"""
+    conn = connect(db_path)
+    base = _load_samples(conn, base_id)
+    new = _load_samples(conn, new_id)
+    conn.close()
+
+    findings = []
+    for key in sorted(set(base) | set(new)):
+        test_id, phase = key
+        finding: Dict[str, Any] = {'test_id': test_id, 'phase': phase, 'flags': []}
+        base_rows, new_rows = base.get(key, []), new.get(key, [])
+        if not base_rows or not new_rows:
+            finding['flags'].append('ONLY IN BASE' if base_rows else 'NEW TEST')
+            findings.append(finding)
+            continue
+
+        base_lat = [r['latency'] for r in base_rows if r['status'] == 'PASSED' and r['latency'] is not None]
+        new_lat = [r['latency'] for r in new_rows if r['status'] == 'PASSED' and r['latency'] is not None]
+        base_pass = len(base_lat) / len(base_rows)
+        new_pass = len(new_lat) / len(new_rows)
+        finding.update({'base_n': len(base_rows), 'new_n': len(new_rows),
+                        'base_pass': base_pass, 'new_pass': new_pass})
+
+        if new_pass < base_pass:
+            finding['flags'].append('MORE FAILURES')
+
+        if base_lat and new_lat:
+            base_med, new_med = median(base_lat), median(new_lat)
+            finding.update({'base_median': base_med, 'new_median': new_med})
+            slower = new_med >= base_med * MIN_SLOWDOWN and new_med - base_med >= MIN_DELTA_SECONDS
+            if len(base_lat) >= 3 and len(new_lat) >= 3:
+                p = mann_whitney_p(base_lat, new_lat)
+                finding['p_value'] = p
+                if slower and p < ALPHA:
+                    finding['flags'].append('LATENCY REGRESSION')
+            elif new_med >= base_med * SINGLE_SAMPLE_SLOWDOWN and new_med - base_med >= MIN_DELTA_SECONDS:
+                finding['flags'].append('LATENCY REGRESSION (untested, <3 samples)')
+
+        base_hits, new_hits = _hit_rate(base_rows), _hit_rate(new_rows)
+        finding.update({'base_preagg': base_hits, 'new_preagg': new_hits})
+        if base_hits is not None and new_hits is not None and new_hits < base_hits:
+            finding['flags'].append('PRE-AGG MISS')
+
+        findings.append(finding)
+    return findings
+
+
+def _fmt(value: Optional[float], suffix: str = 's') -> str:
+    return '-' if value is None else f"{value:.2f}{suffix}"
+
+
+def cmd_list(args):
+    conn = connect(args.db)
+    print(f"{'Run':>5}  {'Run at':<26} {'Mode':<7} {'Model commit':<14} {'Tests':>6} {'Samples':>8}")
+    print("-" * 72)
+    for row in conn.execute(
+        "SELECT r.*, COUNT(DISTINCT s.test_id) AS tests, COUNT(s.test_id) AS samples "
+        "FROM runs r LEFT JOIN samples s USING (run_id) GROUP BY r.run_id ORDER BY r.run_id DESC LIMIT ?",
+        (args.limit,),
+    ):
+        commit = (row['model_commit'] or '?')[:12] + ('*' if row['model_dirty'] else '')
+        print(f"{row['run_id']:>5}  {row['run_at']:<26} {row['mode']:<7} {commit:<14} {row['tests']:>6} {row['samples']:>8}")
+    conn.close()
+
+
+def cmd_compare(args):
+    conn = connect(args.db)
+    if args.base is None or args.new is None:
+        ids = [r['run_id'] for r in conn.execute("SELECT run_id FROM runs ORDER BY run_id DESC LIMIT 2")]
+        if len(ids) < 2:
+            print("Need at least two runs in the history store to compare")
+            sys.exit(2)
+        args.new, args.base = ids
+    runs = {r['run_id']: r for r in conn.execute(
+        "SELECT * FROM runs WHERE run_id IN (?, ?)", (args.base, args.new))}
+    conn.close()
+    for run_id in (args.base, args.new):
+        if run_id not in runs:
+            print(f"Run {run_id} not found")
+            sys.exit(2)
+
+    print(f"Base: run {args.base} ({runs[args.base]['run_at']}, model {(runs[args.base]['model_commit'] or '?')[:12]})")
+    print(f"New:  run {args.new} ({runs[args.new]['run_at']}, model {(runs[args.new]['model_commit'] or '?')[:12]})")
+    print()
+    print(f"{'Test':<14} {'Phase':<7} {'Base p50':>9} {'New p50':>9} {'p-value':>8} {'Pre-agg':>11}  Flags")
+    print("-" * 90)
+
+    findings = compare_runs(args.base, args.new, args.db)
+    flagged = 0
+    for f in findings:
+        preagg = f"{_fmt(f.get('base_preagg'), '')}->{_fmt(f.get('new_preagg'), '')}" \
+            if f.get('base_preagg') is not None or f.get('new_preagg') is not None else '-'
+        p_value = f"{f['p_value']:.3f}" if 'p_value' in f else '-'
+        flags = ', '.join(f['flags'])
+        blocking = [flag for flag in f['flags'] if flag not in ('NEW TEST', 'ONLY IN BASE')]
+        flagged += bool(blocking)
+        print(f"{f['test_id']:<14} {f['phase']:<7} {_fmt(f.get('base_median')):>9} {_fmt(f.get('new_median')):>9} "
+              f"{p_value:>8} {preagg:>11}  {flags}")
+
+    print()
+    print(f"{flagged} regression(s) flagged")
+    sys.exit(1 if flagged else 0)
+
+
+def cmd_import(args):
+    for filename in args.files:
+        run_id = import_results_file(filename, args.db, args.commit)
+        print(f"Imported {filename} as run {run_id}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark history store for Cube metric timings')
+    parser.add_argument('--db', default=DEFAULT_DB, help=f'SQLite history file (default: {DEFAULT_DB})')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p_list = sub.add_parser('list', help='List recorded runs')
+    p_list.add_argument('--limit', type=int, default=20)
+    p_list.set_defaults(func=cmd_list)
+
+    p_compare = sub.add_parser('compare', help='Flag regressions between two runs (default: last two)')
+    p_compare.add_argument('base', nargs='?', type=int, help='Baseline run_id')
+    p_compare.add_argument('new', nargs='?', type=int, help='Run_id to check')
+    p_compare.set_defaults(func=cmd_compare)
+
+    p_import = sub.add_parser('import', help='Import JSON results written by test_metrics.py')
+    p_import.add_argument('files', nargs='+')
+    p_import.add_argument('--commit', help='Model commit the results were measured against')
+    p_import.set_defaults(func=cmd_import)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
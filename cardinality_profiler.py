@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+Dimension cardinality profiler over the source Parquet
+
+Streams each cube's source table once through the local DuckDB engine
+(local_engine.py) and keeps HyperLogLog sketches (sketches.py) per month
+partition for:
+- every source column
+- every dimension used in a rollup, evaluated from its YAML SQL
+- every rollup's full grouping key (its dimensions plus the time dimension
+  truncated to the rollup granularity) = the rollup's rows per partition
+
+The report shows each rollup's estimated rows per partition next to the raw
+rows it aggregates, so a rollup change can be sized before it ships and
+triggers a full rebuild. The JSON output doubles as the --cardinality input
+of rollup_optimizer.py.
+
+Dimensions whose SQL references other cubes or columns the source doesn't
+have (e.g. fields joined in by the cube SQL) are listed as unprofiled, and
+rollups containing them are marked partial (a lower bound).
+
+Usage:
+    python cardinality_profiler.py                              # every cube with rollups
+    python cardinality_profiler.py --cube transaction_lines --output cardinality.json
+    python cardinality_profiler.py --source transaction_lines=gpc.transaction_lines_denormalized_mv
+"""
+
+import re
+import sys
+import json
+import time
+import argparse
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+
+import numpy as np
+
+from cube_model import DEFAULT_MODEL_DIR, Cube, CubeModel, load_model
+from local_engine import PARTITION_COLUMN, connect, parquet_dir
+from sketches import DEFAULT_PRECISION, HyperLogLog
+
+# Colors for output
+class Colors:
+    RED = '\033[0;31m'
+    GREEN = '\033[0;32m'
+    YELLOW = '\033[1;33m'
+    BLUE = '\033[0;34m'
+    BOLD = '\033[1m'
+    NC = '\033[0m'  # No Color
+
+
+BATCH_SIZE = 1_000_000
+EXPLOSION_RATIO = 0.25      # rollup rows above this share of raw rows barely aggregate anything
+SIMPLE_SELECT = re.compile(r"^\s*SELECT\s+\*\s+FROM\s+([\w.]+)\s*$", re.IGNORECASE)
+FROM_TABLE = re.compile(r"\bFROM\s+(gpc\.\w+)", re.IGNORECASE)
+TRUNC_GRANULARITIES = {'hour', 'day', 'week', 'month', 'quarter', 'year'}
+
+
+class Target:
+    """One sketched expression: a column, a dimension or a rollup key"""
+
+    def __init__(self, kind: str, name: str, expressions: List[str]):
+        self.kind = kind
+        self.name = name
+        self.expressions = expressions
+        self.sketches: Dict[str, HyperLogLog] = {}
+        self.partial: List[str] = []
+        self.granularity: Optional[str] = None
+
+
+def _valid(conn, source: str, expression: str) -> bool:
+    try:
+        conn.execute(f"SELECT {expression} FROM ({source}) src LIMIT 0")
+        return True
+    except Exception:
+        return False
+
+
+def resolve_source(conn, cube: Cube, override: Optional[str]) -> Optional[str]:
+    """SQL for the relation a cube reads, runnable on the local engine"""
+    if override:
+        return override if override.lstrip().upper().startswith('SELECT') else f"SELECT * FROM {override}"
+    if cube.sql_table:
+        sql = f"SELECT * FROM {cube.sql_table}"
+        return sql if _valid(conn, sql, '*') else None
+    sql = (cube.sql or '').strip()
+    if sql and _valid(conn, sql, '*'):
+        return sql
+    if SIMPLE_SELECT.match(sql):
+        return None
+    # Cube SQL uses BigQuery-only syntax: fall back to its main (last top-level) FROM table
+    tables = FROM_TABLE.findall(sql)
+    if tables and _valid(conn, f"SELECT * FROM {tables[-1]}", '*'):
+        return f"SELECT * FROM {tables[-1]}"
+    return None
+
+
+class CubeProfile:
+    def __init__(self, model: CubeModel, cube: Cube, source: str, precision: int):
+        self.model = model
+        self.cube = cube
+        self.source = source
+        self.precision = precision
+        self.targets: List[Target] = []
+        self.unprofiled: Dict[str, str] = {}
+        self.rows: Dict[str, int] = {}
+        self.partition_expression = None
+
+    def plan(self, conn):
+        columns = [row[0] for row in conn.execute(f"DESCRIBE SELECT * FROM ({self.source}) src").fetchall()]
+        for column in columns:
+            if column != PARTITION_COLUMN:
+                self.targets.append(Target('column', column, [f'src."{column}"']))
+
+        dimension_sql = {}
+        rollups = [p for p in self.cube.pre_aggregations if p.type == 'rollup']
+        for dimension in dict.fromkeys(d for p in rollups for d in p.dimensions):
+            sql = self.model.member_sql(dimension, 'src')
+            if not dimension.startswith(self.cube.name + '.') or sql is None:
+                self.unprofiled[dimension] = 'joined from another cube'
+            elif not _valid(conn, self.source, sql):
+                self.unprofiled[dimension] = 'SQL not evaluable on the source (joined field or BigQuery syntax)'
+            else:
+                dimension_sql[dimension] = sql
+                self.targets.append(Target('dimension', dimension, [sql]))
+
+        time_sql = {}
+        for rollup in rollups:
+            expressions = [dimension_sql[d] for d in rollup.dimensions if d in dimension_sql]
+            target = Target('rollup', rollup.name, expressions)
+            target.partial = [d for d in rollup.dimensions if d not in dimension_sql]
+            target.granularity = rollup.granularity
+            if rollup.time_dimension and rollup.granularity in TRUNC_GRANULARITIES:
+                if rollup.time_dimension not in time_sql:
+                    time_sql[rollup.time_dimension] = self.model.member_sql(rollup.time_dimension, 'src')
+                sql = time_sql[rollup.time_dimension]
+                if sql and _valid(conn, self.source, sql):
+                    expressions.append(f"date_trunc('{rollup.granularity}', CAST({sql} AS TIMESTAMP))")
+                    if self.partition_expression is None:
+                        self.partition_expression = f"strftime(CAST({sql} AS TIMESTAMP), '%Y-%m')"
+                else:
+                    target.partial.append(rollup.time_dimension)
+            if not expressions:
+                expressions.append("1")
+            self.targets.append(target)
+
+        if PARTITION_COLUMN in columns:
+            self.partition_expression = f'src."{PARTITION_COLUMN}"'
+        elif self.partition_expression is None:
+            self.partition_expression = "'all'"
+
+    def scan(self, conn, batch_size: int):
+        hashes = ', '.join(f"hash({', '.join(t.expressions)}) AS t{i}" for i, t in enumerate(self.targets))
+        query = f"SELECT {self.partition_expression} AS __partition, {hashes} FROM ({self.source}) src"
+        result = conn.execute(query)
+        reader = result.to_arrow_reader(batch_size) if hasattr(result, 'to_arrow_reader') \
+            else result.fetch_record_batch(batch_size)
+        for batch in reader:
+            partitions = batch.column(0).to_numpy(zero_copy_only=False).astype(str)
+            columns = [batch.column(i + 1).to_numpy(zero_copy_only=False) for i in range(len(self.targets))]
+            for partition in np.unique(partitions):
+                mask = partitions == partition
+                self.rows[partition] = self.rows.get(partition, 0) + int(mask.sum())
+                for target, values in zip(self.targets, columns):
+                    sketch = target.sketches.get(partition)
+                    if sketch is None:
+                        sketch = target.sketches[partition] = HyperLogLog(self.precision)
+                    sketch.add_hashes(values[mask])
+
+    def summary(self) -> Dict[str, Any]:
+        partitions = sorted(self.rows)
+        mean_rows = sum(self.rows.values()) / len(partitions) if partitions else 0
+
+        def per_partition(target: Target) -> Dict[str, int]:
+            return {p: len(target.sketches[p]) for p in partitions if p in target.sketches}
+
+        def total(target: Target) -> int:
+            merged = HyperLogLog(self.precision)
+            for sketch in target.sketches.values():
+                merged.merge(sketch)
+            return len(merged)
+
+        result = {
+            'source': self.source,
+            'partitions': dict(sorted(self.rows.items())),
+            'rows_per_partition': round(mean_rows),
+            'columns': {},
+            'dimensions': {},
+            'rollups': {},
+            'unprofiled_dimensions': self.unprofiled,
+        }
+        for target in self.targets:
+            counts = per_partition(target)
+            entry = {'max_per_partition': max(counts.values(), default=0), 'total': total(target),
+                     'partitions': counts}
+            if target.kind == 'column':
+                result['columns'][target.name] = entry
+            elif target.kind == 'dimension':
+                result['dimensions'][target.name] = entry
+            else:
+                mean = sum(counts.values()) / len(counts) if counts else 0
+                entry.update({
+                    'granularity': target.granularity,
+                    'mean_per_partition': round(mean),
+                    'reduction': round(mean / mean_rows, 4) if mean_rows else None,
+                    'partial': target.partial,
+                })
+                result['rollups'][target.name] = entry
+        return result
+
+
+def print_report(name: str, summary: Dict[str, Any]):
+    print(f"\n{Colors.BOLD}{name}{Colors.NC}  ({summary['source']})")
+    print(f"  Partitions: {len(summary['partitions'])}   Raw rows/partition: {summary['rows_per_partition']:,}")
+
+    if summary['dimensions']:
+        print(f"  {'Dimension':<40} {'max/partition':>14} {'total':>12}")
+        for dimension, entry in sorted(summary['dimensions'].items(), key=lambda kv: -kv[1]['max_per_partition']):
+            print(f"  {dimension.split('.', 1)[1]:<40} {entry['max_per_partition']:>14,} {entry['total']:>12,}")
+
+    if summary['rollups']:
+        print(f"\n  {'Rollup':<34} {'gran':>5} {'mean rows/part':>15} {'max rows/part':>14} {'% of raw':>9}")
+        for rollup, entry in sorted(summary['rollups'].items(), key=lambda kv: -kv[1]['mean_per_partition']):
+            share = 100.0 * (entry['reduction'] or 0)
+            color = Colors.RED if (entry['reduction'] or 0) > EXPLOSION_RATIO else Colors.GREEN
+            partial = f" {Colors.YELLOW}(partial: {', '.join(d.split('.', 1)[1] for d in entry['partial'])}){Colors.NC}" \
+                if entry['partial'] else ''
+            print(f"  {color}{rollup:<34}{Colors.NC} {entry['granularity'] or '-':>5} "
+                  f"{entry['mean_per_partition']:>15,} {entry['max_per_partition']:>14,} {share:>8.1f}%{partial}")
+
+    for dimension, reason in summary['unprofiled_dimensions'].items():
+        print(f"  {Colors.YELLOW}! unprofiled {dimension}: {reason}{Colors.NC}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Profile dimension and rollup cardinality over local Parquet')
+    parser.add_argument('--cube', action='append', help='Cube to profile (repeatable; default: every cube with rollups)')
+    parser.add_argument('--model', default=DEFAULT_MODEL_DIR, help='Model directory (default: ./model)')
+    parser.add_argument('--source', action='append', default=[],
+                        help='Override a cube source: cube=gpc.table or cube=SELECT ... (repeatable)')
+    parser.add_argument('--precision', type=int, default=DEFAULT_PRECISION,
+                        help=f'HLL precision, 2^p registers (default: {DEFAULT_PRECISION})')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Rows per streamed batch')
+    parser.add_argument('--output', default='cardinality.json', help='JSON report (default: cardinality.json)')
+    args = parser.parse_args()
+
+    model = load_model(args.model)
+    overrides = dict(s.split('=', 1) for s in args.source)
+    names = args.cube or [name for name, cube in model.cubes.items() if cube.pre_aggregations]
+
+    conn = connect()
+    print(f"{Colors.BOLD}{'='*80}{Colors.NC}")
+    print(f"{Colors.BOLD}CARDINALITY PROFILE{Colors.NC}  (Parquet: {parquet_dir()})")
+    print(f"{Colors.BOLD}{'='*80}{Colors.NC}")
+
+    report = {'generated_at': datetime.now().isoformat(), 'precision': args.precision, 'cubes': {}, 'dimensions': {}}
+    for name in names:
+        cube = model.cubes.get(name)
+        if cube is None:
+            print(f"{Colors.RED}Unknown cube: {name}{Colors.NC}")
+            continue
+        source = resolve_source(conn, cube, overrides.get(name))
+        if source is None:
+            print(f"{Colors.YELLOW}Skipping {name}: source table not available locally{Colors.NC}")
+            continue
+
+        start = time.time()
+        profile = CubeProfile(model, cube, source, args.precision)
+        profile.plan(conn)
+        profile.scan(conn, args.batch_size)
+        summary = profile.summary()
+        summary['seconds'] = round(time.time() - start, 2)
+        report['cubes'][name] = summary
+        for dimension, entry in summary['dimensions'].items():
+            report['dimensions'][dimension] = entry['max_per_partition']
+        print_report(name, summary)
+
+    conn.close()
+    if not report['cubes']:
+        sys.exit(1)
+
+    # Defaults read by rollup_optimizer.py when no cube-specific entry exists
+    first = next(iter(report['cubes'].values()))
+    report['rows_per_partition'] = first['rows_per_partition']
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport saved to: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -12,6 +12,14 @@
 -- 4. Click "Run" to execute
 -- 5. Verify views created successfully
 -- ============================================================================
+--
+-- SUPERSEDED (2026-10-17): both objects are now partitioned, clustered tables
+-- refreshed by materialize_clean_tables.py (same filters, row counts validated
+-- per month). Do not re-run the CREATE VIEW statements below - they would fail
+-- on the existing tables. The verification and test queries still apply.
+--   python3 materialize_clean_tables.py --engine bigquery --full --project magical-desktop
+--   python3 materialize_clean_tables.py --engine bigquery --since 2026-10-01 --project magical-desktop
+-- ============================================================================
 
 -- ============================================================================
 -- VIEW 1: transaction_lines_clean
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""
+Item-level cross-sell affinity as top-K sketches (gpc.cross_sell_affinity_topk)
+
+An exact item x item pair table over full history is too big to keep, so
+this job keeps bounded Space-Saving sketches (sketches.SpaceSaving) instead:
+- scope 'item':     for every item, its top --item-k co-purchased items
+- scope 'category': for every category, its top --category-k item pairs
+                    (a pair counts for the category of each of its items)
+
+Sketches are built per month from the basket pairs (same expansion as
+cross_sell_pairs.py, streamed in chunks) and stored as rows; period 'all' is
+the merge of every stored month, rebuilt after each run. Per row:
+    co_purchase_upper   counted co-purchases (upper bound)
+    co_purchase_lower   upper - overestimate (lower bound)
+    max_error           floor of the scope: any pair missing from the scope has
+                        at most this many co-purchases (<= scope weight / K)
+A row with co_purchase_lower > max_error is guaranteed to be a true top pair.
+
+Storage:
+- local engine: LOCAL_PARQUET_DIR/cross_sell_affinity_topk/partition_month=<period>/part-0.parquet
+- BigQuery: gpc.cross_sell_affinity_topk clustered on period/scope, one period replaced at a time
+
+Usage:
+    python3 cross_sell_affinity.py --full
+    python3 cross_sell_affinity.py --months 2025-10
+    python3 cross_sell_affinity.py --engine bigquery --since 2026-10-01
+    python3 cross_sell_affinity.py --top 214432                         # print the merged top partners of an item
+"""
+
+import sys
+import time
+import argparse
+from typing import List
+
+import numpy as np
+
+from cross_sell_pairs import (BASKETS_SQL, DEFAULT_BQ_PROJECT, DEFAULT_MAX_PAIRS, ITEMS_SQL, SOURCE_TABLE,
+                              BigQueryStore, LocalStore, month_range, pair_chunks)
+from sketches import SpaceSaving
+
+# Colors for output
+class Colors:
+    RED = '\033[0;31m'
+    GREEN = '\033[0;32m'
+    YELLOW = '\033[1;33m'
+    BLUE = '\033[0;34m'
+    BOLD = '\033[1m'
+    NC = '\033[0m'  # No Color
+
+
+TOPK_TABLE = 'cross_sell_affinity_topk'
+ALL_PERIOD = 'all'
+DEFAULT_ITEM_K = 50
+DEFAULT_CATEGORY_K = 1000
+# Category sketches key a pair as item_a * PAIR_BASE + item_b (NetSuite ids are < 2^31)
+PAIR_BASE = 1 << 31
+
+# Sketch rows -> output rows with item attributes; rank 1 = largest upper bound in the scope
+OUTPUT_SQL = """
+SELECT
+  '{period}' AS period,
+  s.scope,
+  CASE WHEN s.scope = 'item' THEN s.item_a END AS scope_item,
+  CASE WHEN s.scope = 'item' THEN a.category ELSE s.category END AS scope_category,
+  s.item_a,
+  s.item_b,
+  a.sku AS item_a_sku,
+  b.sku AS item_b_sku,
+  a.product_name AS item_a_name,
+  b.product_name AS item_b_name,
+  a.category AS item_a_category,
+  b.category AS item_b_category,
+  s.upper AS co_purchase_upper,
+  s.upper - s.error AS co_purchase_lower,
+  s.floor AS max_error,
+  CAST(ROW_NUMBER() OVER (PARTITION BY s.scope, s.item_a_scope, s.category
+                          ORDER BY s.upper DESC, s.item_a, s.item_b) AS BIGINT) AS rank
+FROM sketch_rows s
+LEFT JOIN items a ON a.item = s.item_a
+LEFT JOIN items b ON b.item = s.item_b
+ORDER BY s.scope, scope_category, scope_item, rank"""
+
+
+class AffinitySketches:
+    """Item-scope and category-scope Space-Saving sketches of one period"""
+
+    def __init__(self, item_k: int, category_k: int, categories: List[str]):
+        self.items = SpaceSaving(item_k)
+        self.categories = SpaceSaving(category_k)
+        self.category_names = list(categories)
+        self.category_codes = {name: i for i, name in enumerate(self.category_names)}
+
+    def add_pairs(self, a: np.ndarray, b: np.ndarray, cat_a: np.ndarray, cat_b: np.ndarray):
+        """One chunk of pairs (a < b) with the category codes of both items (-1 = none)"""
+        self.items.add(np.concatenate((a, b)), np.concatenate((b, a)))
+        keys = a * PAIR_BASE + b
+        other = (cat_b >= 0) & (cat_b != cat_a)
+        groups = np.concatenate((cat_a, cat_b[other]))
+        keys = np.concatenate((keys, keys[other]))
+        valid = groups >= 0
+        self.categories.add(groups[valid], keys[valid])
+
+    def merge(self, other: 'AffinitySketches') -> 'AffinitySketches':
+        """Merge another period's sketches (category codes re-mapped by name)"""
+        remap = np.array([self._code(name) for name in other.category_names] or [0], dtype=np.int64)
+        categories = SpaceSaving(other.categories.capacity, remap[other.categories.groups], other.categories.keys,
+                                 other.categories.counts, other.categories.errors,
+                                 {int(remap[g]): f for g, f in other.categories.floors.items()})
+        self.items.merge(other.items)
+        self.categories.merge(categories)
+        return self
+
+    def _code(self, name: str) -> int:
+        if name not in self.category_codes:
+            self.category_codes[name] = len(self.category_names)
+            self.category_names.append(name)
+        return self.category_codes[name]
+
+    def rows(self):
+        """Sketch counters as a pyarrow table (scope, item_a, item_b, category, upper, error, floor)"""
+        import pyarrow as pa
+
+        items, cats = self.items, self.categories
+        item_floor = SpaceSaving._floor_of(items.groups, items.floors)
+        cat_floor = SpaceSaving._floor_of(cats.groups, cats.floors)
+        names = np.array(self.category_names + [None], dtype=object)
+        n_items, n_cats = len(items), len(cats)
+        return pa.table({
+            'scope': pa.array(['item'] * n_items + ['category'] * n_cats, pa.string()),
+            'item_a': np.concatenate((items.groups, cats.keys // PAIR_BASE)),
+            'item_b': np.concatenate((items.keys, cats.keys % PAIR_BASE)),
+            # Item scope ranks per scope item, category scope per category
+            'item_a_scope': np.concatenate((items.groups, np.full(n_cats, -1, dtype=np.int64))),
+            'category': pa.array(np.concatenate((np.full(n_items, None, dtype=object), names[cats.groups])),
+                                 pa.string()),
+            'upper': np.concatenate((items.counts, cats.counts)),
+            'error': np.concatenate((items.errors, cats.errors)),
+            'floor': np.concatenate((item_floor, cat_floor)),
+        })
+
+    @classmethod
+    def from_rows(cls, table, item_k: int, category_k: int) -> 'AffinitySketches':
+        """Rebuild the sketches of a stored period (output rows of OUTPUT_SQL)"""
+        scope = np.array(table.column('scope').to_pylist(), dtype=object)
+        item_a = table.column('item_a').to_numpy(zero_copy_only=False).astype(np.int64)
+        item_b = table.column('item_b').to_numpy(zero_copy_only=False).astype(np.int64)
+        upper = table.column('co_purchase_upper').to_numpy(zero_copy_only=False).astype(np.int64)
+        lower = table.column('co_purchase_lower').to_numpy(zero_copy_only=False).astype(np.int64)
+        floor = table.column('max_error').to_numpy(zero_copy_only=False).astype(np.int64)
+        category = np.array(table.column('scope_category').to_pylist(), dtype=object)
+
+        is_item = scope == 'item'
+        names = sorted({c for c in category[~is_item] if c is not None})
+        sketches = cls(item_k, category_k, names)
+        codes = np.array([sketches.category_codes.get(c, -1) for c in category[~is_item]], dtype=np.int64)
+        sketches.items = SpaceSaving(item_k, item_a[is_item], item_b[is_item], upper[is_item],
+                                     upper[is_item] - lower[is_item],
+                                     {int(g): int(f) for g, f in zip(item_a[is_item], floor[is_item]) if f})
+        cat_keys = item_a[~is_item] * PAIR_BASE + item_b[~is_item]
+        sketches.categories = SpaceSaving(category_k, codes, cat_keys, upper[~is_item],
+                                          upper[~is_item] - lower[~is_item],
+                                          {int(g): int(f) for g, f in zip(codes, floor[~is_item]) if f})
+        return sketches
+
+
+def sketch_month(store, month: str, item_k: int, category_k: int, max_pairs: int):
+    """Stream one month's basket pairs into fresh sketches; returns (sketches, items attributes, pairs seen)"""
+    start, end = month_range(month)
+    baskets = store.fetch(BASKETS_SQL.format(source=SOURCE_TABLE, start=start, end=end))
+    items = store.fetch(ITEMS_SQL.format(source=SOURCE_TABLE, start=start, end=end))
+
+    item_ids = items.column('item').to_numpy(zero_copy_only=False).astype(np.int64)
+    item_cats = np.array(items.column('category').to_pylist(), dtype=object)
+    names = sorted({c for c in item_cats if c is not None})
+    sketches = AffinitySketches(item_k, category_k, names)
+    order = np.argsort(item_ids)
+    sorted_ids = item_ids[order]
+    sorted_codes = np.array([sketches.category_codes.get(c, -1) for c in item_cats[order]], dtype=np.int64)
+
+    def category_of(values: np.ndarray) -> np.ndarray:
+        index = np.clip(np.searchsorted(sorted_ids, values), 0, max(len(sorted_ids) - 1, 0))
+        return np.where(sorted_ids[index] == values, sorted_codes[index], -1) if len(sorted_ids) else -np.ones_like(values)
+
+    pairs = 0
+    basket_ids = baskets.column('transaction').to_numpy(zero_copy_only=False)
+    basket_items = baskets.column('item').to_numpy(zero_copy_only=False)
+    for _, a, b in pair_chunks(basket_ids, basket_items, np.zeros(len(basket_items), dtype=np.int64), max_pairs):
+        sketches.add_pairs(a, b, category_of(a), category_of(b))
+        pairs += len(a)
+    return sketches, items, pairs
+
+
+def output_table(conn, sketches: AffinitySketches, items, period: str):
+    conn.register('sketch_rows', sketches.rows())
+    conn.register('items', items)
+    table = conn.execute(OUTPUT_SQL.format(period=period)).to_arrow_table()
+    conn.unregister('sketch_rows')
+    conn.unregister('items')
+    return table
+
+
+def write_period(store, period: str, table):
+    if isinstance(store, BigQueryStore):
+        store.replace(TOPK_TABLE, table, "CLUSTER BY period, scope, scope_category", f"period = '{period}'")
+    else:
+        store.write(period, table, name=TOPK_TABLE)
+
+
+def print_top(table, item: int, n: int):
+    rows = [r for r in table.to_pylist() if r['scope'] == 'item' and r['scope_item'] == item]
+    rows.sort(key=lambda r: r['rank'])
+    if not rows:
+        print(f"{Colors.YELLOW}No sketch rows for item {item}{Colors.NC}")
+        return
+    print(f"\n{Colors.BOLD}Top {n} co-purchased with {item} ({rows[0]['item_a_name']}){Colors.NC}  "
+          f"max_error {rows[0]['max_error']:,}")
+    for r in rows[:n]:
+        guaranteed = '✓' if r['co_purchase_lower'] > r['max_error'] else ' '
+        print(f"  {r['rank']:>3}. {r['item_b']:<10} {str(r['item_b_name'])[:40]:<40} "
+              f"{r['co_purchase_lower']:>8,} .. {r['co_purchase_upper']:<8,} {guaranteed}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Top-K cross-sell affinity sketches per month, merged across months')
+    parser.add_argument('--engine', choices=['local', 'bigquery'], default='local',
+                        help='Source and destination of the sketches (default: local Parquet)')
+    parser.add_argument('--project', default=DEFAULT_BQ_PROJECT, help='BigQuery project for --engine bigquery')
+    scope = parser.add_mutually_exclusive_group()
+    scope.add_argument('--since', help='Rebuild months of transactions modified on/after this date (YYYY-MM-DD)')
+    scope.add_argument('--months', help='Rebuild these months (YYYY-MM,YYYY-MM)')
+    scope.add_argument('--full', action='store_true', help='Rebuild every month')
+    parser.add_argument('--item-k', type=int, default=DEFAULT_ITEM_K,
+                        help=f'Counters per item (default: {DEFAULT_ITEM_K})')
+    parser.add_argument('--category-k', type=int, default=DEFAULT_CATEGORY_K,
+                        help=f'Counters per category (default: {DEFAULT_CATEGORY_K})')
+    parser.add_argument('--max-pairs', type=int, default=DEFAULT_MAX_PAIRS,
+                        help=f'Pairs expanded per chunk (default: {DEFAULT_MAX_PAIRS:,})')
+    parser.add_argument('--top', type=int, metavar='ITEM', help='Print the all-time top partners of an item')
+    parser.add_argument('-n', type=int, default=10, help='Rows for --top (default: 10)')
+    args = parser.parse_args()
+    if not (args.since or args.months or args.full or args.top):
+        parser.error('one of --since, --months, --full or --top is required')
+
+    print(f"{Colors.BOLD}{'='*80}{Colors.NC}")
+    print(f"{Colors.BOLD}CROSS-SELL AFFINITY gpc.{TOPK_TABLE}{Colors.NC}  (engine: {args.engine})")
+    print(f"{Colors.BOLD}{'='*80}{Colors.NC}")
+
+    start = time.time()
+    try:
+        store = BigQueryStore(args.project) if args.engine == 'bigquery' else LocalStore()
+        if args.since or args.months or args.full:
+            months = [m.strip() for m in args.months.split(',')] if args.months else store.months(args.since)
+            for month in months:
+                month_start = time.time()
+                sketches, items, pairs = sketch_month(store, month, args.item_k, args.category_k, args.max_pairs)
+                write_period(store, month, output_table(store.conn, sketches, items, month))
+                print(f"  {month}: {pairs:,} pairs -> {len(sketches.items):,} item / "
+                      f"{len(sketches.categories):,} category counters ({time.time() - month_start:.1f}s)")
+
+            # Period 'all': merge of every stored month
+            stored = store.read(TOPK_TABLE)
+            if stored is None:
+                print(f"{Colors.YELLOW}  {ALL_PERIOD}: no month has baskets yet, nothing to merge{Colors.NC}")
+            else:
+                merged = AffinitySketches(args.item_k, args.category_k, [])
+                periods = sorted({p for p in stored.column('period').to_pylist() if p != ALL_PERIOD})
+                for period in periods:
+                    rows = stored.filter(np.array(stored.column('period').to_pylist(), dtype=object) == period)
+                    merged.merge(AffinitySketches.from_rows(rows, args.item_k, args.category_k))
+                items = store.fetch(ITEMS_SQL.format(source=SOURCE_TABLE, start='1900-01-01', end='2999-12-31'))
+                write_period(store, ALL_PERIOD, output_table(store.conn, merged, items, ALL_PERIOD))
+                worst = max(list(merged.items.floors.values()) + [0])
+                print(f"  {ALL_PERIOD}: {len(periods)} months merged -> {len(merged.items):,} item / "
+                      f"{len(merged.categories):,} category counters, worst item max_error {worst:,}")
+
+        if args.top:
+            stored = store.read(TOPK_TABLE)
+            if stored is None:
+                raise RuntimeError(f"gpc.{TOPK_TABLE} not built yet")
+            print_top(stored.filter(np.array(stored.column('period').to_pylist(), dtype=object) == ALL_PERIOD),
+                      args.top, args.n)
+    except Exception as e:
+        print(f"{Colors.RED}✗ Affinity sketches failed: {e}{Colors.NC}")
+        sys.exit(1)
+    print(f"\n{Colors.GREEN}✓ Done in {time.time() - start:.1f}s{Colors.NC}")
+
+
+if __name__ == '__main__':
+    main()
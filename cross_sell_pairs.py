@@ -0,0 +1,395 @@
+#!/usr/bin/env python3
+"""
+Incremental pair counts behind the cross_sell cube (gpc.cross_sell_pairs_monthly)
+
+The cross_sell_deduplicated view (docs/bigquery-views) self-joins
+transaction_lines_denormalized_mv on transaction, which is quadratic in basket
+size, and runs over all history on every cross_sell query or rollup build.
+This job counts pairs one month at a time:
+1. distinct (transaction, item) sales lines of the month, sorted into baskets
+2. every basket expanded to its item pairs (a < b) with NumPy and accumulated
+   into a sparse co-occurrence count keyed by (transaction type, a, b), in
+   chunks of at most --max-pairs pairs, so a few huge B2B baskets can't blow
+   up memory
+3. item attributes joined and the view's LEAST/GREATEST canonicalization of
+   category/section applied (CANONICAL_SQL), one row per pair, type and month
+
+co_purchase_count is the number of distinct transactions holding the pair - the
+view's COUNT(DISTINCT transaction), summed over the month's days. Item
+attributes (sku, name, category, section) are taken once per item and month.
+
+Storage:
+- local engine: LOCAL_PARQUET_DIR/cross_sell_pairs_monthly/partition_month=YYYY-MM/part-0.parquet
+- BigQuery: gpc.cross_sell_pairs_monthly, month-partitioned on trandate; a month
+  is replaced with DELETE + INSERT from a staging load, in one transaction
+
+Scopes:
+    --since 2026-10-01        months of the transactions whose header lastmodifieddate is on/after the date
+    --months 2025-09,2025-10  those months
+    --full                    every month of the source
+
+Usage:
+    python3 cross_sell_pairs.py --full                                  # local Parquet
+    python3 cross_sell_pairs.py --engine bigquery --since 2026-10-01
+"""
+
+import os
+import sys
+import time
+import argparse
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# Colors for output
+class Colors:
+    RED = '\033[0;31m'
+    GREEN = '\033[0;32m'
+    YELLOW = '\033[1;33m'
+    BLUE = '\033[0;34m'
+    BOLD = '\033[1m'
+    NC = '\033[0m'  # No Color
+
+
+PAIRS_TABLE = 'cross_sell_pairs_monthly'
+SOURCE_TABLE = 'gpc.transaction_lines_denormalized_mv'
+DEFAULT_BQ_PROJECT = os.environ.get('CUBEJS_DB_BQ_PROJECT_ID', 'gym-plus-coffee')
+DEFAULT_MAX_PAIRS = 20_000_000
+
+# Sales lines of one month (NetSuite: negative quantity = sales), one row per item and transaction
+BASKETS_SQL = """
+SELECT transaction, item, ANY_VALUE(transaction_type) AS transaction_type
+FROM {source}
+WHERE quantity < 0 AND item IS NOT NULL
+  AND transaction_date BETWEEN DATE '{start}' AND DATE '{end}'
+GROUP BY transaction, item
+ORDER BY transaction, item"""
+
+ITEMS_SQL = """
+SELECT item, ANY_VALUE(sku) AS sku, ANY_VALUE(product_name) AS product_name,
+       ANY_VALUE(category) AS category, ANY_VALUE(section) AS section
+FROM {source}
+WHERE quantity < 0 AND item IS NOT NULL
+  AND transaction_date BETWEEN DATE '{start}' AND DATE '{end}'
+GROUP BY item"""
+
+# Same canonicalization as docs/bigquery-views/cross_sell_deduplicated.sql (item_a < item_b already)
+CANONICAL_SQL = """
+SELECT
+  p.item_a,
+  p.item_b,
+  a.sku AS item_a_sku,
+  b.sku AS item_b_sku,
+  a.product_name AS item_a_name,
+  b.product_name AS item_b_name,
+  CASE
+    WHEN a.category IS NULL AND b.category IS NOT NULL THEN b.category
+    WHEN b.category IS NULL AND a.category IS NOT NULL THEN a.category
+    WHEN a.category IS NULL AND b.category IS NULL THEN NULL
+    ELSE LEAST(a.category, b.category)
+  END AS item_a_category,
+  CASE
+    WHEN a.category IS NULL AND b.category IS NOT NULL THEN a.category
+    WHEN b.category IS NULL AND a.category IS NOT NULL THEN b.category
+    WHEN a.category IS NULL AND b.category IS NULL THEN NULL
+    ELSE GREATEST(a.category, b.category)
+  END AS item_b_category,
+  CASE
+    WHEN a.section IS NULL AND b.section IS NOT NULL THEN b.section
+    WHEN b.section IS NULL AND a.section IS NOT NULL THEN a.section
+    WHEN a.section IS NULL AND b.section IS NULL THEN NULL
+    WHEN (a.category IS NULL OR b.category IS NULL OR a.category < b.category)
+         AND (a.section < b.section OR b.section IS NULL) THEN a.section
+    WHEN (a.category IS NULL OR b.category IS NULL OR a.category < b.category)
+         AND (a.section >= b.section OR a.section IS NULL) THEN b.section
+    WHEN (a.category > b.category)
+         AND (b.section < a.section OR a.section IS NULL) THEN b.section
+    WHEN (a.category > b.category)
+         AND (b.section >= a.section OR b.section IS NULL) THEN a.section
+    ELSE LEAST(a.section, b.section)
+  END AS item_a_section,
+  CASE
+    WHEN a.section IS NULL AND b.section IS NOT NULL THEN a.section
+    WHEN b.section IS NULL AND a.section IS NOT NULL THEN b.section
+    WHEN a.section IS NULL AND b.section IS NULL THEN NULL
+    WHEN (a.category IS NULL OR b.category IS NULL OR a.category < b.category)
+         AND (a.section < b.section OR b.section IS NULL) THEN b.section
+    WHEN (a.category IS NULL OR b.category IS NULL OR a.category < b.category)
+         AND (a.section >= b.section OR a.section IS NULL) THEN a.section
+    WHEN (a.category > b.category)
+         AND (b.section < a.section OR a.section IS NULL) THEN a.section
+    WHEN (a.category > b.category)
+         AND (b.section >= a.section OR b.section IS NULL) THEN b.section
+    ELSE GREATEST(a.section, b.section)
+  END AS item_b_section,
+  p.transaction_type,
+  CAST(DATE '{start}' AS TIMESTAMP) AS trandate,
+  CAST(p.co_purchase_count AS BIGINT) AS co_purchase_count
+FROM pair_counts p
+LEFT JOIN items a ON a.item = p.item_a
+LEFT JOIN items b ON b.item = p.item_b
+ORDER BY item_a_category, item_b_category, p.item_a, p.item_b"""
+
+
+def month_range(month: str) -> tuple:
+    start = np.datetime64(month, 'M').astype('datetime64[D]')
+    end = (np.datetime64(month, 'M') + 1).astype('datetime64[D]') - 1
+    return str(start), str(end)
+
+
+def months_sql(since: Optional[str] = None) -> str:
+    """Months (YYYY-MM) of the source lines, or of the transactions modified on/after since"""
+    if since:
+        return ("SELECT DISTINCT FORMAT_DATE('%Y-%m', trandate) AS month FROM gpc.transactions\n"
+                f"WHERE trandate IS NOT NULL AND lastmodifieddate >= DATE '{since}'")
+    return (f"SELECT DISTINCT FORMAT_DATE('%Y-%m', transaction_date) AS month FROM {SOURCE_TABLE}\n"
+            "WHERE transaction_date IS NOT NULL")
+
+
+def basket_pairs(items: np.ndarray, starts: np.ndarray, sizes: np.ndarray) -> tuple:
+    """All (a, b) index pairs a < b within each basket; items sorted within baskets"""
+    # Element at rank r of a basket of size k pairs with the k - r - 1 elements after it
+    rank = np.arange(len(items)) - np.repeat(starts, sizes)
+    fanout = np.repeat(sizes, sizes) - rank - 1
+    left = np.repeat(np.arange(len(items)), fanout)
+    offsets = np.cumsum(fanout) - fanout
+    right = left + 1 + (np.arange(len(left)) - np.repeat(offsets, fanout))
+    return items[left], items[right], left
+
+
+def pair_chunks(basket_ids: np.ndarray, items: np.ndarray, groups: np.ndarray, max_pairs: int):
+    """
+    Yield (groups, item_a, item_b) arrays for all pairs of every basket, in chunks of whole
+    baskets expanding to at most max_pairs pairs (a bigger basket is its own chunk)
+    """
+    if len(items) == 0:
+        return
+    items = np.asarray(items, dtype=np.int64)
+    groups = np.asarray(groups, dtype=np.int64)
+    boundaries = np.flatnonzero(np.diff(basket_ids)) + 1
+    starts = np.concatenate(([0], boundaries))
+    sizes = np.diff(np.concatenate((starts, [len(items)])))
+    cumulative = np.cumsum(sizes * (sizes - 1) // 2)
+
+    chunk_start = 0
+    while chunk_start < len(starts):
+        done = cumulative[chunk_start - 1] if chunk_start else 0
+        chunk_end = max(int(np.searchsorted(cumulative, done + max_pairs, side='right')), chunk_start + 1)
+        lo, hi = starts[chunk_start], starts[chunk_end] if chunk_end < len(starts) else len(items)
+        a, b, left = basket_pairs(items[lo:hi], starts[chunk_start:chunk_end] - lo, sizes[chunk_start:chunk_end])
+        yield groups[lo:hi][left], a, b
+        chunk_start = chunk_end
+
+
+class PairCounter:
+    """Sparse co-occurrence counts keyed by (group, item_a, item_b), item_a < item_b"""
+
+    def __init__(self, max_pairs: int = DEFAULT_MAX_PAIRS):
+        self.max_pairs = max_pairs
+        self.keys = np.empty(0, dtype=np.int64)
+        self.counts = np.empty(0, dtype=np.int64)
+        self.base = None
+
+    def add_baskets(self, basket_ids: np.ndarray, items: np.ndarray, groups: np.ndarray):
+        """
+        basket_ids/items/groups: one row per distinct item of a basket, sorted by
+        basket then item; groups is the basket's group code (repeated per row)
+        """
+        if len(items) == 0:
+            return
+        base = max(self.base or 0, int(items.max()) + 1)
+        if self.base and base != self.base and len(self.keys):
+            # Keys are encoded with the base: re-encode the stored ones (ordering is preserved)
+            pairs = self.pairs()
+            self.keys = (pairs['group'] * base + pairs['item_a']) * base + pairs['item_b']
+        self.base = base
+        for chunk_groups, a, b in pair_chunks(basket_ids, items, groups, self.max_pairs):
+            self._accumulate(chunk_groups, a, b)
+
+    def _accumulate(self, groups: np.ndarray, a: np.ndarray, b: np.ndarray):
+        if len(a) == 0:
+            return
+        keys = (groups * self.base + a) * self.base + b
+        keys, counts = np.unique(keys, return_counts=True)
+        if len(self.keys):
+            keys = np.concatenate((self.keys, keys))
+            counts = np.concatenate((self.counts, counts))
+            keys, inverse = np.unique(keys, return_inverse=True)
+            counts = np.bincount(inverse, weights=counts).astype(np.int64)
+        self.keys, self.counts = keys, counts
+
+    def pairs(self) -> Dict[str, np.ndarray]:
+        base = self.base or 1
+        return {
+            'group': self.keys // (base * base),
+            'item_a': (self.keys // base) % base,
+            'item_b': self.keys % base,
+            'co_purchase_count': self.counts,
+        }
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+
+def count_month(conn, fetch, month: str, max_pairs: int):
+    """Pair-count one month; fetch(sql) returns a pyarrow table. Returns the canonical pyarrow table"""
+    import pyarrow as pa
+
+    start, end = month_range(month)
+    baskets = fetch(BASKETS_SQL.format(source=SOURCE_TABLE, start=start, end=end))
+    types = baskets.column('transaction_type').to_pylist()
+    type_names = sorted({t for t in types if t is not None})
+    codes = {name: i + 1 for i, name in enumerate(type_names)}
+
+    counter = PairCounter(max_pairs)
+    counter.add_baskets(baskets.column('transaction').to_numpy(zero_copy_only=False),
+                        baskets.column('item').to_numpy(zero_copy_only=False),
+                        np.array([codes.get(t, 0) for t in types], dtype=np.int64))
+    pairs = counter.pairs()
+    names = np.array([None] + type_names, dtype=object)
+    pair_counts = pa.table({
+        'item_a': pairs['item_a'], 'item_b': pairs['item_b'],
+        'transaction_type': pa.array(names[pairs['group']], pa.string()),
+        'co_purchase_count': pairs['co_purchase_count'],
+    })
+    items = fetch(ITEMS_SQL.format(source=SOURCE_TABLE, start=start, end=end))
+    conn.register('pair_counts', pair_counts)
+    conn.register('items', items)
+    result = conn.execute(CANONICAL_SQL.format(start=start)).to_arrow_table()
+    conn.unregister('pair_counts')
+    conn.unregister('items')
+    return result, baskets.num_rows
+
+
+class LocalStore:
+    """Reads the local gpc.* views, writes partition_month=YYYY-MM Parquet files"""
+
+    def __init__(self):
+        import duckdb
+        from local_engine import PARTITION_COLUMN, build_init_sql, parquet_dir
+
+        self.root = parquet_dir()
+        self.partition_column = PARTITION_COLUMN
+        # In-memory database: the persistent file may be locked by a running Cube server
+        self.conn = duckdb.connect()
+        self.conn.execute(build_init_sql(self.root))
+
+    def fetch(self, sql: str):
+        return self.conn.execute(sql).to_arrow_table()
+
+    def months(self, since: Optional[str]) -> List[str]:
+        return sorted(row[0] for row in self.conn.execute(months_sql(since)).fetchall())
+
+    def read(self, name: str):
+        """Every partition written so far, or None"""
+        table_dir = os.path.join(self.root, name)
+        if not os.path.isdir(table_dir):
+            return None
+        return self.conn.execute(f"SELECT * FROM read_parquet('{os.path.join(table_dir, '**', '*.parquet')}', "
+                                 "hive_partitioning = true)").to_arrow_table()
+
+    def write(self, month: str, table, name: str = PAIRS_TABLE):
+        import pyarrow.parquet as pq
+
+        path = os.path.join(self.root, name, f"{self.partition_column}={month}", 'part-0.parquet')
+        if table.num_rows == 0:
+            if os.path.exists(path):
+                os.remove(path)
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Written next to the final file under a non-.parquet name, then swapped in atomically
+        pq.write_table(table, path + '.tmp', compression='zstd')
+        os.replace(path + '.tmp', path)
+
+
+class BigQueryStore:
+    """Reads gpc.* from BigQuery, replaces one month of gpc.cross_sell_pairs_monthly at a time"""
+
+    def __init__(self, project: str = DEFAULT_BQ_PROJECT):
+        import duckdb
+        from google.cloud import bigquery
+
+        self.bigquery = bigquery
+        self.client = bigquery.Client(project=project)
+        self.conn = duckdb.connect()
+
+    def fetch(self, sql: str):
+        return self.client.query(sql).to_arrow()
+
+    def months(self, since: Optional[str]) -> List[str]:
+        return sorted(row[0] for row in self.client.query(months_sql(since)).result())
+
+    def read(self, name: str):
+        """The whole table, or None"""
+        from google.api_core.exceptions import NotFound
+        try:
+            return self.client.query(f"SELECT * FROM gpc.{name}").to_arrow()
+        except NotFound:
+            return None
+
+    def replace(self, name: str, table, layout: str, where: str):
+        """Swap the rows matching where for table, in one transaction (creates gpc.<name> with layout)"""
+        import io
+        import pyarrow.parquet as pq
+
+        staging_id = f"gpc.{name}__staging"
+        buffer = io.BytesIO()
+        pq.write_table(table, buffer)
+        buffer.seek(0)
+        job_config = self.bigquery.LoadJobConfig(source_format=self.bigquery.SourceFormat.PARQUET,
+                                                 write_disposition=self.bigquery.WriteDisposition.WRITE_TRUNCATE)
+        self.client.load_table_from_file(buffer, staging_id, job_config=job_config).result()
+        self.client.query(
+            f"CREATE TABLE IF NOT EXISTS gpc.{name}\n{layout}\n"
+            f"AS SELECT * FROM {staging_id} WHERE FALSE;\n"
+            "BEGIN TRANSACTION;\n"
+            f"DELETE FROM gpc.{name}\nWHERE {where};\n"
+            f"INSERT INTO gpc.{name} SELECT * FROM {staging_id};\n"
+            "COMMIT TRANSACTION;"
+        ).result()
+        self.client.delete_table(staging_id, not_found_ok=True)
+
+    def write(self, month: str, table):
+        start, end = month_range(month)
+        self.replace(PAIRS_TABLE, table,
+                     "PARTITION BY TIMESTAMP_TRUNC(trandate, MONTH)\nCLUSTER BY item_a_category, item_b_category",
+                     f"trandate BETWEEN TIMESTAMP '{start}' AND TIMESTAMP '{end} 23:59:59.999999'")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Incremental monthly cross-sell pair counts')
+    parser.add_argument('--engine', choices=['local', 'bigquery'], default='local',
+                        help='Source and destination of the counts (default: local Parquet)')
+    parser.add_argument('--project', default=DEFAULT_BQ_PROJECT, help='BigQuery project for --engine bigquery')
+    scope = parser.add_mutually_exclusive_group(required=True)
+    scope.add_argument('--since', help='Recount months of transactions modified on/after this date (YYYY-MM-DD)')
+    scope.add_argument('--months', help='Recount these months (YYYY-MM,YYYY-MM)')
+    scope.add_argument('--full', action='store_true', help='Recount every month')
+    parser.add_argument('--max-pairs', type=int, default=DEFAULT_MAX_PAIRS,
+                        help=f'Pairs expanded per accumulation chunk (default: {DEFAULT_MAX_PAIRS:,})')
+    args = parser.parse_args()
+
+    print(f"{Colors.BOLD}{'='*80}{Colors.NC}")
+    print(f"{Colors.BOLD}CROSS-SELL PAIRS gpc.{PAIRS_TABLE}{Colors.NC}  (engine: {args.engine})")
+    print(f"{Colors.BOLD}{'='*80}{Colors.NC}")
+
+    start = time.time()
+    try:
+        store = BigQueryStore(args.project) if args.engine == 'bigquery' else LocalStore()
+        months = [m.strip() for m in args.months.split(',')] if args.months else store.months(args.since)
+        total = 0
+        for month in months:
+            month_start = time.time()
+            table, lines = count_month(store.conn, store.fetch, month, args.max_pairs)
+            store.write(month, table)
+            total += table.num_rows
+            print(f"  {month}: {lines:,} basket lines -> {table.num_rows:,} pair rows "
+                  f"({time.time() - month_start:.1f}s)")
+    except Exception as e:
+        print(f"{Colors.RED}✗ Pair counting failed: {e}{Colors.NC}")
+        sys.exit(1)
+    print(f"{Colors.GREEN}✓ {len(months)} month(s), {total:,} pair rows in {time.time() - start:.1f}s{Colors.NC}")
+
+
+if __name__ == '__main__':
+    main()
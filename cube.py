@@ -6,99 +6,49 @@
 # - CUBEJS_DB_BQ_CREDENTIALS=<service-account-json>
 # - CUBEJS_DB_BQ_LOCATION=US (optional)
 #
-# The custom driver_factory below is commented out for Cube Cloud deployments.
-# Uncomment it only for local development with DuckDB.
+# Local development: set USE_BIGQUERY=false to serve the model from DuckDB over a
+# local, month-partitioned Parquet directory (see local_engine.py for the layout
+# and LOCAL_* / CUBEJS_DB_DUCKDB_* settings). Cube Cloud keeps USE_BIGQUERY=true
+# and never registers the driver_factory below.
 
 from cube import config
 import os
+import sys
 
-# COMMENTED OUT FOR CUBE CLOUD - Use environment variables instead
-# Uncomment for local DuckDB development only
-#
-# @config('driver_factory')
-# def driver_factory(ctx: dict) -> dict:
-#     # Get GCS HMAC credentials from environment variables
-#     gcs_key_id = os.environ.get('GCS_KEY_ID', '')
-#     gcs_secret = os.environ.get('GCS_SECRET', '')
-#
-#     # GCS bucket with Parquet files
-#     bucket = 'gs://gym-plus-coffee-bucket-dev/parquet'
-#
-#     # Init SQL to create tables from Parquet files on GCS
-#     init_sql = f"""
-#         -- Install and load GCS extension
-#         INSTALL httpfs;
-#         LOAD httpfs;
-#
-#         -- Create secret for GCS access using HMAC keys
-#         CREATE SECRET gcs_secret (
-#             TYPE GCS,
-#             KEY_ID '{gcs_key_id}',
-#             SECRET '{gcs_secret}'
-#         );
-#
-#         -- Create tables from Parquet files
-#         CREATE TABLE IF NOT EXISTS transactions AS
-#         SELECT * FROM read_parquet('{bucket}/transactions.parquet');
-#
-#         CREATE TABLE IF NOT EXISTS transaction_lines AS
-#         SELECT * FROM read_parquet('{bucket}/transaction_lines.parquet');
-#
-#         CREATE TABLE IF NOT EXISTS items AS
-#         SELECT * FROM read_parquet('{bucket}/items.parquet');
-#
-#         CREATE TABLE IF NOT EXISTS locations AS
-#         SELECT * FROM read_parquet('{bucket}/locations.parquet');
-#
-#         CREATE TABLE IF NOT EXISTS inventory_calculated AS
-#         SELECT * FROM read_parquet('{bucket}/inventory_calculated.parquet');
-#
-#         CREATE TABLE IF NOT EXISTS fulfillments AS
-#         SELECT * FROM read_parquet('{bucket}/fulfillments.parquet');
-#
-#         CREATE TABLE IF NOT EXISTS fulfillment_lines AS
-#         SELECT * FROM read_parquet('{bucket}/fulfillment_lines.parquet');
-#
-#         CREATE TABLE IF NOT EXISTS currencies AS
-#         SELECT * FROM read_parquet('{bucket}/currencies.parquet');
-#
-#         CREATE TABLE IF NOT EXISTS subsidiaries AS
-#         SELECT * FROM read_parquet('{bucket}/subsidiaries.parquet');
-#
-#         CREATE TABLE IF NOT EXISTS departments AS
-#         SELECT * FROM read_parquet('{bucket}/departments.parquet');
-#
-#         CREATE TABLE IF NOT EXISTS classifications AS
-#         SELECT * FROM read_parquet('{bucket}/classifications.parquet');
-#
-#         CREATE TABLE IF NOT EXISTS b2b_customers AS
-#         SELECT * FROM read_parquet('{bucket}/b2b_customers.parquet');
-#
-#         CREATE TABLE IF NOT EXISTS b2b_addresses AS
-#         SELECT * FROM read_parquet('{bucket}/b2b_addresses.parquet');
-#
-#         CREATE TABLE IF NOT EXISTS b2b_customer_addresses AS
-#         SELECT * FROM read_parquet('{bucket}/b2b_customer_addresses.parquet');
-#
-#         -- Create filtered views with AUDIT filters applied
-#         CREATE VIEW IF NOT EXISTS transaction_lines_clean AS
-#         SELECT * FROM transaction_lines
-#         WHERE mainline = 'F'
-#           AND COALESCE(taxline, 'F') = 'F'
-#           AND COALESCE(iscogs, 'F') = 'F'
-#           AND COALESCE(transactiondiscount, 'F') = 'F';
-#
-#         CREATE VIEW IF NOT EXISTS transactions_clean AS
-#         SELECT * FROM transactions
-#         WHERE COALESCE(posting, 'F') = 'T'
-#           AND COALESCE(voided, 'F') = 'F'
-#           AND type IN ('CustInvc', 'CashSale', 'CustCred', 'CashRfnd');
-#     """
-#
-#     # DuckDB configuration (for local development with GCS parquet)
-#     duckdb_config = {
-#         'type': 'duckdb',
-#         'initSql': init_sql,
-#     }
-#
-#     return duckdb_config
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+@config('query_rewrite')
+def query_rewrite(query: dict, ctx: dict) -> dict:
+    # Equivalent queries (member order, "last 30 days" vs explicit dates, timestamp vs
+    # date bounds) are sent in one canonical form so they share the result cache and
+    # generate identical SQL; see query_canonical.py
+    #
+    # Ratio measures (type: number, e.g. average_order_value) never match a rollup;
+    # their additive components do. Clients whose token carries ratio_components: true
+    # get the components instead and compute the ratio on the result (cube_client.py
+    # does this transparently); everyone else still receives the ratio column as before.
+    #
+    # inventory_history.stock_position is a checkpoint plus deltas: a dateRange spanning
+    # more than one month would add up several checkpoints, so it is refused
+    from inventory_snapshots import history_range_error
+    from ratio_measures import rewrite_for_context
+    query = rewrite_for_context(query, ctx.get('securityContext') or {})
+    error = history_range_error(query)
+    if error:
+        raise ValueError(error)
+    return query
+
+
+if os.environ.get('USE_BIGQUERY', 'true').lower() == 'false':
+    from local_engine import build_init_sql
+
+    @config('driver_factory')
+    def driver_factory(ctx: dict) -> dict:
+        # Tables are lazy views over local Parquet (no copy at startup); the
+        # database file itself comes from CUBEJS_DB_DUCKDB_DATABASE_PATH so the
+        # views persist across restarts
+        return {
+            'type': 'duckdb',
+            'initSql': build_init_sql(),
+        }
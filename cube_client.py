@@ -0,0 +1,466 @@
+#!/usr/bin/env python3
+"""
+Shared Cube REST API client for the validation and investigation scripts
+
+Replaces the per-script `requests.get(CUBE_API_URL, ...)` calls with a single
+pooled keep-alive session. load_many() sends independent /load queries as
+multi-query requests (one round trip per batch instead of per query), and
+identical queries in flight at the same time, from any thread, are sent once.
+
+Configuration (environment variables):
+    CUBE_API_URL          Base API URL (default: aqua-stingray .../cubejs-api/v1)
+    CUBE_API_TOKEN        API token sent in the Authorization header (required)
+    CUBE_MAX_CONCURRENCY  Max requests in flight for load_many() (default: 8)
+    CUBE_BATCH_SIZE       Max queries per multi-query /load request; 1 disables batching (default: 10)
+    CUBE_TIMEOUT          Per-request timeout in seconds (default: 60)
+    CUBE_RETRIES          Retries on connection errors and 502/503/504 (default: 3)
+    CUBE_MAX_WAIT         Total seconds to keep polling "Continue wait" (default: 300)
+    CUBE_SPLIT_MONTHS     Split dateRanges into whole months + partial edges in load() (default: true)
+    CUBE_CACHE            Result cache for load(): on (default) | off | refresh (see result_cache.py)
+
+Ratio measures (average_order_value, discount_rate, ...) that the Cube deployment
+answered with their additive components (cube.py query_rewrite, token claim
+ratio_components) are computed back onto the rows, so callers see the ratio.
+
+Queries are sent in canonical form (query_canonical.py), so equivalent requests
+share Cube's cache entries. load() also splits a dateRange with partial months
+at its edges into the whole-month core and the edges, and merges the results:
+the core repeats across ad-hoc ranges and comes from cached monthly partitions.
+inventory_history.stock_position queries whose dateRange spans more than one
+month come back as {"error": ...} without being sent (inventory_snapshots.py).
+
+load() results (each split piece separately) are cached on disk between runs
+(result_cache.py), with TTLs from the model's refresh keys. load_with_stats()
+always asks Cube, so latency measurements are unaffected.
+
+Usage:
+    from cube_client import CubeClient
+
+    client = CubeClient.from_env()
+    data = client.load({"measures": ["transaction_lines.total_revenue"]})
+    data1, data2 = client.load_many([query1, query2])
+"""
+
+import os
+import copy
+import json
+import time
+import hashlib
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Any, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from inventory_snapshots import history_range_error
+from query_canonical import canonical_query, split_query, merge_results
+from result_cache import (DEFAULT_CACHE_PATH, DEFAULT_LIVE_TTL, DEFAULT_MAX_MB, DEFAULT_TTL, ResultCache,
+                          cube_ttls, model_version, query_members, query_ttl)
+
+DEFAULT_API_URL = "https://aqua-stingray.gcp-us-central1.cubecloudapp.dev/cubejs-api/v1"
+DEFAULT_TIMEOUT = 60
+DEFAULT_MAX_CONCURRENCY = 8
+DEFAULT_BATCH_SIZE = 10
+DEFAULT_RETRIES = 3
+DEFAULT_MAX_WAIT = 300
+POLL_INTERVAL = 0.5
+MAX_POLL_INTERVAL = 5.0
+
+# Returned by Cube while a query or pre-aggregation build is still running
+CONTINUE_WAIT = 'Continue wait'
+
+
+class CubeClientError(Exception):
+    """Transport-level failure (connection, HTTP, or non-JSON response)"""
+
+
+class CubeTimeoutError(CubeClientError):
+    """Request exceeded the configured timeout"""
+
+
+class LoadResult:
+    """Outcome of a polled /load call with its timings (seconds)"""
+
+    def __init__(self, data: Dict[str, Any], first_response: float, polls: int, latency: float, timed_out: bool):
+        self.data = data
+        self.first_response = first_response  # time until Cube first answered (result or "Continue wait")
+        self.polls = polls                    # number of "Continue wait" answers received
+        self.latency = latency                # time until the final answer
+        self.timed_out = timed_out            # still "Continue wait" when max_wait expired
+
+
+class CubeClient:
+    def __init__(self, api_url: str, api_token: str, timeout: float = DEFAULT_TIMEOUT,
+                 max_concurrency: int = DEFAULT_MAX_CONCURRENCY, retries: int = DEFAULT_RETRIES,
+                 max_wait: float = DEFAULT_MAX_WAIT, split_months: bool = True,
+                 cache: Optional[ResultCache] = None, cache_refresh: bool = False,
+                 cache_ttl: int = DEFAULT_TTL, cache_live_ttl: int = DEFAULT_LIVE_TTL,
+                 batch_size: int = DEFAULT_BATCH_SIZE):
+        if not api_token:
+            raise CubeClientError("Missing API token - set CUBE_API_TOKEN")
+
+        # Accept both the base URL and the legacy ".../load" URL used by the scripts
+        api_url = api_url.rstrip('/')
+        if api_url.endswith('/load'):
+            api_url = api_url[:-len('/load')]
+
+        self.api_url = api_url
+        self.api_token = api_token
+        self.timeout = timeout
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_wait = max_wait
+        self.split_months = split_months
+        self.batch_size = max(1, batch_size)
+        self._inflight: Dict[str, Future] = {}    # canonical query -> result future of the request sending it
+        self._inflight_lock = threading.Lock()
+        self.cache = cache
+        self.cache_refresh = cache_refresh   # bypass: don't read the cache, still store fresh results
+        self.cache_ttl = cache_ttl
+        self.cache_live_ttl = cache_live_ttl
+        self._cache_scope: Optional[str] = None
+        self._model = None
+        self._model_loaded = False
+        self._model_lock = threading.Lock()       # one load; concurrent first callers wait for it
+        self._measure_types: Dict[str, str] = {}
+        self._cube_ttls: Dict[str, Any] = {}
+
+        retry = Retry(
+            total=retries,
+            backoff_factor=0.5,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset(['GET', 'POST']),
+            raise_on_status=False,
+        )
+        # One pool slot per concurrent worker so connections are reused, not re-opened
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_concurrency, max_retries=retry)
+
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({
+            'Authorization': api_token,
+            'Content-Type': 'application/json',
+        })
+
+    @classmethod
+    def from_env(cls, api_url: Optional[str] = None, api_token: Optional[str] = None,
+                 timeout: Optional[float] = None) -> 'CubeClient':
+        """Build a client from CUBE_* environment variables (explicit arguments win)"""
+        cache_mode = os.environ.get('CUBE_CACHE', 'on').lower()
+        cache = None
+        if cache_mode != 'off':
+            cache = ResultCache(os.environ.get('CUBE_CACHE_PATH', DEFAULT_CACHE_PATH),
+                                max_bytes=int(float(os.environ.get('CUBE_CACHE_MAX_MB', DEFAULT_MAX_MB)) * 1024 * 1024))
+        return cls(
+            api_url=api_url or os.environ.get('CUBE_API_URL', DEFAULT_API_URL),
+            api_token=api_token or os.environ.get('CUBE_API_TOKEN', ''),
+            timeout=timeout or float(os.environ.get('CUBE_TIMEOUT', DEFAULT_TIMEOUT)),
+            max_concurrency=int(os.environ.get('CUBE_MAX_CONCURRENCY', DEFAULT_MAX_CONCURRENCY)),
+            retries=int(os.environ.get('CUBE_RETRIES', DEFAULT_RETRIES)),
+            max_wait=float(os.environ.get('CUBE_MAX_WAIT', DEFAULT_MAX_WAIT)),
+            split_months=os.environ.get('CUBE_SPLIT_MONTHS', 'true').lower() != 'false',
+            cache=cache,
+            cache_refresh=cache_mode == 'refresh',
+            cache_ttl=int(os.environ.get('CUBE_CACHE_TTL', DEFAULT_TTL)),
+            cache_live_ttl=int(os.environ.get('CUBE_CACHE_LIVE_TTL', DEFAULT_LIVE_TTL)),
+            batch_size=int(os.environ.get('CUBE_BATCH_SIZE', DEFAULT_BATCH_SIZE)),
+        )
+
+    def load(self, query: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Run a single /load query, polling through "Continue wait"
+
+        Returns the decoded JSON body. Cube query errors come back as
+        {"error": ...} just like the raw API (including "Continue wait" if
+        max_wait expires); transport failures raise CubeClientError
+        (CubeTimeoutError on timeout).
+
+        A dateRange covering whole months plus partial ones is sent as the
+        whole-month core and the edge ranges, merged back into one result.
+        With a cache, results come from it while fresh (see result_cache.py).
+        """
+        result = self._load_all([query])[0]
+        if isinstance(result, CubeClientError):
+            raise result
+        return result
+
+    def load_many(self, queries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Run independent /load queries together
+
+        Queries go out as multi-query /load requests (up to batch_size queries
+        each, at most max_concurrency requests in flight); identical queries
+        are sent once. Results are returned in the same order as the queries.
+        A transport failure is reported as {"error": ...} in the slots of the
+        queries it affected so the other results are still usable.
+        """
+        return [{'error': str(r)} if isinstance(r, CubeClientError) else r for r in self._load_all(queries)]
+
+    def _load_all(self, queries: List[Dict[str, Any]]) -> List[Any]:
+        """Result (or CubeClientError) per query: split into month pieces, fetched together, merged back"""
+        pieces: Dict[str, Dict[str, Any]] = {}
+        plans = []
+        for query in queries:
+            canonical = canonical_query(query)
+            error = history_range_error(canonical)
+            if error:
+                # Refused by cube.py too; checked here before split_query() cuts it into one-month pieces
+                plans.append(({'error': error}, []))
+                continue
+            parts = (split_query(canonical, self.measure_types()) if self.split_months else None) or [canonical]
+            keys = [json.dumps(part, sort_keys=True) for part in parts]
+            for key, part in zip(keys, parts):
+                pieces.setdefault(key, part)
+            plans.append((canonical, keys))
+        fetched = dict(zip(pieces, self._fetch_many(list(pieces.values()))))
+
+        results, handed_out = [], set()
+        for canonical, keys in plans:
+            if not keys:
+                results.append(canonical)
+                continue
+            parts = []
+            for key in keys:
+                # Callers may modify their result: a piece shared by several queries is copied
+                parts.append(copy.deepcopy(fetched[key]) if key in handed_out else fetched[key])
+                handed_out.add(key)
+            failure = next((part for part in parts if isinstance(part, CubeClientError)), None)
+            if failure is not None:
+                results.append(failure)
+            else:
+                results.append(parts[0] if len(parts) == 1 else merge_results(canonical, parts))
+        return results
+
+    def _fetch_many(self, queries: List[Dict[str, Any]]) -> List[Any]:
+        """
+        Result (or CubeClientError) per distinct canonical query
+
+        Taken from the cache, else from an identical request another thread
+        already has in flight, else sent in multi-query batches.
+        """
+        results: List[Any] = [None] * len(queries)
+        keys = [json.dumps(query, sort_keys=True) for query in queries]
+        for i, query in enumerate(queries):
+            results[i] = self._cache_get(query)
+
+        own: Dict[int, Future] = {}
+        waiting: Dict[int, Future] = {}
+        with self._inflight_lock:
+            for i, key in enumerate(keys):
+                if results[i] is not None:
+                    continue
+                if key in self._inflight:
+                    waiting[i] = self._inflight[key]
+                else:
+                    own[i] = self._inflight[key] = Future()
+
+        def run(batch: List[int]):
+            try:
+                datas = self._load_batch([queries[i] for i in batch])
+            except CubeClientError as e:
+                datas = [e] * len(batch)
+            for i, data in zip(batch, datas):
+                if not isinstance(data, CubeClientError) and 'error' not in data:
+                    self._cache_put(queries[i], data)
+                results[i] = data
+                own[i].set_result(data)
+
+        try:
+            # Queries on the same cube share a batch, so Cube resolves their pre-aggregations together
+            ordered = sorted(own, key=lambda i: (sorted(query_members(queries[i]))[:1], keys[i]))
+            batches = [ordered[n:n + self.batch_size] for n in range(0, len(ordered), self.batch_size)]
+            if len(batches) <= 1:
+                for batch in batches:
+                    run(batch)
+            else:
+                with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(batches))) as pool:
+                    list(pool.map(run, batches))
+        finally:
+            with self._inflight_lock:
+                for i, future in own.items():
+                    if not future.done():
+                        future.set_result(CubeClientError("request failed in another caller"))
+                    self._inflight.pop(keys[i], None)
+
+        for i, future in waiting.items():
+            result = future.result()
+            results[i] = result if isinstance(result, CubeClientError) else copy.deepcopy(result)
+        return results
+
+    def _load_batch(self, queries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        One multi-query /load request (queryType=multi), polled through "Continue wait"
+
+        Cube fails the whole batch if one query is invalid; the queries are
+        then sent one by one so each gets its own result or error.
+        """
+        if len(queries) == 1:
+            return [self.load_with_stats(queries[0]).data]
+
+        start = time.monotonic()
+        delay = POLL_INTERVAL
+        while True:
+            data = self._request(queries, multi=True)
+            if data.get('error') != CONTINUE_WAIT:
+                break
+            if time.monotonic() - start + delay > self.max_wait:
+                return [dict(data) for _ in queries]
+            time.sleep(delay)
+            delay = min(delay * 2, MAX_POLL_INTERVAL)
+
+        results = data.get('results')
+        if 'error' in data or not isinstance(results, list) or len(results) != len(queries):
+            return [self.load_with_stats(query).data for query in queries]
+        for query, result in zip(queries, results):
+            self._complete_ratios(query, result)
+        return results
+
+    def _cache_key(self, query: Dict[str, Any]) -> str:
+        if self._cache_scope is None:
+            token = hashlib.sha256(self.api_token.encode()).hexdigest()[:16]
+            self._cache_scope = f"{self.api_url}|{token}|{model_version()}"
+        return ResultCache.key(query, self._cache_scope)
+
+    def _cache_get(self, query: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        if self.cache is None or self.cache_refresh:
+            return None
+        return self.cache.get(self._cache_key(query))
+
+    def _cache_put(self, query: Dict[str, Any], data: Dict[str, Any]):
+        """Store a successful result with the TTL of the cubes it touches"""
+        if self.cache is None:
+            return
+        model = self.model()
+        resolve = model.resolve if model else (lambda member: member)
+        ttl = query_ttl(query, self._cube_ttls, resolve, self.cache_ttl, self.cache_live_ttl)
+        self.cache.put(self._cache_key(query), query, data, ttl)
+
+    def model(self):
+        """The local CubeModel (None without PyYAML or the model directory)"""
+        if self._model_loaded:
+            return self._model
+        with self._model_lock:
+            if not self._model_loaded:
+                try:
+                    from cube_model import load_model
+                    model = load_model()
+                except (ImportError, OSError):
+                    return None
+                types = {m.qualified: m.type for cube in model.cubes.values() for m in cube.measures.values()}
+                for view_member, cube_member in model.view_members.items():
+                    if cube_member in types:
+                        types[view_member] = types[cube_member]
+                self._measure_types = types
+                self._cube_ttls = cube_ttls(model)
+                self._model = model
+                self._model_loaded = True
+        return self._model
+
+    def measure_types(self) -> Dict[str, str]:
+        """Measure -> Cube type from the local model (view members included; empty without it)"""
+        self.model()
+        return self._measure_types
+
+    def load_with_stats(self, query: Dict[str, Any], max_wait: Optional[float] = None) -> LoadResult:
+        """
+        Run a /load query and keep it alive until Cube returns a result or max_wait expires
+
+        Cube answers {"error": "Continue wait"} while the query (or a
+        pre-aggregation build it depends on) is still running; the same
+        query is re-sent with exponential backoff. Pass max_wait=0 to
+        return the first answer without polling.
+        """
+        max_wait = self.max_wait if max_wait is None else max_wait
+        start = time.monotonic()
+        first_response = None
+        polls = 0
+        delay = POLL_INTERVAL
+        canonical = canonical_query(query)
+
+        while True:
+            data = self._request(canonical)
+            elapsed = time.monotonic() - start
+            if first_response is None:
+                first_response = elapsed
+
+            if data.get('error') != CONTINUE_WAIT:
+                self._complete_ratios(query, data)
+                return LoadResult(data, first_response, polls, elapsed, timed_out=False)
+
+            polls += 1
+            if elapsed + delay > max_wait:
+                return LoadResult(data, first_response, polls, elapsed, timed_out=True)
+
+            time.sleep(delay)
+            delay = min(delay * 2, MAX_POLL_INTERVAL)
+
+    @staticmethod
+    def _complete_ratios(query: Dict[str, Any], data: Dict[str, Any]):
+        """Compute ratio measures cube.py answered with their components (token with ratio_components)"""
+        rows = data.get('data')
+        if not rows or all(m in rows[0] for m in query.get('measures') or []):
+            return
+        from ratio_measures import complete_ratios
+        complete_ratios(query, data)
+
+    def _request(self, query: Any, multi: bool = False) -> Dict[str, Any]:
+        """Send one /load request and decode the JSON body (multi: a list of queries, sent as POST)"""
+        try:
+            if multi:
+                response = self.session.post(
+                    f"{self.api_url}/load",
+                    data=json.dumps({'query': query, 'queryType': 'multi'}),
+                    timeout=self.timeout,
+                )
+            else:
+                response = self.session.get(
+                    f"{self.api_url}/load",
+                    params={'query': json.dumps(query)},
+                    timeout=self.timeout,
+                )
+        except requests.Timeout as e:
+            raise CubeTimeoutError(f"TIMEOUT after {self.timeout}s") from e
+        except requests.RequestException as e:
+            raise CubeClientError(str(e)) from e
+
+        try:
+            return response.json()
+        except ValueError as e:
+            raise CubeClientError(f"HTTP {response.status_code}: {response.text[:200]}") from e
+
+    def pre_aggregation_jobs(self, body: Dict[str, Any]) -> Any:
+        """
+        Call the /pre-aggregations/jobs API
+
+        {"action": "post", "selector": {...}} schedules partition builds and
+        returns their job tokens; {"action": "get", "tokens": [...]} returns
+        the status of each job. Cube errors raise CubeClientError.
+        """
+        try:
+            response = self.session.post(f"{self.api_url}/pre-aggregations/jobs",
+                                         data=json.dumps(body), timeout=self.timeout)
+        except requests.Timeout as e:
+            raise CubeTimeoutError(f"TIMEOUT after {self.timeout}s") from e
+        except requests.RequestException as e:
+            raise CubeClientError(str(e)) from e
+
+        try:
+            data = response.json()
+        except ValueError as e:
+            raise CubeClientError(f"HTTP {response.status_code}: {response.text[:200]}") from e
+        if isinstance(data, dict) and data.get('error'):
+            raise CubeClientError(str(data['error']))
+        return data
+
+    def close(self):
+        self.session.close()
+        if self.cache is not None:
+            self.cache.close()
+
+    def __enter__(self) -> 'CubeClient':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
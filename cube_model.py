@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+Read-only loader for the Cube data model in model/cubes/*.yml and model/views/*.yml
+
+Used by the offline analysis tools (pre-aggregation analyzer, rollup optimizer,
+cardinality profiler). Members are always fully qualified ("cube.member");
+view members are resolved back to the cube member they expose.
+
+Requires PyYAML (`pip install pyyaml`).
+"""
+
+import os
+import re
+import glob
+from datetime import date, timedelta
+from typing import Dict, Any, List, Optional, Set
+
+import yaml
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_MODEL_DIR = os.path.join(BASE_DIR, 'model')
+
+# Measure types Cube can re-aggregate from a rollup
+ADDITIVE_TYPES = {'sum', 'count', 'min', 'max', 'count_distinct_approx'}
+
+# Time granularities from finest to coarsest
+GRANULARITIES = ['second', 'minute', 'hour', 'day', 'week', 'month', 'quarter', 'year']
+
+# {member} / {cube.member} references in member SQL ({CUBE} is the cube itself)
+MEMBER_REF = re.compile(r"\{([A-Za-z_]\w*(?:\.[A-Za-z_]\w*)?)\}")
+DATE_LITERAL = re.compile(r"(\d{4}-\d{2}-\d{2})")
+# Rolling build ranges: CURRENT_DATE, optionally minus N days (SELECT CAST(CURRENT_DATE - INTERVAL 2 DAY AS DATE))
+ROLLING_DATE = re.compile(r"CURRENT_DATE(?:\(\))?(?:\s*-\s*INTERVAL\s*'?(\d+)'?\s*DAY)?", re.IGNORECASE)
+
+
+def rolls_up_to(source: str, target: str) -> bool:
+    """Whether data at `source` granularity can be re-aggregated to `target`"""
+    if source not in GRANULARITIES or target not in GRANULARITIES:
+        return False
+    if source == target:
+        return True
+    if source == 'week' or target == 'week':
+        # Weeks don't nest in months/quarters/years; only finer-than-week data rolls into weeks
+        return target == 'week' and GRANULARITIES.index(source) < GRANULARITIES.index('week')
+    return GRANULARITIES.index(source) < GRANULARITIES.index(target)
+
+
+class Member:
+    def __init__(self, cube: str, name: str, kind: str, definition: Dict[str, Any]):
+        self.cube = cube
+        self.name = name
+        self.kind = kind                     # 'measure' | 'dimension' | 'segment'
+        self.type = definition.get('type')
+        self.sql = str(definition.get('sql', '') or '')
+        self.primary_key = bool(definition.get('primary_key'))
+        self.definition = definition
+
+    @property
+    def qualified(self) -> str:
+        return f"{self.cube}.{self.name}"
+
+    @property
+    def additive(self) -> bool:
+        return self.kind == 'measure' and self.type in ADDITIVE_TYPES
+
+
+class PreAggregation:
+    def __init__(self, cube: str, definition: Dict[str, Any], path: str):
+        self.cube = cube
+        self.name = definition['name']
+        self.type = definition.get('type', 'rollup')
+        self.path = path
+        self.definition = definition
+        self.measures = [qualify(cube, m) for m in definition.get('measures') or []]
+        self.dimensions = [qualify(cube, d) for d in definition.get('dimensions') or []]
+        self.segments = [qualify(cube, s) for s in definition.get('segments') or []]
+        time_dimension = definition.get('time_dimension')
+        self.time_dimension = qualify(cube, time_dimension) if time_dimension else None
+        self.granularity = definition.get('granularity')
+        self.partition_granularity = definition.get('partition_granularity')
+        self.build_range_start = _range_date(definition.get('build_range_start'))
+        self.build_range_end = _range_date(definition.get('build_range_end'))
+        # rollup_lambda: batch rollups it serves (members are taken from the first one)
+        self.rollups = [r.split('.')[-1] for r in definition.get('rollups') or []]
+        self.union_with_source_data = bool(definition.get('union_with_source_data'))
+
+        refresh_key = definition.get('refresh_key') or {}
+        self.refresh_every = refresh_key.get('every')
+        self.refresh_sql = refresh_key.get('sql')
+        self.update_window = refresh_key.get('update_window')
+        self.incremental = bool(refresh_key.get('incremental'))
+
+    @property
+    def qualified(self) -> str:
+        return f"{self.cube}.{self.name}"
+
+
+class Cube:
+    def __init__(self, definition: Dict[str, Any], path: str):
+        self.name = definition['name']
+        self.path = path
+        self.sql = definition.get('sql')
+        self.sql_table = definition.get('sql_table')
+        self.refresh_every = (definition.get('refresh_key') or {}).get('every')
+        self.joins = {j['name']: j for j in definition.get('joins') or []}
+        self.measures = {m['name']: Member(self.name, m['name'], 'measure', m)
+                         for m in definition.get('measures') or []}
+        self.dimensions = {d['name']: Member(self.name, d['name'], 'dimension', d)
+                           for d in definition.get('dimensions') or []}
+        self.segments = {s['name']: Member(self.name, s['name'], 'segment', s)
+                         for s in definition.get('segments') or []}
+        self.pre_aggregations = [PreAggregation(self.name, p, path)
+                                 for p in definition.get('pre_aggregations') or []]
+        rollups = {p.name: p for p in self.pre_aggregations}
+        for lambda_ in self.pre_aggregations:
+            batch = rollups.get(lambda_.rollups[0]) if lambda_.rollups else None
+            if batch and not lambda_.measures and not lambda_.dimensions:
+                lambda_.measures, lambda_.dimensions, lambda_.segments = batch.measures, batch.dimensions, batch.segments
+                lambda_.time_dimension, lambda_.granularity = batch.time_dimension, batch.granularity
+
+
+class CubeModel:
+    def __init__(self, cubes: Dict[str, Cube], view_members: Dict[str, str]):
+        self.cubes = cubes
+        self.view_members = view_members     # "view.member" -> "cube.member"
+
+    def resolve(self, member: str) -> str:
+        """Map a view member to its cube member; cube members are returned unchanged"""
+        return self.view_members.get(member, member)
+
+    def member(self, member: str) -> Optional[Member]:
+        cube_name, _, name = self.resolve(member).partition('.')
+        cube = self.cubes.get(cube_name)
+        if not cube:
+            return None
+        return cube.measures.get(name) or cube.dimensions.get(name) or cube.segments.get(name)
+
+    def pre_aggregations(self, cube: Optional[str] = None) -> List[PreAggregation]:
+        cubes = [self.cubes[cube]] if cube else self.cubes.values()
+        return [p for c in cubes for p in c.pre_aggregations]
+
+    def referenced_members(self, member: Member) -> List[str]:
+        """Qualified members referenced from a member's SQL"""
+        refs = []
+        for ref in MEMBER_REF.findall(member.sql):
+            if ref == 'CUBE':
+                continue
+            if ref.startswith('CUBE.'):
+                ref = ref[len('CUBE.'):]
+            refs.append(ref if '.' in ref else f"{member.cube}.{ref}")
+        return refs
+
+    def member_sql(self, member: str, alias: str, _depth: int = 0) -> Optional[str]:
+        """
+        Member SQL against a source aliased as `alias`, with same-cube member
+        references inlined and `case` dimensions expanded. Returns None for
+        members that reference other cubes.
+        """
+        definition = self.member(member)
+        if definition is None or _depth > 10:
+            return None
+
+        sql = definition.sql
+        case = definition.definition.get('case')
+        if not sql and case:
+            whens = ' '.join(f"WHEN {w['sql']} THEN '{w['label']}'" for w in case.get('when') or [])
+            otherwise = (case.get('else') or {}).get('label')
+            sql = f"CASE {whens}" + (f" ELSE '{otherwise}'" if otherwise else '') + " END"
+
+        def inline(match) -> str:
+            ref = match.group(1)
+            if ref == 'CUBE':
+                return alias
+            if ref.startswith('CUBE.'):
+                ref = ref[len('CUBE.'):]
+            qualified = ref if '.' in ref else f"{definition.cube}.{ref}"
+            if not qualified.startswith(definition.cube + '.'):
+                raise LookupError(qualified)
+            inner = self.member_sql(qualified, alias, _depth + 1)
+            if inner is None:
+                raise LookupError(qualified)
+            return f"({inner})"
+
+        try:
+            return MEMBER_REF.sub(inline, sql)
+        except LookupError:
+            return None
+
+    def leaf_measures(self, member: str, _seen: Optional[Set[str]] = None) -> List[str]:
+        """Additive-or-not base measures a (possibly calculated) measure is built from"""
+        _seen = _seen if _seen is not None else set()
+        definition = self.member(member)
+        if definition is None or definition.kind != 'measure' or member in _seen:
+            return []
+        _seen.add(member)
+        if definition.type != 'number':
+            return [definition.qualified]
+
+        leaves = []
+        for ref in self.referenced_members(definition):
+            ref_member = self.member(ref)
+            if ref_member is not None and ref_member.kind == 'measure':
+                for leaf in self.leaf_measures(ref_member.qualified, _seen):
+                    if leaf not in leaves:
+                        leaves.append(leaf)
+        return leaves
+
+
+def qualify(cube: str, member: str) -> str:
+    return member if '.' in member else f"{cube}.{member}"
+
+
+def _range_date(value: Any) -> Optional[str]:
+    """Date of build_range_* ({sql: SELECT '2025-10-31'} or a CURRENT_DATE expression, as of today)"""
+    if not value:
+        return None
+    sql = value.get('sql', '') if isinstance(value, dict) else str(value)
+    match = DATE_LITERAL.search(str(sql))
+    if match:
+        return match.group(1)
+    match = ROLLING_DATE.search(str(sql))
+    if match:
+        return (date.today() - timedelta(days=int(match.group(1) or 0))).isoformat()
+    return None
+
+
+def _load_views(paths: List[str], cubes: Dict[str, Cube]) -> Dict[str, str]:
+    members = {}
+    for path in paths:
+        with open(path) as f:
+            document = yaml.safe_load(f) or {}
+        for view in document.get('views') or []:
+            for entry in view.get('cubes') or []:
+                cube_name = entry['join_path'].split('.')[-1]
+                cube = cubes.get(cube_name)
+                includes = entry.get('includes') or []
+                if includes == '*' and cube:
+                    includes = list(cube.measures) + list(cube.dimensions) + list(cube.segments)
+                prefix = f"{cube_name}_" if entry.get('prefix') else ''
+                for include in includes:
+                    name, alias = (include.get('name'), include.get('alias')) if isinstance(include, dict) \
+                        else (include, None)
+                    members[f"{view['name']}.{alias or prefix + name}"] = f"{cube_name}.{name}"
+    return members
+
+
+def load_model(model_dir: str = DEFAULT_MODEL_DIR) -> CubeModel:
+    """Load every cube and view definition under model_dir"""
+    cubes = {}
+    for path in sorted(glob.glob(os.path.join(model_dir, 'cubes', '*.yml'))):
+        with open(path) as f:
+            document = yaml.safe_load(f) or {}
+        for definition in document.get('cubes') or []:
+            cubes[definition['name']] = Cube(definition, path)
+
+    view_paths = sorted(glob.glob(os.path.join(model_dir, 'views', '*.yml')))
+    return CubeModel(cubes, _load_views(view_paths, cubes))
@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+"""
+Build stage for gpc.distinct_sketches, mergeable HLL sketches behind the distinct_counts cube
+
+count_distinct_approx measures can't be added up across rollup rows, so a
+distinct-customer KPI over 12 months or across channels either needs a
+rollup at exactly that grain or falls back to APPROX_COUNT_DISTINCT over the
+raw tables. This script stores one HyperLogLog sketch per metric, month and
+segment instead; any range of months and any set of segments is answered by
+merging their sketches with the gpc.hll_count_merge aggregate:
+- BigQuery: HLL_COUNT.INIT sketches (BYTES), gpc.hll_count_merge = HLL_COUNT.MERGE (SQL UDAF)
+- local engine: sparse register lists from sketches.HyperLogLog over DuckDB hash(),
+  gpc.hll_count_merge is a DuckDB macro (local_engine.HLL_SQL)
+Both are built at local_engine.HLL_PRECISION (~0.8% standard error).
+
+Metrics (metric -> distinct value, segment):
+    transactions.unique_customers               customer email, billing_country
+    b2c_customer_channels.unique_customers      customer email, channel_type
+    fulfillment_lines.fulfillment_count         fulfillment, location
+    fulfillment_lines.sku_count                 item, location
+    fulfillment_lines.location_count            location, (none)
+    customer_deposits.deposit_transaction_count deposit, paymentmethod
+    customer_payments.payment_transaction_count payment, paymentmethod
+
+Months are rebuilt whole (DELETE + INSERT on BigQuery, month partitions locally):
+    --since 2026-10-01        months holding rows of headers whose lastmodifieddate is on/after the date,
+                              by each metric's own date (shipdate for fulfillment_lines)
+    --months 2025-09,2025-10
+    --full
+
+Usage:
+    python3 distinct_sketches.py --full                               # local Parquet
+    python3 distinct_sketches.py --engine bigquery --since 2026-10-01
+    python3 distinct_sketches.py --engine bigquery --print-sql --months 2025-10
+    python3 test_hll_sketches.py                                      # error vs exact counts
+"""
+
+import os
+import sys
+import time
+import argparse
+from typing import Dict, List, Optional
+
+from enrich_transaction_lines import month_range
+from local_engine import HLL_PRECISION
+
+# Colors for output
+class Colors:
+    RED = '\033[0;31m'
+    GREEN = '\033[0;32m'
+    YELLOW = '\033[1;33m'
+    BLUE = '\033[0;34m'
+    BOLD = '\033[1m'
+    NC = '\033[0m'  # No Color
+
+
+SKETCH_TABLE = 'distinct_sketches'
+DEFAULT_BQ_PROJECT = os.environ.get('CUBEJS_DB_BQ_PROJECT_ID', 'gym-plus-coffee')
+NO_SEGMENT = '(all)'
+
+# Same channel rules as the b2c_customer_channels cube
+CHANNEL_SQL = """CASE
+      WHEN l.name IS NULL THEN 'D2C'
+      WHEN l.name LIKE 'Bleckmann%' AND l.name NOT LIKE '%Quarantine%' AND l.name NOT LIKE '%Miscellaneous%' THEN 'D2C'
+      WHEN l.name IN ('Meteor Space', '2Flow') THEN 'D2C'
+      WHEN l.name IN (
+        'Dundrum Town Centre', 'Mahon Point', 'Crescent Centre', 'Liffey Valley',
+        'Kildare Village', 'Blanchardstown Centre', 'Galway', 'Swords Pavillon', 'Jervis Centre',
+        'Westfield London', 'Manchester', 'Belfast', 'Liverpool'
+      ) THEN 'RETAIL'
+      WHEN l.name LIKE 'Wholesale%' THEN 'B2B_WHOLESALE'
+      WHEN l.name LIKE 'Lifestyle Sports%' AND l.name NOT LIKE '%Quarantine%' THEN 'B2B_WHOLESALE'
+      WHEN l.name IN ('Otrium', 'The Very Group', 'Digme', 'Academy Crests') THEN 'PARTNER'
+      WHEN l.name LIKE 'Events%' THEN 'EVENTS'
+      ELSE 'OTHER'
+    END"""
+
+# Payment/deposit lines, same filters as the customer_deposits / customer_payments cubes
+CASH_LINES_SQL = """FROM {transaction_lines} tl
+  LEFT JOIN {transaction} t ON tl.transaction = t.id
+  WHERE tl.transaction_type = '{type}'
+    AND COALESCE(tl.mainline, 'F') = 'F'
+    AND COALESCE(tl.taxline, 'F') = 'F'
+    AND COALESCE(t.posting, 'T') = 'T'
+    AND COALESCE(t.voided, 'F') = 'F'"""
+
+# metric -> SELECT of (value, day, segment, header) rows, same sources and filters as the cube;
+# header is the NetSuite transaction whose lastmodifieddate puts the row in a --since rebuild
+METRICS: Dict[str, str] = {
+    'transactions.unique_customers': """
+  SELECT t.custbody_customer_email AS value, t.trandate AS day, t.billing_country AS segment, t.id AS header
+  FROM {transactions_analysis} t""",
+    'b2c_customer_channels.unique_customers': f"""
+  SELECT t.custbody_customer_email AS value, t.trandate AS day,
+    {CHANNEL_SQL} AS segment, t.id AS header
+  FROM {{transaction_lines}} tl
+  JOIN {{transactions_analysis}} t ON tl.transaction = t.id
+  LEFT JOIN {{locations}} l ON tl.location = l.id
+  WHERE t.custbody_customer_email != ''""",
+    'fulfillment_lines.fulfillment_count': """
+  SELECT fl.transaction AS value, fl.shipdate AS day, CAST(fl.location AS STRING) AS segment,
+    fl.transaction AS header
+  FROM {fulfillment_lines} fl""",
+    'fulfillment_lines.sku_count': """
+  SELECT fl.item AS value, fl.shipdate AS day, CAST(fl.location AS STRING) AS segment,
+    fl.transaction AS header
+  FROM {fulfillment_lines} fl""",
+    'fulfillment_lines.location_count': """
+  SELECT fl.location AS value, fl.shipdate AS day, CAST(NULL AS STRING) AS segment,
+    fl.transaction AS header
+  FROM {fulfillment_lines} fl""",
+    'customer_deposits.deposit_transaction_count': """
+  SELECT tl.transaction AS value, tl.trandate AS day, t.paymentmethod AS segment, tl.transaction AS header
+  """ + CASH_LINES_SQL.replace('{type}', 'CustDep'),
+    'customer_payments.payment_transaction_count': """
+  SELECT tl.transaction AS value, tl.trandate AS day, t.paymentmethod AS segment, tl.transaction AS header
+  """ + CASH_LINES_SQL.replace('{type}', 'CustPymt'),
+}
+
+# Tables the metrics read -> what stands in for them in a local Parquet export (None = required)
+SOURCE_TABLES: Dict[str, Optional[str]] = {
+    'transactions_analysis': "SELECT * FROM gpc.transactions",
+    'transaction': "SELECT * FROM gpc.transactions",
+    'transaction_lines': None,
+    'locations': None,
+    'fulfillment_lines': None,
+}
+
+# Shared by the BigQuery builder; gpc.hll_count_merge is what the distinct_counts cube calls
+BQ_UDAF_SQL = """CREATE OR REPLACE AGGREGATE FUNCTION gpc.hll_count_merge(sketch BYTES)
+RETURNS INT64 AS (HLL_COUNT.MERGE(sketch));"""
+
+
+def source_tables(substitutes: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    tables = {name: f"gpc.{name}" for name in SOURCE_TABLES}
+    tables.update({name: f"({sql})" for name, sql in (substitutes or {}).items()})
+    return tables
+
+
+def months_where(months: List[str]) -> str:
+    return ' OR '.join("day BETWEEN DATE '{}' AND DATE '{}'".format(*month_range(m)) for m in months)
+
+
+def rows_sql(metric: str, tables: Dict[str, str], where: Optional[str] = None) -> str:
+    """(value, day, segment) rows of a metric with a value and a date, optionally filtered further"""
+    sql = f"SELECT * FROM ({METRICS[metric].format(**tables)}\n) m\nWHERE value IS NOT NULL AND day IS NOT NULL"
+    return sql + f" AND ({where})" if where else sql
+
+
+def months_sql(since: str, metrics: Dict[str, Dict[str, str]]) -> str:
+    """Months (YYYY-MM) holding rows of headers modified on/after since, each metric by its own day
+    (shipdate for fulfillments, so a late shipment of an old order rebuilds the shipping month)"""
+    modified = f"header IN (SELECT id FROM gpc.transactions WHERE lastmodifieddate >= DATE '{since}')"
+    return '\nUNION DISTINCT\n'.join(
+        f"SELECT DISTINCT FORMAT_DATE('%Y-%m', day) AS month FROM ({rows_sql(metric, tables, modified)})"
+        for metric, tables in metrics.items())
+
+
+def sparse_registers(registers) -> list:
+    """Non-empty HyperLogLog registers as register * 64 + rank codes (local sketch format)"""
+    import numpy as np
+
+    index = np.flatnonzero(registers)
+    return (index * 64 + registers[index]).astype(np.int32).tolist()
+
+
+class LocalBuilder:
+    """Rewrites month partitions under LOCAL_PARQUET_DIR/distinct_sketches"""
+
+    def __init__(self):
+        import duckdb
+        from local_engine import PARTITION_COLUMN, build_init_sql, discover_tables, parquet_dir
+
+        self.root = parquet_dir()
+        self.partition_column = PARTITION_COLUMN
+        self.tables = discover_tables(self.root)
+        # In-memory database: the persistent file may be locked by a running Cube server
+        self.conn = duckdb.connect()
+        self.conn.execute(build_init_sql(self.root))
+
+    def metrics(self) -> Dict[str, Dict[str, str]]:
+        """Metric -> source tables, for the metrics whose tables exist locally"""
+        substitutes = {name: sql for name, sql in SOURCE_TABLES.items() if sql and name not in self.tables}
+        tables = source_tables(substitutes)
+        available = {}
+        for metric, sql in METRICS.items():
+            missing = [name for name, stand_in in SOURCE_TABLES.items()
+                       if stand_in is None and name not in self.tables and f"{{{name}}}" in sql]
+            if missing:
+                print(f"{Colors.YELLOW}! {metric}: {', '.join(missing)} not in {self.root} - skipped{Colors.NC}")
+            else:
+                available[metric] = tables
+        return available
+
+    def months(self, since: Optional[str], metrics: Dict[str, Dict[str, str]]) -> List[str]:
+        """Months holding rows of modified headers, or every month holding rows of a metric"""
+        if since:
+            sql = months_sql(since, metrics)
+        else:
+            sql = '\nUNION\n'.join(f"SELECT DISTINCT strftime(day, '%Y-%m') FROM ({rows_sql(metric, tables)})"
+                                    for metric, tables in metrics.items())
+        return sorted(row[0] for row in self.conn.execute(sql).fetchall())
+
+    def sketch_month(self, month: str, metrics: Dict[str, Dict[str, str]]):
+        import numpy as np
+        import pyarrow as pa
+        from sketches import HyperLogLog
+
+        start, _ = month_range(month)
+        rows = {'metric': [], 'month': [], 'segment': [], 'sketch': []}
+        for metric, tables in metrics.items():
+            hashed = self.conn.execute(
+                f"SELECT COALESCE(CAST(segment AS VARCHAR), '{NO_SEGMENT}') AS segment, hash(value) AS h\n"
+                f"FROM ({rows_sql(metric, tables, months_where([month]))})").to_arrow_table()
+            if hashed.num_rows == 0:
+                continue
+            segments, inverse = np.unique(np.array(hashed.column('segment').to_pylist(), dtype=object),
+                                          return_inverse=True)
+            hashes = hashed.column('h').to_numpy()
+            order = np.argsort(inverse, kind='stable')
+            bounds = np.searchsorted(inverse[order], np.arange(len(segments) + 1))
+            for i, segment in enumerate(segments):
+                sketch = HyperLogLog(HLL_PRECISION)
+                sketch.add_hashes(hashes[order[bounds[i]:bounds[i + 1]]])
+                rows['metric'].append(metric)
+                rows['month'].append(start)
+                rows['segment'].append(segment)
+                rows['sketch'].append(sparse_registers(sketch.registers))
+        return pa.table({
+            'metric': pa.array(rows['metric'], pa.string()),
+            'month': pa.array(rows['month'], pa.string()).cast(pa.date32()),
+            'segment': pa.array(rows['segment'], pa.string()),
+            'sketch': pa.array(rows['sketch'], pa.list_(pa.int32())),
+        })
+
+    def build(self, months: Optional[List[str]], since: Optional[str], full: bool) -> int:
+        import pyarrow.parquet as pq
+
+        metrics = self.metrics()
+        if not metrics:
+            raise RuntimeError("No metric has its source tables locally")
+        if full or SKETCH_TABLE not in self.tables:
+            months = self.months(None, metrics)
+        elif since:
+            months = self.months(since, metrics)
+
+        rows = 0
+        for month in months or []:
+            start = time.time()
+            table = self.sketch_month(month, metrics)
+            path = os.path.join(self.root, SKETCH_TABLE, f"{self.partition_column}={month}", 'part-0.parquet')
+            if table.num_rows == 0:
+                if os.path.exists(path):
+                    os.remove(path)
+                continue
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Written next to the final file under a non-.parquet name, then swapped in atomically
+            pq.write_table(table, path + '.tmp', compression='zstd')
+            os.replace(path + '.tmp', path)
+            rows += table.num_rows
+            print(f"  {month}: {table.num_rows:,} sketches ({time.time() - start:.1f}s)")
+        return rows
+
+
+class BigQueryBuilder:
+    """DELETE + INSERT of the months in scope in gpc.distinct_sketches"""
+
+    def __init__(self, project: str = DEFAULT_BQ_PROJECT):
+        from google.cloud import bigquery
+        self.client = bigquery.Client(project=project)
+
+    def exists(self) -> bool:
+        from google.api_core.exceptions import NotFound
+        try:
+            self.client.get_table(f"gpc.{SKETCH_TABLE}")
+            return True
+        except NotFound:
+            return False
+
+    @staticmethod
+    def sketch_sql(where: Optional[str]) -> str:
+        tables = source_tables()
+        return '\nUNION ALL\n'.join(
+            f"SELECT '{metric}' AS metric, DATE_TRUNC(day, MONTH) AS month,\n"
+            f"  COALESCE(segment, '{NO_SEGMENT}') AS segment, HLL_COUNT.INIT(value, {HLL_PRECISION}) AS sketch\n"
+            f"FROM ({rows_sql(metric, tables, where)})\nGROUP BY month, segment"
+            for metric in METRICS)
+
+    @classmethod
+    def script(cls, months: Optional[List[str]], since: Optional[str], full: bool) -> str:
+        if full:
+            return (f"{BQ_UDAF_SQL}\n"
+                    f"CREATE OR REPLACE TABLE gpc.{SKETCH_TABLE}\n"
+                    "PARTITION BY month\nCLUSTER BY metric, segment AS\n"
+                    + cls.sketch_sql(None) + ';')
+        declare = ''
+        if since:
+            # Evaluated once: the scope reads every metric's sources
+            months_in_scope = months_sql(since, {metric: source_tables() for metric in METRICS})
+            declare = ("DECLARE rebuild_months ARRAY<DATE> DEFAULT (\n"
+                       f"  SELECT ARRAY_AGG(PARSE_DATE('%Y-%m', month)) FROM ({months_in_scope}));\n")
+            scope = "SELECT month FROM UNNEST(rebuild_months) AS month"
+            where = "DATE_TRUNC(day, MONTH) IN UNNEST(rebuild_months)"
+        else:
+            scope = ', '.join(f"DATE '{month_range(m)[0]}'" for m in months)
+            where = months_where(months)
+        return (
+            f"{declare}{BQ_UDAF_SQL}\n"
+            "BEGIN TRANSACTION;\n"
+            f"DELETE FROM gpc.{SKETCH_TABLE}\nWHERE month IN ({scope});\n"
+            f"INSERT INTO gpc.{SKETCH_TABLE}\n" + cls.sketch_sql(where) + ';\n'
+            "COMMIT TRANSACTION;"
+        )
+
+    def build(self, months: Optional[List[str]], since: Optional[str], full: bool) -> int:
+        job = self.client.query(self.script(months, since, full or not self.exists()))
+        job.result()
+        rows = sum((child.num_dml_affected_rows or 0) for child in self.client.list_jobs(parent_job=job.job_id)
+                   if child.statement_type == 'INSERT')
+        return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Materialize mergeable HLL sketches in gpc.distinct_sketches')
+    parser.add_argument('--engine', choices=['local', 'bigquery'], default='local',
+                        help='Where to build the table (default: local Parquet)')
+    parser.add_argument('--project', default=DEFAULT_BQ_PROJECT, help='BigQuery project for --engine bigquery')
+    scope = parser.add_mutually_exclusive_group(required=True)
+    scope.add_argument('--since', help='Rebuild months of transactions modified on/after this date (YYYY-MM-DD)')
+    scope.add_argument('--months', help='Rebuild these months (YYYY-MM,YYYY-MM)')
+    scope.add_argument('--full', action='store_true', help='Rebuild the whole table')
+    parser.add_argument('--print-sql', action='store_true', help='Print the BigQuery script instead of running it')
+    args = parser.parse_args()
+
+    months = [m.strip() for m in args.months.split(',')] if args.months else None
+    if args.print_sql:
+        print(BigQueryBuilder.script(months, args.since, args.full))
+        return
+
+    print(f"{Colors.BOLD}{'='*80}{Colors.NC}")
+    print(f"{Colors.BOLD}BUILD gpc.{SKETCH_TABLE}{Colors.NC}  (engine: {args.engine}, precision {HLL_PRECISION})")
+    print(f"{Colors.BOLD}{'='*80}{Colors.NC}")
+
+    start = time.time()
+    try:
+        builder = BigQueryBuilder(args.project) if args.engine == 'bigquery' else LocalBuilder()
+        rows = builder.build(months, args.since, args.full)
+    except Exception as e:
+        print(f"{Colors.RED}✗ Build failed: {e}{Colors.NC}")
+        sys.exit(1)
+    print(f"{Colors.GREEN}✓ {rows:,} sketches written in {time.time() - start:.1f}s{Colors.NC}")
+
+
+if __name__ == '__main__':
+    main()
@@ -2,6 +2,10 @@
 -- Purpose: Eliminates bidirectional pairs (A+B and B+A) by canonicalizing category/section ordering
 -- Uses LEAST/GREATEST to ensure each pair appears only once while preserving all data
 -- Fixes issue where WHERE clause filtering lost data (45% loss for cross-gender pairs)
+--
+-- 2026-10-17: The cross_sell cube reads gpc.cross_sell_pairs_monthly instead, built month by month
+-- by cross_sell_pairs.py with the same canonicalization (month grain, counts summed over the days).
+-- This view is kept as the reference definition.
 
 CREATE OR REPLACE VIEW `magical-desktop.gpc.cross_sell_deduplicated` AS
 
@@ -7,6 +7,7 @@
 -- 2025-11-27: Created to include SalesOrd/RtnAuth for pipeline metrics (OM003)
 -- 2025-11-30: FIXED to include revenue transactions (CustInvc, CashSale, etc.)
 -- 2026-02-05: Added UNION with transactions_itemship for OM002 fulfilled orders (v74)
+-- 2026-10-17: Date columns are DATE (typed at ingest) - no PARSE/FORMAT_DATE round trip
 --
 -- ISSUE (2026-02-05):
 -- ItemShip transactions are stored in a separate table (transactions_itemship)
@@ -37,9 +38,9 @@ SELECT
   voided,
   createddate,
   lastmodifieddate,
-  CAST(NULL AS STRING) AS closedate,  -- Not in itemship
-  CAST(NULL AS STRING) AS actualshipdate,  -- Not in itemship
-  CAST(NULL AS STRING) AS shipdate,  -- Not in itemship
+  CAST(NULL AS DATE) AS closedate,  -- Not in itemship
+  CAST(NULL AS DATE) AS actualshipdate,  -- Not in itemship
+  CAST(NULL AS DATE) AS shipdate,  -- Not in itemship
   shipmethod,
   shipcarrier,
   CAST(NULL AS STRING) AS memo,  -- Not in itemship
@@ -86,7 +87,7 @@ SELECT
   id,
   type,
   tranid,
-  FORMAT_DATE('%d/%m/%Y', PARSE_DATE('%Y-%m-%d', trandate)) AS trandate,  -- Convert YYYY-MM-DD to DD/MM/YYYY
+  trandate,  -- DATE in both tables since ingest_netsuite.py (was YYYY-MM-DD vs DD/MM/YYYY strings)
   status,
   entity,
   subsidiary,
@@ -100,9 +101,9 @@ SELECT
   voided,
   createddate,
   lastmodifieddate,
-  CAST(NULL AS STRING) AS closedate,
-  CAST(NULL AS STRING) AS actualshipdate,
-  CAST(NULL AS STRING) AS shipdate,
+  CAST(NULL AS DATE) AS closedate,
+  CAST(NULL AS DATE) AS actualshipdate,
+  CAST(NULL AS DATE) AS shipdate,
   shipmethod,
   shipcarrier,
   CAST(NULL AS STRING) AS memo,
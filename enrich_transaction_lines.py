@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+Build stage for gpc.transaction_lines_enriched, the table the transaction_lines cube reads
+
+The enrichment used to live in the cube SQL, so every uncached query and every
+partition build re-ran three CTEs (COGS and OPEX totals per transaction,
+days_to_ship from item shipments), three joins and the per-transaction window
+passes over the whole denormalized MV. This script materializes the same
+columns once:
+- every transaction_lines_denormalized_mv column
+- transaction_total_abs                          ABS(SUM(amount)) over the transaction
+- transaction_shipdate / _billing_country / _shipping_country / _createddate   from the header
+- days_to_ship                                   first item shipment - header createddate
+- line_gl_cogs_allocated / line_opex_allocated   GL totals spread evenly over the transaction's lines
+
+Every value depends on one transaction only, so the table is rebuilt
+incrementally, keyed by transaction:
+- BigQuery: DELETE + INSERT of the transactions in scope, in one transaction
+- local engine: the month partitions (Parquet) holding those transactions are rewritten
+
+Scopes:
+    --since 2026-10-01        transactions whose header lastmodifieddate is on/after the date
+    --months 2025-09,2025-10  every transaction dated in those months
+    --full                    everything (also used when the table doesn't exist yet)
+
+Usage:
+    python3 enrich_transaction_lines.py --full                      # local Parquet
+    python3 enrich_transaction_lines.py --since 2026-10-01
+    python3 enrich_transaction_lines.py --engine bigquery --since 2026-10-01
+    python3 enrich_transaction_lines.py --engine bigquery --print-sql --months 2025-10
+
+Sources must be loaded with ingest_netsuite.py (INT64 keys, DATE columns): the
+joins compare native keys and dates are read without PARSE_DATE.
+
+Run it before partition_refresh.py so the rollup rebuild sees the new rows.
+"""
+
+import os
+import sys
+import time
+import argparse
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+# Colors for output
+class Colors:
+    RED = '\033[0;31m'
+    GREEN = '\033[0;32m'
+    YELLOW = '\033[1;33m'
+    BLUE = '\033[0;34m'
+    BOLD = '\033[1m'
+    NC = '\033[0m'  # No Color
+
+
+ENRICHED_TABLE = 'transaction_lines_enriched'
+DEFAULT_BQ_PROJECT = os.environ.get('CUBEJS_DB_BQ_PROJECT_ID', 'gym-plus-coffee')
+
+# Dialect-specific pieces of ENRICH_SQL
+DAYS_TO_SHIP = {
+    'bigquery': "DATE_DIFF(MIN(itemship.trandate), MIN(t.createddate), DAY)",
+    'duckdb': "date_diff('day', MIN(t.createddate), MIN(itemship.trandate))",
+}
+
+# Empty stand-ins for sources a local Parquet export may not include (BigQuery has them all)
+OPTIONAL_TABLES = {
+    'transaction_accounting_lines_opex':
+        "SELECT CAST(NULL AS INT64) AS transaction, CAST(NULL AS FLOAT64) AS amount WHERE FALSE",
+    'transaction_lines_itemship':
+        "SELECT CAST(NULL AS INT64) AS createdfrom, CAST(NULL AS INT64) AS transaction WHERE FALSE",
+    'transactions_itemship':
+        "SELECT CAST(NULL AS INT64) AS id, CAST(NULL AS STRING) AS type, "
+        "CAST(NULL AS DATE) AS trandate WHERE FALSE",
+}
+
+# Same logic as the former transaction_lines cube SQL; {in_scope} restricts every input to the
+# transactions being rebuilt (empty for a full build)
+ENRICH_SQL = """
+WITH {scope_cte}lines AS (
+  SELECT * FROM gpc.transaction_lines_denormalized_mv{in_scope}
+),
+cogs_aggregated AS (
+  SELECT
+    transaction,
+    SUM(ABS(amount)) as gl_cogs_total
+  FROM gpc.transaction_accounting_lines_cogs{in_scope}
+  GROUP BY 1
+),
+opex_aggregated AS (
+  SELECT
+    transaction,
+    SUM(ABS(CAST(amount AS FLOAT64))) as opex_total
+  FROM {transaction_accounting_lines_opex}{in_scope}
+  GROUP BY 1
+),
+transaction_ship_days AS (
+  SELECT
+    tl.transaction as transaction_id,
+    {days_to_ship} as days_to_ship
+  FROM lines tl
+  LEFT JOIN gpc.transactions t
+    ON tl.transaction = t.id
+  LEFT JOIN {transaction_lines_itemship} itemship_line
+    ON itemship_line.createdfrom = tl.transaction
+  LEFT JOIN {transactions_itemship} itemship
+    ON itemship.id = itemship_line.transaction
+    AND itemship.type = 'ItemShip'
+  WHERE itemship.trandate IS NOT NULL
+    AND t.createddate IS NOT NULL
+  GROUP BY tl.transaction
+)
+SELECT
+  {line_columns},
+  ABS(SUM(tl.amount) OVER (PARTITION BY tl.transaction)) as transaction_total_abs,
+  t.shipdate as transaction_shipdate,
+  t.billing_country as transaction_billing_country,
+  t.shipping_country as transaction_shipping_country,
+  t.createddate as transaction_createddate,
+  ship_days.days_to_ship,
+  COALESCE(cogs.gl_cogs_total, 0) / COUNT(*) OVER (PARTITION BY tl.transaction) as line_gl_cogs_allocated,
+  COALESCE(opex.opex_total, 0) / COUNT(*) OVER (PARTITION BY tl.transaction) as line_opex_allocated
+FROM lines tl
+LEFT JOIN gpc.transactions t ON tl.transaction = t.id
+LEFT JOIN cogs_aggregated cogs ON tl.transaction = cogs.transaction
+LEFT JOIN opex_aggregated opex ON tl.transaction = opex.transaction
+LEFT JOIN transaction_ship_days ship_days ON tl.transaction = ship_days.transaction_id"""
+
+
+def month_range(month: str) -> tuple:
+    start = datetime.strptime(month, '%Y-%m').date()
+    end = (start.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+    return start.isoformat(), end.isoformat()
+
+
+def scope_sql(months: Optional[List[str]] = None, since: Optional[str] = None) -> str:
+    """Transaction ids (INT64 column `transaction`) to rebuild; no arguments = all"""
+    if since:
+        return ("SELECT id AS transaction FROM gpc.transactions\n"
+                f"  WHERE lastmodifieddate >= DATE '{since}'")
+    sql = "SELECT DISTINCT transaction FROM gpc.transaction_lines_denormalized_mv"
+    if months:
+        ranges = ' OR '.join("transaction_date BETWEEN DATE '{}' AND DATE '{}'".format(*month_range(m))
+                             for m in months)
+        sql += f"\n  WHERE {ranges}"
+    return sql
+
+
+def enrich_sql(dialect: str, scope: Optional[str], line_columns: str = 'tl.*',
+               substitutes: Optional[Dict[str, str]] = None) -> str:
+    tables = {name: f"gpc.{name}" for name in OPTIONAL_TABLES}
+    tables.update({name: f"({sql})" for name, sql in (substitutes or {}).items()})
+    return ENRICH_SQL.format(
+        scope_cte=f"scope AS (\n  {scope}\n),\n" if scope else '',
+        in_scope="\n  WHERE transaction IN (SELECT transaction FROM scope)" if scope else '',
+        days_to_ship=DAYS_TO_SHIP[dialect], line_columns=line_columns, **tables)
+
+
+class LocalBuilder:
+    """Rewrites the affected month partitions under LOCAL_PARQUET_DIR/transaction_lines_enriched"""
+
+    def __init__(self):
+        import duckdb
+        from local_engine import PARTITION_COLUMN, build_init_sql, discover_tables, parquet_dir
+
+        self.root = parquet_dir()
+        self.partition_column = PARTITION_COLUMN
+        self.tables = discover_tables(self.root)
+        # In-memory database: the persistent file may be locked by a running Cube server
+        self.conn = duckdb.connect()
+        self.conn.execute(build_init_sql(self.root))
+
+    def columns(self, table: str) -> List[str]:
+        return [row[0] for row in self.conn.execute(f"DESCRIBE SELECT * FROM gpc.{table}").fetchall()]
+
+    def affected_months(self, scope: str) -> List[str]:
+        """Months holding the scoped transactions now, or in the previous enriched build"""
+        sql = ("SELECT DISTINCT FORMAT_DATE('%Y-%m', transaction_date) FROM gpc.transaction_lines_denormalized_mv\n"
+               f"WHERE transaction IN ({scope})")
+        if ENRICHED_TABLE in self.tables:
+            sql += (f"\nUNION SELECT DISTINCT {self.partition_column} FROM gpc.{ENRICHED_TABLE}\n"
+                    f"WHERE transaction IN ({scope})")
+        return sorted(row[0] for row in self.conn.execute(sql).fetchall() if row[0])
+
+    def build(self, months: Optional[List[str]], since: Optional[str], full: bool) -> int:
+        missing = [t for t in ('transaction_lines_denormalized_mv', 'transactions', 'transaction_accounting_lines_cogs')
+                   if t not in self.tables]
+        if missing:
+            raise RuntimeError(f"Missing local tables: {', '.join(missing)}")
+
+        substitutes = {name: sql for name, sql in OPTIONAL_TABLES.items() if name not in self.tables}
+        for name in substitutes:
+            print(f"{Colors.YELLOW}! {name} not in {self.root} - treated as empty{Colors.NC}")
+
+        line_columns = 'tl.*'
+        if self.partition_column in self.columns('transaction_lines_denormalized_mv'):
+            line_columns = f"tl.* EXCLUDE ({self.partition_column})"
+
+        if full or ENRICHED_TABLE not in self.tables:
+            months = self.affected_months(scope_sql())
+        elif since:
+            months = self.affected_months(scope_sql(since=since))
+
+        rows = 0
+        table_dir = os.path.join(self.root, ENRICHED_TABLE)
+        for month in months or []:
+            start = time.time()
+            sql = enrich_sql('duckdb', scope_sql(months=[month]), line_columns, substitutes)
+            path = os.path.join(table_dir, f"{self.partition_column}={month}", 'part-0.parquet')
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Written next to the final file under a non-.parquet name, then swapped in atomically
+            tmp_path = path + '.tmp'
+            self.conn.execute(f"COPY ({sql}\nORDER BY transaction_date, transaction) TO '{tmp_path}' "
+                              "(FORMAT PARQUET, COMPRESSION ZSTD)")
+            count = self.conn.execute(f"SELECT COUNT(*) FROM read_parquet('{tmp_path}')").fetchone()[0]
+            if count:
+                os.replace(tmp_path, path)
+            else:
+                os.remove(tmp_path)
+                if os.path.exists(path):
+                    os.remove(path)
+            rows += count
+            print(f"  {month}: {count:,} lines ({time.time() - start:.1f}s)")
+        return rows
+
+
+class BigQueryBuilder:
+    """DELETE + INSERT of the scoped transactions in gpc.transaction_lines_enriched"""
+
+    def __init__(self, project: str = DEFAULT_BQ_PROJECT):
+        from google.cloud import bigquery
+        self.client = bigquery.Client(project=project)
+
+    def exists(self) -> bool:
+        from google.api_core.exceptions import NotFound
+        try:
+            self.client.get_table(f"gpc.{ENRICHED_TABLE}")
+            return True
+        except NotFound:
+            return False
+
+    @staticmethod
+    def script(months: Optional[List[str]], since: Optional[str], full: bool) -> str:
+        if full:
+            return (f"CREATE OR REPLACE TABLE gpc.{ENRICHED_TABLE}\n"
+                    "PARTITION BY DATE_TRUNC(transaction_date, MONTH)\nCLUSTER BY transaction AS"
+                    + enrich_sql('bigquery', None) + ';')
+        scope = scope_sql(months, since)
+        return (
+            "BEGIN TRANSACTION;\n"
+            f"DELETE FROM gpc.{ENRICHED_TABLE}\nWHERE transaction IN ({scope});\n"
+            f"INSERT INTO gpc.{ENRICHED_TABLE}" + enrich_sql('bigquery', scope) + ';\n'
+            "COMMIT TRANSACTION;"
+        )
+
+    def build(self, months: Optional[List[str]], since: Optional[str], full: bool) -> int:
+        job = self.client.query(self.script(months, since, full or not self.exists()))
+        job.result()
+        rows = sum((child.num_dml_affected_rows or 0) for child in self.client.list_jobs(parent_job=job.job_id)
+                   if child.statement_type == 'INSERT')
+        return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Materialize gpc.transaction_lines_enriched incrementally')
+    parser.add_argument('--engine', choices=['local', 'bigquery'], default='local',
+                        help='Where to build the table (default: local Parquet)')
+    parser.add_argument('--project', default=DEFAULT_BQ_PROJECT, help='BigQuery project for --engine bigquery')
+    scope = parser.add_mutually_exclusive_group(required=True)
+    scope.add_argument('--since', help='Rebuild transactions modified on/after this date (YYYY-MM-DD)')
+    scope.add_argument('--months', help='Rebuild transactions dated in these months (YYYY-MM,YYYY-MM)')
+    scope.add_argument('--full', action='store_true', help='Rebuild the whole table')
+    parser.add_argument('--print-sql', action='store_true', help='Print the BigQuery script instead of running it')
+    args = parser.parse_args()
+
+    months = [m.strip() for m in args.months.split(',')] if args.months else None
+    if args.print_sql:
+        print(BigQueryBuilder.script(months, args.since, args.full))
+        return
+
+    print(f"{Colors.BOLD}{'='*80}{Colors.NC}")
+    print(f"{Colors.BOLD}ENRICH gpc.{ENRICHED_TABLE}{Colors.NC}  (engine: {args.engine})")
+    print(f"{Colors.BOLD}{'='*80}{Colors.NC}")
+
+    start = time.time()
+    try:
+        builder = BigQueryBuilder(args.project) if args.engine == 'bigquery' else LocalBuilder()
+        rows = builder.build(months, args.since, args.full)
+    except Exception as e:
+        print(f"{Colors.RED}✗ Build failed: {e}{Colors.NC}")
+        sys.exit(1)
+    print(f"{Colors.GREEN}✓ {rows:,} lines written in {time.time() - start:.1f}s{Colors.NC}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,572 @@
+#!/usr/bin/env python3
+"""
+Synthetic NetSuite-shaped dataset generator for scale benchmarks
+
+Writes Parquet in the layout read by local_engine.py (one directory per
+table, Hive-style partition_month=YYYY-MM partitions for the fact tables) so
+the model can be benchmarked offline at 1x-10x today's volume.
+
+The data reproduces the quirks the cubes depend on:
+- transactions.trandate / createddate are DD/MM/YYYY strings, id and foreigntotal are STRING
+- sales lines carry negative quantities and amounts (revenue = amount * -1)
+- every order has a mainline header line, a taxline and one iscogs line per item line,
+  and some orders a transactiondiscount line; the lines are written both to
+  transaction_lines_denormalized_mv and, without the denormalized attributes, to the raw transaction_lines
+- ~2% of lines are custom lines with rate NULL that carry the full transaction amount
+- item popularity, location volume and customer repeat purchases are Zipf-skewed;
+  basket sizes are geometric with a long B2B tail
+
+Not generated: fulfillment_lines and deposit/payment transactions (CustDep, CustPymt,
+DepAppl), so the fulfillment sketches in distinct_sketches.py are skipped and the deposit
+and payment metrics stay empty on synthetic data. Run ingest_netsuite.py on the output
+before the build jobs (materialize_clean_tables.py, distinct_sketches.py): it types the
+string dates and keys.
+
+Volumes at scale 1.0 approximate production (~9.5M transaction_lines_denormalized_mv
+rows, ~1.4M transactions over Jan 2022 - Oct 2025). Fact tables scale linearly with
+--scale; the item catalogue and customer base grow with sqrt(scale).
+
+Usage:
+    python generate_synthetic_data.py                          # 1x into LOCAL_PARQUET_DIR
+    python generate_synthetic_data.py --scale 10 --out /data/parquet_10x
+    python generate_synthetic_data.py --scale 0.01 --start 2025-01 --end 2025-03
+"""
+
+import os
+import time
+import argparse
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from local_engine import PARTITION_COLUMN, parquet_dir
+
+# Colors for output
+class Colors:
+    GREEN = '\033[0;32m'
+    YELLOW = '\033[1;33m'
+    BLUE = '\033[0;34m'
+    BOLD = '\033[1m'
+    NC = '\033[0m'  # No Color
+
+
+# Volumes at scale 1.0 over the full Jan 2022 - Oct 2025 range
+BASE_MONTHS = 46
+BASE_ORDERS = 1_430_000
+BASE_ITEMS = 15_000
+BASE_CUSTOMERS = 400_000
+BASE_PURCHASE_ORDERS = 14_000
+ROW_GROUP_SIZE = 122_880
+
+# Transaction type mix (sales types produce negative quantities)
+TRANSACTION_TYPES = ['CashSale', 'CustInvc', 'SalesOrd', 'ItemShip', 'CustCred', 'CashRfnd']
+TRANSACTION_TYPE_P = [0.36, 0.28, 0.22, 0.06, 0.05, 0.03]
+RETURN_TYPES = {'CustCred', 'CashRfnd'}
+
+# name, subsidiary, relative order volume
+LOCATIONS: List[Tuple[str, int, float]] = [
+    ('Bleckmann BE', 2, 30.0), ('Bleckmann UK', 6, 14.0), ('Bleckmann USA', 6, 6.0),
+    ('Bleckmann Australia', 6, 2.0), ('Meteor Space', 2, 3.0), ('2Flow', 2, 1.5),
+    ('Dundrum Town Centre', 2, 4.0), ('Mahon Point', 2, 2.0), ('Crescent Centre', 2, 1.5),
+    ('Liffey Valley', 2, 2.0), ('Kildare Village', 2, 2.5), ('Blanchardstown Centre', 2, 1.5),
+    ('Galway', 2, 1.2), ('Swords Pavillon', 2, 1.0), ('Jervis Centre', 2, 1.0),
+    ('Westfield London', 6, 2.0), ('Manchester', 6, 1.0), ('Belfast', 6, 0.8), ('Liverpool', 6, 0.6),
+    ('Wholesale IE', 2, 0.8), ('Wholesale UK', 6, 0.5), ('Lifestyle Sports B2B', 2, 0.6),
+    ('Otrium', 2, 0.4), ('The Very Group', 6, 0.3), ('Digme', 2, 0.1), ('Academy Crests', 2, 0.1),
+    ('Events Dublin', 2, 0.2), ('Bleckmann BE Quarantine', 2, 0.05), ('Kildare B Stock', 2, 0.05),
+    ('Headquarters Dublin', 2, 0.02), ('PCH China', 2, 0.0),
+]
+WHOLESALE_PREFIXES = ('Wholesale', 'Lifestyle Sports', 'The Very Group')
+
+CATEGORIES = ['Unisex', 'Women', 'Men', 'Children', 'Accessories']
+SECTIONS = ['Hoodies', 'Sweatshirts', 'Joggers', 'T-Shirts', 'Shorts', 'Jackets', 'Leggings', 'Caps', 'Socks']
+COLLECTIONS = ['Essentials', 'Relaxed', 'Signature', 'Performance', 'Heritage', 'Limited']
+COLOURS = ['Black', 'Grey Marl', 'Navy', 'Sand', 'Sage', 'Cream', 'Stone', 'Burgundy', 'Sky Blue', 'Forest']
+SIZES = ['XS', 'S', 'M', 'L', 'XL', 'XXL', 'OS']
+RANGES = ['Core', 'Seasonal', 'Collab']
+GBP_EUR_RATE = 1.17
+VAT_RATE = 0.23
+
+
+def zipf_weights(n: int, s: float) -> np.ndarray:
+    """Normalized 1/rank^s probabilities"""
+    weights = 1.0 / np.arange(1, n + 1) ** s
+    return weights / weights.sum()
+
+
+def month_range(start: str, end: str) -> List[Tuple[int, int]]:
+    year, month = map(int, start.split('-'))
+    end_year, end_month = map(int, end.split('-'))
+    months = []
+    while (year, month) <= (end_year, end_month):
+        months.append((year, month))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+
+def pick(rng: np.random.Generator, values: List[str], size: int, p=None) -> np.ndarray:
+    return np.asarray(values, dtype=object)[rng.choice(len(values), size=size, p=p)]
+
+
+class SyntheticGenerator:
+    def __init__(self, out_dir: str, scale: float, start: str, end: str, seed: int):
+        self.out_dir = out_dir
+        self.scale = scale
+        self.months = month_range(start, end)
+        self.rng = np.random.default_rng(seed)
+        self.rows: Dict[str, int] = {}
+
+        self.n_items = max(50, int(BASE_ITEMS * scale ** 0.5))
+        self.n_customers = max(100, int(BASE_CUSTOMERS * scale ** 0.5))
+        self.orders_per_month = BASE_ORDERS * scale / BASE_MONTHS
+        self.pos_per_month = max(1, int(BASE_PURCHASE_ORDERS * scale / BASE_MONTHS))
+
+        self.next_transaction = 10_000_000
+        self.next_line_uid = 1
+
+    # ------------------------------------------------------------------ writing
+
+    def write(self, table: str, data: Dict[str, pa.Array], partition: str = None):
+        path = os.path.join(self.out_dir, table)
+        if partition:
+            path = os.path.join(path, f"{PARTITION_COLUMN}={partition}")
+        os.makedirs(path, exist_ok=True)
+        pq.write_table(pa.table(data), os.path.join(path, 'part-0.parquet'),
+                       row_group_size=ROW_GROUP_SIZE, compression='zstd')
+        self.rows[table] = self.rows.get(table, 0) + len(next(iter(data.values())))
+
+    # --------------------------------------------------------------- dimensions
+
+    def build_dimensions(self):
+        rng = self.rng
+        n = self.n_items
+
+        # Popularity rank is random w.r.t. id so hot items are spread over the catalogue
+        self.item_ids = np.arange(1000, 1000 + n, dtype=np.int64)
+        self.item_p = zipf_weights(n, 1.1)[rng.permutation(n)]
+        self.item_price = np.round(rng.choice([15, 25, 35, 45, 55, 65, 85, 120], size=n) - 0.01, 2)
+        self.item_cost = np.round(self.item_price * rng.uniform(0.22, 0.38, size=n), 2)
+        self.item_category = pick(rng, CATEGORIES, n, p=[0.35, 0.3, 0.2, 0.08, 0.07])
+        self.item_section = pick(rng, SECTIONS, n)
+        self.item_collection = pick(rng, COLLECTIONS, n)
+        self.item_colour = pick(rng, COLOURS, n)
+        self.item_size = pick(rng, SIZES, n, p=[0.08, 0.2, 0.27, 0.24, 0.14, 0.05, 0.02])
+        season_year = rng.integers(22, 26, size=n)
+        self.item_season = np.char.add(pick(rng, ['SS', 'AW'], n).astype(str), season_year.astype(str)).astype(object)
+        self.item_range = pick(rng, RANGES, n, p=[0.6, 0.3, 0.1])
+        self.item_sku = np.char.mod('GPC-%06d', self.item_ids).astype(object)
+        self.item_name = (self.item_collection.astype(str) + ' ' + self.item_section.astype(str)).astype(object)
+
+        inactive = rng.random(n) < 0.08
+        self.write('items', {
+            'id': pa.array(self.item_ids),
+            'itemid': pa.array(self.item_sku, pa.string()),
+            'displayname': pa.array(self.item_name, pa.string()),
+            'description': pa.array(self.item_name + ' - ' + self.item_colour, pa.string()),
+            'itemtype': pa.array(np.full(n, 'InvtPart', dtype=object), pa.string()),
+            'isinactive': pa.array(np.where(inactive, 'T', 'F'), pa.string()),
+            'cost': pa.array(self.item_cost),
+            'lastpurchaseprice': pa.array(self.item_cost),
+            'custitem_gpc_category': pa.array(self.item_category, pa.string()),
+            'custitem_gpc_sections': pa.array(self.item_section, pa.string()),
+            'custitem_gpc_collection': pa.array(self.item_collection, pa.string()),
+            'custitem_gpc_parent_colour': pa.array(self.item_colour, pa.string()),
+            'custitem_gpc_child_colour': pa.array(self.item_colour, pa.string()),
+            'custitem_gpc_size': pa.array(self.item_size, pa.string()),
+            'custitem_gpc_season': pa.array(self.item_season, pa.string()),
+            'custitem_gpc_seasontype': pa.array(np.where(self.item_range == 'Core', 'Core', 'Seasonal'), pa.string()),
+            'custitem_gpc_range': pa.array(self.item_range, pa.string()),
+            'custitem_gpc_fabric': pa.array(pick(rng, ['Cotton', 'Polyester', 'Blend'], n), pa.string()),
+            'custitem_gpc_stylenumber': pa.array(np.char.mod('ST%05d', self.item_ids // 7), pa.string()),
+            'custitemmarkdown': pa.array(np.where(rng.random(n) < 0.15, 'T', 'F'), pa.string()),
+            'custitem_coo_iso2': pa.array(pick(rng, ['CN', 'PT', 'TR', 'BD'], n), pa.string()),
+        })
+
+        names = [loc[0] for loc in LOCATIONS]
+        self.location_ids = np.arange(1, len(LOCATIONS) + 1, dtype=np.int64)
+        self.location_subsidiary = np.array([loc[1] for loc in LOCATIONS], dtype=np.int64)
+        weights = np.array([loc[2] for loc in LOCATIONS])
+        self.location_p = weights / weights.sum()
+        self.location_name = np.asarray(names, dtype=object)
+        self.location_wholesale = np.array([name.startswith(WHOLESALE_PREFIXES) for name in names])
+        self.write('locations', {
+            'id': pa.array(self.location_ids),
+            'name': pa.array(names, pa.string()),
+            'subsidiary': pa.array(self.location_subsidiary),
+        })
+
+    def build_inventory(self):
+        """Point-in-time stock: popular items are stocked at more locations"""
+        rng = self.rng
+        stocking = [i for i, name in enumerate(self.location_name)
+                    if not name.startswith(('Headquarters', 'Events'))]
+        per_item = np.clip((self.item_p / self.item_p.max() * len(stocking)).astype(int), 1, len(stocking))
+        per_item = np.maximum(per_item, rng.integers(1, 4, size=self.n_items))
+        item_idx = np.repeat(np.arange(self.n_items), per_item)
+        location_idx = np.asarray(stocking)[
+            np.concatenate([rng.permutation(len(stocking))[:k] for k in per_item])]
+
+        quantity = np.round(rng.gamma(1.5, 40.0, size=len(item_idx)) * (self.item_p[item_idx] * self.n_items) ** 0.3)
+        backorder = rng.random(len(item_idx)) < 0.03
+        quantity[backorder] = -rng.integers(1, 20, size=backorder.sum())
+
+        self.write('inventory_calculated', {
+            'item': pa.array(self.item_ids[item_idx]),
+            'location': pa.array(self.location_ids[location_idx]),
+            'itemid': pa.array(self.item_sku[item_idx], pa.string()),
+            'displayname': pa.array(self.item_name[item_idx], pa.string()),
+            'calculated_quantity_available': pa.array(quantity),
+        })
+
+    # -------------------------------------------------------------------- facts
+
+    def build_month(self, year: int, month: int):
+        rng = self.rng
+        partition = f"{year:04d}-{month:02d}"
+        month_start = np.datetime64(f"{partition}-01", 'D')
+        days_in_month = int(((np.datetime64(partition, 'M') + 1).astype('datetime64[D]') - month_start).astype(int))
+
+        # Seasonality: Black Friday / Christmas peak, slow January
+        seasonality = {1: 0.8, 11: 1.6, 12: 1.4}.get(month, 1.0)
+        n = max(1, rng.poisson(self.orders_per_month * seasonality))
+
+        transaction_ids = np.arange(self.next_transaction, self.next_transaction + n, dtype=np.int64)
+        self.next_transaction += n
+
+        types = pick(rng, TRANSACTION_TYPES, n, p=TRANSACTION_TYPE_P)
+        is_return = np.isin(types, list(RETURN_TYPES))
+        sign = np.where(is_return, 1, -1)
+        day = rng.integers(0, days_in_month, size=n)
+        dates = month_start + day.astype('timedelta64[D]')
+        location_idx = rng.choice(len(self.location_ids), size=n, p=self.location_p)
+        subsidiary = self.location_subsidiary[location_idx]
+        wholesale = self.location_wholesale[location_idx]
+        customer = rng.choice(self.n_customers, size=n, p=self._customer_p())
+        emails = np.char.mod('customer%07d@example.com', customer).astype(object)
+
+        # Basket sizes: geometric for D2C/retail, long tail for wholesale orders
+        basket = np.minimum(rng.geometric(0.55, size=n), 25)
+        basket[wholesale] += rng.integers(5, 40, size=wholesale.sum())
+
+        order_idx = np.repeat(np.arange(n), basket)
+        m = len(order_idx)
+        item_idx = rng.choice(self.n_items, size=m, p=self.item_p)
+        units = np.where(wholesale[order_idx], rng.integers(2, 24, size=m), rng.integers(1, 3, size=m))
+        quantity = (units * sign[order_idx]).astype(np.float64)
+        rate = self.item_price[item_idx] * np.where(wholesale[order_idx], 0.5, 1.0)
+        amount = np.round(rate * quantity, 2)
+
+        # Custom lines (shipping, gift cards...) have no rate and carry the full transaction amount
+        custom = rng.random(m) < 0.02
+        order_total = np.bincount(order_idx, weights=amount, minlength=n)
+        amount[custom] = np.round(order_total[order_idx[custom]], 2)
+        rate_null = custom.copy()
+
+        tax = np.round(np.abs(amount) * VAT_RATE / (1 + VAT_RATE), 2)
+        cost = self.item_cost[item_idx]
+        cogs_amount = np.round(cost * np.abs(quantity), 2)
+
+        lines = self._line_columns(
+            transaction=transaction_ids[order_idx], order_idx=order_idx, item_idx=item_idx,
+            quantity=quantity, rate=rate, rate_null=rate_null, amount=amount, tax=tax, cost=cost,
+            mainline='F', taxline='F', iscogs='F', discount='F')
+
+        # Header, tax, COGS and discount lines of the same transactions
+        header_total = np.round(np.bincount(order_idx, weights=amount, minlength=n), 2)
+        tax_total = np.round(np.bincount(order_idx, weights=tax, minlength=n), 2)
+        all_orders = np.arange(n)
+        discounted = all_orders[rng.random(n) < 0.1]
+        cogs_rows = np.flatnonzero(~is_return[order_idx] & ~custom)
+
+        parts = [
+            lines,
+            self._line_columns(transaction=transaction_ids, order_idx=all_orders, item_idx=None,
+                               quantity=None, rate=None, rate_null=None, amount=header_total, tax=tax_total,
+                               cost=None, mainline='T', taxline='F', iscogs='F', discount='F'),
+            self._line_columns(transaction=transaction_ids, order_idx=all_orders, item_idx=None,
+                               quantity=None, rate=None, rate_null=None, amount=sign * tax_total, tax=None,
+                               cost=None, mainline='F', taxline='T', iscogs='F', discount='F'),
+            self._line_columns(transaction=transaction_ids[order_idx[cogs_rows]], order_idx=order_idx[cogs_rows],
+                               item_idx=item_idx[cogs_rows], quantity=quantity[cogs_rows], rate=None,
+                               rate_null=None, amount=-cogs_amount[cogs_rows], tax=None, cost=cost[cogs_rows],
+                               mainline='F', taxline='F', iscogs='T', discount='F'),
+            self._line_columns(transaction=transaction_ids[discounted], order_idx=discounted, item_idx=None,
+                               quantity=None, rate=None, rate_null=None,
+                               amount=np.round(-header_total[discounted] * 0.1, 2), tax=None, cost=None,
+                               mainline='F', taxline='F', iscogs='F', discount='T'),
+        ]
+        columns = {name: np.concatenate([part[name] for part in parts])
+                   for name in parts[0] if name not in ('_order', '_mask')}
+        order_of_line = np.concatenate([part['_order'] for part in parts])
+        masks = {name: np.concatenate([part['_mask'][name] for part in parts]) for name in parts[0]['_mask']}
+
+        # Sorted by date then transaction so row-group min/max stats prune on both
+        sort = np.lexsort((columns['transaction'], day[order_of_line]))
+        line_count = len(sort)
+        line_ids = np.arange(self.next_line_uid, self.next_line_uid + line_count, dtype=np.int64)
+        self.next_line_uid += line_count
+
+        o = order_of_line[sort]
+        i = columns['_item_idx'][sort]
+        has_item = i >= 0
+        i_safe = np.where(has_item, i, 0)
+
+        def item_attr(values: np.ndarray) -> pa.Array:
+            return pa.array(values[i_safe], pa.string(), mask=~has_item)
+
+        # Subsidiary 2 (IE) books in EUR, subsidiary 6 (UK) in GBP
+        gbp = subsidiary == 6
+        currency_id = np.where(gbp, 2, 1).astype(np.int64)
+        currency_name = np.where(gbp, 'GBP', 'EUR').astype(object)
+        exchange_rate = np.where(gbp, GBP_EUR_RATE, 1.0)
+
+        lines_mv = {
+            'id': pa.array(line_ids),
+            'transaction': pa.array(columns['transaction'][sort]),
+            'transaction_type': pa.array(types[o], pa.string()),
+            'transaction_date': pa.array(dates[o]),
+            'item': pa.array(self.item_ids[i_safe], mask=~has_item),
+            'location': pa.array(self.location_ids[location_idx[o]]),
+            'location_name': pa.array(self.location_name[location_idx[o]], pa.string()),
+            'subsidiary': pa.array(subsidiary[o]),
+            'department': pa.array(np.where(wholesale[o], 3, 1).astype(np.int64)),
+            'department_name': pa.array(np.where(wholesale[o], 'Wholesale', 'D2C'), pa.string()),
+            'class': pa.array(np.where(wholesale[o], 2, 1).astype(np.int64)),
+            'classification_name': pa.array(np.where(wholesale[o], 'B2B', 'Retail'), pa.string()),
+            'quantity': pa.array(columns['quantity'][sort], mask=masks['quantity'][sort]),
+            'quantitybilled': pa.array(np.abs(columns['quantity'][sort]), mask=masks['quantity'][sort]),
+            'quantitypacked': pa.array(np.abs(columns['quantity'][sort]), mask=masks['quantity'][sort]),
+            'rate': pa.array(columns['rate'][sort], mask=masks['rate'][sort]),
+            'baseprice': pa.array(self.item_price[i_safe], mask=~has_item),
+            'amount': pa.array(columns['amount'][sort]),
+            'foreignamount': pa.array(np.round(columns['amount'][sort] / exchange_rate[o], 2)),
+            'taxamount': pa.array(columns['tax'][sort], mask=masks['tax'][sort]),
+            'costestimate': pa.array(columns['cost'][sort], mask=masks['cost'][sort]),
+            'blandedcost': pa.array(np.round(columns['cost'][sort] * 0.08, 2), mask=masks['cost'][sort]),
+            'landedcostperline': pa.array(np.round(columns['cost'][sort] * 0.08, 2), mask=masks['cost'][sort]),
+            'estgrossprofit': pa.array(np.round(-columns['amount'][sort] - columns['cost'][sort] * np.abs(columns['quantity'][sort]), 2),
+                                       mask=masks['cost'][sort] | masks['quantity'][sort]),
+            'estgrossprofitpercent': pa.array(np.round(1 - columns['cost'][sort] / np.maximum(columns['rate'][sort], 0.01), 4),
+                                              mask=masks['cost'][sort] | masks['rate'][sort]),
+            'mainline': pa.array(columns['mainline'][sort], pa.string()),
+            'taxline': pa.array(columns['taxline'][sort], pa.string()),
+            'iscogs': pa.array(columns['iscogs'][sort], pa.string()),
+            'transactiondiscount': pa.array(columns['transactiondiscount'][sort], pa.string()),
+            'customer_email': pa.array(emails[o], pa.string()),
+            'category': item_attr(self.item_category),
+            'collection': item_attr(self.item_collection),
+            'color': item_attr(self.item_colour),
+            'season': item_attr(self.item_season),
+            'section': item_attr(self.item_section),
+            'size': item_attr(self.item_size),
+            'product_name': item_attr(self.item_name),
+            'product_range': item_attr(self.item_range),
+            'sku': item_attr(self.item_sku),
+            'currency_name': pa.array(currency_name[o], pa.string()),
+            'transaction_currency_id': pa.array(currency_id[o].astype(np.int64)),
+            'transaction_exchange_rate': pa.array(exchange_rate[o]),
+        }
+        self.write('transaction_lines_denormalized_mv', lines_mv, partition)
+
+        # Raw NetSuite line table: the same lines without the denormalized attributes
+        # (materialize_clean_tables.py, distinct_sketches.py and the deposit/payment cubes read it)
+        self.write('transaction_lines', {
+            'id': lines_mv['id'],
+            'transaction': lines_mv['transaction'],
+            'transaction_type': lines_mv['transaction_type'],
+            'trandate': lines_mv['transaction_date'],
+            'item': lines_mv['item'],
+            'location': lines_mv['location'],
+            'subsidiary': lines_mv['subsidiary'],
+            'department': lines_mv['department'],
+            'class': lines_mv['class'],
+            'createdfrom': pa.nulls(line_count, pa.int64()),
+            'quantity': lines_mv['quantity'],
+            'rate': lines_mv['rate'],
+            'amount': lines_mv['amount'],
+            'netamount': lines_mv['amount'],
+            'foreignamount': lines_mv['foreignamount'],
+            'taxamount': lines_mv['taxamount'],
+            'costestimate': lines_mv['costestimate'],
+            'mainline': lines_mv['mainline'],
+            'taxline': lines_mv['taxline'],
+            'iscogs': lines_mv['iscogs'],
+            'transactiondiscount': lines_mv['transactiondiscount'],
+        }, partition)
+
+        # Transaction headers: DD/MM/YYYY string dates and STRING numerics as exported from NetSuite
+        trandate = np.char.add(np.char.mod('%02d', day + 1), f"/{month:02d}/{year:04d}")
+        created_day = np.maximum(day + 1 - rng.integers(0, 2, size=n), 1)
+        createddate = np.char.add(np.char.mod('%02d', created_day), f"/{month:02d}/{year:04d}")
+        ship_day = np.minimum(day + rng.integers(1, 6, size=n), days_in_month - 1)
+        shipdate = (month_start + ship_day.astype('timedelta64[D]')).astype(str)
+        # Last edited a few days after shipping, possibly in the next month
+        modified = month_start + (ship_day + rng.integers(0, 3, size=n)).astype('timedelta64[D]')
+        modified_month = modified.astype('datetime64[M]')
+        months_since_epoch = modified_month.astype(np.int64)
+        lastmodifieddate = np.char.add(np.char.add(
+            np.char.mod('%02d/', (modified - modified_month).astype(np.int64) + 1),
+            np.char.mod('%02d/', months_since_epoch % 12 + 1)),
+            np.char.mod('%04d', months_since_epoch // 12 + 1970))
+        country = np.where(subsidiary == 6, 'GB', pick(rng, ['IE', 'DE', 'FR', 'NL', 'US', 'AU'], n,
+                                                       p=[0.6, 0.1, 0.08, 0.07, 0.1, 0.05]))
+        status = np.where(types == 'ItemShip', 'C', pick(rng, ['A', 'B', 'C'], n, p=[0.1, 0.85, 0.05]))
+
+        self.write('transactions', {
+            'id': pa.array(transaction_ids.astype(str), pa.string()),
+            'tranid': pa.array(np.char.mod('INV%08d', transaction_ids), pa.string()),
+            'type': pa.array(types, pa.string()),
+            'status': pa.array(status, pa.string()),
+            'trandate': pa.array(trandate, pa.string()),
+            'createddate': pa.array(createddate, pa.string()),
+            'lastmodifieddate': pa.array(lastmodifieddate, pa.string()),
+            'shipdate': pa.array(shipdate, pa.string()),
+            'entity': pa.array(np.where(wholesale, 500_000 + customer % 300, 1_000_000 + customer).astype(str), pa.string()),
+            'subsidiary': pa.array(subsidiary),
+            'currency': pa.array(currency_id.astype(np.int64)),
+            'exchangerate': pa.array(exchange_rate.astype(str), pa.string()),
+            'total': pa.array((-header_total).round(2).astype(str), pa.string()),
+            'foreigntotal': pa.array((-header_total / exchange_rate).round(2).astype(str), pa.string()),
+            'posting': pa.array(np.where(types == 'SalesOrd', 'F', 'T'), pa.string()),
+            'voided': pa.array(np.where(rng.random(n) < 0.005, 'T', 'F'), pa.string()),
+            'paymentmethod': pa.array(pick(rng, ['Card', 'PayPal', 'Cash', 'Bank Transfer'], n,
+                                           p=[0.6, 0.2, 0.1, 0.1]), pa.string(), mask=types == 'SalesOrd'),
+            'custbody_customer_email': pa.array(emails, pa.string()),
+            'custbody_shopify_order_name': pa.array(np.char.mod('#%07d', transaction_ids - 9_000_000), pa.string(),
+                                                    mask=wholesale),
+            'custbody_pwks_remote_order_source': pa.array(np.where(wholesale, 'Wholesale', 'Shopify'), pa.string()),
+            'billing_country': pa.array(country, pa.string()),
+            'shipping_country': pa.array(country, pa.string()),
+            'memo': pa.array(np.full(n, None, dtype=object), pa.string()),
+        }, partition)
+
+        # GL COGS lines for the item lines of invoiced/cash sales
+        gl = cogs_rows[np.isin(types[order_idx[cogs_rows]], ['CustInvc', 'CashSale'])]
+        self.write('transaction_accounting_lines_cogs', {
+            'transaction': pa.array(transaction_ids[order_idx[gl]]),
+            'transactionline': pa.array((np.arange(len(gl)) % 97 + 1).astype(np.int64)),
+            'account': pa.array(np.full(len(gl), 213, dtype=np.int64)),
+            'account_name': pa.array(np.full(len(gl), 'Cost of Goods Sold', dtype=object), pa.string()),
+            'acctnumber': pa.array(np.full(len(gl), '50000', dtype=object), pa.string()),
+            'accttype': pa.array(np.full(len(gl), 'COGS', dtype=object), pa.string()),
+            'amount': pa.array(cogs_amount[gl]),
+            'trandate': pa.array(dates[order_idx[gl]]),
+        }, partition)
+
+        self.build_purchase_orders(partition, month_start, days_in_month)
+
+    def build_purchase_orders(self, partition: str, month_start: np.datetime64, days_in_month: int):
+        rng = self.rng
+        n = self.pos_per_month
+        po_ids = np.arange(self.next_transaction, self.next_transaction + n, dtype=np.int64)
+        self.next_transaction += n
+
+        per_po = rng.integers(5, 40, size=n)
+        po_idx = np.repeat(np.arange(n), per_po)
+        m = len(po_idx)
+        warehouses = np.flatnonzero(np.char.startswith(self.location_name.astype(str), 'Bleckmann'))
+        item_idx = rng.choice(self.n_items, size=m, p=self.item_p)
+        quantity = rng.integers(50, 600, size=m).astype(np.float64)
+        received = np.floor(quantity * rng.choice([0.0, 0.5, 1.0], size=m, p=[0.3, 0.2, 0.5]))
+        day = rng.integers(0, days_in_month, size=n)
+
+        self.write('purchase_order_lines', {
+            'id': pa.array((np.arange(m) % 200 + 1).astype(np.int64)),
+            'transaction': pa.array(po_ids[po_idx]),
+            'item': pa.array(self.item_ids[item_idx]),
+            'location': pa.array(self.location_ids[rng.choice(warehouses, size=n)][po_idx]),
+            'quantity': pa.array(quantity),
+            'quantityshiprecv': pa.array(received.astype(int).astype(str), pa.string()),
+            'quantitybilled': pa.array(received),
+            'rate': pa.array(self.item_cost[item_idx]),
+            'trandate': pa.array((month_start + day.astype('timedelta64[D]'))[po_idx]),
+        }, partition)
+
+    # ---------------------------------------------------------------- helpers
+
+    def _customer_p(self) -> np.ndarray:
+        if not hasattr(self, '_customer_weights'):
+            # Heavy repeat buyers at the head, long tail of one-off customers
+            self._customer_weights = zipf_weights(self.n_customers, 0.7)
+        return self._customer_weights
+
+    @staticmethod
+    def _line_columns(transaction, order_idx, item_idx, quantity, rate, rate_null, amount, tax, cost,
+                      mainline, taxline, iscogs, discount) -> Dict[str, np.ndarray]:
+        """Columns for one kind of line; None means the column is NULL for every row"""
+        k = len(order_idx)
+        zeros = np.zeros(k)
+
+        def column(values, mask=None):
+            if values is None:
+                return zeros, np.ones(k, dtype=bool)
+            return np.asarray(values, dtype=np.float64), (np.zeros(k, dtype=bool) if mask is None else mask)
+
+        quantity, quantity_mask = column(quantity)
+        rate, rate_mask = column(rate, rate_null)
+        tax, tax_mask = column(tax)
+        cost, cost_mask = column(cost)
+        return {
+            'transaction': np.asarray(transaction, dtype=np.int64),
+            '_item_idx': np.full(k, -1) if item_idx is None else item_idx,
+            'quantity': quantity,
+            'rate': rate,
+            'amount': np.asarray(amount, dtype=np.float64),
+            'tax': tax,
+            'cost': cost,
+            'mainline': np.full(k, mainline, dtype=object),
+            'taxline': np.full(k, taxline, dtype=object),
+            'iscogs': np.full(k, iscogs, dtype=object),
+            'transactiondiscount': np.full(k, discount, dtype=object),
+            '_order': order_idx,
+            '_mask': {'quantity': quantity_mask, 'rate': rate_mask, 'tax': tax_mask, 'cost': cost_mask},
+        }
+
+    # -------------------------------------------------------------------- run
+
+    def run(self):
+        start = time.time()
+        print(f"{Colors.BOLD}Generating synthetic NetSuite data (scale {self.scale}x){Colors.NC}")
+        print(f"Output:    {self.out_dir}")
+        print(f"Months:    {len(self.months)} ({self.months[0][0]}-{self.months[0][1]:02d} .. "
+              f"{self.months[-1][0]}-{self.months[-1][1]:02d})")
+        print(f"Items:     {self.n_items:,}   Customers: {self.n_customers:,}\n")
+
+        self.build_dimensions()
+        self.build_inventory()
+        for year, month in self.months:
+            month_start = time.time()
+            self.build_month(year, month)
+            print(f"  {Colors.BLUE}{year}-{month:02d}{Colors.NC} "
+                  f"{self.rows['transaction_lines_denormalized_mv']:>12,} lines so far "
+                  f"({time.time() - month_start:.1f}s)")
+
+        print(f"\n{Colors.BOLD}Rows written{Colors.NC}")
+        for table, count in sorted(self.rows.items()):
+            print(f"  {table:<40} {count:>12,}")
+        print(f"\n{Colors.GREEN}Done in {time.time() - start:.1f}s{Colors.NC}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate synthetic NetSuite-shaped Parquet for offline benchmarks')
+    parser.add_argument('--scale', type=float, default=1.0, help='Volume relative to production (default: 1.0)')
+    parser.add_argument('--out', default=None, help='Output directory (default: LOCAL_PARQUET_DIR)')
+    parser.add_argument('--start', default='2022-01', help='First month YYYY-MM (default: 2022-01)')
+    parser.add_argument('--end', default='2025-10', help='Last month YYYY-MM (default: 2025-10)')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed (default: 42)')
+    args = parser.parse_args()
+
+    if args.scale <= 0:
+        parser.error('--scale must be positive')
+
+    out_dir = args.out or parquet_dir()
+    if os.path.isdir(out_dir) and os.listdir(out_dir):
+        print(f"{Colors.YELLOW}Warning: {out_dir} is not empty - existing partitions are overwritten{Colors.NC}")
+
+    SyntheticGenerator(out_dir, args.scale, args.start, args.end, args.seed).run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,405 @@
+#!/usr/bin/env python3
+"""
+NetSuite ingest: typed keys and dates, month-partitioned and clustered tables
+
+Productionizes the filtering script from GCP_UPLOAD_POST_PROCESSING_GUIDE.md
+(Step 2). Every table of a raw extraction is rewritten with a declared schema:
+- KEY_COLUMNS: ID and foreign-key columns become INT64, whatever type NetSuite
+  exported them as (strings, floats, mixed per file). The cubes join on native
+  keys (`tl.transaction = t.id`) instead of `SAFE_CAST(t.id AS INT64)`.
+- DATE_COLUMNS: DD/MM/YYYY and YYYY-MM-DD strings (NetSuite mixes both, even
+  within one column) become DATE, so the model never runs
+  PARSE_DATE('%d/%m/%Y', ...) per row or compares dates as strings.
+- PARTITION_DATE / CLUSTER_COLUMNS: fact tables are physically partitioned by
+  the month of their transaction date and clustered on type/location, so a
+  date filter (e.g. one rollup partition build) prunes to its months.
+
+Values that don't parse become NULL (SAFE_CAST semantics) and are counted per
+column; a table is rejected if any typed column has more than
+--max-bad-values of its non-empty values unparseable.
+
+Input: one directory per table (or <table>.parquet / <table>.json[l] files),
+Parquet or JSON, optionally Hive month partitions (partition_month=YYYY-MM).
+Output: typed Parquet in the layout local_engine.py reads - partitioned tables
+as partition_month=YYYY-MM/ directories (recomputed from PARTITION_DATE),
+rows sorted by the cluster columns within each month so Parquet row-group
+min/max stats prune on them too. With --bigquery the typed files are also
+loaded into that dataset as `PARTITION BY DATE_TRUNC(<date>, MONTH)
+CLUSTER BY <columns>` tables.
+
+The AUDIT clean filters of the original script (mainline/taxline/iscogs/
+transactiondiscount, posting/voided/type) are applied with --clean.
+
+Usage:
+    python3 ingest_netsuite.py --source data/raw                        # -> LOCAL_PARQUET_DIR
+    python3 ingest_netsuite.py --source /data/netsuite_extractions --out /data/typed --table transactions
+    python3 ingest_netsuite.py --source data/raw --bigquery gym-plus-coffee.gpc
+"""
+
+import os
+import sys
+import time
+import glob
+import shutil
+import argparse
+from typing import Dict, List
+
+# Colors for output
+class Colors:
+    RED = '\033[0;31m'
+    GREEN = '\033[0;32m'
+    YELLOW = '\033[1;33m'
+    BLUE = '\033[0;34m'
+    BOLD = '\033[1m'
+    NC = '\033[0m'  # No Color
+
+
+# Declared key columns per table, written as INT64 (columns a table doesn't have are skipped)
+KEY_COLUMNS: Dict[str, List[str]] = {
+    'transaction_lines_denormalized_mv': ['id', 'transaction', 'item', 'location', 'subsidiary', 'department',
+                                          'class', 'createdfrom', 'transaction_currency_id'],
+    'transaction_lines': ['id', 'transaction', 'item', 'location', 'subsidiary', 'department', 'class',
+                          'createdfrom'],
+    'transaction_lines_itemship': ['id', 'transaction', 'item', 'location', 'createdfrom'],
+    'transactions': ['id', 'entity', 'subsidiary', 'currency', 'postingperiod'],
+    'transaction': ['id', 'entity', 'subsidiary', 'currency', 'postingperiod'],
+    'transactions_itemship': ['id', 'entity', 'subsidiary', 'currency', 'postingperiod'],
+    'transaction_accounting_lines_cogs': ['transaction', 'transactionline', 'account'],
+    'transaction_accounting_lines_opex': ['transaction', 'transactionline', 'account'],
+    'accounting_lines_journal': ['transaction', 'transactionline', 'account'],
+    'journal_headers': ['id', 'subsidiary', 'currency'],
+    'item_receipts': ['id', 'entity', 'subsidiary', 'currency', 'createdfrom'],
+    'item_receipt_lines': ['id', 'transaction', 'item', 'location', 'createdfrom'],
+    'purchase_orders': ['id', 'entity', 'subsidiary', 'currency'],
+    'purchase_order_lines': ['id', 'transaction', 'item', 'location'],
+    'fulfillments': ['id', 'entity', 'createdfrom'],
+    'fulfillment_lines': ['id', 'transaction', 'item', 'location', 'createdfrom'],
+    'inventory_adjustments': ['id', 'transaction', 'item', 'location'],
+    'inventory_adjustment_headers': ['id', 'subsidiary'],
+    'inventory_calculated': ['item', 'location'],
+    'vendor_bills': ['id', 'entity', 'subsidiary', 'currency'],
+    'items': ['id', 'parent'],
+    'locations': ['id', 'subsidiary'],
+    'b2b_customers': ['id'],
+    'b2b_addresses': ['id'],
+    'b2b_customer_addresses': ['customer', 'address'],
+    'vendors': ['id'],
+    'subsidiaries': ['id'],
+    'currencies': ['id'],
+    'departments': ['id'],
+    'classifications': ['id'],
+}
+
+# Declared date columns per table, written as DATE (missing columns are skipped)
+HEADER_DATES = ['trandate', 'createddate', 'lastmodifieddate', 'shipdate', 'actualshipdate', 'closedate', 'duedate']
+DATE_COLUMNS: Dict[str, List[str]] = {
+    'transaction_lines_denormalized_mv': ['transaction_date'],
+    'transaction_lines': ['trandate'],
+    'transaction_lines_itemship': ['trandate'],
+    'transactions': HEADER_DATES,
+    'transaction': HEADER_DATES,
+    'transactions_itemship': HEADER_DATES,
+    'transaction_accounting_lines_cogs': ['trandate'],
+    'transaction_accounting_lines_opex': ['trandate'],
+    'accounting_lines_journal': ['trandate'],
+    'journal_headers': ['trandate'],
+    'item_receipts': HEADER_DATES,
+    'item_receipt_lines': ['trandate'],
+    'purchase_orders': HEADER_DATES,
+    'purchase_order_lines': ['trandate', 'expectedreceiptdate'],
+    'fulfillments': HEADER_DATES,
+    'fulfillment_lines': ['trandate', 'shipdate'],
+    'inventory_adjustments': ['trandate'],
+    'inventory_adjustment_headers': ['trandate'],
+    'vendor_bills': HEADER_DATES,
+    'b2b_customers': ['datecreated', 'lastmodifieddate'],
+    'b2b_addresses': ['lastmodifieddate'],
+}
+
+# Formats NetSuite exports dates in, tried in order
+DATE_FORMATS = ['%d/%m/%Y', '%Y-%m-%d']
+
+# Fact tables: month partitions on this date column ...
+PARTITION_DATE: Dict[str, str] = {
+    'transaction_lines_denormalized_mv': 'transaction_date',
+    'transaction_lines': 'trandate',
+    'transactions': 'trandate',
+    'transaction': 'trandate',
+    'transactions_itemship': 'trandate',
+    'transaction_accounting_lines_cogs': 'trandate',
+    'transaction_accounting_lines_opex': 'trandate',
+    'accounting_lines_journal': 'trandate',
+    'item_receipts': 'trandate',
+    'purchase_orders': 'trandate',
+    'fulfillment_lines': 'shipdate',
+    'inventory_adjustments': 'trandate',
+    'vendor_bills': 'trandate',
+}
+
+# ... clustered (BigQuery) / sorted within the month (Parquet) on these columns
+CLUSTER_COLUMNS: Dict[str, List[str]] = {
+    'transaction_lines_denormalized_mv': ['transaction_type', 'location'],
+    'transaction_lines': ['transaction_type', 'location'],
+    'transactions': ['type'],
+    'transaction': ['type'],
+    'transactions_itemship': ['type'],
+    'transaction_accounting_lines_cogs': ['transaction'],
+    'transaction_accounting_lines_opex': ['transaction'],
+    'accounting_lines_journal': ['transaction_type'],
+    'item_receipts': ['type'],
+    'fulfillment_lines': ['location'],
+    'inventory_adjustments': ['location'],
+    'inventory_calculated': ['location', 'item'],
+}
+
+# AUDIT filters from the original filter_audit_data.py (applied with --clean); NULL flags
+# count as 'F', as in create_filtered_views.sql and local_engine.DERIVED_VIEWS
+CLEAN_FILTERS: Dict[str, str] = {
+    'transaction_lines': ("mainline = 'F' AND COALESCE(taxline, 'F') = 'F' AND COALESCE(iscogs, 'F') = 'F' "
+                          "AND COALESCE(transactiondiscount, 'F') = 'F'"),
+    'transactions': ("COALESCE(posting, 'F') = 'T' AND COALESCE(voided, 'F') = 'F' "
+                     "AND type IN ('CustInvc', 'CashSale', 'CustCred', 'CashRfnd')"),
+}
+
+PARTITION_COLUMN = 'partition_month'
+DEFAULT_MAX_BAD_VALUES = 0.001
+
+
+def discover_sources(root: str) -> Dict[str, str]:
+    """Map table name -> DuckDB relation reading its raw files"""
+    sources = {}
+    for entry in sorted(os.listdir(root)):
+        if entry.startswith('.'):
+            continue
+        path = os.path.join(root, entry)
+        if os.path.isdir(path):
+            files = [f for f in glob.glob(os.path.join(path, '**', '*'), recursive=True) if os.path.isfile(f)]
+            if any(f.endswith('.parquet') for f in files):
+                sources[entry] = (f"read_parquet('{os.path.join(path, '**', '*.parquet')}', "
+                                  "hive_partitioning = true, union_by_name = true)")
+            elif any(f.endswith(('.json', '.jsonl')) for f in files):
+                sources[entry] = f"read_json_auto('{os.path.join(path, '**', '*.json*')}', hive_partitioning = true)"
+        elif entry.endswith('.parquet'):
+            sources.setdefault(entry[:-len('.parquet')], f"read_parquet('{path}')")
+        elif entry.endswith(('.json', '.jsonl')):
+            sources.setdefault(entry.rsplit('.', 1)[0], f"read_json_auto('{path}')")
+    return sources
+
+
+def key_expression(column: str) -> str:
+    """INT64 key from whatever NetSuite exported ('123', 123, 123.0); anything else -> NULL"""
+    return (f"COALESCE(TRY_CAST({column} AS BIGINT), "
+            f"TRY_CAST(CASE WHEN TRY_CAST({column} AS DOUBLE) = FLOOR(TRY_CAST({column} AS DOUBLE)) "
+            f"THEN TRY_CAST({column} AS DOUBLE) END AS BIGINT))")
+
+
+def date_expression(column: str, source_type: str) -> str:
+    """DATE from a DATE/TIMESTAMP column or a string in one of DATE_FORMATS; anything else -> NULL"""
+    if source_type == 'DATE':
+        return column
+    if source_type.startswith('TIMESTAMP'):
+        return f"CAST({column} AS DATE)"
+    text = f"NULLIF(TRIM(CAST({column} AS VARCHAR)), '')"
+    parsed = ', '.join(f"TRY_STRPTIME({text}, '{fmt}')" for fmt in DATE_FORMATS)
+    return f"CAST(COALESCE({parsed}) AS DATE)"
+
+
+class TableIngest:
+    def __init__(self, conn, name: str, relation: str, clean: bool):
+        self.conn = conn
+        self.name = name
+        self.relation = relation
+        self.clean = clean
+        self.columns = {row[0]: row[1] for row in conn.execute(f"DESCRIBE SELECT * FROM {relation}").fetchall()}
+        self.keys = [c for c in KEY_COLUMNS.get(name, []) if c in self.columns]
+        self.dates = [c for c in DATE_COLUMNS.get(name, []) if c in self.columns]
+        self.partition_date = PARTITION_DATE.get(name) if PARTITION_DATE.get(name) in self.dates else None
+        self.cluster = [c for c in CLUSTER_COLUMNS.get(name, []) if c in self.columns]
+
+    @property
+    def typed(self) -> Dict[str, str]:
+        """column -> typed expression over the raw relation"""
+        typed = {c: key_expression(c) for c in self.keys}
+        typed.update({c: date_expression(c, self.columns[c]) for c in self.dates})
+        return typed
+
+    @property
+    def select_sql(self) -> str:
+        replace = ', '.join(f"{expr} AS {c}" for c, expr in self.typed.items())
+        sql = f"SELECT * REPLACE ({replace}) FROM {self.relation}" if replace else f"SELECT * FROM {self.relation}"
+        if self.clean and self.name in CLEAN_FILTERS:
+            sql += f" WHERE {CLEAN_FILTERS[self.name]}"
+        if not self.partition_date:
+            return sql + (f" ORDER BY {', '.join(self.cluster)}" if self.cluster else '')
+
+        # Month partitions recomputed from the typed date; cluster columns then date within the month
+        source = f"SELECT * EXCLUDE ({PARTITION_COLUMN}) FROM ({sql})" if PARTITION_COLUMN in self.columns \
+            else f"SELECT * FROM ({sql})"
+        order = ', '.join(self.cluster + [self.partition_date])
+        return (f"SELECT *, strftime({self.partition_date}, '%Y-%m') AS {PARTITION_COLUMN} "
+                f"FROM ({source}) ORDER BY {order}")
+
+    def bad_values(self) -> Dict[str, tuple]:
+        """column -> (unparseable values, non-empty values)"""
+        typed = self.typed
+        if not typed:
+            return {}
+        parts = []
+        for c, expr in typed.items():
+            present = f"NULLIF(TRIM(CAST({c} AS VARCHAR)), '') IS NOT NULL"
+            parts.append(f"COUNT(*) FILTER (WHERE {present} AND {expr} IS NULL)")
+            parts.append(f"COUNT(*) FILTER (WHERE {present})")
+        row = self.conn.execute(f"SELECT {', '.join(parts)} FROM {self.relation}").fetchone()
+        return {c: (row[2 * i], row[2 * i + 1]) for i, c in enumerate(typed)}
+
+    def write(self, out_dir: str) -> int:
+        """Write typed Parquet to out_dir/<table>/ (replacing it); returns rows written"""
+        table_dir = os.path.join(out_dir, self.name)
+        tmp_dir = os.path.join(out_dir, f".{self.name}.ingest")
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+
+        if self.partition_date or PARTITION_COLUMN in self.columns:
+            self.conn.execute(f"COPY ({self.select_sql}) TO '{tmp_dir}' (FORMAT PARQUET, COMPRESSION ZSTD, "
+                              f"PARTITION_BY ({PARTITION_COLUMN}), OVERWRITE_OR_IGNORE, FILENAME_PATTERN 'part-{{i}}')")
+        else:
+            self.conn.execute(f"COPY ({self.select_sql}) TO '{os.path.join(tmp_dir, 'part-0.parquet')}' "
+                              "(FORMAT PARQUET, COMPRESSION ZSTD)")
+
+        rows = self.conn.execute(
+            f"SELECT COUNT(*) FROM read_parquet('{os.path.join(tmp_dir, '**', '*.parquet')}')").fetchone()[0]
+        # Swap in only after the full table was written (the source may be out_dir itself)
+        shutil.rmtree(table_dir, ignore_errors=True)
+        os.rename(tmp_dir, table_dir)
+        return rows
+
+    def typed_columns(self, out_dir: str) -> Dict[str, str]:
+        glob_path = os.path.join(out_dir, self.name, '**', '*.parquet')
+        rows = self.conn.execute(f"DESCRIBE SELECT * FROM read_parquet('{glob_path}', hive_partitioning = true)")
+        return {row[0]: row[1] for row in rows.fetchall()}
+
+    def partitions(self, out_dir: str) -> int:
+        return len(glob.glob(os.path.join(out_dir, self.name, f'{PARTITION_COLUMN}=*')))
+
+
+def load_bigquery(dataset: str, table: TableIngest, out_dir: str):
+    """
+    Load the typed Parquet of one table into BigQuery, replacing the table
+
+    Files are loaded into a staging table, then swapped in with CREATE OR
+    REPLACE ... PARTITION BY / CLUSTER BY (a load job can't change the
+    partitioning of an existing table).
+    """
+    from google.cloud import bigquery
+
+    project, _, _ = dataset.rpartition('.')
+    client = bigquery.Client(project=project or None)
+    table_id = f"{dataset}.{table.name}"
+    staging_id = f"{table_id}__ingest"
+    files = sorted(glob.glob(os.path.join(out_dir, table.name, '**', '*.parquet'), recursive=True))
+    for i, path in enumerate(files):
+        job_config = bigquery.LoadJobConfig(
+            source_format=bigquery.SourceFormat.PARQUET,
+            write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE if i == 0
+            else bigquery.WriteDisposition.WRITE_APPEND,
+        )
+        with open(path, 'rb') as f:
+            client.load_table_from_file(f, staging_id, job_config=job_config).result()
+
+    ddl = f"CREATE OR REPLACE TABLE `{table_id}`"
+    if table.partition_date:
+        ddl += f"\nPARTITION BY DATE_TRUNC({table.partition_date}, MONTH)"
+    if table.cluster:
+        ddl += f"\nCLUSTER BY {', '.join(table.cluster[:4])}"
+    client.query(f"{ddl}\nAS SELECT * FROM `{staging_id}`").result()
+    client.delete_table(staging_id, not_found_ok=True)
+
+    schema = {field.name: field.field_type for field in client.get_table(table_id).schema}
+    wrong = [k for k in table.keys if schema.get(k) not in ('INTEGER', 'INT64')]
+    wrong += [d for d in table.dates if schema.get(d) != 'DATE']
+    if wrong:
+        raise RuntimeError(f"{table_id}: columns not typed after load: {', '.join(wrong)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Ingest NetSuite extractions with typed keys and dates')
+    parser.add_argument('--source', required=True, help='Raw extraction directory (one entry per table)')
+    parser.add_argument('--out', help='Typed Parquet output directory (default: LOCAL_PARQUET_DIR)')
+    parser.add_argument('--table', action='append', help='Only ingest this table (repeatable)')
+    parser.add_argument('--clean', action='store_true', help='Apply the AUDIT clean filters (lines/transactions)')
+    parser.add_argument('--max-bad-values', '--max-bad-keys', dest='max_bad_values', type=float,
+                        default=DEFAULT_MAX_BAD_VALUES,
+                        help=f'Max share of unparseable key/date values per column (default: {DEFAULT_MAX_BAD_VALUES})')
+    parser.add_argument('--bigquery', metavar='PROJECT.DATASET', help='Also load the typed tables into BigQuery')
+    args = parser.parse_args()
+
+    import duckdb
+    from local_engine import parquet_dir
+
+    out_dir = args.out or parquet_dir()
+    sources = discover_sources(args.source)
+    names = args.table or list(sources)
+    os.makedirs(out_dir, exist_ok=True)
+    conn = duckdb.connect()
+
+    print(f"{Colors.BOLD}{'='*80}{Colors.NC}")
+    print(f"{Colors.BOLD}NETSUITE INGEST{Colors.NC}  ({args.source} -> {out_dir})")
+    print(f"{Colors.BOLD}{'='*80}{Colors.NC}")
+
+    failed = []
+    for name in names:
+        if name not in sources:
+            print(f"{Colors.RED}✗ {name}: not found in {args.source}{Colors.NC}")
+            failed.append(name)
+            continue
+
+        start = time.time()
+        table = TableIngest(conn, name, sources[name], args.clean)
+        if name not in KEY_COLUMNS and name not in DATE_COLUMNS:
+            print(f"{Colors.YELLOW}! {name}: no declared schema - copied as is{Colors.NC}")
+
+        rejected = False
+        for column, (bad, total) in table.bad_values().items():
+            if bad:
+                share = bad / total if total else 0
+                color = Colors.RED if share > args.max_bad_values else Colors.YELLOW
+                print(f"  {color}{name}.{column}: {bad:,} of {total:,} values unparseable -> NULL{Colors.NC}")
+                rejected = rejected or share > args.max_bad_values
+        if rejected:
+            print(f"{Colors.RED}✗ {name}: rejected (--max-bad-values {args.max_bad_values}){Colors.NC}")
+            failed.append(name)
+            continue
+
+        rows = table.write(out_dir)
+        typed = table.typed_columns(out_dir)
+        untyped = [k for k in table.keys if typed.get(k) != 'BIGINT'] + \
+                  [d for d in table.dates if typed.get(d) != 'DATE']
+        if untyped:
+            print(f"{Colors.RED}✗ {name}: columns not typed after write: {', '.join(untyped)}{Colors.NC}")
+            failed.append(name)
+            continue
+
+        if args.bigquery:
+            try:
+                load_bigquery(args.bigquery, table, out_dir)
+            except Exception as e:
+                print(f"{Colors.RED}✗ {name}: BigQuery load failed: {e}{Colors.NC}")
+                failed.append(name)
+                continue
+
+        layout = ''
+        if table.partition_date:
+            layout = f"  {table.partitions(out_dir)} months by {table.partition_date}"
+            if table.cluster:
+                layout += f", clustered on {', '.join(table.cluster)}"
+        print(f"{Colors.GREEN}✓ {name:<36}{Colors.NC} {rows:>12,} rows  "
+              f"{len(table.keys)} INT64 keys, {len(table.dates)} DATEs{layout}  ({time.time() - start:.1f}s)")
+
+    conn.close()
+    if failed:
+        print(f"\n{Colors.RED}{len(failed)} table(s) failed: {', '.join(failed)}{Colors.NC}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
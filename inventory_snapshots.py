@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+"""
+Daily inventory history: delta-encoded snapshots of gpc.inventory_calculated
+
+inventory_calculated only holds the current position, so GMROI and
+sell-through fall back to today's stock for past periods. This script records
+the position every day it runs, without storing a full copy per day:
+- gpc.inventory_history   (snapshot_date, item, location, kind, quantity)
+    kind = 'checkpoint'   the full position (non-zero rows) on the first snapshot of each month
+    kind = 'delta'        the change since the previous snapshot, changed positions only
+- gpc.inventory_monthly   (month, item, location, average_quantity, closing_quantity, snapshot_days)
+    day-weighted average and closing stock per month, rebuilt with every snapshot of the month
+
+The position on any day D is the latest checkpoint on or before D plus the
+deltas up to D, so a reconstruction reads at most one month of history. The
+inventory_history cube exposes it (dateRange from the first of the month to D),
+inventory_monthly serves average stock to GMROI and turnover. A stock_position
+query whose dateRange spans more than one month would add up several months'
+checkpoints: history_range_error() rejects it (cube.py query_rewrite, cube_client.py).
+
+Both tables are partitioned by month; a day is replaced as a whole (DELETE +
+INSERT on BigQuery, the month partition rewritten locally). Snapshots can only
+be appended: inventory_calculated has no history to backfill from.
+
+Usage:
+    python3 inventory_snapshots.py                                 # snapshot today, local Parquet
+    python3 inventory_snapshots.py --engine bigquery --date 2026-10-18
+    python3 inventory_snapshots.py --as-of 2026-09-15              # reconstructed position totals
+    python3 inventory_snapshots.py --months 2026-09                # rebuild monthly averages only
+    python3 inventory_snapshots.py --engine bigquery --print-sql
+
+Run it once a day after ingest_netsuite.py has refreshed inventory_calculated.
+"""
+
+import os
+import sys
+import time
+import argparse
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional
+
+from enrich_transaction_lines import month_range
+from query_canonical import resolve_relative
+
+# Colors for output
+class Colors:
+    RED = '\033[0;31m'
+    GREEN = '\033[0;32m'
+    YELLOW = '\033[1;33m'
+    BLUE = '\033[0;34m'
+    BOLD = '\033[1m'
+    NC = '\033[0m'  # No Color
+
+
+HISTORY_TABLE = 'inventory_history'
+MONTHLY_TABLE = 'inventory_monthly'
+# inventory_history cube members whose sum includes the checkpoints
+POSITION_MEASURE = f'{HISTORY_TABLE}.stock_position'
+SNAPSHOT_DIMENSION = f'{HISTORY_TABLE}.snapshot_date'
+DEFAULT_BQ_PROJECT = os.environ.get('CUBEJS_DB_BQ_PROJECT_ID', 'gym-plus-coffee')
+
+# Days from start to end, per dialect
+DAYS_BETWEEN = {
+    'bigquery': "DATE_DIFF({end}, {start}, DAY)",
+    'duckdb': "date_diff('day', {start}, {end})",
+}
+
+CURRENT_SQL = """SELECT item, location, SUM(CAST(calculated_quantity_available AS FLOAT64)) AS quantity
+  FROM gpc.inventory_calculated
+  WHERE item IS NOT NULL AND location IS NOT NULL
+  GROUP BY item, location"""
+
+BQ_TABLES_SQL = f"""CREATE TABLE IF NOT EXISTS gpc.{HISTORY_TABLE}
+  (snapshot_date DATE, item INT64, location INT64, kind STRING, quantity FLOAT64)
+PARTITION BY DATE_TRUNC(snapshot_date, MONTH)
+CLUSTER BY item, location;
+CREATE TABLE IF NOT EXISTS gpc.{MONTHLY_TABLE}
+  (month DATE, item INT64, location INT64, average_quantity FLOAT64, closing_quantity FLOAT64, snapshot_days INT64)
+PARTITION BY month
+CLUSTER BY item, location;"""
+
+
+def month_of(day: str) -> str:
+    return day[:7]
+
+
+def position_sql(as_of: str) -> str:
+    """Position per item/location on a day: latest checkpoint on or before it plus the deltas since"""
+    return (
+        "SELECT item, location, SUM(quantity) AS quantity\n"
+        f"  FROM gpc.{HISTORY_TABLE}\n"
+        f"  WHERE snapshot_date <= DATE '{as_of}'\n"
+        f"    AND snapshot_date >= (SELECT MAX(snapshot_date) FROM gpc.{HISTORY_TABLE}\n"
+        f"                          WHERE kind = 'checkpoint' AND snapshot_date <= DATE '{as_of}')\n"
+        "  GROUP BY item, location\n"
+        "  HAVING SUM(quantity) <> 0"
+    )
+
+
+def checkpoint_sql(day: str) -> str:
+    return (f"SELECT DATE '{day}' AS snapshot_date, item, location, 'checkpoint' AS kind, quantity\n"
+            f"FROM ({CURRENT_SQL}) c\nWHERE quantity <> 0")
+
+
+def delta_sql(day: str) -> str:
+    """Changed positions since the previous snapshot (positions that disappear count as going to 0)"""
+    previous = (date.fromisoformat(day) - timedelta(days=1)).isoformat()
+    return (
+        f"SELECT DATE '{day}' AS snapshot_date, item, location, 'delta' AS kind,\n"
+        "  COALESCE(c.quantity, 0) - COALESCE(p.quantity, 0) AS quantity\n"
+        f"FROM ({CURRENT_SQL}) c\n"
+        f"FULL OUTER JOIN ({position_sql(previous)}) p USING (item, location)\n"
+        "WHERE COALESCE(c.quantity, 0) <> COALESCE(p.quantity, 0)"
+    )
+
+
+def monthly_sql(month: str, dialect: str) -> str:
+    """Average and closing stock per item/location over the snapshot days of a month
+
+    With C the checkpoint in effect on the month's first snapshot day F and L the last
+    snapshot day, every history row from C to L holds its quantity until L, so
+    sum of daily positions = sum(quantity * days it is in effect) - no daily expansion.
+    """
+    start, end = month_range(month)
+    days = DAYS_BETWEEN[dialect]
+    return (
+        "WITH bounds AS (\n"
+        f"  SELECT first_day, last_day, {days.format(start='first_day', end='last_day')} + 1 AS snapshot_days,\n"
+        f"    (SELECT MAX(snapshot_date) FROM gpc.{HISTORY_TABLE}\n"
+        "     WHERE kind = 'checkpoint' AND snapshot_date <= first_day) AS checkpoint_day\n"
+        "  FROM (SELECT MIN(snapshot_date) AS first_day, MAX(snapshot_date) AS last_day\n"
+        f"        FROM gpc.{HISTORY_TABLE} WHERE snapshot_date BETWEEN DATE '{start}' AND DATE '{end}') m\n"
+        "  WHERE first_day IS NOT NULL\n"
+        ")\n"
+        f"SELECT DATE '{start}' AS month, h.item, h.location,\n"
+        "  SUM(h.quantity * CASE WHEN h.snapshot_date <= b.first_day THEN b.snapshot_days\n"
+        f"                       ELSE {days.format(start='h.snapshot_date', end='b.last_day')} + 1 END)\n"
+        "    / MAX(b.snapshot_days) AS average_quantity,\n"
+        "  SUM(h.quantity) AS closing_quantity,\n"
+        "  MAX(b.snapshot_days) AS snapshot_days\n"
+        f"FROM gpc.{HISTORY_TABLE} h\n"
+        "CROSS JOIN bounds b\n"
+        "WHERE h.snapshot_date BETWEEN b.checkpoint_day AND b.last_day\n"
+        "GROUP BY h.item, h.location"
+    )
+
+
+def history_range_error(query: Dict[str, Any], today: Optional[date] = None) -> Optional[str]:
+    """Why a stock_position query can't be answered (None when it can): it needs a
+    snapshot_date dateRange within one month, or the sum adds up several checkpoints"""
+    if POSITION_MEASURE not in (query.get('measures') or []):
+        return None
+    ranges = [t.get('dateRange') for t in query.get('timeDimensions') or []
+              if t.get('dimension') == SNAPSHOT_DIMENSION and t.get('dateRange')]
+    if not ranges:
+        return f"{POSITION_MEASURE} needs a {SNAPSHOT_DIMENSION} dateRange within one month"
+    for date_range in ranges:
+        if isinstance(date_range, str):
+            resolved = resolve_relative(date_range, today or date.today())
+            if not resolved:
+                return f"{POSITION_MEASURE} needs explicit dates or a single-month dateRange, not {date_range!r}"
+            date_range = resolved
+        if len(date_range) != 2 or month_of(str(date_range[0])) != month_of(str(date_range[1])):
+            return (f"{POSITION_MEASURE} dateRange {date_range[0]}..{date_range[1]} spans more than one "
+                    "month and would add up several checkpoints - use [first of the month, as-of date]")
+    return None
+
+
+def as_of_totals_sql(as_of: str) -> str:
+    return (f"SELECT COUNT(*) AS positions, COUNT(DISTINCT item) AS skus, SUM(quantity) AS units\n"
+            f"FROM ({position_sql(as_of)}) p")
+
+
+class LocalBuilder:
+    """Rewrites month partitions under LOCAL_PARQUET_DIR/inventory_history and inventory_monthly"""
+
+    def __init__(self):
+        import duckdb
+        from local_engine import PARTITION_COLUMN, build_init_sql, discover_tables, parquet_dir
+
+        self.root = parquet_dir()
+        self.partition_column = PARTITION_COLUMN
+        self._init_sql = build_init_sql
+        self.tables = discover_tables(self.root)
+        # In-memory database: the persistent file may be locked by a running Cube server
+        self.conn = duckdb.connect()
+        self.conn.execute(build_init_sql(self.root))
+
+    def partition_path(self, table: str, month: str) -> str:
+        return os.path.join(self.root, table, f"{self.partition_column}={month}", 'part-0.parquet')
+
+    def write(self, table: str, month: str, data) -> None:
+        import pyarrow.parquet as pq
+
+        path = self.partition_path(table, month)
+        if data.num_rows == 0:
+            if os.path.exists(path):
+                os.remove(path)
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Written next to the final file under a non-.parquet name, then swapped in atomically
+        pq.write_table(data, path + '.tmp', compression='zstd')
+        os.replace(path + '.tmp', path)
+
+    def refresh_views(self) -> None:
+        """New tables/partitions become visible to the in-memory views"""
+        self.conn.execute(self._init_sql(self.root))
+
+    def query(self, sql: str):
+        return self.conn.execute(sql).fetchall()
+
+    def snapshot(self, day: str) -> int:
+        if 'inventory_calculated' not in self.tables:
+            raise RuntimeError(f"inventory_calculated not in {self.root}")
+        month = month_of(day)
+        path = self.partition_path(HISTORY_TABLE, month)
+        earlier = 0
+        if HISTORY_TABLE in self.tables:
+            latest = self.query(f"SELECT MAX(snapshot_date) FROM gpc.{HISTORY_TABLE}")[0][0]
+            if latest and latest.isoformat() > day:
+                raise RuntimeError(f"gpc.{HISTORY_TABLE} already has snapshots after {day} (latest {latest})")
+            start, _ = month_range(month)
+            earlier = self.query(f"SELECT COUNT(*) FROM gpc.{HISTORY_TABLE}\n"
+                                 f"WHERE snapshot_date >= DATE '{start}' AND snapshot_date < DATE '{day}'")[0][0]
+
+        # First snapshot of the month is a checkpoint, later ones are deltas against the day before
+        # (a same-day re-run replaces the day's rows; they don't count towards the previous position)
+        new = self.conn.execute(delta_sql(day) if earlier else checkpoint_sql(day)).to_arrow_table()
+        self.conn.register('new_rows', new)
+        kept = (f"SELECT snapshot_date, item, location, kind, quantity FROM read_parquet('{path}')\n"
+                f"WHERE snapshot_date <> DATE '{day}'\nUNION ALL\n") if os.path.exists(path) else ''
+        data = self.conn.execute(f"SELECT * FROM ({kept}SELECT * FROM new_rows)\n"
+                                 "ORDER BY snapshot_date, item, location").to_arrow_table()
+        self.conn.unregister('new_rows')
+        self.write(HISTORY_TABLE, month, data)
+        self.tables[HISTORY_TABLE] = path
+        self.refresh_views()
+        print(f"  {day}: {new.num_rows:,} {'delta' if earlier else 'checkpoint'} rows")
+        return new.num_rows
+
+    def monthly(self, months: List[str]) -> int:
+        rows = 0
+        for month in months:
+            data = self.conn.execute(monthly_sql(month, 'duckdb')).to_arrow_table()
+            self.write(MONTHLY_TABLE, month, data)
+            rows += data.num_rows
+            print(f"  {month}: {data.num_rows:,} monthly positions")
+        self.refresh_views()
+        return rows
+
+    def build(self, day: Optional[str], months: Optional[List[str]]) -> int:
+        if months:
+            if HISTORY_TABLE not in self.tables:
+                raise RuntimeError(f"gpc.{HISTORY_TABLE} not built - take a snapshot first")
+            return self.monthly(months)
+        rows = self.snapshot(day)
+        self.monthly([month_of(day)])
+        return rows
+
+
+class BigQueryBuilder:
+    """Appends a day to gpc.inventory_history and rebuilds its month in gpc.inventory_monthly"""
+
+    def __init__(self, project: str = DEFAULT_BQ_PROJECT):
+        from google.cloud import bigquery
+        self.client = bigquery.Client(project=project)
+
+    def query(self, sql: str):
+        return [tuple(row.values()) for row in self.client.query(sql).result()]
+
+    @staticmethod
+    def script(day: Optional[str], months: Optional[List[str]]) -> str:
+        monthly = ''.join(
+            f"DELETE FROM gpc.{MONTHLY_TABLE} WHERE month = DATE '{month_range(m)[0]}';\n"
+            f"INSERT INTO gpc.{MONTHLY_TABLE}\n{monthly_sql(m, 'bigquery')};\n"
+            for m in (months or [month_of(day)]))
+        if months:
+            return f"{BQ_TABLES_SQL}\nBEGIN TRANSACTION;\n{monthly}COMMIT TRANSACTION;"
+
+        start, _ = month_range(month_of(day))
+        return (
+            f"{BQ_TABLES_SQL}\n"
+            f"IF EXISTS (SELECT 1 FROM gpc.{HISTORY_TABLE} WHERE snapshot_date > DATE '{day}') THEN\n"
+            f"  RAISE USING MESSAGE = 'gpc.{HISTORY_TABLE} already has snapshots after {day}';\n"
+            "END IF;\n"
+            "BEGIN TRANSACTION;\n"
+            f"DELETE FROM gpc.{HISTORY_TABLE} WHERE snapshot_date = DATE '{day}';\n"
+            # First snapshot of the month is a checkpoint, later ones are deltas
+            f"IF EXISTS (SELECT 1 FROM gpc.{HISTORY_TABLE} WHERE snapshot_date BETWEEN DATE '{start}' AND DATE '{day}') THEN\n"
+            f"  INSERT INTO gpc.{HISTORY_TABLE}\n{delta_sql(day)};\n"
+            "ELSE\n"
+            f"  INSERT INTO gpc.{HISTORY_TABLE}\n{checkpoint_sql(day)};\n"
+            "END IF;\n"
+            f"{monthly}"
+            "COMMIT TRANSACTION;"
+        )
+
+    def build(self, day: Optional[str], months: Optional[List[str]]) -> int:
+        self.client.query(self.script(day, months)).result()
+        table = MONTHLY_TABLE if months else HISTORY_TABLE
+        where = (f"month IN ({', '.join(f'DATE {month_range(m)[0]!r}' for m in months)})" if months
+                 else f"snapshot_date = DATE '{day}'")
+        return self.query(f"SELECT COUNT(*) FROM gpc.{table} WHERE {where}")[0][0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Record delta-encoded daily inventory snapshots')
+    parser.add_argument('--engine', choices=['local', 'bigquery'], default='local',
+                        help='Where to keep the history (default: local Parquet)')
+    parser.add_argument('--project', default=DEFAULT_BQ_PROJECT, help='BigQuery project for --engine bigquery')
+    action = parser.add_mutually_exclusive_group()
+    action.add_argument('--date', default=date.today().isoformat(),
+                        help='Snapshot date for the current inventory_calculated (default: today)')
+    action.add_argument('--as-of', help='Print the reconstructed position totals on this date instead')
+    action.add_argument('--months', help='Only rebuild monthly averages for these months (YYYY-MM,YYYY-MM)')
+    parser.add_argument('--print-sql', action='store_true', help='Print the BigQuery script instead of running it')
+    args = parser.parse_args()
+
+    months = [m.strip() for m in args.months.split(',')] if args.months else None
+    if args.print_sql:
+        print(as_of_totals_sql(args.as_of) if args.as_of else BigQueryBuilder.script(args.date, months))
+        return
+
+    print(f"{Colors.BOLD}{'='*80}{Colors.NC}")
+    if args.as_of:
+        print(f"{Colors.BOLD}INVENTORY AS OF {args.as_of}{Colors.NC}  (engine: {args.engine})")
+    else:
+        target = f"gpc.{MONTHLY_TABLE}" if months else f"gpc.{HISTORY_TABLE} ({args.date})"
+        print(f"{Colors.BOLD}SNAPSHOT {target}{Colors.NC}  (engine: {args.engine})")
+    print(f"{Colors.BOLD}{'='*80}{Colors.NC}")
+
+    start = time.time()
+    try:
+        builder = BigQueryBuilder(args.project) if args.engine == 'bigquery' else LocalBuilder()
+        if args.as_of:
+            positions, skus, units = builder.query(as_of_totals_sql(args.as_of))[0]
+            print(f"  {positions:,} positions, {skus:,} SKUs, {units or 0:,.0f} units")
+            return
+        rows = builder.build(args.date, months)
+    except Exception as e:
+        print(f"{Colors.RED}✗ Snapshot failed: {e}{Colors.NC}")
+        sys.exit(1)
+    print(f"{Colors.GREEN}✓ {rows:,} rows written in {time.time() - start:.1f}s{Colors.NC}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Offline DuckDB engine for the Cube model
+
+Serves the `gpc.*` tables from a local, month-partitioned Parquet directory
+instead of BigQuery. Every table is a lazy view over its Parquet files, so
+DuckDB only reads the columns and partitions a query touches. Nothing is
+copied into the database at startup, which keeps startup time flat as the
+data grows. The database file is persistent, so the views, types and macros
+survive restarts.
+
+Expected layout (one directory per table, Hive-style month partitions):
+    <LOCAL_PARQUET_DIR>/transaction_lines/partition_month=2025-01/part-0.parquet
+    <LOCAL_PARQUET_DIR>/transactions/partition_month=2025-01/part-0.parquet
+    <LOCAL_PARQUET_DIR>/items/items.parquet          (small tables need no partitions)
+
+Configuration (environment variables):
+    USE_BIGQUERY                    Set to false to enable the local engine in cube.py
+    LOCAL_PARQUET_DIR               Root of the Parquet directory (default: ./data/parquet)
+    CUBEJS_DB_DUCKDB_DATABASE_PATH  Persistent DuckDB file (default: ./data/local.duckdb)
+    LOCAL_DUCKDB_MEMORY_LIMIT       DuckDB memory_limit, e.g. 4GB (default: DuckDB's own)
+    LOCAL_DUCKDB_THREADS            DuckDB worker threads (default: DuckDB's own)
+
+Usage:
+    python local_engine.py init      # create/refresh the views in the DuckDB file
+    python local_engine.py tables    # list discovered tables and row counts
+    python local_engine.py sql       # print the initSql passed to the Cube DuckDB driver
+"""
+
+import os
+import sys
+import argparse
+from typing import Dict, List, Optional
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_PARQUET_DIR = os.path.join(BASE_DIR, 'data', 'parquet')
+# Not gpc.duckdb: the file name becomes the catalog name and would clash with schema gpc
+DEFAULT_DATABASE_PATH = os.path.join(BASE_DIR, 'data', 'local.duckdb')
+
+SCHEMA = 'gpc'
+PARTITION_COLUMN = 'partition_month'
+
+# BigQuery spellings used by the model SQL that DuckDB understands once aliased.
+# INT64 is already a DuckDB type; TIMESTAMP_TRUNC/DATE_DIFF(..., DAY)/SAFE_CAST
+# cannot be shimmed and need dialect-neutral SQL in the model.
+COMPAT_SQL = """
+CREATE TYPE IF NOT EXISTS FLOAT64 AS DOUBLE;
+CREATE OR REPLACE MACRO parse_date(fmt, s) AS CAST(strptime(s, fmt) AS DATE);
+CREATE OR REPLACE MACRO format_date(fmt, d) AS strftime(CAST(d AS DATE), fmt);
+"""
+
+# HLL sketches written by distinct_sketches.py; BigQuery stores HLL_COUNT.INIT sketches at the same precision
+HLL_PRECISION = 14
+
+# gpc.hll_count_merge(sketch): aggregate that merges the sketches of a group and estimates the
+# distinct count, like the BigQuery UDAF of the same name over HLL_COUNT.MERGE. A local sketch is
+# a sparse register list: register * 64 + rank for every non-empty register (sketches.HyperLogLog).
+# Merging needs the max rank per register; expanding rank k to the flags 1..k turns that into a
+# set union (list_distinct), and sum(2^-max rank) = m - sum(2^-j) over the distinct flags.
+HLL_SQL = f"""
+CREATE OR REPLACE MACRO gpc.hll_flags(codes) AS
+  list_distinct(flatten(list_transform(codes, x -> range(x - x % 64 + 1, x + 1))));
+CREATE OR REPLACE MACRO gpc.hll_estimate(zsum, empty, m) AS
+  CASE WHEN (0.7213 / (1 + 1.079 / m)) * m * m / zsum <= 2.5 * m AND empty > 0
+       THEN m * ln(m / empty)
+       ELSE (0.7213 / (1 + 1.079 / m)) * m * m / zsum END;
+CREATE OR REPLACE MACRO gpc.hll_count_merge(sketch) AS
+  COALESCE(CAST(ROUND(gpc.hll_estimate(
+    {1 << HLL_PRECISION} - COALESCE(list_sum(list_transform(gpc.hll_flags(flatten(list(sketch))),
+                                                            x -> pow(2.0, -(x % 64)))), 0),
+    {1 << HLL_PRECISION} - COALESCE(len(list_filter(gpc.hll_flags(flatten(list(sketch))), x -> x % 64 = 1)), 0),
+    {1 << HLL_PRECISION})) AS BIGINT), 0);
+"""
+
+# gpc.quantile_merge(sketch, phi): aggregate over the t-digests written by quantile_sketches.py
+# (centroid lists of {v: mean, w: weight}), like the BigQuery UDAF over KLL_QUANTILES.MERGE_POINT.
+# Centroids of all sketches sorted by mean; the answer is the first centroid whose cumulative weight
+# reaches phi * total. The running weight and target travel in the list_reduce accumulator.
+QUANTILE_SQL = """
+CREATE OR REPLACE MACRO gpc.quantile_merge(sketch, phi) AS
+  list_reduce(
+    list_sort(flatten(list(sketch))),
+    (acc, c) -> CASE WHEN acc.v IS NOT NULL AND acc.w >= acc.t THEN acc
+                     ELSE {'v': c.v, 'w': acc.w + c.w, 't': acc.t} END,
+    {'v': CAST(NULL AS DOUBLE), 'w': CAST(0 AS BIGINT),
+     't': phi * list_sum(list_transform(flatten(list(sketch)), c -> c.w))}
+  ).v;
+"""
+
+# Same AUDIT filters as create_filtered_views.sql
+DERIVED_VIEWS: Dict[str, tuple] = {
+    'transaction_lines_clean': ('transaction_lines', """
+        WHERE mainline = 'F'
+          AND COALESCE(taxline, 'F') = 'F'
+          AND COALESCE(iscogs, 'F') = 'F'
+          AND COALESCE(transactiondiscount, 'F') = 'F'"""),
+    'transactions_clean': ('transactions', """
+        WHERE COALESCE(posting, 'F') = 'T'
+          AND COALESCE(voided, 'F') = 'F'
+          AND type IN ('CustInvc', 'CashSale', 'CustCred', 'CashRfnd')"""),
+}
+
+
+def parquet_dir() -> str:
+    return os.environ.get('LOCAL_PARQUET_DIR', DEFAULT_PARQUET_DIR)
+
+
+def database_path() -> str:
+    return os.environ.get('CUBEJS_DB_DUCKDB_DATABASE_PATH', DEFAULT_DATABASE_PATH)
+
+
+def discover_tables(root: str) -> Dict[str, str]:
+    """Map table name -> read_parquet glob for every table directory or file under root"""
+    tables = {}
+    if not os.path.isdir(root):
+        return tables
+
+    for entry in sorted(os.listdir(root)):
+        if entry.startswith('.'):
+            continue  # in-progress builds (ingest_netsuite.py, materialize_clean_tables.py)
+        path = os.path.join(root, entry)
+        if os.path.isdir(path):
+            has_parquet = any(f.endswith('.parquet') for _, _, files in os.walk(path) for f in files)
+            if has_parquet:
+                tables[entry] = os.path.join(path, '**', '*.parquet')
+        elif entry.endswith('.parquet'):
+            tables.setdefault(entry[:-len('.parquet')], path)
+
+    return tables
+
+
+def _quote(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def table_view_sql(name: str, glob: str) -> str:
+    """Lazy view over the Parquet files of one table (Hive partitions become columns)"""
+    return (
+        f"CREATE OR REPLACE VIEW {SCHEMA}.{name} AS\n"
+        f"SELECT * FROM read_parquet({_quote(glob)}, hive_partitioning = true, union_by_name = true);"
+    )
+
+
+def build_init_sql(root: Optional[str] = None, memory_limit: Optional[str] = None,
+                   threads: Optional[str] = None) -> str:
+    """Build the initSql run by the DuckDB driver on every connection"""
+    root = root or parquet_dir()
+    memory_limit = memory_limit or os.environ.get('LOCAL_DUCKDB_MEMORY_LIMIT')
+    threads = threads or os.environ.get('LOCAL_DUCKDB_THREADS')
+
+    statements: List[str] = []
+    if memory_limit:
+        statements.append(f"SET memory_limit = {_quote(memory_limit)};")
+    if threads:
+        statements.append(f"SET threads = {int(threads)};")
+
+    statements.append(f"CREATE SCHEMA IF NOT EXISTS {SCHEMA};")
+    statements.append(COMPAT_SQL.strip())
+    statements.append(HLL_SQL.strip())
+    statements.append(QUANTILE_SQL.strip())
+
+    tables = discover_tables(root)
+    for name, glob in tables.items():
+        statements.append(table_view_sql(name, glob))
+
+    # Filtered views, unless a materialized copy exists (materialize_clean_tables.py)
+    for name, (base, where) in DERIVED_VIEWS.items():
+        if base in tables and name not in tables:
+            statements.append(f"CREATE OR REPLACE VIEW {SCHEMA}.{name} AS\nSELECT * FROM {SCHEMA}.{base}{where};")
+
+    return '\n\n'.join(statements)
+
+
+def connect(db_path: Optional[str] = None, read_only: bool = False):
+    """Open the persistent DuckDB file with the local views in place"""
+    import duckdb
+
+    db_path = db_path or database_path()
+    if not read_only:
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+    conn = duckdb.connect(db_path, read_only=read_only)
+    if not read_only:
+        conn.execute(build_init_sql())
+    return conn
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline DuckDB engine over local Parquet')
+    parser.add_argument('command', choices=['init', 'tables', 'sql'],
+                        help='init: create views in the DuckDB file; tables: list row counts; sql: print initSql')
+    parser.add_argument('--parquet-dir', help='Override LOCAL_PARQUET_DIR')
+    parser.add_argument('--database', help='Override CUBEJS_DB_DUCKDB_DATABASE_PATH')
+    args = parser.parse_args()
+
+    if args.parquet_dir:
+        os.environ['LOCAL_PARQUET_DIR'] = args.parquet_dir
+    if args.database:
+        os.environ['CUBEJS_DB_DUCKDB_DATABASE_PATH'] = args.database
+
+    if args.command == 'sql':
+        print(build_init_sql())
+        return
+
+    tables = discover_tables(parquet_dir())
+    if not tables:
+        print(f"No Parquet tables found under {parquet_dir()}")
+        sys.exit(1)
+
+    conn = connect()
+    print(f"Database: {database_path()}")
+    print(f"Parquet:  {parquet_dir()}")
+
+    if args.command == 'tables':
+        derived = [v for v, (base, _) in DERIVED_VIEWS.items() if base in tables]
+        for name in dict.fromkeys(list(tables) + derived):
+            count = conn.execute(f"SELECT COUNT(*) FROM {SCHEMA}.{name}").fetchone()[0]
+            print(f"  {SCHEMA}.{name:<45} {count:>12,}")
+    else:
+        print(f"Created {len(tables)} table views in schema {SCHEMA}")
+
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
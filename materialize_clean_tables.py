@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+Refresh job for gpc.transaction_lines_clean / gpc.transactions_clean as tables
+
+create_filtered_views.sql defined both as plain views, so every query
+re-applied the AUDIT filters (mainline/taxline/iscogs/transactiondiscount,
+posting/voided/type) over the full raw tables although they drop 42% and 33%
+of the rows. This job materializes them with the same filters
+(local_engine.DERIVED_VIEWS), partitioned by transaction month and clustered
+like their base tables (ingest_netsuite.py PARTITION_DATE / CLUSTER_COLUMNS):
+- BigQuery: CREATE OR REPLACE TABLE ... PARTITION BY ... CLUSTER BY on a full
+  build; DELETE + INSERT of the months in scope, in one transaction, otherwise
+- local engine: partition_month=YYYY-MM Parquet directories next to the base
+  tables, which local_engine.py then serves instead of the filtered views
+
+Every refreshed month is validated: the rows in the table must equal the rows
+of the base table passing the filter; a mismatch fails the job (exit 1).
+
+Scopes:
+    --since 2026-10-01        months of the transactions whose header lastmodifieddate is on/after the date
+    --months 2025-09,2025-10  those months
+    --full                    everything (also used when a table doesn't exist yet)
+
+Usage:
+    python3 materialize_clean_tables.py --full                          # local Parquet
+    python3 materialize_clean_tables.py --engine bigquery --since 2026-10-01
+    python3 materialize_clean_tables.py --engine bigquery --print-sql --months 2025-10
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from ingest_netsuite import CLUSTER_COLUMNS, PARTITION_DATE
+from local_engine import DERIVED_VIEWS
+
+# Colors for output
+class Colors:
+    RED = '\033[0;31m'
+    GREEN = '\033[0;32m'
+    YELLOW = '\033[1;33m'
+    BLUE = '\033[0;34m'
+    BOLD = '\033[1m'
+    NC = '\033[0m'  # No Color
+
+
+DEFAULT_BQ_PROJECT = os.environ.get('CUBEJS_DB_BQ_PROJECT_ID', 'gym-plus-coffee')
+
+# Materialized table -> (base table, WHERE clause, month date column, cluster columns)
+CLEAN_TABLES: Dict[str, tuple] = {
+    name: (base, ' '.join(where.split()), PARTITION_DATE[base], CLUSTER_COLUMNS.get(base, []))
+    for name, (base, where) in DERIVED_VIEWS.items()
+}
+
+
+def month_range(month: str) -> tuple:
+    start = datetime.strptime(month, '%Y-%m').date()
+    end = (start.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+    return start.isoformat(), end.isoformat()
+
+
+def months_sql(since: Optional[str] = None) -> str:
+    """Months (YYYY-MM) holding transactions modified on/after since; no argument = all months"""
+    sql = "SELECT DISTINCT FORMAT_DATE('%Y-%m', trandate) AS month FROM gpc.transactions\nWHERE trandate IS NOT NULL"
+    if since:
+        sql += f" AND lastmodifieddate >= DATE '{since}'"
+    return sql
+
+
+def in_months(column: str, months: List[str]) -> str:
+    """Literal date ranges, so BigQuery prunes to the month partitions"""
+    return '(' + ' OR '.join("{} BETWEEN DATE '{}' AND DATE '{}'".format(column, *month_range(m))
+                             for m in months) + ')'
+
+
+class LocalBuilder:
+    """Writes LOCAL_PARQUET_DIR/<table>/partition_month=YYYY-MM/ from the local base tables"""
+
+    def __init__(self):
+        import duckdb
+        from local_engine import PARTITION_COLUMN, build_init_sql, discover_tables, parquet_dir
+
+        self.root = parquet_dir()
+        self.partition_column = PARTITION_COLUMN
+        self.tables = discover_tables(self.root)
+        # In-memory database: the persistent file may be locked by a running Cube server
+        self.conn = duckdb.connect()
+        self.conn.execute(build_init_sql(self.root))
+
+    def columns(self, table: str) -> List[str]:
+        return [row[0] for row in self.conn.execute(f"DESCRIBE SELECT * FROM gpc.{table}").fetchall()]
+
+    def months(self, months: Optional[List[str]], since: Optional[str]) -> List[str]:
+        if months:
+            return months
+        return sorted(row[0] for row in self.conn.execute(months_sql(since)).fetchall())
+
+    def build(self, months: Optional[List[str]], since: Optional[str], full: bool) -> Dict[str, Dict[str, tuple]]:
+        """Returns table -> month -> (rows in table, rows expected); month '*' for a full build"""
+        results = {}
+        for name, (base, where, date_column, cluster) in CLEAN_TABLES.items():
+            if base not in self.tables:
+                print(f"{Colors.YELLOW}! {base} not in {self.root} - {name} skipped{Colors.NC}")
+                continue
+            base_columns = self.columns(base)
+            select = f"SELECT * EXCLUDE ({self.partition_column})" if self.partition_column in base_columns \
+                else "SELECT *"
+            order = f" ORDER BY {', '.join(cluster + [date_column])}"
+            table_dir = os.path.join(self.root, name)
+
+            if full or name not in self.tables:
+                start = time.time()
+                tmp_dir = os.path.join(self.root, f".{name}.build")
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+                self.conn.execute(
+                    f"COPY ({select}, strftime({date_column}, '%Y-%m') AS {self.partition_column} "
+                    f"FROM gpc.{base} {where}{order}) TO '{tmp_dir}' (FORMAT PARQUET, COMPRESSION ZSTD, "
+                    f"PARTITION_BY ({self.partition_column}), FILENAME_PATTERN 'part-{{i}}')")
+                shutil.rmtree(table_dir, ignore_errors=True)
+                os.rename(tmp_dir, table_dir)
+                actual = self.conn.execute(
+                    f"SELECT COUNT(*) FROM read_parquet('{os.path.join(table_dir, '**', '*.parquet')}')").fetchone()[0]
+                expected = self.conn.execute(f"SELECT COUNT(*) FROM gpc.{base} {where}").fetchone()[0]
+                results[name] = {'*': (actual, expected)}
+                print(f"  {name}: {actual:,} rows, full build ({time.time() - start:.1f}s)")
+                continue
+
+            results[name] = {}
+            for month in self.months(months, since):
+                start = time.time()
+                if self.partition_column in base_columns:
+                    month_filter = f"{self.partition_column} = '{month}'"
+                else:
+                    month_filter = in_months(date_column, [month])
+                path = os.path.join(table_dir, f"{self.partition_column}={month}", 'part-0.parquet')
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                # Written next to the final file under a non-.parquet name, then swapped in atomically
+                tmp_path = path + '.tmp'
+                self.conn.execute(f"COPY ({select} FROM gpc.{base} {where} AND {month_filter}{order}) "
+                                  f"TO '{tmp_path}' (FORMAT PARQUET, COMPRESSION ZSTD)")
+                actual = self.conn.execute(f"SELECT COUNT(*) FROM read_parquet('{tmp_path}')").fetchone()[0]
+                if actual:
+                    os.replace(tmp_path, path)
+                else:
+                    os.remove(tmp_path)
+                    shutil.rmtree(os.path.dirname(path), ignore_errors=True)
+                expected = self.conn.execute(
+                    f"SELECT COUNT(*) FROM gpc.{base} {where} AND {in_months(date_column, [month])}").fetchone()[0]
+                results[name][month] = (actual, expected)
+                print(f"  {name} {month}: {actual:,} rows ({time.time() - start:.1f}s)")
+        return results
+
+
+class BigQueryBuilder:
+    """Full CREATE OR REPLACE, or DELETE + INSERT of the months in scope, per clean table"""
+
+    def __init__(self, project: str = DEFAULT_BQ_PROJECT):
+        from google.cloud import bigquery
+        self.client = bigquery.Client(project=project)
+
+    def table_type(self, name: str) -> Optional[str]:
+        """TABLE, VIEW (the old create_filtered_views.sql definition) or None"""
+        from google.api_core.exceptions import NotFound
+        try:
+            return self.client.get_table(f"gpc.{name}").table_type
+        except NotFound:
+            return None
+
+    @staticmethod
+    def script(name: str, months: Optional[List[str]], full: bool, replaces_view: bool = False) -> str:
+        base, where, date_column, cluster = CLEAN_TABLES[name]
+        if full:
+            ddl = f"DROP VIEW IF EXISTS gpc.{name};\n" if replaces_view else ''
+            ddl += f"CREATE OR REPLACE TABLE gpc.{name}\nPARTITION BY DATE_TRUNC({date_column}, MONTH)\n"
+            if cluster:
+                ddl += f"CLUSTER BY {', '.join(cluster[:4])}\n"
+            return ddl + f"AS SELECT * FROM gpc.{base}\n{where};"
+        scope = in_months(date_column, months)
+        return (
+            "BEGIN TRANSACTION;\n"
+            f"DELETE FROM gpc.{name}\nWHERE {scope};\n"
+            f"INSERT INTO gpc.{name}\nSELECT * FROM gpc.{base}\n{where}\n  AND {scope};\n"
+            "COMMIT TRANSACTION;"
+        )
+
+    def counts(self, name: str, months: Optional[List[str]]) -> Dict[str, tuple]:
+        """month -> (rows in table, rows expected); month '*' when months is None"""
+        base, where, date_column, _ = CLEAN_TABLES[name]
+        month = "'*'" if months is None else f"FORMAT_DATE('%Y-%m', {date_column})"
+        scope = f"\n  AND {in_months(date_column, months)}" if months else ''
+        sql = (f"WITH actual AS (SELECT {month} AS month, COUNT(*) AS n FROM gpc.{name}\n"
+               f"  WHERE TRUE{scope} GROUP BY 1),\n"
+               f"expected AS (SELECT {month} AS month, COUNT(*) AS n FROM gpc.{base}\n  {where}{scope} GROUP BY 1)\n"
+               "SELECT month, IFNULL(actual.n, 0), IFNULL(expected.n, 0)\n"
+               "FROM actual FULL OUTER JOIN expected USING (month)")
+        return {row[0]: (row[1], row[2]) for row in self.client.query(sql).result()}
+
+    def build(self, months: Optional[List[str]], since: Optional[str], full: bool) -> Dict[str, Dict[str, tuple]]:
+        if not full and not months:
+            months = sorted(row[0] for row in self.client.query(months_sql(since)).result())
+        results = {}
+        for name in CLEAN_TABLES:
+            start = time.time()
+            table_type = self.table_type(name)
+            full_build = full or table_type != 'TABLE'
+            if not full_build and not months:
+                results[name] = {}
+                continue
+            self.client.query(self.script(name, months, full_build, replaces_view=table_type == 'VIEW')).result()
+            results[name] = self.counts(name, None if full_build else months)
+            print(f"  {name}: {'full build' if full_build else f'{len(months)} month(s)'} "
+                  f"({time.time() - start:.1f}s)")
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Materialize the AUDIT-filtered _clean tables incrementally')
+    parser.add_argument('--engine', choices=['local', 'bigquery'], default='local',
+                        help='Where to build the tables (default: local Parquet)')
+    parser.add_argument('--project', default=DEFAULT_BQ_PROJECT, help='BigQuery project for --engine bigquery')
+    scope = parser.add_mutually_exclusive_group(required=True)
+    scope.add_argument('--since', help='Rebuild months of transactions modified on/after this date (YYYY-MM-DD)')
+    scope.add_argument('--months', help='Rebuild these months (YYYY-MM,YYYY-MM)')
+    scope.add_argument('--full', action='store_true', help='Rebuild the whole tables')
+    parser.add_argument('--print-sql', action='store_true',
+                        help='Print the BigQuery scripts instead of running them (--months or --full)')
+    args = parser.parse_args()
+
+    months = [m.strip() for m in args.months.split(',')] if args.months else None
+    if args.print_sql:
+        if args.since:
+            parser.error('--print-sql needs --months or --full (--since resolves months from BigQuery)')
+        print('\n\n'.join(BigQueryBuilder.script(name, months, args.full) for name in CLEAN_TABLES))
+        return
+
+    print(f"{Colors.BOLD}{'='*80}{Colors.NC}")
+    print(f"{Colors.BOLD}MATERIALIZE {', '.join(CLEAN_TABLES)}{Colors.NC}  (engine: {args.engine})")
+    print(f"{Colors.BOLD}{'='*80}{Colors.NC}")
+
+    start = time.time()
+    try:
+        builder = BigQueryBuilder(args.project) if args.engine == 'bigquery' else LocalBuilder()
+        results = builder.build(months, args.since, args.full)
+    except Exception as e:
+        print(f"{Colors.RED}✗ Build failed: {e}{Colors.NC}")
+        sys.exit(1)
+
+    print(f"\n{Colors.BOLD}Row count validation{Colors.NC}")
+    mismatches = 0
+    for name, counts in results.items():
+        for month, (actual, expected) in sorted(counts.items()):
+            ok = actual == expected
+            mismatches += not ok
+            color = Colors.GREEN if ok else Colors.RED
+            label = 'all months' if month == '*' else month
+            print(f"  {color}{'✓' if ok else '✗'} {name:<26} {label:<10} {actual:>12,} rows "
+                  f"(expected {expected:,}){Colors.NC}")
+
+    if mismatches:
+        print(f"\n{Colors.RED}✗ {mismatches} partition(s) failed validation{Colors.NC}")
+        sys.exit(1)
+    print(f"\n{Colors.GREEN}✓ Done in {time.time() - start:.1f}s{Colors.NC}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Build stage for gpc.order_baskets, the order-grain table the order_baskets cube reads
+
+The cube SQL used to GROUP BY transaction over every line of
+transaction_lines_denormalized_patched (joined to transactions_analysis and
+b2b_customers) on each uncached query and rollup build. This script keeps
+the same rows materialized - one per order (transaction, email, country):
+- trandate, type                       from the header
+- line_count, units, order_total       line aggregates
+- line_count_bucket                    '1 item' / '2 items' / '3 items' / '4+ items'
+- customer_type                        'B2B/Wholesale' when the entity is in b2b_customers
+
+Every row depends on one order only, so the table is rebuilt incrementally,
+keyed by transaction, partitioned by order month:
+- BigQuery: DELETE + INSERT of the orders in scope, in one transaction
+- local engine: the month partitions (Parquet) holding those orders are rewritten
+
+Scopes:
+    --since 2026-10-01        orders whose header lastmodifieddate is on/after the date, plus the
+                              orders of b2b_customers entries modified since (customer_type)
+    --months 2025-09,2025-10  every order dated in those months
+    --full                    everything (also used when the table doesn't exist yet)
+
+Usage:
+    python3 order_baskets.py --full                      # local Parquet
+    python3 order_baskets.py --since 2026-10-01
+    python3 order_baskets.py --engine bigquery --since 2026-10-01
+    python3 order_baskets.py --engine bigquery --print-sql --months 2025-10
+
+Run it before partition_refresh.py so the basket_analysis rollup sees the new rows.
+"""
+
+import os
+import sys
+import time
+import argparse
+from typing import Dict, List, Optional
+
+from enrich_transaction_lines import month_range
+
+# Colors for output
+class Colors:
+    RED = '\033[0;31m'
+    GREEN = '\033[0;32m'
+    YELLOW = '\033[1;33m'
+    BLUE = '\033[0;34m'
+    BOLD = '\033[1m'
+    NC = '\033[0m'  # No Color
+
+
+BASKETS_TABLE = 'order_baskets'
+DEFAULT_BQ_PROJECT = os.environ.get('CUBEJS_DB_BQ_PROJECT_ID', 'gym-plus-coffee')
+
+# BigQuery views a local Parquet export doesn't have, and what stands in for them
+LOCAL_STAND_INS = {
+    'transaction_lines_denormalized_patched':
+        "SELECT l.*, t.billing_country FROM gpc.transaction_lines_denormalized_mv l\n"
+        "    LEFT JOIN gpc.transactions t ON l.transaction = t.id",
+    'transactions_analysis': "SELECT * FROM gpc.transactions",
+    'b2b_customers': "SELECT CAST(NULL AS INT64) AS id, CAST(NULL AS DATE) AS lastmodifieddate WHERE FALSE",
+}
+
+# Same logic as the former order_baskets cube SQL; {in_scope} restricts the lines to the
+# orders being rebuilt (empty for a full build)
+BASKETS_SQL = """
+WITH {scope_cte}lines AS (
+  SELECT * FROM {transaction_lines_denormalized_patched}{in_scope}
+)
+SELECT
+  tl.transaction as order_id,
+  t.trandate,
+  t.type,
+  tl.customer_email,
+  tl.billing_country,
+  CAST(COUNT(*) AS FLOAT64) as line_count,
+  CAST(SUM(CASE WHEN tl.quantity < 0 THEN ABS(tl.quantity) ELSE 0 END) AS FLOAT64) as units,
+  CAST(SUM(tl.amount * -1) AS FLOAT64) as order_total,
+  CASE
+    WHEN COUNT(*) = 1 THEN '1 item'
+    WHEN COUNT(*) = 2 THEN '2 items'
+    WHEN COUNT(*) = 3 THEN '3 items'
+    ELSE '4+ items'
+  END as line_count_bucket,
+  CASE
+    WHEN b2b.id IS NOT NULL THEN 'B2B/Wholesale'
+    ELSE 'Retail/D2C'
+  END as customer_type
+FROM lines tl
+JOIN {transactions_analysis} t ON tl.transaction = t.id
+LEFT JOIN {b2b_customers} b2b ON t.entity = b2b.id
+GROUP BY tl.transaction, t.trandate, t.type, tl.customer_email, tl.billing_country, customer_type"""
+
+
+def scope_sql(months: Optional[List[str]] = None, since: Optional[str] = None,
+              tables: Optional[Dict[str, str]] = None) -> str:
+    """Order ids (INT64 column `transaction`) to rebuild; no arguments = all"""
+    tables = tables or source_tables()
+    if since:
+        return (f"SELECT id AS transaction FROM {tables['transactions_analysis']}\n"
+                f"  WHERE lastmodifieddate >= DATE '{since}'\n"
+                f"     OR entity IN (SELECT id FROM {tables['b2b_customers']} WHERE lastmodifieddate >= DATE '{since}')")
+    sql = f"SELECT id AS transaction FROM {tables['transactions_analysis']}"
+    if months:
+        ranges = ' OR '.join("trandate BETWEEN DATE '{}' AND DATE '{}'".format(*month_range(m)) for m in months)
+        sql += f"\n  WHERE {ranges}"
+    return sql
+
+
+def source_tables(substitutes: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    tables = {name: f"gpc.{name}" for name in LOCAL_STAND_INS}
+    tables.update({name: f"({sql})" for name, sql in (substitutes or {}).items()})
+    return tables
+
+
+def baskets_sql(scope: Optional[str], substitutes: Optional[Dict[str, str]] = None) -> str:
+    return BASKETS_SQL.format(
+        scope_cte=f"scope AS (\n  {scope}\n),\n" if scope else '',
+        in_scope="\n  WHERE transaction IN (SELECT transaction FROM scope)" if scope else '',
+        **source_tables(substitutes))
+
+
+class LocalBuilder:
+    """Rewrites the affected month partitions under LOCAL_PARQUET_DIR/order_baskets"""
+
+    def __init__(self):
+        import duckdb
+        from local_engine import PARTITION_COLUMN, build_init_sql, discover_tables, parquet_dir
+
+        self.root = parquet_dir()
+        self.partition_column = PARTITION_COLUMN
+        self.tables = discover_tables(self.root)
+        # In-memory database: the persistent file may be locked by a running Cube server
+        self.conn = duckdb.connect()
+        self.conn.execute(build_init_sql(self.root))
+
+    def affected_months(self, scope: str, tables: Dict[str, str]) -> List[str]:
+        """Months holding the scoped orders now, or in the previous build"""
+        sql = (f"SELECT DISTINCT FORMAT_DATE('%Y-%m', trandate) FROM {tables['transactions_analysis']}\n"
+               f"WHERE id IN ({scope})")
+        if BASKETS_TABLE in self.tables:
+            sql += (f"\nUNION SELECT DISTINCT {self.partition_column} FROM gpc.{BASKETS_TABLE}\n"
+                    f"WHERE order_id IN ({scope})")
+        return sorted(row[0] for row in self.conn.execute(sql).fetchall() if row[0])
+
+    def build(self, months: Optional[List[str]], since: Optional[str], full: bool) -> int:
+        missing = [t for t in ('transaction_lines_denormalized_mv', 'transactions') if t not in self.tables]
+        if missing:
+            raise RuntimeError(f"Missing local tables: {', '.join(missing)}")
+
+        substitutes = {name: sql for name, sql in LOCAL_STAND_INS.items() if name not in self.tables}
+        for name in substitutes:
+            print(f"{Colors.YELLOW}! {name} not in {self.root} - using its local stand-in{Colors.NC}")
+        tables = source_tables(substitutes)
+
+        if full or BASKETS_TABLE not in self.tables:
+            months = self.affected_months(scope_sql(tables=tables), tables)
+        elif since:
+            months = self.affected_months(scope_sql(since=since, tables=tables), tables)
+
+        rows = 0
+        table_dir = os.path.join(self.root, BASKETS_TABLE)
+        for month in months or []:
+            start = time.time()
+            sql = baskets_sql(scope_sql(months=[month], tables=tables), substitutes)
+            path = os.path.join(table_dir, f"{self.partition_column}={month}", 'part-0.parquet')
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Written next to the final file under a non-.parquet name, then swapped in atomically
+            tmp_path = path + '.tmp'
+            self.conn.execute(f"COPY ({sql}\nORDER BY trandate, order_id) TO '{tmp_path}' "
+                              "(FORMAT PARQUET, COMPRESSION ZSTD)")
+            count = self.conn.execute(f"SELECT COUNT(*) FROM read_parquet('{tmp_path}')").fetchone()[0]
+            if count:
+                os.replace(tmp_path, path)
+            else:
+                os.remove(tmp_path)
+                if os.path.exists(path):
+                    os.remove(path)
+            rows += count
+            print(f"  {month}: {count:,} orders ({time.time() - start:.1f}s)")
+        return rows
+
+
+class BigQueryBuilder:
+    """DELETE + INSERT of the scoped orders in gpc.order_baskets"""
+
+    def __init__(self, project: str = DEFAULT_BQ_PROJECT):
+        from google.cloud import bigquery
+        self.client = bigquery.Client(project=project)
+
+    def exists(self) -> bool:
+        from google.api_core.exceptions import NotFound
+        try:
+            self.client.get_table(f"gpc.{BASKETS_TABLE}")
+            return True
+        except NotFound:
+            return False
+
+    @staticmethod
+    def script(months: Optional[List[str]], since: Optional[str], full: bool) -> str:
+        if full:
+            return (f"CREATE OR REPLACE TABLE gpc.{BASKETS_TABLE}\n"
+                    "PARTITION BY DATE_TRUNC(trandate, MONTH)\n"
+                    "CLUSTER BY billing_country, line_count_bucket, type, customer_type AS"
+                    + baskets_sql(None) + ';')
+        scope = scope_sql(months, since)
+        return (
+            "BEGIN TRANSACTION;\n"
+            f"DELETE FROM gpc.{BASKETS_TABLE}\nWHERE order_id IN ({scope});\n"
+            f"INSERT INTO gpc.{BASKETS_TABLE}" + baskets_sql(scope) + ';\n'
+            "COMMIT TRANSACTION;"
+        )
+
+    def build(self, months: Optional[List[str]], since: Optional[str], full: bool) -> int:
+        job = self.client.query(self.script(months, since, full or not self.exists()))
+        job.result()
+        rows = sum((child.num_dml_affected_rows or 0) for child in self.client.list_jobs(parent_job=job.job_id)
+                   if child.statement_type == 'INSERT')
+        return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Materialize gpc.order_baskets incrementally')
+    parser.add_argument('--engine', choices=['local', 'bigquery'], default='local',
+                        help='Where to build the table (default: local Parquet)')
+    parser.add_argument('--project', default=DEFAULT_BQ_PROJECT, help='BigQuery project for --engine bigquery')
+    scope = parser.add_mutually_exclusive_group(required=True)
+    scope.add_argument('--since', help='Rebuild orders modified on/after this date (YYYY-MM-DD)')
+    scope.add_argument('--months', help='Rebuild orders dated in these months (YYYY-MM,YYYY-MM)')
+    scope.add_argument('--full', action='store_true', help='Rebuild the whole table')
+    parser.add_argument('--print-sql', action='store_true', help='Print the BigQuery script instead of running it')
+    args = parser.parse_args()
+
+    months = [m.strip() for m in args.months.split(',')] if args.months else None
+    if args.print_sql:
+        print(BigQueryBuilder.script(months, args.since, args.full))
+        return
+
+    print(f"{Colors.BOLD}{'='*80}{Colors.NC}")
+    print(f"{Colors.BOLD}BUILD gpc.{BASKETS_TABLE}{Colors.NC}  (engine: {args.engine})")
+    print(f"{Colors.BOLD}{'='*80}{Colors.NC}")
+
+    start = time.time()
+    try:
+        builder = BigQueryBuilder(args.project) if args.engine == 'bigquery' else LocalBuilder()
+        rows = builder.build(months, args.since, args.full)
+    except Exception as e:
+        print(f"{Colors.RED}✗ Build failed: {e}{Colors.NC}")
+        sys.exit(1)
+    print(f"{Colors.GREEN}✓ {rows:,} orders written in {time.time() - start:.1f}s{Colors.NC}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,505 @@
+#!/usr/bin/env python3
+"""
+Partition-aware refresh for the monthly-partitioned rollups
+
+Instead of rebuilding every monthly partition to pick up a few NetSuite edits,
+fingerprints each month of a cube's source tables in ONE grouped scan and
+rebuilds only the partitions whose fingerprint changed since the last run:
+- tables with NetSuite's lastmodifieddate: row count + checksum of (id, lastmodifieddate)
+- tables without it (transaction_lines_enriched, order_baskets, inventory_monthly): row count + checksum of the full row
+Both checksums are XORs of row hashes, so they don't depend on row order.
+
+Months inside the update window (the months overlapping the last N days up
+to today, N from the rollups' refresh_key.update_window) are rebuilt on every run regardless:
+late GL postings and shipments land there, and they only reach the enriched
+table when enrich_transaction_lines.py re-enriches their transaction.
+
+Rebuilds are posted to Cube's /pre-aggregations/jobs API with a dateRange
+selector per run of consecutive changed months, naming only the rollups whose
+build range (rolling CURRENT_DATE ranges as of today) covers those months, so they work the same whether
+Cube serves BigQuery or the local DuckDB engine (local_engine.py). The
+fingerprinting scan runs against the same engine with --engine.
+
+The first run for an engine only records a baseline (the rollups are assumed
+current); pass --full to rebuild every month instead. Fingerprints are stored
+in partition_refresh.sqlite next to this script (override with --db or
+PARTITION_REFRESH_DB) and only updated once the rebuild jobs were accepted.
+
+Usage:
+    python3 partition_refresh.py status                      # what would be rebuilt (local engine)
+    python3 partition_refresh.py run --wait                  # post rebuild jobs and wait for them
+    python3 partition_refresh.py run --engine bigquery
+    python3 partition_refresh.py history
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import sqlite3
+import argparse
+from datetime import date, datetime, timedelta
+from typing import Dict, Any, List, Optional, Tuple
+
+from cube_model import DEFAULT_MODEL_DIR, PreAggregation, load_model
+
+# Colors for output
+class Colors:
+    RED = '\033[0;31m'
+    GREEN = '\033[0;32m'
+    YELLOW = '\033[1;33m'
+    BLUE = '\033[0;34m'
+    BOLD = '\033[1m'
+    NC = '\033[0m'  # No Color
+
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DB = os.environ.get('PARTITION_REFRESH_DB', os.path.join(REPO_DIR, 'partition_refresh.sqlite'))
+DEFAULT_BQ_PROJECT = os.environ.get('CUBEJS_DB_BQ_PROJECT_ID', 'gym-plus-coffee')
+DEFAULT_TIMEZONE = 'UTC'
+JOB_POLL_INTERVAL = 5.0
+
+# Source tables behind each partitioned cube: (table, DATE column of the row, last-modified column).
+# Dates are DATE columns (ingest_netsuite.py), so the expressions run on both engines.
+SOURCES: Dict[str, List[Tuple[str, str, Optional[str]]]] = {
+    'transaction_lines': [
+        ('gpc.transaction_lines_enriched', "transaction_date", None),
+        ('gpc.transactions', "trandate", 'lastmodifieddate'),
+    ],
+    'order_baskets': [
+        ('gpc.order_baskets', "trandate", None),
+    ],
+    'transactions': [
+        ('gpc.transactions', "trandate", 'lastmodifieddate'),
+    ],
+    'inventory_monthly': [
+        ('gpc.inventory_monthly', "month", None),
+    ],
+}
+
+ROW_HASH = {
+    'duckdb': "hash(t)",
+    'bigquery': "FARM_FINGERPRINT(TO_JSON_STRING(t))",
+}
+MODIFIED_HASH = {
+    'duckdb': "hash(t.id, t.{column})",
+    'bigquery': "FARM_FINGERPRINT(CONCAT(CAST(t.id AS STRING), '|', IFNULL(CAST(t.{column} AS STRING), '')))",
+}
+
+INTERVAL = re.compile(r"^\s*(\d+)\s*(day|week|month)s?\s*$", re.IGNORECASE)
+INTERVAL_DAYS = {'day': 1, 'week': 7, 'month': 30}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS fingerprints (
+    engine      TEXT NOT NULL,
+    source      TEXT NOT NULL,
+    month       TEXT NOT NULL,
+    row_count   INTEGER NOT NULL,
+    checksum    TEXT,
+    checked_at  TEXT NOT NULL,
+    PRIMARY KEY (engine, source, month)
+);
+
+CREATE TABLE IF NOT EXISTS refreshes (
+    refresh_id        INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_at            TEXT NOT NULL,
+    engine            TEXT NOT NULL,
+    cube              TEXT NOT NULL,
+    months            TEXT NOT NULL,
+    pre_aggregations  TEXT NOT NULL,
+    tokens            TEXT
+);
+"""
+
+
+def connect_db(db_path: str = DEFAULT_DB) -> sqlite3.Connection:
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    conn.executescript(SCHEMA)
+    return conn
+
+
+class LocalEngine:
+    """Fingerprint queries against the local Parquet through DuckDB"""
+    name = 'local'
+    dialect = 'duckdb'
+
+    def __init__(self):
+        import duckdb
+        from local_engine import build_init_sql
+
+        # In-memory database: the persistent file may be locked by a running Cube server
+        self.conn = duckdb.connect()
+        self.conn.execute(build_init_sql())
+
+    def query(self, sql: str) -> List[tuple]:
+        return self.conn.execute(sql).fetchall()
+
+
+class BigQueryEngine:
+    """Fingerprint queries against BigQuery (requires google-cloud-bigquery and credentials)"""
+    name = 'bigquery'
+    dialect = 'bigquery'
+
+    def __init__(self, project: str = DEFAULT_BQ_PROJECT):
+        from google.cloud import bigquery
+        self.client = bigquery.Client(project=project)
+
+    def query(self, sql: str) -> List[tuple]:
+        return [tuple(row.values()) for row in self.client.query(sql).result()]
+
+
+def fingerprint_sql(dialect: str, table: str, date_sql: str, modified: Optional[str]) -> str:
+    row_hash = MODIFIED_HASH[dialect].format(column=modified) if modified else ROW_HASH[dialect]
+    return f"""
+        SELECT FORMAT_DATE('%Y-%m', {date_sql}) AS month,
+               COUNT(*) AS row_count,
+               CAST(BIT_XOR({row_hash}) AS STRING) AS checksum
+        FROM {table} t
+        WHERE {date_sql} IS NOT NULL
+        GROUP BY 1
+        ORDER BY 1"""
+
+
+def fingerprint(engine, table: str, date_sql: str, modified: Optional[str]) -> Dict[str, Tuple[int, str]]:
+    """month -> (row_count, checksum) for one source table"""
+    rows = engine.query(fingerprint_sql(engine.dialect, table, date_sql, modified))
+    return {str(month): (int(count), str(checksum)) for month, count, checksum in rows}
+
+
+def stored_fingerprints(conn: sqlite3.Connection, engine: str, source: str) -> Dict[str, Tuple[int, str]]:
+    rows = conn.execute("SELECT month, row_count, checksum FROM fingerprints WHERE engine = ? AND source = ?",
+                        (engine, source)).fetchall()
+    return {row['month']: (row['row_count'], row['checksum']) for row in rows}
+
+
+def save_fingerprints(conn: sqlite3.Connection, engine: str, source: str,
+                      current: Dict[str, Tuple[int, str]], months: List[str]):
+    checked_at = datetime.now().isoformat(timespec='seconds')
+    conn.execute(f"DELETE FROM fingerprints WHERE engine = ? AND source = ? AND month IN ({','.join('?' * len(months))})",
+                 (engine, source, *months))
+    conn.executemany(
+        "INSERT INTO fingerprints (engine, source, month, row_count, checksum, checked_at) VALUES (?, ?, ?, ?, ?, ?)",
+        [(engine, source, month, *current[month], checked_at) for month in months if month in current])
+    conn.commit()
+
+
+def interval_days(value: Optional[str]) -> int:
+    """'60 day' / '8 week' / '2 month' -> days (0 when unset)"""
+    if not value:
+        return 0
+    match = INTERVAL.match(str(value))
+    if not match:
+        raise ValueError(f"Unsupported interval: {value}")
+    return int(match.group(1)) * INTERVAL_DAYS[match.group(2).lower()]
+
+
+def month_bounds(month: str) -> Tuple[date, date]:
+    start = datetime.strptime(month, '%Y-%m').date()
+    next_month = (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return start, next_month - timedelta(days=1)
+
+
+def covers(pre_agg: PreAggregation, month: str) -> bool:
+    """Whether the month is inside the rollup's build range (CURRENT_DATE ends resolve to today)"""
+    return (pre_agg.build_range_start is None or month >= pre_agg.build_range_start[:7]) and \
+           (pre_agg.build_range_end is None or month <= pre_agg.build_range_end[:7])
+
+
+def build_range(pre_aggs: List[PreAggregation]) -> Tuple[Optional[str], Optional[str]]:
+    """Widest (start month, end month) over the rollups; None = open-ended"""
+    starts = [p.build_range_start for p in pre_aggs]
+    ends = [p.build_range_end for p in pre_aggs]
+    start = None if None in starts else min(starts)[:7]
+    end = None if None in ends else max(ends)[:7]
+    return start, end
+
+
+def month_ranges(months: List[str]) -> List[Tuple[str, str]]:
+    """Collapse sorted months into [first day, last day] ranges of consecutive months"""
+    ranges = []
+    for month in months:
+        start, end = month_bounds(month)
+        if ranges and datetime.strptime(ranges[-1][1], '%Y-%m-%d').date() + timedelta(days=1) == start:
+            ranges[-1] = (ranges[-1][0], end.isoformat())
+        else:
+            ranges.append((start.isoformat(), end.isoformat()))
+    return ranges
+
+
+class RefreshPlan:
+    def __init__(self, cube: str, pre_aggs: List[PreAggregation], window_days: int,
+                 today: Optional[date] = None):
+        self.cube = cube
+        self.pre_aggs = pre_aggs
+        self.window_days = window_days
+        self.today = today or date.today()
+        self.range_start, self.range_end = build_range(pre_aggs)
+        self.current: Dict[str, Dict[str, Tuple[int, str]]] = {}   # source -> month -> fingerprint
+        self.previous: Dict[str, Dict[str, Tuple[int, str]]] = {}
+        self.reasons: Dict[str, List[str]] = {}                   # month -> why it is rebuilt
+        self.outside: List[str] = []                              # months with data outside the build range
+        self.baseline = False
+
+    def in_range(self, month: str) -> bool:
+        return (self.range_start is None or month >= self.range_start) and \
+               (self.range_end is None or month <= self.range_end)
+
+    @property
+    def months(self) -> List[str]:
+        """Every month with source data inside the build range"""
+        seen = {m for fingerprints in self.current.values() for m in fingerprints}
+        return sorted(m for m in seen if self.in_range(m))
+
+    def compare(self, full: bool = False):
+        months = self.months
+        seen = {m for fingerprints in self.current.values() for m in fingerprints}
+        self.outside = sorted(m for m in seen if not self.in_range(m))
+        self.baseline = not full and not any(self.previous.values())
+
+        if full:
+            for month in months:
+                self.reasons.setdefault(month, []).append('full rebuild')
+            return
+
+        if self.baseline:
+            return
+        for source, current in self.current.items():
+            previous = self.previous.get(source, {})
+            for month in sorted(set(current) | set(previous)):
+                if not self.in_range(month):
+                    continue
+                if month not in previous:
+                    reason = f"new in {source}"
+                elif month not in current:
+                    reason = f"emptied in {source}"
+                elif current[month] != previous[month]:
+                    delta = current[month][0] - previous[month][0]
+                    reason = f"changed in {source} ({delta:+,} rows)" if delta else f"changed in {source}"
+                else:
+                    continue
+                self.reasons.setdefault(month, []).append(reason)
+
+        # Update window: months overlapping the last window_days up to today are always rebuilt
+        if months and self.window_days:
+            window_start = self.today - timedelta(days=self.window_days - 1)
+            for month in months:
+                if month_bounds(month)[1] >= window_start:
+                    self.reasons.setdefault(month, []).append('update window')
+
+    @property
+    def rebuild(self) -> List[str]:
+        return sorted(self.reasons)
+
+    def covering(self, month: str) -> List[PreAggregation]:
+        """Rollups with a partition for the month"""
+        return [p for p in self.pre_aggs if covers(p, month)]
+
+
+def plan_cube(model, engine, db: sqlite3.Connection, cube_name: str, window_days: Optional[int],
+              full: bool) -> Optional[RefreshPlan]:
+    pre_aggs = [p for p in model.pre_aggregations(cube_name) if p.partition_granularity == 'month']
+    if not pre_aggs:
+        print(f"{Colors.YELLOW}Skipping {cube_name}: no monthly-partitioned rollups{Colors.NC}")
+        return None
+    if window_days is None:
+        window_days = max(interval_days(p.update_window) for p in pre_aggs)
+
+    plan = RefreshPlan(cube_name, pre_aggs, window_days)
+    for table, date_sql, modified in SOURCES.get(cube_name, []):
+        start = time.time()
+        try:
+            plan.current[table] = fingerprint(engine, table, date_sql, modified)
+        except Exception as e:
+            print(f"{Colors.YELLOW}! {table}: not fingerprinted ({str(e).splitlines()[0][:120]}){Colors.NC}")
+            continue
+        plan.previous[table] = stored_fingerprints(db, engine.name, table)
+        kind = f"id + {modified}" if modified else 'full row'
+        print(f"  {table}: {len(plan.current[table])} months, {kind} checksum ({time.time() - start:.1f}s)")
+
+    if not plan.current:
+        print(f"{Colors.RED}No source of {cube_name} could be fingerprinted{Colors.NC}")
+        return None
+    plan.compare(full)
+    return plan
+
+
+def print_plan(plan: RefreshPlan):
+    months = plan.months
+    range_text = f"{plan.range_start or 'first month'} .. {plan.range_end or 'last month'}"
+    print(f"\n{Colors.BOLD}{plan.cube}{Colors.NC}: {len(plan.pre_aggs)} monthly rollups, "
+          f"{len(months)} partitions in build range ({range_text}), update window {plan.window_days} days")
+
+    if plan.baseline:
+        print(f"  {Colors.BLUE}No stored fingerprints for this engine - recording a baseline{Colors.NC}")
+    for month in plan.rebuild:
+        color = Colors.YELLOW if plan.reasons[month] == ['update window'] else Colors.GREEN
+        print(f"  {color}REBUILD {month}{Colors.NC}  {'; '.join(plan.reasons[month])}")
+    if plan.outside:
+        print(f"  {Colors.YELLOW}! {len(plan.outside)} month(s) with data outside the build range "
+              f"({plan.outside[0]} .. {plan.outside[-1]}) - advance build_range_end to serve them{Colors.NC}")
+
+    skipped = len(months) - len(plan.rebuild)
+    builds = sum(len(plan.covering(month)) for month in plan.rebuild)
+    total = sum(len(plan.covering(month)) for month in months)
+    print(f"  {len(plan.rebuild)}/{len(months)} partitions to rebuild, {skipped} unchanged "
+          f"({builds}/{total} rollup partition builds)")
+
+
+def selectors(plan: RefreshPlan, timezone: str) -> List[Dict[str, Any]]:
+    """One /pre-aggregations/jobs selector per run of consecutive months covered by the same rollups"""
+    groups: Dict[Tuple[str, ...], List[str]] = {}
+    for month in plan.rebuild:
+        rollups = tuple(p.qualified for p in plan.covering(month))
+        if rollups:
+            groups.setdefault(rollups, []).append(month)
+    return [{
+        'contexts': [{'securityContext': {}}],
+        'timezones': [timezone],
+        'preAggregations': list(rollups),
+        'dateRange': [start, end],
+    } for rollups, months in groups.items() for start, end in month_ranges(months)]
+
+
+def job_statuses(response: Any) -> Dict[str, str]:
+    """Normalize the jobs API 'get' answer (object or list form) to token -> status"""
+    if isinstance(response, dict):
+        return {token: str(job.get('status')) for token, job in response.items()}
+    return {job.get('token'): str(job.get('status')) for job in response or []}
+
+
+def wait_for_jobs(client, tokens: List[str], max_wait: float) -> bool:
+    start = time.time()
+    while True:
+        statuses = job_statuses(client.pre_aggregation_jobs({'action': 'get', 'resType': 'object', 'tokens': tokens}))
+        pending = [t for t, s in statuses.items() if s in ('scheduled', 'processing')]
+        failed = [t for t, s in statuses.items() if s.startswith('failure') or s == 'missing_partition']
+        print(f"  jobs: {len(statuses) - len(pending) - len(failed)} done, {len(pending)} pending, "
+              f"{len(failed)} failed ({time.time() - start:.0f}s)")
+        if failed:
+            for token in failed:
+                print(f"  {Colors.RED}✗ {token}: {statuses[token]}{Colors.NC}")
+            return False
+        if not pending:
+            return True
+        if time.time() - start > max_wait:
+            print(f"  {Colors.YELLOW}Still building after {max_wait:.0f}s - check again later{Colors.NC}")
+            return False
+        time.sleep(JOB_POLL_INTERVAL)
+
+
+def make_engine(args):
+    return BigQueryEngine(args.project) if args.engine == 'bigquery' else LocalEngine()
+
+
+def cmd_status(args):
+    model = load_model(args.model)
+    engine = make_engine(args)
+    db = connect_db(args.db)
+    print(f"{Colors.BOLD}{'='*80}{Colors.NC}")
+    print(f"{Colors.BOLD}PARTITION REFRESH PLAN{Colors.NC}  (engine: {engine.name})")
+    print(f"{Colors.BOLD}{'='*80}{Colors.NC}")
+    for cube_name in args.cube or list(SOURCES):
+        plan = plan_cube(model, engine, db, cube_name, args.update_window, args.full)
+        if plan:
+            print_plan(plan)
+
+
+def cmd_run(args):
+    from cube_client import CubeClient, CubeClientError
+
+    model = load_model(args.model)
+    engine = make_engine(args)
+    db = connect_db(args.db)
+    client = CubeClient.from_env()
+    print(f"{Colors.BOLD}{'='*80}{Colors.NC}")
+    print(f"{Colors.BOLD}PARTITION REFRESH{Colors.NC}  (engine: {engine.name}, Cube: {client.api_url})")
+    print(f"{Colors.BOLD}{'='*80}{Colors.NC}")
+
+    ok = True
+    for cube_name in args.cube or list(SOURCES):
+        plan = plan_cube(model, engine, db, cube_name, args.update_window, args.full)
+        if plan is None:
+            ok = False
+            continue
+        print_plan(plan)
+
+        tokens = []
+        if plan.rebuild and not plan.baseline:
+            posts = selectors(plan, args.timezone)
+            try:
+                for selector in posts:
+                    posted = client.pre_aggregation_jobs({'action': 'post', 'selector': selector})
+                    tokens.extend(posted or [])
+                    print(f"  posted {selector['dateRange'][0]} .. {selector['dateRange'][1]}: "
+                          f"{len(posted or [])} job(s), {len(selector['preAggregations'])} rollups")
+            except CubeClientError as e:
+                print(f"{Colors.RED}✗ Rebuild jobs rejected: {e} - fingerprints not updated{Colors.NC}")
+                ok = False
+                continue
+            db.execute("INSERT INTO refreshes (run_at, engine, cube, months, pre_aggregations, tokens) "
+                       "VALUES (?, ?, ?, ?, ?, ?)",
+                       (datetime.now().isoformat(timespec='seconds'), engine.name, cube_name,
+                        json.dumps(plan.rebuild), json.dumps(sorted({p for selector in posts for p in selector['preAggregations']})),
+                        json.dumps(tokens)))
+
+        # Months outside the build range stay unrecorded so they count as new once it advances
+        for source, current in plan.current.items():
+            months = sorted((set(current) | set(plan.previous.get(source, {}))) - set(plan.outside))
+            if months:
+                save_fingerprints(db, engine.name, source, current, months)
+
+        if tokens and args.wait:
+            ok = wait_for_jobs(client, tokens, args.max_wait) and ok
+
+    client.close()
+    if not ok:
+        sys.exit(1)
+
+
+def cmd_history(args):
+    db = connect_db(args.db)
+    rows = db.execute("SELECT * FROM refreshes ORDER BY refresh_id DESC LIMIT ?", (args.limit,)).fetchall()
+    if not rows:
+        print("No refreshes recorded")
+        return
+    print(f"{'ID':>4}  {'Run at':<20} {'Engine':<9} {'Cube':<20} {'Jobs':>5}  Months")
+    for row in rows:
+        months = json.loads(row['months'])
+        print(f"{row['refresh_id']:>4}  {row['run_at']:<20} {row['engine']:<9} {row['cube']:<20} "
+              f"{len(json.loads(row['tokens'] or '[]')):>5}  {', '.join(months)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Rebuild only the changed monthly rollup partitions')
+    parser.add_argument('--db', default=DEFAULT_DB, help=f'SQLite fingerprint store (default: {DEFAULT_DB})')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    for name, func, help_text in (('status', cmd_status, 'Show which partitions changed (posts nothing)'),
+                                  ('run', cmd_run, 'Post rebuild jobs for changed partitions')):
+        p = sub.add_parser(name, help=help_text)
+        p.add_argument('--engine', choices=['local', 'bigquery'], default='local',
+                       help='Where to fingerprint the sources (default: local)')
+        p.add_argument('--project', default=DEFAULT_BQ_PROJECT, help='BigQuery project for --engine bigquery')
+        p.add_argument('--cube', action='append', help=f'Cube to refresh (repeatable; default: {", ".join(SOURCES)})')
+        p.add_argument('--model', default=DEFAULT_MODEL_DIR, help='Model directory (default: ./model)')
+        p.add_argument('--update-window', type=int, metavar='DAYS',
+                       help='Always rebuild partitions in the last DAYS (default: the rollups\' update_window)')
+        p.add_argument('--full', action='store_true', help='Rebuild every partition in the build range')
+        p.set_defaults(func=func)
+        if name == 'run':
+            p.add_argument('--timezone', default=DEFAULT_TIMEZONE, help='Pre-aggregation timezone (default: UTC)')
+            p.add_argument('--wait', action='store_true', help='Poll the jobs until they finish')
+            p.add_argument('--max-wait', type=float, default=3600, help='Seconds to wait with --wait')
+
+    p_history = sub.add_parser('history', help='List posted refreshes')
+    p_history.add_argument('--limit', type=int, default=20)
+    p_history.set_defaults(func=cmd_history)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,411 @@
+#!/usr/bin/env python3
+"""
+Pre-aggregation hit-rate analyzer
+
+Checks every query in the corpus (test scripts, JSON query logs) against the
+pre_aggregations blocks in model/cubes/*.yml and reports whether a rollup
+would serve it or whether it falls through to raw BigQuery - and why:
+missing dimension/measure/segment, non-additive measure (type: number,
+avg, count_distinct), time dimension or granularity mismatch, or a
+dateRange not aligned to the rollup granularity.
+
+Matching follows Cube's rollup rules for the features this model uses. Calculated
+`type: number` measures are reported as non-additive, as documented in
+transaction_lines.yml ("Calculated measures (type: number) cannot be
+pre-aggregated - use component measures instead"); the report lists the
+component measures to query instead.
+
+Usage:
+    python preagg_analyzer.py                           # all root *.py / *.json / *.jsonl
+    python preagg_analyzer.py test_metrics.py queries.jsonl
+    python preagg_analyzer.py --misses-only --output preagg_report.json
+"""
+
+import os
+import ast
+import sys
+import json
+import glob
+import argparse
+from datetime import date, timedelta
+from typing import Dict, Any, List, Optional, Tuple
+
+from cube_model import BASE_DIR, DEFAULT_MODEL_DIR, CubeModel, PreAggregation, load_model, rolls_up_to
+
+# Colors for output
+class Colors:
+    RED = '\033[0;31m'
+    GREEN = '\033[0;32m'
+    YELLOW = '\033[1;33m'
+    BLUE = '\033[0;34m'
+    BOLD = '\033[1m'
+    NC = '\033[0m'  # No Color
+
+
+QUERY_KEYS = ('measures', 'dimensions', 'timeDimensions')
+UNKNOWN = object()
+
+
+class CorpusQuery:
+    def __init__(self, query: Dict[str, Any], source: str, label: Optional[str] = None):
+        self.query = query
+        self.source = source
+        self.label = label or source
+
+
+# ---------------------------------------------------------------- corpus
+
+def _literal(node: ast.AST) -> Any:
+    """literal_eval that degrades to UNKNOWN for non-literal parts (variables, f-strings)"""
+    if isinstance(node, ast.Dict):
+        return {_literal(k): _literal(v) for k, v in zip(node.keys, node.values) if k is not None}
+    if isinstance(node, (ast.List, ast.Tuple)):
+        return [_literal(e) for e in node.elts]
+    try:
+        return ast.literal_eval(node)
+    except (ValueError, SyntaxError, TypeError):
+        return UNKNOWN
+
+
+def _clean(value: Any) -> Any:
+    """Drop UNKNOWN parts so a partially literal query can still be analyzed"""
+    if isinstance(value, dict):
+        return {k: _clean(v) for k, v in value.items() if k is not UNKNOWN and v is not UNKNOWN}
+    if isinstance(value, list):
+        return [_clean(v) for v in value if v is not UNKNOWN]
+    return value
+
+
+def is_query(value: Any) -> bool:
+    return isinstance(value, dict) and any(k in value for k in QUERY_KEYS) and 'query' not in value
+
+
+def queries_from_python(path: str) -> List[CorpusQuery]:
+    with open(path) as f:
+        tree = ast.parse(f.read(), filename=path)
+
+    # Label dicts that sit in a ("TEST_ID", ..., {query}) tuple like HIGH_RISK_TESTS
+    labels = {}
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Tuple) and node.elts and isinstance(node.elts[0], ast.Constant) \
+                and isinstance(node.elts[0].value, str):
+            for element in node.elts[1:]:
+                if isinstance(element, ast.Dict):
+                    labels[id(element)] = node.elts[0].value
+
+    found = []
+    name = os.path.relpath(path, BASE_DIR)
+    for node in ast.walk(tree):
+        if not isinstance(node, ast.Dict):
+            continue
+        keys = [k.value for k in node.keys if isinstance(k, ast.Constant)]
+        if not any(k in keys for k in QUERY_KEYS):
+            continue
+        query = _clean(_literal(node))
+        if is_query(query):
+            source = f"{name}:{node.lineno}"
+            label = labels.get(id(node))
+            found.append(CorpusQuery(query, source, f"{label} ({source})" if label else source))
+    return found
+
+
+def _walk_json(value: Any, source: str, found: List[CorpusQuery]):
+    if is_query(value):
+        found.append(CorpusQuery(value, source, value.get('test_id') if isinstance(value.get('test_id'), str) else None))
+        return
+    if isinstance(value, dict):
+        if is_query(value.get('query')):
+            label = value.get('test_id') or value.get('name')
+            found.append(CorpusQuery(value['query'], source, f"{label} ({source})" if label else None))
+            return
+        for child in value.values():
+            _walk_json(child, source, found)
+    elif isinstance(value, list):
+        for child in value:
+            _walk_json(child, source, found)
+    elif isinstance(value, str) and value.lstrip().startswith('{'):
+        # /load URLs and logs often carry the query as an embedded JSON string
+        try:
+            _walk_json(json.loads(value), source, found)
+        except ValueError:
+            pass
+
+
+def queries_from_json(path: str) -> List[CorpusQuery]:
+    found = []
+    name = os.path.relpath(path, BASE_DIR)
+    with open(path) as f:
+        if path.endswith('.jsonl'):
+            for lineno, line in enumerate(f, 1):
+                if line.strip():
+                    try:
+                        _walk_json(json.loads(line), f"{name}:{lineno}", found)
+                    except ValueError:
+                        continue
+        else:
+            try:
+                _walk_json(json.load(f), name, found)
+            except ValueError:
+                pass
+    return found
+
+
+def load_corpus(paths: List[str]) -> List[CorpusQuery]:
+    corpus = []
+    for path in paths:
+        if path.endswith('.py'):
+            try:
+                corpus.extend(queries_from_python(path))
+            except SyntaxError:
+                continue
+        elif path.endswith(('.json', '.jsonl')):
+            corpus.extend(queries_from_json(path))
+    return corpus
+
+
+def default_corpus() -> List[str]:
+    own = {os.path.abspath(__file__)}
+    paths = []
+    for pattern in ('*.py', '*.json', '*.jsonl'):
+        paths.extend(p for p in sorted(glob.glob(os.path.join(BASE_DIR, pattern))) if os.path.abspath(p) not in own)
+    return paths
+
+
+# -------------------------------------------------------------- matching
+
+def _filter_members(filters: List[Any]) -> List[str]:
+    members = []
+    for f in filters or []:
+        if not isinstance(f, dict):
+            continue
+        for key in ('and', 'or'):
+            members.extend(_filter_members(f.get(key)))
+        member = f.get('member') or f.get('dimension')
+        if isinstance(member, str):
+            members.append(member)
+    return members
+
+
+def _parse_date(value: Any) -> Optional[date]:
+    try:
+        return date.fromisoformat(str(value)[:10])
+    except ValueError:
+        return None
+
+
+def aligned(date_range: Any, granularity: str) -> bool:
+    """Whether an absolute dateRange starts and ends on `granularity` boundaries"""
+    if not isinstance(date_range, list) or len(date_range) != 2:
+        return True  # relative ranges ("last 12 months") are resolved to whole units by Cube
+    start, end = _parse_date(date_range[0]), _parse_date(date_range[1])
+    if start is None or end is None or granularity in ('second', 'minute', 'hour', 'day'):
+        return True
+    after_end = end + timedelta(days=1)
+    if granularity == 'week':
+        return start.weekday() == 0 and after_end.weekday() == 0
+    months = {'month': 1, 'quarter': 3, 'year': 12}[granularity]
+    return start.day == 1 and after_end.day == 1 and (start.month - 1) % months == 0 \
+        and (after_end.month - 1) % months == 0
+
+
+class Analyzer:
+    def __init__(self, model: CubeModel):
+        self.model = model
+
+    def members(self, query: Dict[str, Any]) -> Dict[str, List[str]]:
+        resolve = self.model.resolve
+        time_dimensions = [t for t in query.get('timeDimensions') or [] if isinstance(t, dict) and t.get('dimension')]
+        return {
+            'measures': [resolve(m) for m in query.get('measures') or []],
+            'dimensions': [resolve(d) for d in query.get('dimensions') or []],
+            'segments': [resolve(s) for s in query.get('segments') or []],
+            'filters': [resolve(m) for m in _filter_members(query.get('filters'))],
+            'time': [dict(t, dimension=resolve(t['dimension'])) for t in time_dimensions],
+        }
+
+    def check(self, members: Dict[str, List[Any]], pre_agg: PreAggregation) -> Tuple[List[str], List[str]]:
+        """Reasons the rollup cannot serve the query (empty = hit) and non-blocking warnings"""
+        reasons, warnings = [], []
+        model = self.model
+        rollup_dims = set(pre_agg.dimensions)
+        query_dims = set(members['dimensions'])
+        time = members['time']
+
+        for measure in members['measures']:
+            definition = model.member(measure)
+            if definition is None:
+                reasons.append(f"unknown member {measure}")
+            elif definition.type == 'number':
+                leaves = model.leaf_measures(measure)
+                missing = [leaf for leaf in leaves if leaf not in pre_agg.measures]
+                hint = f"query components {', '.join(leaves)}" if leaves else "raw SQL aggregate"
+                if leaves and not missing:
+                    hint += " (all in this rollup)"
+                reasons.append(f"non-additive measure {measure} (type: number; {hint})")
+            elif measure not in pre_agg.measures:
+                reasons.append(f"missing measure {measure}")
+            elif not definition.additive:
+                # avg / count_distinct only match a rollup with exactly the same grouping
+                exact = query_dims == rollup_dims and all(t.get('granularity') in (None, pre_agg.granularity)
+                                                          for t in time)
+                if not exact:
+                    reasons.append(f"non-additive measure {measure} (type: {definition.type}) "
+                                   f"needs exactly the rollup's dimensions")
+
+        for dimension in members['dimensions']:
+            if dimension not in rollup_dims:
+                reasons.append(f"missing dimension {dimension}")
+
+        for member in members['filters']:
+            definition = model.member(member)
+            if definition is not None and definition.kind == 'measure':
+                if member not in pre_agg.measures:
+                    reasons.append(f"filter on measure {member} not in rollup")
+            elif member not in rollup_dims and member != pre_agg.time_dimension:
+                reasons.append(f"filter on {member} not in rollup dimensions")
+
+        for segment in members['segments']:
+            if segment not in pre_agg.segments:
+                reasons.append(f"missing segment {segment}")
+
+        for t in time:
+            granularity, date_range = t.get('granularity'), t.get('dateRange')
+            if granularity is None and date_range is None:
+                continue
+            if pre_agg.time_dimension is None:
+                reasons.append(f"time dimension {t['dimension']} but rollup has none")
+                continue
+            if t['dimension'] != pre_agg.time_dimension:
+                reasons.append(f"time dimension {t['dimension']} (rollup uses {pre_agg.time_dimension})")
+                continue
+            if granularity and not rolls_up_to(pre_agg.granularity, granularity):
+                reasons.append(f"granularity {granularity} cannot be rolled up from {pre_agg.granularity}")
+            if not aligned(date_range, pre_agg.granularity):
+                reasons.append(f"dateRange {date_range} not aligned to {pre_agg.granularity}")
+            if isinstance(date_range, list) and len(date_range) == 2 and pre_agg.build_range_end:
+                end = _parse_date(date_range[1])
+                if end and end.isoformat() > pre_agg.build_range_end:
+                    warnings.append(f"dateRange ends after build_range_end {pre_agg.build_range_end} "
+                                    f"- later data is not in the rollup")
+
+        return reasons, warnings
+
+    def analyze(self, item: CorpusQuery) -> Dict[str, Any]:
+        query = item.query
+        result = {'label': item.label, 'source': item.source, 'query': query}
+        if query.get('ungrouped'):
+            return dict(result, status='MISS', cube=None, rollup=None, reasons=['ungrouped query'], warnings=[])
+
+        members = self.members(query)
+        referenced = members['measures'] + members['dimensions'] + [t['dimension'] for t in members['time']]
+        cubes = list(dict.fromkeys(m.split('.')[0] for m in referenced if '.' in m))
+        if not cubes:
+            return dict(result, status='SKIPPED', cube=None, rollup=None, reasons=['no literal members'],
+                        warnings=[])
+
+        best = None
+        for cube in cubes:
+            if cube not in self.model.cubes:
+                continue
+            for pre_agg in self.model.pre_aggregations(cube):
+                if pre_agg.type not in ('rollup', 'rollupLambda', 'rollup_lambda'):
+                    continue
+                reasons, warnings = self.check(members, pre_agg)
+                if not reasons:
+                    return dict(result, status='HIT', cube=cube, rollup=pre_agg.name, reasons=[],
+                                warnings=warnings)
+                if best is None or len(reasons) < len(best[1]):
+                    best = (pre_agg, reasons, warnings)
+
+        if best is None:
+            return dict(result, status='MISS', cube=cubes[0], rollup=None, reasons=['cube has no rollups'],
+                        warnings=[])
+        pre_agg, reasons, warnings = best
+        return dict(result, status='MISS', cube=pre_agg.cube, rollup=None, closest=pre_agg.name,
+                    reasons=reasons, warnings=warnings)
+
+
+# ---------------------------------------------------------------- report
+
+def print_report(results: List[Dict[str, Any]], misses_only: bool):
+    print(f"{Colors.BOLD}{'='*80}{Colors.NC}")
+    print(f"{Colors.BOLD}PRE-AGGREGATION HIT-RATE ANALYSIS{Colors.NC}")
+    print(f"{Colors.BOLD}{'='*80}{Colors.NC}\n")
+
+    for r in results:
+        if r['status'] == 'SKIPPED' or (misses_only and r['status'] == 'HIT'):
+            continue
+        if r['status'] == 'HIT':
+            print(f"{Colors.GREEN}✓ HIT {Colors.NC} {r['label']} → {r['cube']}.{r['rollup']}")
+        else:
+            closest = f" (closest: {r['cube']}.{r['closest']})" if r.get('closest') else ''
+            print(f"{Colors.RED}✗ MISS{Colors.NC} {r['label']}{closest}")
+            for reason in r['reasons']:
+                print(f"    - {reason}")
+        for warning in r['warnings']:
+            print(f"    {Colors.YELLOW}! {warning}{Colors.NC}")
+
+    analyzed = [r for r in results if r['status'] != 'SKIPPED']
+    hits = sum(1 for r in analyzed if r['status'] == 'HIT')
+    print(f"\n{Colors.BOLD}SUMMARY{Colors.NC}")
+    print(f"Queries analyzed: {len(analyzed)} ({len(results) - len(analyzed)} skipped)")
+    if analyzed:
+        print(f"Rollup hit rate:  {hits}/{len(analyzed)} ({100.0 * hits / len(analyzed):.0f}%)")
+
+    by_cube: Dict[str, List[int]] = {}
+    for r in analyzed:
+        counts = by_cube.setdefault(r['cube'] or '-', [0, 0])
+        counts[0 if r['status'] == 'HIT' else 1] += 1
+    for cube, (cube_hits, cube_misses) in sorted(by_cube.items()):
+        print(f"  {cube:<40} {cube_hits:>4} hit  {cube_misses:>4} miss")
+
+    top = top_miss_reasons(analyzed)
+    if top:
+        print(f"\n{Colors.BOLD}Top miss reasons{Colors.NC}")
+        for reason, count in top[:15]:
+            print(f"  {count:>4}  {reason}")
+
+
+def top_miss_reasons(results: List[Dict[str, Any]]) -> List[Tuple[str, int]]:
+    counts: Dict[str, int] = {}
+    for r in results:
+        if r['status'] != 'MISS':
+            continue
+        for reason in r['reasons']:
+            # Group by the member, not the hint text
+            key = reason.split(' (')[0]
+            counts[key] = counts.get(key, 0) + 1
+    return sorted(counts.items(), key=lambda kv: (-kv[1], kv[0]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check which corpus queries are served by a pre-aggregation')
+    parser.add_argument('paths', nargs='*', help='Query sources: .py scripts, .json/.jsonl logs (default: repo root)')
+    parser.add_argument('--model', default=DEFAULT_MODEL_DIR, help='Model directory (default: ./model)')
+    parser.add_argument('--misses-only', action='store_true', help='Only print queries that miss every rollup')
+    parser.add_argument('--output', help='Write the full report as JSON')
+    args = parser.parse_args()
+
+    analyzer = Analyzer(load_model(args.model))
+    corpus = load_corpus(args.paths or default_corpus())
+    if not corpus:
+        print("No queries found")
+        sys.exit(1)
+
+    results = [analyzer.analyze(item) for item in corpus]
+    print_report(results, args.misses_only)
+
+    if args.output:
+        analyzed = [r for r in results if r['status'] != 'SKIPPED']
+        with open(args.output, 'w') as f:
+            json.dump({
+                'total': len(analyzed),
+                'hits': sum(1 for r in analyzed if r['status'] == 'HIT'),
+                'top_miss_reasons': top_miss_reasons(analyzed),
+                'results': results,
+            }, f, indent=2, default=str)
+        print(f"\nReport saved to: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+Build stage for gpc.quantile_sketches, mergeable quantile sketches behind the quantiles cube
+
+Rollups only keep sums and counts, so supplier_lead_times can answer average
+lead time but not the p90/p99 tail buyers plan safety stock from, and
+order_baskets only has line_count_bucket. This script stores one quantile
+sketch per metric, month and segment; percentiles over any range of months
+and any set of segments come from merging them with gpc.quantile_merge:
+- BigQuery: KLL_QUANTILES.INIT_FLOAT64 sketches (BYTES), gpc.quantile_merge is a SQL UDAF
+  over KLL_QUANTILES.MERGE_POINT_FLOAT64
+- local engine: t-digest centroid lists (sketches.TDigest), gpc.quantile_merge is a DuckDB
+  macro (local_engine.QUANTILE_SQL)
+
+Metrics (metric -> value, segment):
+    supplier_lead_times.lead_time_days   PO date -> receipt date (0-365 days, as the cube), supplier_id
+    order_baskets.line_count             lines per order, customer_type
+    order_baskets.order_total            order value, customer_type
+
+Months are rebuilt whole (DELETE + INSERT on BigQuery, month partitions locally):
+    --since 2026-10-01        months of transactions whose header lastmodifieddate is on/after the date
+    --months 2025-09,2025-10
+    --full
+
+Usage:
+    python3 quantile_sketches.py --full                               # local Parquet
+    python3 quantile_sketches.py --engine bigquery --since 2026-10-01
+    python3 quantile_sketches.py --engine bigquery --print-sql --months 2025-10
+
+Run it after order_baskets.py so the basket sketches see the rebuilt orders.
+"""
+
+import os
+import sys
+import time
+import argparse
+from typing import Dict, List, Optional
+
+from enrich_transaction_lines import month_range
+from sketches import DEFAULT_COMPRESSION
+
+# Colors for output
+class Colors:
+    RED = '\033[0;31m'
+    GREEN = '\033[0;32m'
+    YELLOW = '\033[1;33m'
+    BLUE = '\033[0;34m'
+    BOLD = '\033[1m'
+    NC = '\033[0m'  # No Color
+
+
+SKETCH_TABLE = 'quantile_sketches'
+DEFAULT_BQ_PROJECT = os.environ.get('CUBEJS_DB_BQ_PROJECT_ID', 'gym-plus-coffee')
+NO_SEGMENT = '(all)'
+
+# Dialect-specific pieces of METRICS
+LEAD_TIME_DAYS = {
+    'bigquery': "DATE_DIFF(ir.trandate, po.trandate, DAY)",
+    'duckdb': "date_diff('day', po.trandate, ir.trandate)",
+}
+
+# metric -> SELECT of (value, day, segment) rows, same sources and filters as the cube
+METRICS: Dict[str, str] = {
+    'supplier_lead_times.lead_time_days': """
+  SELECT {lead_time_days} AS value, ir.trandate AS day, CAST(po.entity AS STRING) AS segment
+  FROM gpc.item_receipt_lines irl
+  INNER JOIN gpc.item_receipts ir ON irl.transaction = ir.id
+  INNER JOIN gpc.purchase_orders po ON irl.createdfrom = po.id
+  WHERE irl.createdfrom IS NOT NULL
+    AND irl.mainline = 'F'
+    AND irl.item IS NOT NULL
+    AND {lead_time_days} BETWEEN 0 AND 365""",
+    'order_baskets.line_count': """
+  SELECT line_count AS value, trandate AS day, customer_type AS segment
+  FROM gpc.order_baskets""",
+    'order_baskets.order_total': """
+  SELECT order_total AS value, trandate AS day, customer_type AS segment
+  FROM gpc.order_baskets""",
+}
+
+# Tables each metric reads (a local Parquet export may lack some)
+METRIC_TABLES: Dict[str, List[str]] = {
+    'supplier_lead_times.lead_time_days': ['item_receipt_lines', 'item_receipts', 'purchase_orders'],
+    'order_baskets.line_count': ['order_baskets'],
+    'order_baskets.order_total': ['order_baskets'],
+}
+
+# gpc.quantile_merge is what the quantiles cube calls
+BQ_UDAF_SQL = """CREATE OR REPLACE AGGREGATE FUNCTION gpc.quantile_merge(sketch BYTES, phi FLOAT64 NOT AGGREGATE)
+RETURNS FLOAT64 AS (KLL_QUANTILES.MERGE_POINT_FLOAT64(sketch, phi));"""
+
+
+def months_where(months: List[str]) -> str:
+    return ' OR '.join("day BETWEEN DATE '{}' AND DATE '{}'".format(*month_range(m)) for m in months)
+
+
+def rows_sql(metric: str, dialect: str, where: Optional[str] = None) -> str:
+    """(value, day, segment) rows of a metric with a value and a date, optionally filtered further"""
+    sql = (f"SELECT * FROM ({METRICS[metric].format(lead_time_days=LEAD_TIME_DAYS[dialect])}\n) m\n"
+           "WHERE value IS NOT NULL AND day IS NOT NULL")
+    return sql + f" AND ({where})" if where else sql
+
+
+def months_sql(since: str) -> str:
+    return ("SELECT DISTINCT FORMAT_DATE('%Y-%m', trandate) AS month FROM gpc.transactions\n"
+            f"WHERE trandate IS NOT NULL AND lastmodifieddate >= DATE '{since}'")
+
+
+class LocalBuilder:
+    """Rewrites month partitions under LOCAL_PARQUET_DIR/quantile_sketches"""
+
+    def __init__(self, compression: int = DEFAULT_COMPRESSION):
+        import duckdb
+        from local_engine import PARTITION_COLUMN, build_init_sql, discover_tables, parquet_dir
+
+        self.root = parquet_dir()
+        self.partition_column = PARTITION_COLUMN
+        self.compression = compression
+        self.tables = discover_tables(self.root)
+        # In-memory database: the persistent file may be locked by a running Cube server
+        self.conn = duckdb.connect()
+        self.conn.execute(build_init_sql(self.root))
+
+    def metrics(self) -> List[str]:
+        """Metrics whose tables exist locally"""
+        available = []
+        for metric, tables in METRIC_TABLES.items():
+            missing = [t for t in tables if t not in self.tables]
+            if missing:
+                print(f"{Colors.YELLOW}! {metric}: {', '.join(missing)} not in {self.root} - skipped{Colors.NC}")
+            else:
+                available.append(metric)
+        return available
+
+    def months(self, since: Optional[str], metrics: List[str]) -> List[str]:
+        """Months with modified headers, or every month holding rows of a metric"""
+        if since:
+            sql = months_sql(since)
+        else:
+            sql = '\nUNION\n'.join(f"SELECT DISTINCT strftime(day, '%Y-%m') FROM ({rows_sql(metric, 'duckdb')})"
+                                    for metric in metrics)
+        return sorted(row[0] for row in self.conn.execute(sql).fetchall())
+
+    def sketch_month(self, month: str, metrics: List[str]):
+        import numpy as np
+        import pyarrow as pa
+        from sketches import TDigest
+
+        start, _ = month_range(month)
+        rows = {'metric': [], 'month': [], 'segment': [], 'value_count': [], 'sketch': []}
+        for metric in metrics:
+            values = self.conn.execute(
+                f"SELECT COALESCE(CAST(segment AS VARCHAR), '{NO_SEGMENT}') AS segment, CAST(value AS DOUBLE) AS v\n"
+                f"FROM ({rows_sql(metric, 'duckdb', months_where([month]))})").to_arrow_table()
+            if values.num_rows == 0:
+                continue
+            segments, inverse = np.unique(np.array(values.column('segment').to_pylist(), dtype=object),
+                                          return_inverse=True)
+            v = values.column('v').to_numpy()
+            order = np.argsort(inverse, kind='stable')
+            bounds = np.searchsorted(inverse[order], np.arange(len(segments) + 1))
+            for i, segment in enumerate(segments):
+                digest = TDigest(self.compression)
+                digest.add(v[order[bounds[i]:bounds[i + 1]]])
+                rows['metric'].append(metric)
+                rows['month'].append(start)
+                rows['segment'].append(segment)
+                rows['value_count'].append(digest.count)
+                rows['sketch'].append([{'v': m, 'w': w} for m, w in zip(digest.means.tolist(), digest.weights.tolist())])
+        return pa.table({
+            'metric': pa.array(rows['metric'], pa.string()),
+            'month': pa.array(rows['month'], pa.string()).cast(pa.date32()),
+            'segment': pa.array(rows['segment'], pa.string()),
+            'value_count': pa.array(rows['value_count'], pa.int64()),
+            'sketch': pa.array(rows['sketch'], pa.list_(pa.struct([('v', pa.float64()), ('w', pa.int64())]))),
+        })
+
+    def build(self, months: Optional[List[str]], since: Optional[str], full: bool) -> int:
+        import pyarrow.parquet as pq
+
+        metrics = self.metrics()
+        if not metrics:
+            raise RuntimeError("No metric has its source tables locally")
+        if full or SKETCH_TABLE not in self.tables:
+            months = self.months(None, metrics)
+        elif since:
+            months = self.months(since, metrics)
+
+        rows = 0
+        for month in months or []:
+            start = time.time()
+            table = self.sketch_month(month, metrics)
+            path = os.path.join(self.root, SKETCH_TABLE, f"{self.partition_column}={month}", 'part-0.parquet')
+            if table.num_rows == 0:
+                if os.path.exists(path):
+                    os.remove(path)
+                continue
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Written next to the final file under a non-.parquet name, then swapped in atomically
+            pq.write_table(table, path + '.tmp', compression='zstd')
+            os.replace(path + '.tmp', path)
+            rows += table.num_rows
+            print(f"  {month}: {table.num_rows:,} sketches ({time.time() - start:.1f}s)")
+        return rows
+
+
+class BigQueryBuilder:
+    """DELETE + INSERT of the months in scope in gpc.quantile_sketches"""
+
+    def __init__(self, project: str = DEFAULT_BQ_PROJECT):
+        from google.cloud import bigquery
+        self.client = bigquery.Client(project=project)
+
+    def exists(self) -> bool:
+        from google.api_core.exceptions import NotFound
+        try:
+            self.client.get_table(f"gpc.{SKETCH_TABLE}")
+            return True
+        except NotFound:
+            return False
+
+    @staticmethod
+    def sketch_sql(where: Optional[str]) -> str:
+        return '\nUNION ALL\n'.join(
+            f"SELECT '{metric}' AS metric, DATE_TRUNC(day, MONTH) AS month,\n"
+            f"  COALESCE(segment, '{NO_SEGMENT}') AS segment, COUNT(*) AS value_count,\n"
+            f"  KLL_QUANTILES.INIT_FLOAT64(CAST(value AS FLOAT64)) AS sketch\n"
+            f"FROM ({rows_sql(metric, 'bigquery', where)})\nGROUP BY month, segment"
+            for metric in METRICS)
+
+    @classmethod
+    def script(cls, months: Optional[List[str]], since: Optional[str], full: bool) -> str:
+        if full:
+            return (f"{BQ_UDAF_SQL}\n"
+                    f"CREATE OR REPLACE TABLE gpc.{SKETCH_TABLE}\n"
+                    "PARTITION BY month\nCLUSTER BY metric, segment AS\n"
+                    + cls.sketch_sql(None) + ';')
+        if since:
+            scope = ("SELECT DISTINCT DATE_TRUNC(trandate, MONTH) FROM gpc.transactions\n"
+                     f"  WHERE lastmodifieddate >= DATE '{since}'")
+            where = f"DATE_TRUNC(day, MONTH) IN ({scope})"
+        else:
+            scope = ', '.join(f"DATE '{month_range(m)[0]}'" for m in months)
+            where = months_where(months)
+        return (
+            f"{BQ_UDAF_SQL}\n"
+            "BEGIN TRANSACTION;\n"
+            f"DELETE FROM gpc.{SKETCH_TABLE}\nWHERE month IN ({scope});\n"
+            f"INSERT INTO gpc.{SKETCH_TABLE}\n" + cls.sketch_sql(where) + ';\n'
+            "COMMIT TRANSACTION;"
+        )
+
+    def build(self, months: Optional[List[str]], since: Optional[str], full: bool) -> int:
+        job = self.client.query(self.script(months, since, full or not self.exists()))
+        job.result()
+        rows = sum((child.num_dml_affected_rows or 0) for child in self.client.list_jobs(parent_job=job.job_id)
+                   if child.statement_type == 'INSERT')
+        return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Materialize mergeable quantile sketches in gpc.quantile_sketches')
+    parser.add_argument('--engine', choices=['local', 'bigquery'], default='local',
+                        help='Where to build the table (default: local Parquet)')
+    parser.add_argument('--project', default=DEFAULT_BQ_PROJECT, help='BigQuery project for --engine bigquery')
+    scope = parser.add_mutually_exclusive_group(required=True)
+    scope.add_argument('--since', help='Rebuild months of transactions modified on/after this date (YYYY-MM-DD)')
+    scope.add_argument('--months', help='Rebuild these months (YYYY-MM,YYYY-MM)')
+    scope.add_argument('--full', action='store_true', help='Rebuild the whole table')
+    parser.add_argument('--compression', type=int, default=DEFAULT_COMPRESSION,
+                        help=f't-digest compression for the local engine (default: {DEFAULT_COMPRESSION})')
+    parser.add_argument('--print-sql', action='store_true', help='Print the BigQuery script instead of running it')
+    args = parser.parse_args()
+
+    months = [m.strip() for m in args.months.split(',')] if args.months else None
+    if args.print_sql:
+        print(BigQueryBuilder.script(months, args.since, args.full))
+        return
+
+    print(f"{Colors.BOLD}{'='*80}{Colors.NC}")
+    print(f"{Colors.BOLD}BUILD gpc.{SKETCH_TABLE}{Colors.NC}  (engine: {args.engine})")
+    print(f"{Colors.BOLD}{'='*80}{Colors.NC}")
+
+    start = time.time()
+    try:
+        builder = BigQueryBuilder(args.project) if args.engine == 'bigquery' else LocalBuilder(args.compression)
+        rows = builder.build(months, args.since, args.full)
+    except Exception as e:
+        print(f"{Colors.RED}✗ Build failed: {e}{Colors.NC}")
+        sys.exit(1)
+    print(f"{Colors.GREEN}✓ {rows:,} sketches written in {time.time() - start:.1f}s{Colors.NC}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""
+Canonical /load queries and month-aligned dateRange splitting, for result-cache hits
+
+Two requests that ask for the same result rarely look the same: measures come
+in a different order, "last 30 days" vs the explicit dates, or
+"2025-01-31T23:59:59.999" vs "2025-01-31". Every variant is a new cache key.
+
+canonical_query() rewrites a query into one canonical form with the same result:
+- relative dateRange strings ("last 30 days", "this month", ...) resolved to dates (UTC queries only)
+- ISO timestamps on day boundaries shortened to dates
+- measures, dimensions, segments, filters and set-filter values sorted, except that without an
+  order the member Cube sorts by default stays first, so the row order is kept
+  (time dimension with granularity asc, else first measure desc, else first dimension asc)
+
+split_query() cuts a dateRange that covers whole months and partial months at the edges
+(["2025-01-15", "2025-04-10"]) into the month-aligned core (["2025-02-01", "2025-03-31"]) and the
+edge ranges. The core lines up with the monthly rollup partitions, so it repeats across
+ad-hoc ranges and is served from cache; merge_results() puts the pieces back together:
+- granularity day or month: rows of different pieces are different periods (concatenated)
+- no granularity: rows are summed per dimension values (only for sum/count measures)
+
+cube.py applies canonical_query() in query_rewrite; cube_client.py applies both.
+
+Usage:
+    python3 query_canonical.py '{"measures": ["b.x", "a.y"], "timeDimensions": [...]}'
+"""
+
+import re
+import sys
+import json
+import calendar
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+# Filter operators whose values form a set (order doesn't matter)
+SET_OPERATORS = {'equals', 'notEquals', 'contains', 'notContains', 'startsWith', 'endsWith'}
+
+# Granularities whose buckets never straddle a month boundary
+SPLIT_GRANULARITIES = {'day', 'month'}
+
+# Measure types the pieces of a range can simply be added up for
+SUMMABLE_TYPES = {'sum', 'count'}
+
+RELATIVE_LAST_N = re.compile(r"^last\s+(\d+)\s+(day|week|month|quarter|year)s?$", re.IGNORECASE)
+RELATIVE_PERIOD = re.compile(r"^(this|last)\s+(week|month|quarter|year)$", re.IGNORECASE)
+DAY_START = re.compile(r"^(\d{4}-\d{2}-\d{2})(?:T00:00:00(?:\.0+)?Z?)?$")
+DAY_END = re.compile(r"^(\d{4}-\d{2}-\d{2})(?:T23:59:59(?:\.9+)?Z?)?$")
+
+
+def _period_start(day: date, unit: str) -> date:
+    if unit == 'day':
+        return day
+    if unit == 'week':
+        return day - timedelta(days=day.weekday())
+    if unit == 'month':
+        return day.replace(day=1)
+    if unit == 'quarter':
+        return day.replace(month=(day.month - 1) // 3 * 3 + 1, day=1)
+    return day.replace(month=1, day=1)
+
+
+def _add_periods(day: date, unit: str, count: int) -> date:
+    """Start of a period shifted by count periods (day must be a period start)"""
+    if unit == 'day':
+        return day + timedelta(days=count)
+    if unit == 'week':
+        return day + timedelta(weeks=count)
+    months = {'month': 1, 'quarter': 3, 'year': 12}[unit] * count
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def resolve_relative(value: str, today: date) -> Optional[Tuple[str, str]]:
+    """[start, end] of Cube's relative range strings; None for anything else"""
+    text = value.strip().lower()
+    if text == 'today':
+        return today.isoformat(), today.isoformat()
+    if text == 'yesterday':
+        day = today - timedelta(days=1)
+        return day.isoformat(), day.isoformat()
+
+    match = RELATIVE_PERIOD.match(text)
+    if match:
+        tense, unit = match.group(1), match.group(2)
+        start = _period_start(today, unit)
+        if tense == 'last':
+            start = _add_periods(start, unit, -1)
+        end = _add_periods(start, unit, 1) - timedelta(days=1)
+        return start.isoformat(), end.isoformat()
+
+    match = RELATIVE_LAST_N.match(text)
+    if match:
+        # N whole periods before the current one, which is excluded
+        count, unit = int(match.group(1)), match.group(2)
+        current = _period_start(today, unit)
+        return _add_periods(current, unit, -count).isoformat(), (current - timedelta(days=1)).isoformat()
+    return None
+
+
+def _canonical_range(date_range: Any, today: date, utc: bool) -> Any:
+    if isinstance(date_range, str):
+        resolved = resolve_relative(date_range, today) if utc else None
+        return list(resolved) if resolved else date_range
+    if isinstance(date_range, list) and len(date_range) == 2 and all(isinstance(d, str) for d in date_range):
+        start, end = DAY_START.match(date_range[0]), DAY_END.match(date_range[1])
+        return [start.group(1) if start else date_range[0], end.group(1) if end else date_range[1]]
+    return date_range
+
+
+def _sort_key(value: Any) -> str:
+    return json.dumps(value, sort_keys=True)
+
+
+def _canonical_filters(filters: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    result = []
+    for f in filters:
+        f = dict(f)
+        for logical in ('and', 'or'):
+            if logical in f:
+                f[logical] = _canonical_filters(f[logical])
+        if f.get('operator') in SET_OPERATORS and isinstance(f.get('values'), list):
+            f['values'] = sorted(f['values'], key=str)
+        result.append(f)
+    return sorted(result, key=_sort_key)
+
+
+def default_order(query: Dict[str, Any]) -> List[List[str]]:
+    """The order Cube applies to a query without one"""
+    for t in query.get('timeDimensions') or []:
+        if t.get('granularity'):
+            return [[t['dimension'], 'asc']]
+    if query.get('measures'):
+        return [[query['measures'][0], 'desc']]
+    if query.get('dimensions'):
+        return [[query['dimensions'][0], 'asc']]
+    return []
+
+
+def canonical_query(query: Dict[str, Any], today: Optional[date] = None) -> Dict[str, Any]:
+    """Same query in canonical form (same result, same cache key for equivalent requests)"""
+    today = today or datetime.now(timezone.utc).date()
+    utc = query.get('timezone') in (None, 'UTC', 'Etc/UTC')
+    canonical = dict(query)
+
+    # Without an order Cube sorts by the first measure (or dimension): that member stays
+    # first. The order isn't made explicit, as an explicit order on a ratio measure would
+    # keep cube.py's query_rewrite from replacing it with its components.
+    # An empty order ([] or {}) is the same as none: it is dropped below, so the lead is kept too.
+    lead = None
+    if not canonical.get('order'):
+        order = default_order(query)
+        lead = order[0][0] if order else None
+    elif isinstance(canonical['order'], dict):
+        canonical['order'] = [[member, direction] for member, direction in canonical['order'].items()]
+
+    for key in ('measures', 'dimensions', 'segments'):
+        if key in canonical:
+            members = sorted(dict.fromkeys(canonical[key]))
+            if lead in members:
+                members = [lead] + [m for m in members if m != lead]
+            canonical[key] = members
+    if 'filters' in canonical:
+        canonical['filters'] = _canonical_filters(canonical['filters'])
+    if 'timeDimensions' in canonical:
+        time_dimensions = []
+        for t in canonical['timeDimensions']:
+            t = dict(t)
+            if 'dateRange' in t:
+                t['dateRange'] = _canonical_range(t['dateRange'], today, utc)
+            time_dimensions.append(t)
+        canonical['timeDimensions'] = sorted(time_dimensions, key=_sort_key)
+
+    # Empty lists are the same as absent ones
+    return {key: value for key, value in canonical.items() if value != [] and value != {}}
+
+
+def _month_end(day: date) -> date:
+    return day.replace(day=calendar.monthrange(day.year, day.month)[1])
+
+
+def month_split(start: date, end: date) -> Optional[Tuple[Tuple[date, date], List[Tuple[date, date]]]]:
+    """(core, edges) of a range with at least one whole month and a partial month at an edge"""
+    core_start = start if start.day == 1 else _month_end(start) + timedelta(days=1)
+    core_end = end if end == _month_end(end) else end.replace(day=1) - timedelta(days=1)
+    if core_start > core_end or (core_start == start and core_end == end):
+        return None
+    edges = []
+    if start < core_start:
+        edges.append((start, core_start - timedelta(days=1)))
+    if core_end < end:
+        edges.append((core_end + timedelta(days=1), end))
+    return (core_start, core_end), edges
+
+
+def split_query(query: Dict[str, Any], measure_types: Dict[str, str]) -> Optional[List[Dict[str, Any]]]:
+    """[core, edge, ...] queries for a month-splittable canonical query; None when it can't be split
+
+    measure_types maps measure -> Cube type (only needed for queries without granularity).
+    """
+    time_dimensions = query.get('timeDimensions') or []
+    ranged = [t for t in time_dimensions if isinstance(t.get('dateRange'), list)]
+    if len(ranged) != 1 or len(time_dimensions) != 1:
+        return None
+    if any(key in query for key in ('limit', 'offset', 'total', 'ungrouped')):
+        return None
+    t = ranged[0]
+    granularity = t.get('granularity')
+    if granularity and granularity not in SPLIT_GRANULARITIES:
+        return None
+    if not granularity and any(measure_types.get(m) not in SUMMABLE_TYPES for m in query.get('measures') or []):
+        return None
+    # Merged rows are re-sorted by the time bucket, or by a single order member without granularity
+    order = query.get('order') or default_order(query)
+    if granularity and order not in ([], [[t['dimension'], 'asc']]):
+        return None
+    if len(order) > 1:
+        return None
+    try:
+        start, end = (date.fromisoformat(d) for d in t['dateRange'])
+    except ValueError:
+        return None
+
+    split = month_split(start, end)
+    if not split:
+        return None
+    core, edges = split
+    return [dict(query, timeDimensions=[dict(t, dateRange=[a.isoformat(), b.isoformat()])])
+            for a, b in [core] + edges]
+
+
+def _number(value: Any) -> float:
+    return float(value) if value is not None else 0.0
+
+
+def _format(value: float) -> str:
+    value = round(value, 9)  # float noise from adding decimal strings
+    return str(int(value)) if value == int(value) else repr(value)
+
+
+def merge_results(query: Dict[str, Any], results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """One /load result from the results of split_query() pieces (errors pass through)"""
+    for result in results:
+        if 'error' in result:
+            return result
+    merged = dict(results[0])
+    t = query['timeDimensions'][0]
+    if t.get('granularity'):
+        key = f"{t['dimension']}.{t['granularity']}"
+        rows = [row for result in results for row in result.get('data') or []]
+        merged['data'] = sorted(rows, key=lambda row: row.get(key) or '')
+    else:
+        measures = query.get('measures') or []
+        groups: Dict[str, Dict[str, Any]] = {}
+        for result in results:
+            for row in result.get('data') or []:
+                group_key = _sort_key({k: v for k, v in row.items() if k not in measures})
+                if group_key not in groups:
+                    groups[group_key] = dict(row, **{m: 0.0 for m in measures})
+                for m in measures:
+                    groups[group_key][m] += _number(row.get(m))
+        rows = [dict(row, **{m: _format(row[m]) for m in measures}) for row in groups.values()]
+        order = query.get('order') or default_order(query)
+        if order and order[0][0] in measures:
+            rows.sort(key=lambda row: float(row[order[0][0]]), reverse=order[0][1] == 'desc')
+        elif order:
+            rows.sort(key=lambda row: str(row.get(order[0][0]) or ''), reverse=order[0][1] == 'desc')
+        merged['data'] = rows
+
+    used = {}
+    for result in results:
+        used.update(result.get('usedPreAggregations') or {})
+    if used:
+        merged['usedPreAggregations'] = used
+    return merged
+
+
+def main():
+    if len(sys.argv) != 2 or sys.argv[1] in ('-h', '--help'):
+        print(__doc__)
+        sys.exit(0 if len(sys.argv) == 2 else 1)
+    canonical = canonical_query(json.loads(sys.argv[1]))
+    print(json.dumps(canonical, indent=2))
+    pieces = split_query(canonical, {})
+    for piece in pieces or []:
+        print(f"piece: {piece['timeDimensions'][0]['dateRange']}")
+
+
+if __name__ == '__main__':
+    main()
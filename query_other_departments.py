@@ -30,7 +30,7 @@ try:
       FROM demo.transaction_lines_clean tl
       LEFT JOIN demo.transactions_analysis t ON tl.transaction = t.id
       LEFT JOIN demo.departments d ON tl.department = d.id
-      WHERE t.trandate BETWEEN '01/07/2022' AND '31/10/2025'
+      WHERE t.trandate BETWEEN DATE '2022-07-01' AND DATE '2025-10-31'
         AND t.type IN ('CustInvc', 'CashSale')
       GROUP BY 1, 2, 3
     )
@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+"""
+Ratio measures rewritten to their additive components, and recomputed on the result
+
+`type: number` ratios (average_order_value, discount_rate, repeat_rate, ...)
+don't match the rollups even when every component they divide is stored
+there. This module reads their formulas from the model and:
+- rewrite_query(): replaces each ratio measure in a query with its additive
+  components, so the query can be answered from a rollup (cube.py query_rewrite)
+- complete_ratios(): computes the ratio columns back onto the result rows and
+  drops the components the caller didn't ask for (cube_client.CubeClient)
+
+A measure qualifies when its SQL is arithmetic (+ - * /, NULLIF, CAST, numbers)
+over measures, contains a division, and bottoms out in additive measures.
+Measures with their own filters (average_order_value_retail) are skipped, at
+any nesting depth: their components alone would drop the filter.
+Ratios used in filters or order are left alone: Cube has to evaluate those.
+
+Usage:
+    python3 ratio_measures.py                 # list detected ratio measures
+    python3 ratio_measures.py --query '{"measures": ["transaction_lines.average_order_value"]}'
+"""
+
+import re
+import json
+import argparse
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from cube_model import DEFAULT_MODEL_DIR, CubeModel, load_model
+from query_canonical import canonical_query, default_order
+
+# Colors for output
+class Colors:
+    RED = '\033[0;31m'
+    GREEN = '\033[0;32m'
+    YELLOW = '\033[1;33m'
+    BLUE = '\033[0;34m'
+    BOLD = '\033[1m'
+    NC = '\033[0m'  # No Color
+
+
+TOKEN = re.compile(r"\s*(?:(\d+(?:\.\d*)?|\.\d+)|\{([^}]+)\}|([A-Za-z_]\w*)|([-+*/(),]))")
+CAST_TYPES = {'FLOAT64', 'DOUBLE', 'NUMERIC', 'DECIMAL', 'INT64', 'BIGINT', 'FLOAT'}
+
+Formula = Callable[[Dict[str, Optional[float]]], Optional[float]]
+
+
+class Ratio:
+    """A calculated measure as a formula over additive component measures"""
+
+    def __init__(self, measure: str, components: List[str], formula: Formula):
+        self.measure = measure
+        self.components = components
+        self.formula = formula
+
+    def evaluate(self, row: Dict[str, Any]) -> Optional[float]:
+        """Ratio for one result row (Cube returns measures as strings)"""
+        values = {}
+        for component in self.components:
+            value = row.get(component)
+            values[component] = float(value) if value is not None else None
+        return self.formula(values)
+
+
+def _arith(op: str, a: Optional[float], b: Optional[float]) -> Optional[float]:
+    if a is None or b is None:
+        return None
+    if op == '+':
+        return a + b
+    if op == '-':
+        return a - b
+    if op == '*':
+        return a * b
+    return a / b if b != 0 else None
+
+
+class _Parser:
+    """Recursive-descent parser for the arithmetic subset of measure SQL"""
+
+    def __init__(self, model: CubeModel, member, depth: int):
+        if member.definition.get('filters'):
+            # Cube applies a measure's own filters inside its SQL; the plain
+            # components in a rollup would give the unfiltered ratio
+            raise ValueError(f"{member.qualified} has filters")
+        self.model = model
+        self.member = member
+        self.depth = depth
+        self.tokens = self._tokenize(member.sql)
+        self.pos = 0
+        self.components: List[str] = []
+        self.divides = False
+
+    @staticmethod
+    def _tokenize(sql: str) -> List[Tuple[str, str]]:
+        tokens, pos, sql = [], 0, sql.strip()
+        while pos < len(sql):
+            match = TOKEN.match(sql, pos)
+            if not match or match.end() == pos:
+                raise ValueError(f"unsupported SQL near {sql[pos:pos + 20]!r}")
+            number, ref, word, op = match.groups()
+            if number is not None:
+                tokens.append(('num', number))
+            elif ref is not None:
+                tokens.append(('ref', ref))
+            elif word is not None:
+                tokens.append(('word', word.upper()))
+            else:
+                tokens.append(('op', op))
+            pos = match.end()
+        return tokens
+
+    def peek(self) -> Optional[Tuple[str, str]]:
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def take(self, kind: str, value: Optional[str] = None) -> str:
+        token = self.peek()
+        if token is None or token[0] != kind or (value is not None and token[1] != value):
+            raise ValueError(f"expected {value or kind} in {self.member.qualified}")
+        self.pos += 1
+        return token[1]
+
+    def parse(self) -> Formula:
+        formula = self.expr()
+        if self.peek() is not None:
+            raise ValueError(f"unsupported SQL in {self.member.qualified}")
+        return formula
+
+    def expr(self) -> Formula:
+        left = self.term()
+        while self.peek() in (('op', '+'), ('op', '-')):
+            op = self.take('op')
+            left = (lambda l, r, o: lambda v: _arith(o, l(v), r(v)))(left, self.term(), op)
+        return left
+
+    def term(self) -> Formula:
+        left = self.factor()
+        while self.peek() in (('op', '*'), ('op', '/')):
+            op = self.take('op')
+            self.divides = self.divides or op == '/'
+            left = (lambda l, r, o: lambda v: _arith(o, l(v), r(v)))(left, self.factor(), op)
+        return left
+
+    def factor(self) -> Formula:
+        token = self.peek()
+        if token is None:
+            raise ValueError(f"unexpected end of {self.member.qualified}")
+        kind, value = token
+        if kind == 'num':
+            self.pos += 1
+            return lambda v, n=float(value): n
+        if kind == 'ref':
+            self.pos += 1
+            return self.reference(value)
+        if token == ('op', '('):
+            self.pos += 1
+            inner = self.expr()
+            self.take('op', ')')
+            return inner
+        if token == ('op', '-'):
+            self.pos += 1
+            inner = self.factor()
+            return lambda v: None if inner(v) is None else -inner(v)
+        if token == ('word', 'NULLIF'):
+            self.pos += 1
+            self.take('op', '(')
+            a = self.expr()
+            self.take('op', ',')
+            b = self.expr()
+            self.take('op', ')')
+            return lambda v: None if a(v) is None or a(v) == b(v) else a(v)
+        if token == ('word', 'CAST'):
+            self.pos += 1
+            self.take('op', '(')
+            inner = self.expr()
+            self.take('word', 'AS')
+            if self.take('word') not in CAST_TYPES:
+                raise ValueError(f"unsupported CAST in {self.member.qualified}")
+            self.take('op', ')')
+            return inner
+        raise ValueError(f"unsupported SQL in {self.member.qualified}")
+
+    def reference(self, ref: str) -> Formula:
+        if ref.startswith('CUBE.'):
+            ref = ref[len('CUBE.'):]
+        qualified = ref if '.' in ref else f"{self.member.cube}.{ref}"
+        member = self.model.member(qualified)
+        if member is None or member.kind != 'measure':
+            raise ValueError(f"{qualified} is not a measure")
+        if member.type == 'number':
+            if self.depth > 10:
+                raise ValueError(f"{qualified} nests too deeply")
+            inner = _Parser(self.model, member, self.depth + 1)
+            formula = inner.parse()
+            self.divides = self.divides or inner.divides
+            for component in inner.components:
+                if component not in self.components:
+                    self.components.append(component)
+            return formula
+        if not member.additive:
+            raise ValueError(f"{qualified} is not additive (type: {member.type})")
+        if member.qualified not in self.components:
+            self.components.append(member.qualified)
+        return lambda v, name=member.qualified: v.get(name)
+
+
+def ratio_measures(model: CubeModel) -> Dict[str, Ratio]:
+    """Calculated measures that divide additive components, by qualified name"""
+    ratios = {}
+    for cube in model.cubes.values():
+        for member in cube.measures.values():
+            if member.type != 'number' or not member.sql:
+                continue
+            try:
+                parser = _Parser(model, member, 0)
+                formula = parser.parse()
+            except ValueError:
+                continue
+            if parser.divides and parser.components:
+                ratios[member.qualified] = Ratio(member.qualified, parser.components, formula)
+    return ratios
+
+
+_ratios: Optional[Dict[str, Ratio]] = None
+
+
+def default_ratios() -> Dict[str, Ratio]:
+    """Ratio measures of the model next to this file (loaded once)"""
+    global _ratios
+    if _ratios is None:
+        _ratios = ratio_measures(load_model(DEFAULT_MODEL_DIR))
+    return _ratios
+
+
+def _filter_members(filters: Optional[List[Dict[str, Any]]]) -> List[str]:
+    members = []
+    for f in filters or []:
+        if 'member' in f or 'dimension' in f:
+            members.append(f.get('member') or f.get('dimension'))
+        members.extend(_filter_members(f.get('and')) + _filter_members(f.get('or')))
+    return members
+
+
+def _order_members(order: Any) -> List[str]:
+    """Members of an order in any of Cube's forms: {m: dir}, [[m, dir], ...] or [{m: dir}, ...]"""
+    if isinstance(order, dict):
+        return list(order)
+    members = []
+    for entry in order or []:
+        if isinstance(entry, dict):
+            members.extend(entry)
+        elif entry:
+            members.append(entry[0])
+    return members
+
+
+def rewrite_query(query: Dict[str, Any], ratios: Optional[Dict[str, Ratio]] = None) -> Tuple[Dict[str, Any], List[str]]:
+    """Query with ratio measures replaced by their components, and the ratios replaced
+
+    Without an order, Cube sorts by the first measure; complete_ratios() sorts the rows
+    by that ratio again. Only with a limit (the top rows) does Cube have to compute it.
+    """
+    ratios = default_ratios() if ratios is None else ratios
+    pinned = set(_filter_members(query.get('filters'))) | set(_order_members(query.get('order')))
+    if not query.get('order') and 'limit' in query:
+        pinned |= set(_order_members(default_order(query)))
+    measures, replaced = [], []
+    for measure in query.get('measures') or []:
+        ratio = ratios.get(measure)
+        if ratio is None or measure in pinned:
+            if measure not in measures:
+                measures.append(measure)
+            continue
+        replaced.append(measure)
+        measures.extend(c for c in ratio.components if c not in measures)
+    if not replaced:
+        return query, []
+    return dict(query, measures=measures), replaced
+
+
+def complete_ratios(query: Dict[str, Any], result: Dict[str, Any],
+                    ratios: Optional[Dict[str, Ratio]] = None) -> List[str]:
+    """Add the ratio measures of `query` missing from a /load result computed from their components
+
+    Components the query didn't ask for are removed again. Returns the ratios computed.
+    """
+    rows = result.get('data')
+    requested = query.get('measures') or []
+    if not rows or not requested:
+        return []
+    ratios = default_ratios() if ratios is None else ratios
+    missing = [m for m in requested if m not in rows[0] and m in ratios]
+    if not missing:
+        return []
+    extra = {c for m in missing for c in ratios[m].components} - set(requested)
+    for row in rows:
+        for measure in missing:
+            row[measure] = ratios[measure].evaluate(row)
+        for component in extra:
+            row.pop(component, None)
+    lead = default_order(query) if not query.get('order') else []
+    if lead and lead[0][0] in missing:
+        # Cube's default order (first measure desc, NULLs last), which the components lost
+        rows.sort(key=lambda row: (row[lead[0][0]] is not None, row[lead[0][0]] or 0.0), reverse=True)
+    return missing
+
+
+def rewrite_for_context(query: Dict[str, Any], security_context: Dict[str, Any]) -> Dict[str, Any]:
+    """cube.py query_rewrite: canonical form, then ratio components for tokens with ratio_components"""
+    query = canonical_query(query)
+    if not security_context.get('ratio_components'):
+        return query
+    return rewrite_query(query)[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='List ratio measures and how queries are rewritten for rollups')
+    parser.add_argument('--model', default=DEFAULT_MODEL_DIR, help='Model directory (default: ./model)')
+    parser.add_argument('--query', help='Print the rewrite of this /load query (JSON)')
+    args = parser.parse_args()
+
+    ratios = ratio_measures(load_model(args.model))
+    if args.query:
+        rewritten, replaced = rewrite_query(json.loads(args.query), ratios)
+        print(json.dumps(rewritten, indent=2))
+        if not replaced:
+            print(f"{Colors.YELLOW}No ratio measure rewritten{Colors.NC}")
+        return
+
+    print(f"{Colors.BOLD}{'='*80}{Colors.NC}")
+    print(f"{Colors.BOLD}RATIO MEASURES{Colors.NC}  ({len(ratios)} rewritten to additive components)")
+    print(f"{Colors.BOLD}{'='*80}{Colors.NC}")
+    for name, ratio in sorted(ratios.items()):
+        print(f"  {name:<60} {', '.join(ratio.components)}")
+
+
+if __name__ == '__main__':
+    main()
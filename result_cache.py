@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+On-disk /load result cache for cube_client.CubeClient
+
+The investigation and validation scripts re-run the same 5-30 s queries on
+every iteration. CubeClient.load() keeps their results in a SQLite file:
+- key: canonical query (query_canonical.py) + Cube API URL + token + model version
+  (hash of model/**/*.yml and cube.py), so editing the model invalidates everything
+- TTL: the shortest refresh_key `every` of the cubes the query touches (pre-aggregation
+  or cube refresh keys in model/cubes/*.yml, e.g. 1 day for currencies); cubes without
+  one get CUBE_CACHE_TTL. Cubes served by a live-tail lambda (union_with_source_data)
+  get CUBE_CACHE_LIVE_TTL unless the dateRange ends before the live tail
+- size: least recently used entries are evicted beyond CUBE_CACHE_MAX_MB
+
+Configuration (environment variables, read by CubeClient.from_env):
+    CUBE_CACHE            on (default) | off | refresh (don't read, store fresh results)
+    CUBE_CACHE_PATH       SQLite file (default: cube_cache.sqlite next to this script)
+    CUBE_CACHE_MAX_MB     Size limit before LRU eviction (default: 256)
+    CUBE_CACHE_TTL        TTL in seconds for cubes without refresh_key.every (default: 3600)
+    CUBE_CACHE_LIVE_TTL   TTL in seconds for results including the live tail (default: 300)
+
+Usage:
+    python3 result_cache.py stats
+    python3 result_cache.py ttls                 # TTL per cube from the model
+    python3 result_cache.py purge                # drop expired entries
+    python3 result_cache.py clear
+"""
+
+import os
+import re
+import glob
+import json
+import time
+import sqlite3
+import hashlib
+import argparse
+import threading
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Colors for output
+class Colors:
+    RED = '\033[0;31m'
+    GREEN = '\033[0;32m'
+    YELLOW = '\033[1;33m'
+    BLUE = '\033[0;34m'
+    BOLD = '\033[1m'
+    NC = '\033[0m'  # No Color
+
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CACHE_PATH = os.path.join(REPO_DIR, 'cube_cache.sqlite')
+DEFAULT_MAX_MB = 256
+DEFAULT_TTL = 3600
+DEFAULT_LIVE_TTL = 300
+
+# Batch rollups behind the lambdas end at build_range_end = today - 2 days
+LIVE_TAIL_DAYS = 2
+
+EVERY = re.compile(r"^\s*(\d+)\s*(second|minute|hour|day|week)s?\s*$", re.IGNORECASE)
+EVERY_SECONDS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400, 'week': 604800}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key         TEXT PRIMARY KEY,
+    query       TEXT NOT NULL,
+    result      TEXT NOT NULL,
+    size        INTEGER NOT NULL,
+    created_at  REAL NOT NULL,
+    expires_at  REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed_at);
+"""
+
+
+def parse_every(every: Any) -> Optional[int]:
+    """Seconds of a refresh_key `every` ("1 day", "24 hour"); None for cron or unknown values"""
+    match = EVERY.match(str(every or ''))
+    if not match:
+        return None
+    return int(match.group(1)) * EVERY_SECONDS[match.group(2).lower()]
+
+
+def model_version(model_dir: str = os.path.join(REPO_DIR, 'model')) -> str:
+    """Hash of the model YAML and cube.py (query_rewrite), in path order"""
+    digest = hashlib.sha256()
+    paths = sorted(glob.glob(os.path.join(model_dir, '**', '*.yml'), recursive=True))
+    for path in paths + [os.path.join(REPO_DIR, 'cube.py')]:
+        if os.path.exists(path):
+            digest.update(os.path.relpath(path, REPO_DIR).encode())
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+def cube_ttls(model) -> Dict[str, Tuple[Optional[int], bool]]:
+    """cube -> (shortest refresh_key every in seconds or None, served by a live-tail lambda)"""
+    ttls = {}
+    for name, cube in model.cubes.items():
+        everies = [parse_every(cube.refresh_every)] + [parse_every(p.refresh_every) for p in cube.pre_aggregations]
+        everies = [e for e in everies if e]
+        live = any(p.union_with_source_data for p in cube.pre_aggregations)
+        ttls[name] = (min(everies) if everies else None, live)
+    return ttls
+
+
+def query_members(query: Dict[str, Any]) -> List[str]:
+    """Every member a /load query references"""
+    members = list(query.get('measures') or []) + list(query.get('dimensions') or [])
+    members += list(query.get('segments') or [])
+    members += [t['dimension'] for t in query.get('timeDimensions') or [] if t.get('dimension')]
+
+    def filter_members(filters):
+        for f in filters or []:
+            if f.get('member') or f.get('dimension'):
+                members.append(f.get('member') or f.get('dimension'))
+            filter_members(f.get('and'))
+            filter_members(f.get('or'))
+    filter_members(query.get('filters'))
+    order = query.get('order') or []
+    members += list(order) if isinstance(order, dict) else [entry[0] for entry in order if entry]
+    return members
+
+
+def _ends_before_tail(query: Dict[str, Any], today: date) -> bool:
+    """Whether every dateRange of the query ends before the live tail"""
+    ranges = [t.get('dateRange') for t in query.get('timeDimensions') or [] if t.get('dateRange')]
+    if not ranges:
+        return False
+    tail_start = today - timedelta(days=LIVE_TAIL_DAYS)
+    for date_range in ranges:
+        if not isinstance(date_range, list) or len(date_range) != 2:
+            return False
+        try:
+            if date.fromisoformat(str(date_range[1])[:10]) >= tail_start:
+                return False
+        except ValueError:
+            return False
+    return True
+
+
+def query_ttl(query: Dict[str, Any], ttls: Dict[str, Tuple[Optional[int], bool]],
+              resolve: Callable[[str], str] = lambda member: member, default_ttl: int = DEFAULT_TTL,
+              live_ttl: int = DEFAULT_LIVE_TTL, today: Optional[date] = None) -> int:
+    """Seconds a result of `query` stays fresh: the shortest TTL of the cubes it touches
+
+    ttls comes from cube_ttls(); resolve maps view members to cube members (CubeModel.resolve).
+    """
+    today = today or datetime.now(timezone.utc).date()
+    cubes = [c for c in {resolve(m).split('.')[0] for m in query_members(query)} if c in ttls]
+    ttl = min([ttls[c][0] or default_ttl for c in cubes] or [default_ttl])
+    if any(ttls[c][1] for c in cubes) and not _ends_before_tail(query, today):
+        ttl = min(ttl, live_ttl)
+    return ttl
+
+
+class ResultCache:
+    """SQLite-backed /load result cache with per-entry TTL and LRU size eviction"""
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_bytes: int = DEFAULT_MAX_MB * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()     # load_many() shares the client across threads
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.executescript(SCHEMA)
+
+    @staticmethod
+    def key(query: Dict[str, Any], scope: str) -> str:
+        """Cache key of a canonical query within a scope (API, token, model version)"""
+        return hashlib.sha256(f"{scope}\n{json.dumps(query, sort_keys=True)}".encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute("SELECT result, expires_at FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                self.conn.execute("DELETE FROM results WHERE key = ?", (key,))
+                self.conn.commit()
+                return None
+            self.conn.execute("UPDATE results SET accessed_at = ? WHERE key = ?", (now, key))
+            self.conn.commit()
+        return json.loads(row[0])
+
+    def put(self, key: str, query: Dict[str, Any], result: Dict[str, Any], ttl: int):
+        now = time.time()
+        payload = json.dumps(result)
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, json.dumps(query, sort_keys=True), payload, len(payload), now, now + ttl, now))
+            self._evict()
+            self.conn.commit()
+
+    def _evict(self):
+        """Drop expired entries, then the least recently used ones beyond max_bytes"""
+        self.conn.execute("DELETE FROM results WHERE expires_at <= ?", (time.time(),))
+        self.conn.execute("""
+            DELETE FROM results WHERE key IN (
+                SELECT key FROM (
+                    SELECT key, SUM(size) OVER (ORDER BY accessed_at DESC, key) AS running
+                    FROM results)
+                WHERE running > ?)""", (self.max_bytes,))
+
+    def purge(self) -> int:
+        """Drop expired entries; returns how many were removed"""
+        with self.lock:
+            removed = self.conn.execute("DELETE FROM results WHERE expires_at <= ?", (time.time(),)).rowcount
+            self.conn.commit()
+        return removed
+
+    def clear(self) -> int:
+        with self.lock:
+            removed = self.conn.execute("DELETE FROM results").rowcount
+            self.conn.commit()
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            entries, size, expired = self.conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(expires_at <= ?), 0) FROM results",
+                (time.time(),)).fetchone()
+        return {'entries': entries, 'bytes': size, 'expired': expired, 'max_bytes': self.max_bytes}
+
+    def close(self):
+        self.conn.close()
+
+
+def cmd_stats(cache: ResultCache, args):
+    stats = cache.stats()
+    print(f"{Colors.BOLD}{'='*80}{Colors.NC}")
+    print(f"{Colors.BOLD}RESULT CACHE{Colors.NC}  {cache.path}")
+    print(f"{Colors.BOLD}{'='*80}{Colors.NC}")
+    print(f"  Entries: {stats['entries']} ({stats['expired']} expired)")
+    print(f"  Size:    {stats['bytes'] / 1024 / 1024:.1f} MB of {stats['max_bytes'] / 1024 / 1024:.0f} MB")
+    print(f"  Model:   {model_version()}")
+
+
+def cmd_ttls(cache: ResultCache, args):
+    from cube_model import load_model
+    ttls = cube_ttls(load_model())
+    print(f"{Colors.BOLD}{'='*80}{Colors.NC}")
+    print(f"{Colors.BOLD}CACHE TTL PER CUBE{Colors.NC}  (refresh_key every; default {args.default_ttl}s)")
+    print(f"{Colors.BOLD}{'='*80}{Colors.NC}")
+    for name, (ttl, live) in sorted(ttls.items()):
+        note = f"  {Colors.YELLOW}live tail: {args.live_ttl}s for recent ranges{Colors.NC}" if live else ''
+        source = f"{ttl}s" if ttl else f"{Colors.BLUE}{args.default_ttl}s (default){Colors.NC}"
+        print(f"  {name:<40} {source}{note}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Inspect or clear the cube_client result cache')
+    parser.add_argument('command', choices=['stats', 'ttls', 'purge', 'clear'])
+    parser.add_argument('--path', default=os.environ.get('CUBE_CACHE_PATH', DEFAULT_CACHE_PATH),
+                        help=f'SQLite cache file (default: {DEFAULT_CACHE_PATH})')
+    args = parser.parse_args()
+    args.default_ttl = int(os.environ.get('CUBE_CACHE_TTL', DEFAULT_TTL))
+    args.live_ttl = int(os.environ.get('CUBE_CACHE_LIVE_TTL', DEFAULT_LIVE_TTL))
+
+    cache = ResultCache(args.path)
+    if args.command == 'stats':
+        cmd_stats(cache, args)
+    elif args.command == 'ttls':
+        cmd_ttls(cache, args)
+    elif args.command == 'purge':
+        print(f"{Colors.GREEN}Removed {cache.purge()} expired entries{Colors.NC}")
+    else:
+        print(f"{Colors.GREEN}Removed {cache.clear()} entries{Colors.NC}")
+    cache.close()
+
+
+if __name__ == '__main__':
+    main()
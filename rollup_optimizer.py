@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+Workload-driven rollup design optimizer
+
+Takes a query log (the same sources preagg_analyzer.py reads) and dimension
+cardinality estimates, and proposes a small set of rollups for one cube that
+covers the workload within a storage / build budget. Selection is the greedy
+view-selection algorithm over the dimension lattice (Harinarayan, Rajaraman &
+Ullman): candidates are the dimension sets the queries group/filter by plus
+their pairwise unions, and each step adds the candidate with the highest
+benefit per unit cost. Benefit is the weighted reduction in rows scanned by
+the queries it can answer; cost is the rollup's rows plus its build scan of the
+raw partition (scaled by --build-weight), so one rollup serving several
+query shapes beats several tiny ones that each re-read the source. Selection
+stops when no candidate saves more than it costs, or a budget is reached.
+
+Rows per partition are estimated with Cardenas' formula, capped by the raw rows
+in a partition: D * (1 - (1 - 1/D)^N), where D is the product of the
+dimension cardinalities times the time buckets per partition and N is the raw
+rows per partition.
+
+Cardinality sources, in order of precedence:
+    --cardinality FILE   JSON {"rows_per_partition": N, "dimensions": {"cube.member": distinct, ...}}
+                         (as written by cardinality_profiler.py)
+    "# N values" comments next to rollup dimensions in the cube YAML
+    --default-cardinality for anything else
+
+Usage:
+    python rollup_optimizer.py                                  # transaction_lines, repo corpus
+    python rollup_optimizer.py query_log.jsonl --max-rollups 6
+    python rollup_optimizer.py --cardinality cardinality.json --max-storage-rows 50000000 --output rollups.yml
+"""
+
+import re
+import sys
+import json
+import math
+import argparse
+from typing import Dict, Any, List, FrozenSet, Optional, Tuple
+
+import yaml
+
+from cube_model import DEFAULT_MODEL_DIR, CubeModel, load_model
+from preagg_analyzer import Analyzer, aligned, default_corpus, load_corpus
+
+# Colors for output
+class Colors:
+    RED = '\033[0;31m'
+    GREEN = '\033[0;32m'
+    YELLOW = '\033[1;33m'
+    BLUE = '\033[0;34m'
+    BOLD = '\033[1m'
+    NC = '\033[0m'  # No Color
+
+
+DEFAULT_CUBE = 'transaction_lines'
+DEFAULT_ROWS_PER_PARTITION = 206_000   # ~9.5M transaction_lines over 46 monthly partitions
+DEFAULT_CARDINALITY = 50
+DEFAULT_PARTITIONS = 46
+TIME_BUCKETS = {'day': 30, 'week': 5, 'month': 1, 'quarter': 1, 'year': 1}
+VALUES_COMMENT = re.compile(r"^\s*-\s*([A-Za-z_]\w*)\s*#\s*([\d,]+)\s+values")
+
+
+def cardinality_hints(path: str, cube: str) -> Dict[str, int]:
+    """'- channel_type   # 5 values' comments in the cube YAML"""
+    hints = {}
+    with open(path) as f:
+        for line in f:
+            match = VALUES_COMMENT.match(line)
+            if match:
+                hints[f"{cube}.{match.group(1)}"] = int(match.group(2).replace(',', ''))
+    return hints
+
+
+class Workload:
+    """Queries on one cube, reduced to what a rollup has to contain"""
+
+    def __init__(self, model: CubeModel, cube: str):
+        self.model = model
+        self.cube = cube
+        self.groups: Dict[Tuple[FrozenSet[str], str], Dict[str, Any]] = {}
+        self.uncoverable: List[Tuple[str, str]] = []
+        self.time_dimension = None
+
+    def add(self, label: str, members: Dict[str, List[Any]]):
+        referenced = members['measures'] + members['dimensions'] + [t['dimension'] for t in members['time']]
+        if not any(m.startswith(self.cube + '.') for m in referenced):
+            return
+
+        measures = []
+        for measure in members['measures']:
+            definition = self.model.member(measure)
+            if definition is None:
+                return self.uncoverable.append((label, f"unknown member {measure}"))
+            leaves = self.model.leaf_measures(measure) if definition.type == 'number' else [measure]
+            if not leaves:
+                return self.uncoverable.append((label, f"{measure} aggregates raw SQL"))
+            for leaf in leaves:
+                if not self.model.member(leaf).additive:
+                    return self.uncoverable.append((label, f"non-additive leaf measure {leaf}"))
+            measures.extend(leaves)
+
+        # Filters need their member in the rollup too; time filters use the time dimension
+        dimensions = set(members['dimensions'])
+        granularity = 'month'
+        for t in members['time']:
+            self.time_dimension = self.time_dimension or t['dimension']
+            if t.get('granularity') in TIME_BUCKETS and TIME_BUCKETS[t['granularity']] > TIME_BUCKETS[granularity]:
+                granularity = t['granularity']
+            if not aligned(t.get('dateRange'), 'month'):
+                granularity = 'day'
+        for member in members['filters']:
+            definition = self.model.member(member)
+            if definition is not None and definition.kind == 'dimension' and member != self.time_dimension:
+                dimensions.add(member)
+        if any(not d.startswith(self.cube + '.') for d in dimensions):
+            foreign = sorted(d for d in dimensions if not d.startswith(self.cube + '.'))
+            return self.uncoverable.append((label, f"dimensions from other cubes: {', '.join(foreign)}"))
+
+        key = (frozenset(dimensions), granularity)
+        group = self.groups.setdefault(key, {'weight': 0, 'measures': set(), 'labels': []})
+        group['weight'] += 1
+        group['measures'].update(measures)
+        group['labels'].append(label)
+
+
+class RollupOptimizer:
+    def __init__(self, workload: Workload, cardinality: Dict[str, int], rows_per_partition: int,
+                 default_cardinality: int, build_weight: float = 1.0):
+        self.workload = workload
+        self.build_weight = build_weight
+        self.cardinality = cardinality
+        self.rows_per_partition = rows_per_partition
+        self.default_cardinality = default_cardinality
+        self.defaulted = set()
+
+    def card(self, dimension: str) -> int:
+        if dimension not in self.cardinality:
+            self.defaulted.add(dimension)
+        return max(1, self.cardinality.get(dimension, self.default_cardinality))
+
+    def size(self, dimensions: FrozenSet[str], granularity: str) -> float:
+        """Estimated rollup rows per monthly partition"""
+        combinations = float(TIME_BUCKETS[granularity])
+        for d in dimensions:
+            combinations *= self.card(d)
+        n = self.rows_per_partition
+        if combinations >= 1e12:
+            return float(n)
+        # Cardenas: expected distinct combinations present in n rows
+        return min(float(n), combinations * -math.expm1(n * math.log1p(-1.0 / combinations))
+                   if combinations > 1 else 1.0)
+
+    def candidates(self) -> List[Tuple[FrozenSet[str], str]]:
+        bases = list(self.workload.groups)
+        candidates = set(bases)
+        for i, (dims_a, gran_a) in enumerate(bases):
+            for dims_b, gran_b in bases[i + 1:]:
+                candidates.add((dims_a | dims_b, finer(gran_a, gran_b)))
+        return sorted(candidates, key=lambda c: (len(c[0]), sorted(c[0]), c[1]))
+
+    @staticmethod
+    def covers(view: Tuple[FrozenSet[str], str], query: Tuple[FrozenSet[str], str]) -> bool:
+        return query[0] <= view[0] and TIME_BUCKETS[view[1]] >= TIME_BUCKETS[query[1]]
+
+    def optimize(self, max_rollups: int, max_storage_rows: Optional[float], max_build_rows: Optional[float],
+                 partitions: int) -> List[Dict[str, Any]]:
+        groups = self.workload.groups
+        raw = float(self.rows_per_partition)
+        cost = {q: raw for q in groups}       # rows scanned per partition to answer q today
+        selected = []
+        storage = build = 0.0
+        candidates = self.candidates()
+        sizes = {c: self.size(*c) for c in candidates}
+
+        while len(selected) < max_rollups:
+            best, best_score, best_benefit = None, 0.0, 0.0
+            for view in candidates:
+                if view in selected:
+                    continue
+                size = sizes[view]
+                if max_storage_rows and storage + size * partitions > max_storage_rows:
+                    continue
+                if max_build_rows and build + (raw + size) * partitions > max_build_rows:
+                    continue
+                benefit = sum(g['weight'] * max(0.0, cost[q] - size)
+                              for q, g in groups.items() if self.covers(view, q))
+                view_cost = size + raw * self.build_weight
+                if benefit <= view_cost:
+                    continue  # the rollup would cost more to maintain than it saves
+                score = benefit / view_cost
+                if score > best_score:
+                    best, best_score, best_benefit = view, score, benefit
+            if best is None or best_benefit <= 0:
+                break
+            selected.append(best)
+            storage += sizes[best] * partitions
+            build += (raw + sizes[best]) * partitions
+            for q in groups:
+                if self.covers(best, q):
+                    cost[q] = min(cost[q], sizes[best])
+
+        # Each query group is served by the smallest selected rollup covering it
+        rollups = {view: {'dimensions': view[0], 'granularity': view[1], 'rows_per_partition': sizes[view],
+                          'measures': set(), 'queries': []} for view in selected}
+        for q, g in groups.items():
+            covering = [v for v in selected if self.covers(v, q)]
+            if covering:
+                view = min(covering, key=lambda v: sizes[v])
+                rollups[view]['measures'].update(g['measures'])
+                rollups[view]['queries'].extend(g['labels'])
+        return [r for r in rollups.values() if r['queries']]
+
+
+def finer(a: str, b: str) -> str:
+    return a if TIME_BUCKETS[a] >= TIME_BUCKETS[b] else b
+
+
+def short(member: str) -> str:
+    return member.split('.', 1)[1]
+
+
+def to_yaml(rollups: List[Dict[str, Any]], cube: str, template: Dict[str, Any], time_dimension: str) -> str:
+    """pre_aggregations YAML, with the sizing estimate as a comment above each rollup"""
+    lines = ['    pre_aggregations:']
+    for i, rollup in enumerate(rollups, 1):
+        dims = sorted(short(d) for d in rollup['dimensions'])
+        name = f"opt_{i}_" + ('_'.join(d[:12] for d in dims[:3]) or 'totals')
+        definition = {
+            'name': name,
+            'measures': sorted(short(m) for m in rollup['measures']),
+            'dimensions': dims,
+            'time_dimension': short(time_dimension),
+            'granularity': rollup['granularity'],
+            'partition_granularity': 'month',
+        }
+        for key in ('build_range_end', 'refresh_key'):
+            if key in template:
+                # Folded SQL (sql: >) comes back with a trailing newline; keep the copy on one line
+                definition[key] = {k: v.strip() if isinstance(v, str) else v for k, v in template[key].items()} \
+                    if isinstance(template[key], dict) else template[key]
+        if not dims:
+            del definition['dimensions']
+
+        body = yaml.safe_dump([definition], sort_keys=False, default_flow_style=False, width=1000)
+        lines.append(f"      # est. {rollup['rows_per_partition']:,.0f} rows/partition, "
+                     f"serves {len(rollup['queries'])} queries")
+        lines.extend('      ' + line for line in body.rstrip().splitlines())
+        lines.append('')
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Propose rollups for a cube from a query workload')
+    parser.add_argument('paths', nargs='*', help='Query log sources (default: repo root scripts / JSON)')
+    parser.add_argument('--cube', default=DEFAULT_CUBE, help=f'Cube to optimize (default: {DEFAULT_CUBE})')
+    parser.add_argument('--model', default=DEFAULT_MODEL_DIR, help='Model directory (default: ./model)')
+    parser.add_argument('--cardinality', help='Cardinality JSON (see cardinality_profiler.py)')
+    parser.add_argument('--rows-per-partition', type=int, help='Raw source rows per monthly partition')
+    parser.add_argument('--partitions', type=int, default=DEFAULT_PARTITIONS,
+                        help=f'Monthly partitions in the build range (default: {DEFAULT_PARTITIONS})')
+    parser.add_argument('--default-cardinality', type=int, default=DEFAULT_CARDINALITY,
+                        help=f'Distinct values assumed for unprofiled dimensions (default: {DEFAULT_CARDINALITY})')
+    parser.add_argument('--max-rollups', type=int, default=8, help='Maximum rollups to propose (default: 8)')
+    parser.add_argument('--max-storage-rows', type=float, help='Budget: total rollup rows across all partitions')
+    parser.add_argument('--max-build-rows', type=float,
+                        help='Budget: rows read + written by a full rebuild of all proposed rollups')
+    parser.add_argument('--build-weight', type=float, default=1.0,
+                        help='Cost of one build scan of a raw partition, relative to storing one row (default: 1.0)')
+    parser.add_argument('--output', help='Write the proposed pre_aggregations YAML to this file')
+    args = parser.parse_args()
+
+    model = load_model(args.model)
+    if args.cube not in model.cubes:
+        print(f"{Colors.RED}Unknown cube: {args.cube}{Colors.NC}")
+        sys.exit(1)
+    cube = model.cubes[args.cube]
+
+    cardinality = cardinality_hints(cube.path, cube.name)
+    rows_per_partition = DEFAULT_ROWS_PER_PARTITION
+    if args.cardinality:
+        with open(args.cardinality) as f:
+            profile = json.load(f)
+        cardinality.update(profile.get('dimensions', {}))
+        cube_profile = profile.get('cubes', {}).get(cube.name, {})
+        rows_per_partition = cube_profile.get('rows_per_partition') or \
+            profile.get('rows_per_partition', rows_per_partition)
+    rows_per_partition = args.rows_per_partition or rows_per_partition
+
+    analyzer = Analyzer(model)
+    workload = Workload(model, cube.name)
+    for item in load_corpus(args.paths or default_corpus()):
+        if not item.query.get('ungrouped'):
+            workload.add(item.label, analyzer.members(item.query))
+    if not workload.groups:
+        print(f"No rollup-compatible queries on {cube.name} in the workload")
+        sys.exit(1)
+
+    time_dimension = workload.time_dimension or next(
+        (p.time_dimension for p in cube.pre_aggregations if p.time_dimension), f"{cube.name}.transaction_date")
+    template = next((p.definition for p in cube.pre_aggregations if p.time_dimension == time_dimension), {})
+
+    optimizer = RollupOptimizer(workload, cardinality, rows_per_partition, args.default_cardinality,
+                                args.build_weight)
+    rollups = optimizer.optimize(args.max_rollups, args.max_storage_rows, args.max_build_rows, args.partitions)
+
+    print(f"{Colors.BOLD}{'='*80}{Colors.NC}")
+    print(f"{Colors.BOLD}ROLLUP DESIGN FOR {cube.name.upper()}{Colors.NC}")
+    print(f"{Colors.BOLD}{'='*80}{Colors.NC}")
+    total_queries = sum(g['weight'] for g in workload.groups.values())
+    served = sum(len(r['queries']) for r in rollups)
+    print(f"Workload: {total_queries} rollup-compatible queries in {len(workload.groups)} distinct shapes")
+    print(f"Raw rows/partition: {rows_per_partition:,}   Partitions: {args.partitions}\n")
+
+    for i, rollup in enumerate(rollups, 1):
+        dims = ', '.join(sorted(short(d) for d in rollup['dimensions'])) or '(no dimensions)'
+        print(f"{Colors.GREEN}{i}. [{rollup['granularity']}] {dims}{Colors.NC}")
+        print(f"   est. {rollup['rows_per_partition']:,.0f} rows/partition "
+              f"({rollup['rows_per_partition'] * args.partitions:,.0f} total), "
+              f"{len(rollup['measures'])} measures, serves {len(rollup['queries'])} queries")
+
+    existing = [p for p in cube.pre_aggregations if p.type == 'rollup']
+    existing_rows = sum(optimizer.size(frozenset(p.dimensions), p.granularity if p.granularity in TIME_BUCKETS
+                                       else 'day') for p in existing)
+    proposed_rows = sum(r['rows_per_partition'] for r in rollups)
+    print(f"\nCoverage: {served}/{total_queries} queries")
+    print(f"Storage:  proposed {proposed_rows:,.0f} rows/partition in {len(rollups)} rollups "
+          f"vs existing {existing_rows:,.0f} in {len(existing)}")
+    print(f"Build:    proposed scans {len(rollups) * args.partitions} partitions "
+          f"vs existing {len(existing) * args.partitions}")
+
+    if workload.uncoverable:
+        print(f"\n{Colors.YELLOW}Not rollup-compatible ({len(workload.uncoverable)}):{Colors.NC}")
+        for label, reason in workload.uncoverable:
+            print(f"  - {label}: {reason}")
+    if optimizer.defaulted:
+        print(f"\n{Colors.YELLOW}Assumed {args.default_cardinality} values (no estimate) for: "
+              f"{', '.join(sorted(short(d) for d in optimizer.defaulted))}{Colors.NC}")
+
+    text = to_yaml(rollups, cube.name, template, time_dimension)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+        print(f"\nYAML saved to: {args.output}")
+    else:
+        print(f"\n{text}")
+
+
+if __name__ == '__main__':
+    main()
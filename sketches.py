@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Probabilistic sketches used by the offline profiling tools
+
+HyperLogLog over 64-bit hashes (Flajolet et al. 2007, with the linear-counting
+small-range correction from Heule et al. 2013). Updates are vectorized with
+NumPy; the hashes are computed upstream, e.g. with DuckDB's hash(), so values
+of any type can be sketched at Parquet scan speed.
+
+Relative standard error is about 1.04 / sqrt(2^precision): ~0.8% at the
+default precision of 14 (16 KiB of registers per sketch).
+
+Space-Saving heavy hitters (Metwally et al. 2005) over many groups at once,
+merged like the mergeable summaries of Agarwal et al. 2012: at most `capacity`
+counters per group, and every count is an upper bound whose overestimate is
+at most the group's floor (<= total weight / capacity). Any key whose true
+count exceeds the floor is guaranteed to be kept.
+
+Merging t-digest (Dunning & Ertl 2019) for quantiles: weighted centroids that
+each span at most one unit of the k1 scale function, so they stay small (down
+to single values) near q = 0 and q = 1 where tail percentiles are read.
+"""
+
+from typing import Dict, Optional
+
+import numpy as np
+
+DEFAULT_PRECISION = 14
+DEFAULT_COMPRESSION = 200
+
+
+def _bit_length(values: np.ndarray) -> np.ndarray:
+    """Exact bit length of uint64 values (0 for 0) without float rounding"""
+    hi = (values >> np.uint64(32)).astype(np.float64)
+    lo = (values & np.uint64(0xFFFFFFFF)).astype(np.float64)
+    hi_bits = np.frexp(hi)[1]
+    lo_bits = np.frexp(lo)[1]
+    return np.where(hi_bits > 0, hi_bits + 32, lo_bits)
+
+
+class HyperLogLog:
+    def __init__(self, precision: int = DEFAULT_PRECISION, registers: Optional[np.ndarray] = None):
+        if not 4 <= precision <= 18:
+            raise ValueError("precision must be between 4 and 18")
+        self.precision = precision
+        self.m = 1 << precision
+        self.registers = registers if registers is not None else np.zeros(self.m, dtype=np.uint8)
+
+    def add_hashes(self, hashes: np.ndarray):
+        """Add an array of 64-bit hashes (uint64; NULL rows should be dropped beforehand)"""
+        if len(hashes) == 0:
+            return
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        p = np.uint64(self.precision)
+        index = (hashes >> (np.uint64(64) - p)).astype(np.int64)
+        # Rank = position of the first 1-bit in the remaining 64 - p bits
+        remaining = hashes << p
+        rank = np.where(remaining == 0, 64 - self.precision + 1, 65 - _bit_length(remaining))
+        np.maximum.at(self.registers, index, rank.astype(np.uint8))
+
+    def merge(self, other: 'HyperLogLog') -> 'HyperLogLog':
+        """Union in place (both sketches must share the precision)"""
+        if other.precision != self.precision:
+            raise ValueError("cannot merge sketches with different precision")
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def copy(self) -> 'HyperLogLog':
+        return HyperLogLog(self.precision, self.registers.copy())
+
+    def estimate(self) -> float:
+        m = float(self.m)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * m and zeros:
+            return m * np.log(m / zeros)  # linear counting for small cardinalities
+        return float(raw)
+
+    def __len__(self) -> int:
+        return int(round(self.estimate()))
+
+
+class SpaceSaving:
+    """
+    Top-k counters per group: (group, key) -> count (upper bound), error
+
+    For every kept counter count - error <= true count <= count. A key that
+    isn't kept has a true count <= floor of its group. Batches are
+    pre-aggregated exactly, then merged, so updates stay vectorized.
+    """
+
+    def __init__(self, capacity: int, groups: Optional[np.ndarray] = None, keys: Optional[np.ndarray] = None,
+                 counts: Optional[np.ndarray] = None, errors: Optional[np.ndarray] = None,
+                 floors: Optional[Dict[int, int]] = None):
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.capacity = capacity
+        empty = np.empty(0, dtype=np.int64)
+        self.groups = empty if groups is None else np.asarray(groups, dtype=np.int64)
+        self.keys = empty if keys is None else np.asarray(keys, dtype=np.int64)
+        self.counts = empty if counts is None else np.asarray(counts, dtype=np.int64)
+        self.errors = np.zeros_like(self.counts) if errors is None else np.asarray(errors, dtype=np.int64)
+        self.floors = dict(floors or {})
+
+    def add(self, groups: np.ndarray, keys: np.ndarray, weights: Optional[np.ndarray] = None):
+        """Add one batch of (group, key) occurrences (weights default to 1)"""
+        if len(keys) == 0:
+            return
+        pairs = np.stack((np.asarray(groups, dtype=np.int64), np.asarray(keys, dtype=np.int64)), axis=1)
+        unique, inverse = np.unique(pairs, axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        counts = np.bincount(inverse, weights=weights, minlength=len(unique)).astype(np.int64)
+        self.merge(SpaceSaving(self.capacity, unique[:, 0], unique[:, 1], counts))
+
+    def merge(self, other: 'SpaceSaving') -> 'SpaceSaving':
+        """Union in place; a counter missing on one side is charged that side's floor"""
+        groups = np.concatenate((self.groups, other.groups))
+        keys = np.concatenate((self.keys, other.keys))
+        side = np.concatenate((np.zeros(len(self.keys), dtype=np.int8), np.ones(len(other.keys), dtype=np.int8)))
+        pairs = np.stack((groups, keys), axis=1)
+        unique, inverse = np.unique(pairs, axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        n = len(unique)
+        counts = np.bincount(inverse, weights=np.concatenate((self.counts, other.counts)), minlength=n)
+        errors = np.bincount(inverse, weights=np.concatenate((self.errors, other.errors)), minlength=n)
+        in_self = np.bincount(inverse, weights=(side == 0), minlength=n) > 0
+        in_other = np.bincount(inverse, weights=(side == 1), minlength=n) > 0
+
+        unique_groups = unique[:, 0]
+        floor_self = self._floor_of(unique_groups, self.floors)
+        floor_other = self._floor_of(unique_groups, other.floors)
+        charge = np.where(in_self, 0, floor_self) + np.where(in_other, 0, floor_other)
+        counts = counts.astype(np.int64) + charge
+        errors = errors.astype(np.int64) + charge
+
+        floors = {g: self.floors.get(g, 0) + other.floors.get(g, 0)
+                  for g in set(self.floors) | set(other.floors)}
+        self.groups, self.keys, self.counts, self.errors = unique_groups, unique[:, 1], counts, errors
+        self.floors = {g: f for g, f in floors.items() if f}
+        self._truncate()
+        return self
+
+    @staticmethod
+    def _floor_of(groups: np.ndarray, floors: Dict[int, int]) -> np.ndarray:
+        if not floors or len(groups) == 0:
+            return np.zeros(len(groups), dtype=np.int64)
+        ids = np.fromiter(floors.keys(), dtype=np.int64)
+        values = np.fromiter(floors.values(), dtype=np.int64)
+        order = np.argsort(ids)
+        ids, values = ids[order], values[order]
+        index = np.clip(np.searchsorted(ids, groups), 0, len(ids) - 1)
+        return np.where(ids[index] == groups, values[index], 0)
+
+    def _truncate(self):
+        """Keep the capacity largest counters per group; the largest dropped count raises the floor"""
+        order = np.lexsort((self.keys, -self.counts, self.groups))
+        groups = self.groups[order]
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(groups)) + 1)) if len(groups) else np.empty(0, int)
+        rank = np.arange(len(groups)) - np.repeat(starts, np.diff(np.concatenate((starts, [len(groups)]))))
+        keep = rank < self.capacity
+        dropped = ~keep
+        if dropped.any():
+            # rank == capacity is the largest dropped counter of its group
+            first_dropped = rank == self.capacity
+            for g, c in zip(groups[first_dropped].tolist(), self.counts[order][first_dropped].tolist()):
+                self.floors[g] = max(self.floors.get(g, 0), c)
+        order = order[keep]
+        self.groups, self.keys = self.groups[order], self.keys[order]
+        self.counts, self.errors = self.counts[order], self.errors[order]
+
+    def floor(self, group: int) -> int:
+        return self.floors.get(group, 0)
+
+    def top(self, group: int, n: Optional[int] = None) -> list:
+        """[(key, count, error)] of one group, largest count first"""
+        mask = self.groups == group
+        order = np.argsort(-self.counts[mask], kind='stable')[:n]
+        return list(zip(self.keys[mask][order].tolist(), self.counts[mask][order].tolist(),
+                        self.errors[mask][order].tolist()))
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+
+class TDigest:
+    """
+    Mergeable quantile sketch: centroid means and integer weights, sorted by mean
+
+    With compression d there are at most ~d / 2 merged centroids; the rank
+    error at quantile q is about sqrt(q * (1 - q)) * pi / d. quantile(q) is
+    the first centroid whose cumulative weight reaches q * total, the same
+    rule as the local engine's gpc.quantile_merge macro.
+    """
+
+    def __init__(self, compression: int = DEFAULT_COMPRESSION, means: Optional[np.ndarray] = None,
+                 weights: Optional[np.ndarray] = None):
+        if compression < 10:
+            raise ValueError("compression must be at least 10")
+        self.compression = compression
+        self.means = np.empty(0, dtype=np.float64) if means is None else np.asarray(means, dtype=np.float64)
+        self.weights = np.empty(0, dtype=np.int64) if weights is None else np.asarray(weights, dtype=np.int64)
+
+    def add(self, values: np.ndarray, weights: Optional[np.ndarray] = None):
+        """Add a batch of values (NaN should be dropped beforehand; weights default to 1)"""
+        values = np.asarray(values, dtype=np.float64)
+        weights = np.ones(len(values), dtype=np.int64) if weights is None else np.asarray(weights, dtype=np.int64)
+        self._compress(np.concatenate((self.means, values)), np.concatenate((self.weights, weights)))
+
+    def merge(self, other: 'TDigest') -> 'TDigest':
+        """Union in place"""
+        self._compress(np.concatenate((self.means, other.means)), np.concatenate((self.weights, other.weights)))
+        return self
+
+    def _compress(self, means: np.ndarray, weights: np.ndarray):
+        if len(means) == 0:
+            self.means, self.weights = means, weights
+            return
+        # Equal values first, so repeated values (day counts, line counts) collapse exactly
+        means, inverse = np.unique(means, return_inverse=True)
+        weights = np.bincount(inverse.reshape(-1), weights=weights).astype(np.int64)
+        cumulative = np.cumsum(weights)
+        left = (cumulative - weights) / cumulative[-1]
+        # Centroids whose left edge falls in the same unit of k(q) = d / (2 pi) * asin(2q - 1) merge
+        unit = np.floor(self.compression / (2 * np.pi) * (np.arcsin(2 * left - 1) + np.pi / 2)).astype(np.int64)
+        starts = np.flatnonzero(np.concatenate(([True], unit[1:] != unit[:-1])))
+        merged = np.add.reduceat(weights, starts)
+        self.means = np.add.reduceat(means * weights, starts) / merged
+        self.weights = merged
+
+    @property
+    def count(self) -> int:
+        return int(self.weights.sum())
+
+    def quantile(self, q: float) -> float:
+        if len(self.means) == 0:
+            return float('nan')
+        cumulative = np.cumsum(self.weights)
+        index = min(int(np.searchsorted(cumulative, q * cumulative[-1])), len(cumulative) - 1)
+        return float(self.means[index])
+
+    def __len__(self) -> int:
+        return len(self.means)
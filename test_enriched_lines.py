@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Enriched lines check: gpc.transaction_lines_enriched vs the cube CTEs it replaced
+
+The transaction_lines cube used to compute its enrichment in SQL over the
+whole denormalized MV (COGS/OPEX totals, days_to_ship, per-transaction window
+passes). enrich_transaction_lines.py builds the same columns month by month,
+scoped to the transactions being rebuilt. This check runs the former cube SQL
+over the whole tables (REFERENCE_SQL) and compares it row for row with the
+materialized table: every line, every column (DOUBLEs to 1e-6).
+
+By default it builds a small synthetic export in a temporary directory
+(generate_synthetic_data.py + ingest_netsuite.py, plus item shipments and OPEX
+lines the generator doesn't write), then checks the --full build, a
+--months rebuild and a --since rebuild. With --local it checks the table
+already built under LOCAL_PARQUET_DIR.
+
+Usage:
+    python3 test_enriched_lines.py
+    python3 enrich_transaction_lines.py --full && python3 test_enriched_lines.py --local
+"""
+
+import os
+import sys
+import tempfile
+import argparse
+import subprocess
+from typing import Dict, List, Optional
+
+# ANSI color codes
+class Colors:
+    RED = '\033[0;31m'
+    GREEN = '\033[0;32m'
+    YELLOW = '\033[1;33m'
+    BLUE = '\033[0;34m'
+    BOLD = '\033[1m'
+    NC = '\033[0m'  # No Color
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+SYNTHETIC_MONTHS = ('2025-01', '2025-03')
+
+# The transaction_lines cube SQL before gpc.transaction_lines_enriched, on the typed tables of
+# ingest_netsuite.py (INT64 keys and DATE columns, so its CASTs and PARSE_DATEs are dropped)
+REFERENCE_SQL = """
+WITH cogs_aggregated AS (
+  SELECT transaction, SUM(ABS(amount)) as gl_cogs_total
+  FROM gpc.transaction_accounting_lines_cogs
+  GROUP BY transaction
+),
+opex_aggregated AS (
+  SELECT transaction, SUM(ABS(CAST(amount AS FLOAT64))) as opex_total
+  FROM {transaction_accounting_lines_opex}
+  GROUP BY transaction
+),
+transaction_ship_days AS (
+  SELECT
+    tl.transaction as transaction_id,
+    MIN(itemship.trandate) - MIN(t.createddate) as days_to_ship
+  FROM gpc.transaction_lines_denormalized_mv tl
+  LEFT JOIN gpc.transactions t ON tl.transaction = t.id
+  LEFT JOIN {transaction_lines_itemship} itemship_line ON itemship_line.createdfrom = tl.transaction
+  LEFT JOIN {transactions_itemship} itemship
+    ON itemship.id = itemship_line.transaction
+    AND itemship.type = 'ItemShip'
+  WHERE itemship.trandate IS NOT NULL
+    AND t.createddate IS NOT NULL
+  GROUP BY tl.transaction
+)
+SELECT
+  tl.*,
+  ABS(SUM(tl.amount) OVER (PARTITION BY tl.transaction)) as transaction_total_abs,
+  t.shipdate as transaction_shipdate,
+  t.billing_country as transaction_billing_country,
+  t.shipping_country as transaction_shipping_country,
+  t.createddate as transaction_createddate,
+  ship_days.days_to_ship,
+  COALESCE(cogs.gl_cogs_total, 0) / COUNT(*) OVER (PARTITION BY tl.transaction) as line_gl_cogs_allocated,
+  COALESCE(opex.opex_total, 0) / COUNT(*) OVER (PARTITION BY tl.transaction) as line_opex_allocated
+FROM gpc.transaction_lines_denormalized_mv tl
+LEFT JOIN gpc.transactions t ON tl.transaction = t.id
+LEFT JOIN cogs_aggregated cogs ON tl.transaction = cogs.transaction
+LEFT JOIN opex_aggregated opex ON tl.transaction = opex.transaction
+LEFT JOIN transaction_ship_days ship_days ON tl.transaction = ship_days.transaction_id"""
+
+# Item shipments (about 2 of 3 orders, one with two shipments) and OPEX lines for the synthetic export
+EXTRA_TABLES_SQL = {
+    'transactions_itemship': """
+        SELECT 900000000 + id * 2 + k AS id, 'ItemShip' AS type,
+               trandate + CAST(1 + (id + k) % 9 AS INTEGER) AS trandate
+        FROM gpc.transactions, range(2) r(k)
+        WHERE id % 3 != 0 AND (k = 0 OR id % 5 = 0)""",
+    'transaction_lines_itemship': """
+        SELECT (id - 900000000) // 2 AS createdfrom, id AS transaction
+        FROM read_parquet('{root}/transactions_itemship.parquet')""",
+    'transaction_accounting_lines_opex': """
+        SELECT id AS transaction, -1.25 * (id % 7) AS amount
+        FROM gpc.transactions, range(2) r(k)
+        WHERE id % 4 = 1""",
+}
+
+
+def run(args: List[str], env: Dict[str, str]):
+    result = subprocess.run([sys.executable] + args, cwd=REPO_DIR, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"{args[0]} failed:\n{result.stdout[-2000:]}{result.stderr[-2000:]}")
+
+
+def synthetic_export(tmp: str) -> str:
+    """Typed local export of SYNTHETIC_MONTHS under tmp/typed (returns its path)"""
+    import duckdb
+    from local_engine import build_init_sql
+
+    raw, typed = os.path.join(tmp, 'raw'), os.path.join(tmp, 'typed')
+    env = dict(os.environ, LOCAL_PARQUET_DIR=typed)
+    run(['generate_synthetic_data.py', '--scale', '0.005', '--start', SYNTHETIC_MONTHS[0],
+         '--end', SYNTHETIC_MONTHS[1], '--out', raw], env)
+    run(['ingest_netsuite.py', '--source', raw, '--out', typed], env)
+
+    conn = duckdb.connect()
+    conn.execute(build_init_sql(typed))
+    for name, sql in EXTRA_TABLES_SQL.items():
+        conn.execute(f"COPY ({sql.format(root=typed)}) TO '{os.path.join(typed, name)}.parquet' (FORMAT PARQUET)")
+    conn.close()
+    return typed
+
+
+def compare(conn, reference_sql: str, table_sql: str, columns: Optional[List[str]] = None) -> List[str]:
+    """Rows of reference_sql missing from table_sql and the other way round (DOUBLEs rounded)"""
+    described = conn.execute(f"DESCRIBE {reference_sql}").fetchall()
+    columns = columns or [row[0] for row in described]
+    types = {row[0]: row[1] for row in described}
+    select = ', '.join(f'ROUND("{c}", 6) AS "{c}"' if types[c] in ('DOUBLE', 'FLOAT') else f'"{c}"'
+                       for c in columns)
+    failures = []
+    counts = [conn.execute(f"SELECT COUNT(*) FROM ({sql})").fetchone()[0] for sql in (reference_sql, table_sql)]
+    if counts[0] != counts[1]:
+        failures.append(f"{counts[1]:,} rows, expected {counts[0]:,}")
+    for label, a, b in (('missing', reference_sql, table_sql), ('unexpected', table_sql, reference_sql)):
+        rows = conn.execute(f"SELECT {select} FROM ({a}) EXCEPT ALL SELECT {select} FROM ({b}) LIMIT 3").fetchall()
+        for row in rows:
+            failures.append(f"{label} row: {dict(zip(columns, row))}")
+    if not counts[0]:
+        failures.append("no rows to compare")
+    return failures
+
+
+def check_enriched(root: str) -> List[str]:
+    """Enriched table under root vs REFERENCE_SQL over the same tables"""
+    import duckdb
+    from enrich_transaction_lines import ENRICHED_TABLE, OPTIONAL_TABLES
+    from local_engine import build_init_sql, discover_tables
+
+    tables = discover_tables(root)
+    substitutes = {name: f"gpc.{name}" if name in tables else f"({sql})" for name, sql in OPTIONAL_TABLES.items()}
+    conn = duckdb.connect()
+    conn.execute(build_init_sql(root))
+    try:
+        reference = REFERENCE_SQL.format(**substitutes)
+        columns = [row[0] for row in conn.execute(f"DESCRIBE {reference}").fetchall() if row[0] != 'partition_month']
+        return compare(conn, reference, f"SELECT * FROM gpc.{ENRICHED_TABLE}", columns)
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare gpc.transaction_lines_enriched with the former cube SQL')
+    parser.add_argument('--local', action='store_true',
+                        help='Check the table already built under LOCAL_PARQUET_DIR instead of a synthetic export')
+    args = parser.parse_args()
+
+    print("=" * 80)
+    print("ENRICHED TRANSACTION LINES vs FORMER CUBE CTEs")
+    print("=" * 80)
+
+    failed = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.local:
+            from local_engine import parquet_dir
+            builds = [(f"existing table in {parquet_dir()}", None)]
+            root = parquet_dir()
+        else:
+            root = synthetic_export(tmp)
+            print(f"Synthetic export {SYNTHETIC_MONTHS[0]}..{SYNTHETIC_MONTHS[1]} in {root}")
+            builds = [('--full build', ['--full']), ('--months 2025-02 rebuild', ['--months', '2025-02']),
+                      ('--since 2025-03-01 rebuild', ['--since', '2025-03-01'])]
+
+        for name, build_args in builds:
+            if build_args:
+                run(['enrich_transaction_lines.py'] + build_args, dict(os.environ, LOCAL_PARQUET_DIR=root))
+            failures = check_enriched(root)
+            failed += bool(failures)
+            status = f"{Colors.RED}✗{Colors.NC}" if failures else f"{Colors.GREEN}✓{Colors.NC}"
+            print(f"{status} {name}")
+            for failure in failures[:6]:
+                print(f"    {Colors.RED}{failure}{Colors.NC}")
+
+    print()
+    if failed:
+        print(f"{Colors.RED}✗ {failed} of {len(builds)} checks failed{Colors.NC}")
+        sys.exit(1)
+    print(f"{Colors.GREEN}✓ Materialized lines match the cube CTEs they replace{Colors.NC}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+HLL sketch accuracy: merged gpc.distinct_sketches vs exact distinct counts
+
+For every metric in gpc.distinct_sketches, compares gpc.hll_count_merge over
+the stored sketches with COUNT(DISTINCT) over the metric's source rows:
+- each month, all segments merged
+- the last 12 months merged (the long-range case the sketches exist for)
+- each segment over the last 12 months
+
+Reports the relative error per case and fails when any estimate is off by
+more than --tolerance standard errors (1.04 / sqrt(2^precision)), with a
+floor of --min-abs-error for tiny counts.
+
+Usage:
+    python3 distinct_sketches.py --full && python3 test_hll_sketches.py      # local Parquet
+    python3 test_hll_sketches.py --engine bigquery
+"""
+
+import sys
+import time
+import argparse
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+from distinct_sketches import SKETCH_TABLE, BigQueryBuilder, LocalBuilder, rows_sql, source_tables
+from local_engine import HLL_PRECISION
+
+# ANSI color codes
+class Colors:
+    RED = '\033[0;31m'
+    GREEN = '\033[0;32m'
+    YELLOW = '\033[1;33m'
+    BLUE = '\033[0;34m'
+    BOLD = '\033[1m'
+    NC = '\033[0m'  # No Color
+
+
+STANDARD_ERROR = 1.04 / (1 << HLL_PRECISION) ** 0.5
+
+
+def last_months_start(month: str, count: int = 12) -> str:
+    year, mon = map(int, month.split('-'))
+    index = year * 12 + mon - 1 - (count - 1)
+    return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+
+def compare(query, metric: str, tables: Dict[str, str]) -> List[Tuple[str, int, int]]:
+    """(case, exact, estimate) for one metric"""
+    cases = []
+    estimates = dict(query(
+        "SELECT FORMAT_DATE('%Y-%m', month), gpc.hll_count_merge(sketch)\n"
+        f"FROM gpc.{SKETCH_TABLE} WHERE metric = '{metric}' GROUP BY 1"))
+    exact = dict(query(
+        f"SELECT FORMAT_DATE('%Y-%m', day), COUNT(DISTINCT value) FROM ({rows_sql(metric, tables)}) GROUP BY 1"))
+    for month in sorted(set(estimates) | set(exact)):
+        cases.append((month, exact.get(month, 0), estimates.get(month, 0)))
+    if not exact:
+        return cases
+
+    start = last_months_start(max(exact))
+    window = f"FORMAT_DATE('%Y-%m', {{column}}) >= '{start}'"
+    segment_estimates = dict(query(
+        "SELECT segment, gpc.hll_count_merge(sketch)\n"
+        f"FROM gpc.{SKETCH_TABLE} WHERE metric = '{metric}' AND {window.format(column='month')} GROUP BY 1"))
+    segment_exact = dict(query(
+        "SELECT COALESCE(CAST(segment AS STRING), '(all)'), COUNT(DISTINCT value)\n"
+        f"FROM ({rows_sql(metric, tables, window.format(column='day'))}) GROUP BY 1"))
+    total_estimate = query(
+        f"SELECT gpc.hll_count_merge(sketch) FROM gpc.{SKETCH_TABLE}\n"
+        f"WHERE metric = '{metric}' AND {window.format(column='month')}")[0][0]
+    total_exact = query(
+        f"SELECT COUNT(DISTINCT value) FROM ({rows_sql(metric, tables, window.format(column='day'))})")[0][0]
+    cases.append((f"{start}..{max(exact)} (12 months)", total_exact, total_estimate))
+    for segment in sorted(set(segment_estimates) | set(segment_exact)):
+        cases.append((f"12 months, {segment}", segment_exact.get(segment, 0), segment_estimates.get(segment, 0)))
+    return cases
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure HLL sketch error against exact distinct counts')
+    parser.add_argument('--engine', choices=['local', 'bigquery'], default='local',
+                        help='Engine holding gpc.distinct_sketches (default: local Parquet)')
+    parser.add_argument('--tolerance', type=float, default=4.0,
+                        help='Allowed error in standard errors (default: 4)')
+    parser.add_argument('--min-abs-error', type=int, default=2,
+                        help='Always allow this absolute error, for tiny counts (default: 2)')
+    parser.add_argument('--verbose', action='store_true', help='Print every case, not only the worst')
+    args = parser.parse_args()
+
+    print("=" * 80)
+    print(f"HLL SKETCH ACCURACY - {args.engine} engine, precision {HLL_PRECISION} "
+          f"(standard error {STANDARD_ERROR:.2%})")
+    print(f"Run: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    print("=" * 80)
+
+    if args.engine == 'bigquery':
+        client = BigQueryBuilder().client
+        query = lambda sql: [tuple(row.values()) for row in client.query(sql).result()]
+        metrics = {row[0]: source_tables() for row in query(f"SELECT DISTINCT metric FROM gpc.{SKETCH_TABLE}")}
+    else:
+        builder = LocalBuilder()
+        if SKETCH_TABLE not in builder.tables:
+            print(f"{Colors.RED}gpc.{SKETCH_TABLE} not built - run distinct_sketches.py --full first{Colors.NC}")
+            sys.exit(1)
+        query = lambda sql: builder.conn.execute(sql).fetchall()
+        stored = {row[0] for row in query(f"SELECT DISTINCT metric FROM gpc.{SKETCH_TABLE}")}
+        metrics = {metric: tables for metric, tables in builder.metrics().items() if metric in stored}
+
+    failures = 0
+    for metric, tables in metrics.items():
+        start = time.time()
+        cases = compare(query, metric, tables)
+        errors = []
+        for case, exact, estimate in cases:
+            allowed = max(args.tolerance * STANDARD_ERROR * exact, args.min_abs_error)
+            error = (estimate - exact) / exact if exact else float(estimate > 0)
+            failed = abs(estimate - exact) > allowed
+            failures += failed
+            errors.append((abs(error), case, exact, estimate, failed))
+            if args.verbose or failed:
+                color = Colors.RED if failed else Colors.NC
+                print(f"  {color}{case:<40} exact {exact:>10,}  estimate {estimate:>10,}  {error:+.2%}{Colors.NC}")
+
+        mean = sum(e[0] for e in errors) / len(errors) if errors else 0.0
+        worst = max(errors) if errors else (0.0, '-', 0, 0, False)
+        status = f"{Colors.RED}✗{Colors.NC}" if any(e[4] for e in errors) else f"{Colors.GREEN}✓{Colors.NC}"
+        print(f"{status} {Colors.BOLD}{metric}{Colors.NC}: {len(cases)} cases, mean |error| {mean:.2%}, "
+              f"worst {worst[0]:.2%} ({worst[1]}: {worst[2]:,} vs {worst[3]:,}) ({time.time() - start:.1f}s)")
+
+    print()
+    if not metrics:
+        print(f"{Colors.YELLOW}No metrics to check{Colors.NC}")
+        sys.exit(1)
+    if failures:
+        print(f"{Colors.RED}✗ {failures} estimate(s) outside {args.tolerance:g} standard errors{Colors.NC}")
+        sys.exit(1)
+    print(f"{Colors.GREEN}✓ All estimates within {args.tolerance:g} standard errors{Colors.NC}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+Inventory snapshot check: positions rebuilt from checkpoint + deltas, and the monthly averages
+
+Runs inventory_snapshots.py over a small inventory_calculated in a temporary
+LOCAL_PARQUET_DIR, one day at a time (TIMELINE below), and compares with the
+positions written on each day:
+- as-of position on every day (position_sql, and the inventory_history cube SQL summed from the
+  first of the month): skipped days carry the previous snapshot, a month's first snapshot after
+  the rollover is a new checkpoint, a same-day re-run replaces that day's rows
+- inventory_monthly: day-weighted average, closing stock and snapshot days per month
+- a snapshot before the latest one is refused
+- stock_position queries over more than one month are rejected (history_range_error, and
+  by cube_client before they are sent)
+
+Usage:
+    python3 test_inventory_snapshots.py
+"""
+
+import os
+import sys
+import tempfile
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from inventory_snapshots import HISTORY_TABLE, MONTHLY_TABLE, history_range_error, month_of, position_sql
+from test_enriched_lines import run
+from test_result_cache import StubClient
+
+# ANSI color codes
+class Colors:
+    RED = '\033[0;31m'
+    GREEN = '\033[0;32m'
+    YELLOW = '\033[1;33m'
+    BLUE = '\033[0;34m'
+    BOLD = '\033[1m'
+    NC = '\033[0m'  # No Color
+
+Position = Dict[Tuple[int, int], float]
+
+# (day, inventory_calculated on that day as (item, location) -> quantity), in run order.
+# 2025-02-01 and 2025-02-04 are skipped; 2025-02-02 (checkpoint) and 2025-02-05 (delta) run twice.
+TIMELINE: List[Tuple[str, Position]] = [
+    ('2025-01-30', {(1, 10): 5, (2, 10): 3, (3, 20): 7}),
+    ('2025-01-31', {(1, 10): 4, (2, 10): 3, (3, 20): 7, (4, 20): 2}),
+    ('2025-02-02', {(1, 10): 9}),
+    ('2025-02-02', {(1, 10): 4, (2, 10): 1, (4, 20): 2}),
+    ('2025-02-03', {(1, 10): 6, (2, 10): 1, (4, 20): 2, (5, 10): 8}),
+    ('2025-02-05', {(1, 10): 100}),
+    ('2025-02-05', {(1, 10): 6, (3, 20): 1, (4, 20): 0, (5, 10): 3}),
+]
+LAST_DAY = '2025-02-06'
+
+POSITION = 'inventory_history.stock_position'
+CHANGED = 'inventory_history.units_changed'
+SNAPSHOT = 'inventory_history.snapshot_date'
+
+
+def write_inventory(root: str, position: Position):
+    """inventory_calculated with each position split over two rows (the snapshot sums them)"""
+    import duckdb
+
+    rows = [f"({item}, {location}, {quantity / 2})" for (item, location), quantity in position.items()] * 2
+    rows.append("(99, NULL, 50.0)")   # no location: not a position
+    conn = duckdb.connect()
+    conn.execute(f"""COPY (SELECT * FROM (VALUES {', '.join(rows)})
+                     t(item, location, calculated_quantity_available))
+                     TO '{os.path.join(root, 'inventory_calculated.parquet')}' (FORMAT PARQUET)""")
+    conn.close()
+
+
+def expected_positions() -> Dict[str, Position]:
+    """Position on every day from the first snapshot to LAST_DAY (last run of a day wins, skipped days carry)"""
+    recorded = {day: {k: q for k, q in position.items() if q} for day, position in TIMELINE}
+    positions: Dict[str, Position] = {}
+    current: Position = {}
+    day = date.fromisoformat(TIMELINE[0][0])
+    while day <= date.fromisoformat(LAST_DAY):
+        current = recorded.get(day.isoformat(), current)
+        positions[day.isoformat()] = current
+        day += timedelta(days=1)
+    return positions
+
+
+def expected_monthly(positions: Dict[str, Position]) -> Dict[Tuple[str, int, int], Tuple[float, float, int]]:
+    """(month, item, location) -> (average, closing, snapshot days) from the first to the last snapshot of each month"""
+    snapshot_days = sorted({day for day, _ in TIMELINE})
+    expected = {}
+    for month in sorted({month_of(day) for day in snapshot_days}):
+        in_month = [day for day in snapshot_days if month_of(day) == month]
+        days = [day for day in positions if in_month[0] <= day <= in_month[-1]]
+        for key in {key for day in days for key in positions[day]}:
+            average = sum(positions[day].get(key, 0) for day in days) / len(days)
+            expected[(f"{month}-01",) + key] = (average, positions[in_month[-1]].get(key, 0), len(days))
+    return expected
+
+
+def rows(conn, sql: str) -> Position:
+    return {(item, location): quantity for item, location, quantity in conn.execute(sql).fetchall()}
+
+
+def check_history(root: str) -> List[str]:
+    import duckdb
+    from cube_model import load_model
+    from local_engine import build_init_sql
+
+    positions = expected_positions()
+    cube_sql = load_model().cubes[HISTORY_TABLE].sql
+    conn = duckdb.connect()
+    conn.execute(build_init_sql(root))
+    failures = []
+    try:
+        first_snapshot = {}
+        for day, _ in TIMELINE:
+            first_snapshot.setdefault(month_of(day), day)
+        for day, position in positions.items():
+            got = rows(conn, position_sql(day))
+            if got != position:
+                failures.append(f"{day}: position {got}, expected {position}")
+            if first_snapshot.get(month_of(day), '9999') > day:
+                continue   # before the month's first snapshot the cube range holds no checkpoint
+            cube = rows(conn, f"""SELECT item, location, SUM(quantity) FROM ({cube_sql}) h
+                                  WHERE CAST(snapshot_date AS DATE) BETWEEN DATE '{month_of(day)}-01' AND DATE '{day}'
+                                  GROUP BY item, location HAVING SUM(quantity) <> 0""")
+            if cube != position:
+                failures.append(f"{day}: cube stock_position {cube}, expected {position}")
+
+        kinds = dict(conn.execute(f"SELECT CAST(snapshot_date AS VARCHAR), STRING_AGG(DISTINCT kind, ',') "
+                                  f"FROM gpc.{HISTORY_TABLE} GROUP BY 1").fetchall())
+        expected_kinds = {'2025-01-30': 'checkpoint', '2025-01-31': 'delta', '2025-02-02': 'checkpoint',
+                          '2025-02-03': 'delta', '2025-02-05': 'delta'}
+        if kinds != expected_kinds:
+            failures.append(f"snapshot kinds {kinds}, expected {expected_kinds}")
+    finally:
+        conn.close()
+    return failures
+
+
+def check_monthly(root: str) -> List[str]:
+    import duckdb
+    from local_engine import build_init_sql
+
+    expected = expected_monthly(expected_positions())
+    conn = duckdb.connect()
+    conn.execute(build_init_sql(root))
+    try:
+        got = {(str(month), item, location): (round(average, 9), closing, days)
+               for month, item, location, average, closing, days in conn.execute(
+                   f"SELECT month, item, location, average_quantity, closing_quantity, snapshot_days "
+                   f"FROM gpc.{MONTHLY_TABLE}").fetchall()}
+    finally:
+        conn.close()
+    expected = {key: (round(average, 9), closing, days) for key, (average, closing, days) in expected.items()}
+    failures = []
+    for key in sorted(set(got) | set(expected)):
+        if got.get(key) != expected.get(key):
+            failures.append(f"{key}: (average, closing, days) {got.get(key)}, expected {expected.get(key)}")
+    return failures
+
+
+def check_out_of_order(root: str) -> List[str]:
+    try:
+        run(['inventory_snapshots.py', '--date', '2025-02-04'], dict(os.environ, LOCAL_PARQUET_DIR=root))
+    except RuntimeError:
+        return []
+    return ["snapshot for 2025-02-04 accepted after 2025-02-05"]
+
+
+def position_query(date_range, measure: str = POSITION, granularity: Optional[str] = None):
+    time_dimension = {'dimension': SNAPSHOT, 'dateRange': date_range}
+    if granularity:
+        time_dimension['granularity'] = granularity
+    return {'measures': [measure], 'timeDimensions': [time_dimension]}
+
+
+def check_ranges() -> List[str]:
+    today = date(2025, 3, 3)
+    cases = [
+        (position_query(['2025-02-01', '2025-02-15']), True, "first of the month to the as-of date"),
+        (position_query(['2025-02-01', '2025-02-28T23:59:59']), True, "timestamp end in the same month"),
+        (position_query('last month'), True, "relative range within one month"),
+        (position_query(['2025-01-01', '2025-02-15']), False, "range over two months"),
+        (position_query(['2025-01-01', '2025-02-28'], granularity='month'), False, "two months by month"),
+        (position_query('last 7 days'), False, "relative range over a month boundary"),
+        (position_query('from 3 days ago to now'), False, "relative range that can't be resolved"),
+        ({'measures': [POSITION]}, False, "no dateRange"),
+        (position_query(['2025-01-01', '2025-02-15'], measure=CHANGED), True, "units_changed (deltas only)"),
+    ]
+    failures = []
+    for query, allowed, name in cases:
+        error = history_range_error(query, today=today)
+        if (error is None) != allowed:
+            failures.append(f"{name}: {'rejected' if error else 'accepted'} ({error})")
+
+    client = StubClient(lambda q: {'data': [{POSITION: '1'}]}, cache=None, max_wait=0)
+    results = client.load_many([position_query(['2025-01-15', '2025-03-31']),
+                                position_query(['2025-03-01', '2025-03-31'])])
+    if 'error' not in results[0] or 'error' in results[1]:
+        failures.append(f"client results {results}")
+    if len(client.requests) != 1:
+        failures.append(f"client sent {len(client.requests)} requests, expected only the one-month query")
+    return failures
+
+
+def main():
+    print("=" * 80)
+    print("INVENTORY SNAPSHOTS - checkpoint + deltas and monthly averages")
+    print("=" * 80)
+
+    failed = 0
+    with tempfile.TemporaryDirectory() as root:
+        env = dict(os.environ, LOCAL_PARQUET_DIR=root)
+        for day, position in TIMELINE:
+            write_inventory(root, position)
+            run(['inventory_snapshots.py', '--date', day], env)
+        print(f"Snapshots {', '.join(day for day, _ in TIMELINE)} in {root}")
+
+        checks = [
+            ('as-of positions (skipped days, re-runs, month rollover)', lambda: check_history(root)),
+            ('monthly average and closing stock', lambda: check_monthly(root)),
+            ('snapshot before the latest refused', lambda: check_out_of_order(root)),
+            ('stock_position ranges over more than one month rejected', check_ranges),
+        ]
+        for name, check in checks:
+            failures = check()
+            failed += bool(failures)
+            status = f"{Colors.RED}✗{Colors.NC}" if failures else f"{Colors.GREEN}✓{Colors.NC}"
+            print(f"{status} {name}")
+            for failure in failures[:6]:
+                print(f"    {Colors.RED}{failure}{Colors.NC}")
+
+    print()
+    if failed:
+        print(f"{Colors.RED}✗ {failed} of {len(checks)} checks failed{Colors.NC}")
+        sys.exit(1)
+    print(f"{Colors.GREEN}✓ All {len(checks)} checks passed{Colors.NC}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Offline checks for CubeClient.load_many() batching (stub transport, no Cube API)
+
+- equivalent queries (same canonical form) and shared month-split pieces are sent once,
+  and every caller gets its own copy of a shared result
+- distinct queries go out in multi-query requests of at most batch_size, queries on the
+  same cube in the same request; results come back in the order of the queries
+- a batch Cube rejects as a whole is re-sent query by query, so only the invalid query fails
+- a transport failure fills only the slots of the queries in that request
+
+Usage:
+    python3 test_load_many.py
+"""
+
+import sys
+from typing import Any, Dict, List
+
+from cube_client import CubeClientError
+from test_result_cache import StubClient
+
+# ANSI color codes
+class Colors:
+    RED = '\033[0;31m'
+    GREEN = '\033[0;32m'
+    YELLOW = '\033[1;33m'
+    BLUE = '\033[0;34m'
+    BOLD = '\033[1m'
+    NC = '\033[0m'  # No Color
+
+REVENUE = 'transaction_lines.total_revenue'
+UNITS = 'transaction_lines.units_sold'
+CHANNEL = 'transaction_lines.channel_type'
+DATE = 'transaction_lines.transaction_date'
+ORDERS = 'transactions.order_count'
+CUSTOMERS = 'transactions.unique_customers'
+TYPE = 'transactions.type'
+
+
+def echo(query: Dict[str, Any]) -> Dict[str, Any]:
+    """One row per query: '1' for every measure, the query's dimensions named after themselves"""
+    row = {m: '1' for m in query.get('measures') or []}
+    row.update({d: d for d in query.get('dimensions') or []})
+    return {'data': [row]}
+
+
+def sent(client: StubClient) -> List[Dict[str, Any]]:
+    """Every query the client sent, multi-query requests flattened"""
+    return [q for query, multi in client.requests for q in (query if multi else [query])]
+
+
+def check_duplicates(client_options: Dict[str, Any]) -> List[str]:
+    client = StubClient(echo, **client_options)
+    channels = {'member': CHANNEL, 'operator': 'equals', 'values': ['D2C', 'RETAIL']}
+    queries = [
+        {'measures': [REVENUE, UNITS], 'dimensions': [CHANNEL], 'filters': [channels]},
+        {'measures': [UNITS]},
+        # Same canonical form as the first: duplicate measure, filter values in another order
+        {'measures': [REVENUE, UNITS, REVENUE], 'dimensions': [CHANNEL],
+         'filters': [dict(channels, values=['RETAIL', 'D2C'])]},
+        {'measures': [UNITS]},
+    ]
+    failures = []
+    results = client.load_many(queries)
+    if len(sent(client)) != 2:
+        failures.append(f"{len(sent(client))} queries sent for 2 distinct ones")
+    if results[0] != results[2] or results[1] != results[3] or results[0] == results[1]:
+        failures.append("results not in query order")
+    results[0]['data'].append({'caller': 'modified'})
+    if results[2] == results[0]:
+        failures.append("a shared result is the same object for both callers")
+
+    split = StubClient(echo, **client_options)
+    # Both ranges hold February whole: the 2025-02 core piece is fetched once, edges separately
+    ranged = [{'measures': [REVENUE], 'timeDimensions': [{'dimension': DATE, 'dateRange': date_range}]}
+              for date_range in (['2025-01-15', '2025-02-28'], ['2025-02-01', '2025-03-10'])]
+    merged = split.load_many(ranged)
+    ranges = sorted(tuple(q['timeDimensions'][0]['dateRange']) for q in sent(split))
+    expected = [('2025-01-15', '2025-01-31'), ('2025-02-01', '2025-02-28'), ('2025-03-01', '2025-03-10')]
+    if ranges != expected:
+        failures.append(f"split pieces sent {ranges}, expected {expected}")
+    if [r['data'] for r in merged] != [[{REVENUE: '2'}], [{REVENUE: '2'}]]:
+        failures.append(f"split pieces not merged back: {[r['data'] for r in merged]}")
+    return failures
+
+
+def check_batches(client_options: Dict[str, Any]) -> List[str]:
+    client = StubClient(echo, batch_size=2, **client_options)
+    queries = [
+        {'measures': [ORDERS], 'dimensions': [TYPE]},
+        {'measures': [REVENUE], 'dimensions': [CHANNEL]},
+        {'measures': [CUSTOMERS]},
+        {'measures': [UNITS], 'dimensions': [CHANNEL]},
+        {'measures': [REVENUE]},
+        {'measures': [UNITS]},
+    ]
+    failures = []
+    results = client.load_many(queries)
+    sizes = sorted(len(query) if multi else 1 for query, multi in client.requests)
+    if sizes != [2, 2, 2]:
+        failures.append(f"request sizes {sizes}, expected [2, 2, 2] for 6 queries in batches of 2")
+    if len(sent(client)) != len(queries):
+        failures.append(f"{len(sent(client))} queries sent for {len(queries)}")
+    for query, multi in client.requests:
+        cubes = {member.split('.')[0] for q in (query if multi else [query]) for member in q['measures']}
+        if len(cubes) != 1:
+            failures.append(f"request mixes cubes {sorted(cubes)} (4 transaction_lines + 2 transactions queries)")
+    for query, result in zip(queries, results):
+        if set(result['data'][0]) != set(query['measures']) | set(query.get('dimensions') or []):
+            failures.append(f"result of {query['measures']} in the wrong slot: {result['data'][0]}")
+    return failures
+
+
+class RejectingClient(StubClient):
+    """Fails a whole multi-query request when one query in it is invalid, like Cube"""
+
+    def _request(self, query: Any, multi: bool = False) -> Dict[str, Any]:
+        if multi and any('invalid.member' in q.get('measures', []) for q in query):
+            with self._requests_lock:
+                self.requests.append((query, multi))
+            return {'error': "Cube 'invalid' not found"}
+        return super()._request(query, multi)
+
+
+def check_failures(client_options: Dict[str, Any]) -> List[str]:
+    failures = []
+    client = RejectingClient(lambda q: {'error': "Cube 'invalid' not found"}
+                             if 'invalid.member' in q['measures'] else echo(q), **client_options)
+    results = client.load_many([{'measures': [REVENUE]}, {'measures': ['invalid.member']}, {'measures': [UNITS]}])
+    if 'error' in results[0] or 'error' in results[2] or 'error' not in results[1]:
+        failures.append(f"rejected batch not re-sent one by one: {results}")
+
+    def unreachable(query):
+        if UNITS in query['measures']:
+            raise CubeClientError('connection reset')
+        return echo(query)
+
+    client = StubClient(unreachable, batch_size=1, **client_options)
+    results = client.load_many([{'measures': [REVENUE]}, {'measures': [UNITS]}, {'measures': [ORDERS]}])
+    if [('error' in r) for r in results] != [False, True, False]:
+        failures.append(f"transport failure not confined to its request: {results}")
+    return failures
+
+
+def main():
+    print("=" * 80)
+    print("LOAD_MANY - batching and duplicate queries (stub transport)")
+    print("=" * 80)
+
+    client_options = {'cache': None, 'max_wait': 0}
+    checks = [
+        ('duplicate queries and shared pieces sent once', check_duplicates),
+        ('multi-query batches', check_batches),
+        ('failed batches and requests', check_failures),
+    ]
+    failed = 0
+    for name, check in checks:
+        failures = check(client_options)
+        failed += bool(failures)
+        status = f"{Colors.RED}✗{Colors.NC}" if failures else f"{Colors.GREEN}✓{Colors.NC}"
+        print(f"{status} {name}")
+        for failure in failures:
+            print(f"    {Colors.RED}{failure}{Colors.NC}")
+
+    print()
+    if failed:
+        print(f"{Colors.RED}✗ {failed} of {len(checks)} checks failed{Colors.NC}")
+        sys.exit(1)
+    print(f"{Colors.GREEN}✓ All {len(checks)} checks passed{Colors.NC}")
+
+
+if __name__ == '__main__':
+    main()
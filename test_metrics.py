@@ -10,6 +10,15 @@ Usage:
 
 Or:
     python3 test_metrics.py --url <API_URL> --token <API_TOKEN>
+
+Load mode replays the same test set with N concurrent virtual users and
+reports throughput and p50/p95/p99 latency per test_id, cold and warm apart:
+    python3 test_metrics.py --load --users 10 --duration 120
+    python3 test_metrics.py --load --users 5 --iterations 3
+
+Slow (cold-cache) queries are polled through Cube's "Continue wait" answers
+until they finish or --max-wait expires; use --no-poll to report the first
+"Continue wait" as a failure instead.
 """
 
 import os
@@ -17,12 +26,13 @@ import sys
 import json
 import time
 import argparse
-import urllib.request
-import urllib.parse
-import urllib.error
+import threading
 from typing import Dict, Any, Tuple, List
 from datetime import datetime
 
+from cube_client import CubeClient, CubeClientError, CubeTimeoutError
+from benchmark_history import DEFAULT_DB, record_run
+
 # ANSI color codes
 class Colors:
     RED = '\033[0;31m'
@@ -33,17 +43,162 @@ class Colors:
     NC = '\033[0m'  # No Color
 
 
+# High-risk test set: (test_id, name, description, query)
+# Date Range: 2024-11-01 to 2025-10-31 (12 months)
+HIGH_RISK_TESTS: List[Tuple[str, str, str, Dict[str, Any]]] = [
+    # Test 1: MM001 - Gross Margin % (GL-based with JOIN)
+    (
+        "MM001",
+        "Gross Margin % (GL-based COGS)",
+        "Uses gl_based_gross_margin_pct which requires JOIN to transaction_accounting_lines_cogs",
+        {
+            "measures": ["transaction_lines.gl_based_gross_margin_pct"],
+            "dimensions": ["transaction_lines.channel_type"],
+            "timeDimensions": [{
+                "dimension": "transaction_lines.transaction_date",
+                "granularity": "month",
+                "dateRange": ["2024-11-01", "2025-10-31"]
+            }]
+        }
+    ),
+
+    # Test 2: GMROI001 - GMROI (GL-based)
+    (
+        "GMROI001",
+        "GMROI (GL-based COGS)",
+        "Gross Margin Return on Investment using GL COGS (requires JOIN)",
+        {
+            "measures": ["transaction_lines.gl_based_gmroi"],
+            "dimensions": ["transaction_lines.category"],
+            "timeDimensions": [{
+                "dimension": "transaction_lines.transaction_date",
+                "granularity": "month",
+                "dateRange": ["2024-11-01", "2025-10-31"]
+            }]
+        }
+    ),
+
+    # Test 3: LIFE004 - Sales Velocity (units per week)
+    (
+        "LIFE004",
+        "Sales Velocity (units per week)",
+        "Complex calculated measure using MIN/MAX date aggregation",
+        {
+            "measures": ["transaction_lines.units_per_week"],
+            "dimensions": ["transaction_lines.category"],
+            "timeDimensions": [{
+                "dimension": "transaction_lines.transaction_date",
+                "granularity": "month",
+                "dateRange": ["2024-11-01", "2025-10-31"]
+            }]
+        }
+    ),
+
+    # Test 4: RET004 - Return Rate Components
+    (
+        "RET004",
+        "Return Rate Components",
+        "Customer credits vs revenue transactions (transaction level)",
+        {
+            "measures": ["transactions.customer_credits_aligned", "transactions.revenue_transaction_count_aligned"],
+            "dimensions": ["transactions.customer_type"],
+            "timeDimensions": [{
+                "dimension": "transactions.trandate",
+                "granularity": "month",
+                "dateRange": ["2024-11-01", "2025-10-31"]
+            }]
+        }
+    ),
+
+    # Test 5: RET005 - Return Rate % (line-level)
+    (
+        "RET005",
+        "Return Rate % (line level)",
+        "Calculated return_rate measure (units_returned / total units)",
+        {
+            "measures": ["transaction_lines.return_rate"],
+            "dimensions": ["transaction_lines.category"],
+            "timeDimensions": [{
+                "dimension": "transaction_lines.transaction_date",
+                "granularity": "month",
+                "dateRange": ["2024-11-01", "2025-10-31"]
+            }]
+        }
+    ),
+
+    # Test 6: FD002 - Fulfillments per Order
+    (
+        "FD002",
+        "Fulfillments per Order",
+        "Calculated measure: fulfillment_count / unique_orders",
+        {
+            "measures": ["fulfillments.fulfillments_per_order"],
+            "dimensions": ["fulfillments.status_name"],
+            "timeDimensions": [{
+                "dimension": "fulfillments.trandate",
+                "granularity": "month",
+                "dateRange": ["2024-11-01", "2025-10-31"]
+            }]
+        }
+    ),
+
+    # Test 7: MM001 Components - Revenue + GL COGS separately
+    (
+        "MM001_COMP",
+        "MM001 Components (Revenue + GL COGS)",
+        "Test component measures separately to isolate JOIN issue",
+        {
+            "measures": ["transaction_lines.total_revenue", "transaction_lines.gl_based_cogs"],
+            "dimensions": ["transaction_lines.channel_type"],
+            "timeDimensions": [{
+                "dimension": "transaction_lines.transaction_date",
+                "granularity": "month",
+                "dateRange": ["2024-11-01", "2025-10-31"]
+            }]
+        }
+    ),
+
+    # Test 8: GL COGS Direct from COGS cube
+    (
+        "COGS_DIRECT",
+        "GL COGS (Direct from COGS cube)",
+        "Query COGS cube directly (no JOIN) to test if COGS cube itself has issues",
+        {
+            "measures": ["transaction_accounting_lines_cogs.gl_cogs"],
+            "dimensions": ["transaction_accounting_lines_cogs.category"],
+            "timeDimensions": [{
+                "dimension": "transaction_accounting_lines_cogs.transaction_date",
+                "granularity": "month",
+                "dateRange": ["2024-11-01", "2025-10-31"]
+            }]
+        }
+    ),
+]
+
+
+def used_pre_aggregations(data: Dict[str, Any]) -> List[str]:
+    """Pre-aggregation tables Cube reports having used for a /load response"""
+    return sorted(data.get('usedPreAggregations') or {})
+
+
 class MetricTester:
-    def __init__(self, api_url: str, api_token: str, timeout: int = 30):
+    def __init__(self, api_url: str, api_token: str, timeout: int = 30, max_wait: float = 300):
         self.api_url = api_url
         self.api_token = api_token
         self.timeout = timeout
+        self.max_wait = max_wait
+        self.client = CubeClient(api_url, api_token, timeout=timeout, max_wait=max_wait)
         self.results: List[Dict[str, Any]] = []
 
     def test_metric(self, test_id: str, name: str, description: str, query: Dict[str, Any]) -> Tuple[bool, float, str]:
         """
         Test a single metric query
 
+        Each result records three timings: first_response (until Cube first
+        answered, possibly with "Continue wait"), polls (number of "Continue
+        wait" answers) and latency (until the final answer). duration is
+        kept equal to latency for older result readers.
+
         Returns: (success, duration, error_message)
         """
         print(f"\n{Colors.BOLD}Testing {test_id}: {name}{Colors.NC}")
@@ -53,45 +208,56 @@ class MetricTester:
         start_time = time.time()
 
         try:
-            # Prepare request
-            query_str = json.dumps(query)
-            params = urllib.parse.urlencode({'query': query_str})
-            url = f"{self.api_url}/load?{params}"
-
-            req = urllib.request.Request(url)
-            req.add_header('Authorization', self.api_token)
-            req.add_header('Content-Type', 'application/json')
-
-            # Make request with timeout
-            with urllib.request.urlopen(req, timeout=self.timeout) as response:
-                data = json.loads(response.read().decode())
-                duration = time.time() - start_time
-
-                # Check for errors in response
-                if 'error' in data:
-                    error_msg = data.get('error', 'Unknown error')
-                    print(f"{Colors.RED}❌ FAILED{Colors.NC} ({duration:.2f}s) - {error_msg}")
-                    self.results.append({
-                        'test_id': test_id,
-                        'name': name,
-                        'status': 'FAILED',
-                        'duration': duration,
-                        'error': error_msg
-                    })
-                    return False, duration, error_msg
-
-                print(f"{Colors.GREEN}✓ PASSED{Colors.NC} ({duration:.2f}s)")
+            outcome = self.client.load_with_stats(query)
+            data = outcome.data
+            duration = outcome.latency
+            timings = {
+                'duration': duration,
+                'first_response': outcome.first_response,
+                'polls': outcome.polls,
+                'latency': outcome.latency,
+            }
+            timing_msg = f"{duration:.2f}s, first response {outcome.first_response:.2f}s, {outcome.polls} polls"
+
+            if outcome.timed_out:
+                error_msg = f"TIMEOUT after {duration:.2f}s (still 'Continue wait' after {outcome.polls} polls)"
+                print(f"{Colors.RED}❌ TIMEOUT{Colors.NC} ({timing_msg})")
+                self.results.append({
+                    'test_id': test_id,
+                    'name': name,
+                    'status': 'TIMEOUT',
+                    **timings,
+                    'error': error_msg
+                })
+                return False, duration, error_msg
+
+            # Check for errors in response
+            if 'error' in data:
+                error_msg = data.get('error', 'Unknown error')
+                print(f"{Colors.RED}❌ FAILED{Colors.NC} ({timing_msg}) - {error_msg}")
                 self.results.append({
                     'test_id': test_id,
                     'name': name,
-                    'status': 'PASSED',
-                    'duration': duration
+                    'status': 'FAILED',
+                    **timings,
+                    'error': error_msg
                 })
-                return True, duration, ""
+                return False, duration, error_msg
+
+            print(f"{Colors.GREEN}✓ PASSED{Colors.NC} ({timing_msg})")
+            self.results.append({
+                'test_id': test_id,
+                'name': name,
+                'status': 'PASSED',
+                **timings,
+                'pre_aggregations': used_pre_aggregations(data)
+            })
+            return True, duration, ""
 
-        except urllib.error.URLError as e:
+        except CubeClientError as e:
             duration = time.time() - start_time
-            if duration >= self.timeout:
+            timed_out = isinstance(e, CubeTimeoutError)
+            if timed_out:
                 error_msg = f"TIMEOUT after {duration:.2f}s"
                 print(f"{Colors.RED}❌ TIMEOUT{Colors.NC} ({duration:.2f}s)")
             else:
@@ -101,7 +267,7 @@ class MetricTester:
             self.results.append({
                 'test_id': test_id,
                 'name': name,
-                'status': 'TIMEOUT' if duration >= self.timeout else 'ERROR',
+                'status': 'TIMEOUT' if timed_out else 'ERROR',
                 'duration': duration,
                 'error': error_msg
             })
@@ -143,7 +309,10 @@ class MetricTester:
         print(f"{Colors.BOLD}Detailed Results:{Colors.NC}\n")
         for result in self.results:
             status_color = Colors.GREEN if result['status'] == 'PASSED' else Colors.RED
-            print(f"  {result['test_id']}: {status_color}{result['status']}{Colors.NC} ({result['duration']:.2f}s)")
+            detail = f"{result['duration']:.2f}s"
+            if 'polls' in result:
+                detail += f", first response {result['first_response']:.2f}s, {result['polls']} polls"
+            print(f"  {result['test_id']}: {status_color}{result['status']}{Colors.NC} ({detail})")
             if 'error' in result:
                 print(f"    Error: {result['error']}")
 
@@ -166,12 +335,181 @@ class MetricTester:
         print(f"Results saved to: {filename}")
 
 
+def percentile(values: List[float], pct: float) -> float:
+    """Percentile with linear interpolation between closest ranks"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100.0
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+class LoadTester:
+    """
+    Replay a test set with concurrent virtual users
+
+    Each user walks the test set in a loop (starting at a different offset so
+    the same query is not always fired in lock-step) until the duration
+    expires or it has completed the requested number of passes.
+
+    A sample is "cold" if it was sent before the first successful answer for
+    its test_id came back - i.e. it could not have been served by Cube's
+    result cache or a warm pre-aggregation - and "warm" otherwise.
+    """
+
+    def __init__(self, client: CubeClient, tests: List[Tuple[str, str, str, Dict[str, Any]]],
+                 users: int, duration: float = None, iterations: int = None):
+        if duration is None and iterations is None:
+            raise ValueError("LoadTester needs a duration or an iteration count")
+        self.client = client
+        self.tests = tests
+        self.users = users
+        self.duration = duration
+        self.iterations = iterations
+        self.samples: List[Dict[str, Any]] = []
+        self.elapsed = 0.0
+        self._lock = threading.Lock()
+        self._first_success: Dict[str, float] = {}
+
+    def _run_user(self, user: int, start: float):
+        passes = 0
+        offset = user % len(self.tests)
+        while True:
+            for i in range(len(self.tests)):
+                if self.duration is not None and time.monotonic() - start >= self.duration:
+                    return
+                test_id, _, _, query = self.tests[(offset + i) % len(self.tests)]
+                self._run_query(user, test_id, query, start)
+            passes += 1
+            if self.iterations is not None and passes >= self.iterations:
+                return
+
+    def _run_query(self, user: int, test_id: str, query: Dict[str, Any], start: float):
+        sent_at = time.monotonic() - start
+        sample = {'test_id': test_id, 'user': user, 'sent_at': sent_at}
+        try:
+            outcome = self.client.load_with_stats(query)
+            sample.update({
+                'latency': outcome.latency,
+                'first_response': outcome.first_response,
+                'polls': outcome.polls,
+            })
+            if outcome.timed_out:
+                sample['status'] = 'TIMEOUT'
+            elif 'error' in outcome.data:
+                sample['status'] = 'FAILED'
+                sample['error'] = outcome.data['error']
+            else:
+                sample['status'] = 'PASSED'
+                sample['pre_aggregations'] = used_pre_aggregations(outcome.data)
+        except CubeClientError as e:
+            sample['latency'] = time.monotonic() - start - sent_at
+            sample['status'] = 'TIMEOUT' if isinstance(e, CubeTimeoutError) else 'ERROR'
+            sample['error'] = str(e)
+
+        with self._lock:
+            if sample['status'] == 'PASSED' and test_id not in self._first_success:
+                self._first_success[test_id] = sent_at + sample['latency']
+            self.samples.append(sample)
+
+    def run(self) -> List[Dict[str, Any]]:
+        """Run all virtual users to completion and return the raw samples"""
+        start = time.monotonic()
+        threads = [threading.Thread(target=self._run_user, args=(user, start), daemon=True)
+                   for user in range(self.users)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.elapsed = time.monotonic() - start
+
+        # Classify once every answer is in: cold = sent before the first success landed
+        for sample in self.samples:
+            first_success = self._first_success.get(sample['test_id'])
+            sample['phase'] = 'cold' if first_success is None or sample['sent_at'] < first_success else 'warm'
+        return self.samples
+
+    def summarize(self) -> List[Dict[str, Any]]:
+        """Throughput and latency percentiles per (test_id, phase)"""
+        groups: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+        for sample in self.samples:
+            groups.setdefault((sample['test_id'], sample['phase']), []).append(sample)
+
+        order = {test[0]: i for i, test in enumerate(self.tests)}
+        summary = []
+        for (test_id, phase), samples in sorted(groups.items(), key=lambda g: (order[g[0][0]], g[0][1])):
+            latencies = [s['latency'] for s in samples if s['status'] == 'PASSED']
+            summary.append({
+                'test_id': test_id,
+                'phase': phase,
+                'requests': len(samples),
+                'passed': len(latencies),
+                'failed': len(samples) - len(latencies),
+                'throughput': len(latencies) / self.elapsed if self.elapsed else 0.0,
+                'p50': percentile(latencies, 50),
+                'p95': percentile(latencies, 95),
+                'p99': percentile(latencies, 99),
+            })
+        return summary
+
+    def print_summary(self):
+        """Print per-test throughput and latency percentiles"""
+        summary = self.summarize()
+        passed = sum(1 for s in self.samples if s['status'] == 'PASSED')
+
+        print(f"\n{Colors.BOLD}{'='*60}{Colors.NC}")
+        print(f"{Colors.BOLD}LOAD TEST SUMMARY{Colors.NC}")
+        print(f"{Colors.BOLD}{'='*60}{Colors.NC}\n")
+        print(f"Virtual users: {self.users}")
+        print(f"Wall clock:    {self.elapsed:.1f}s")
+        print(f"Requests:      {len(self.samples)} ({passed} passed)")
+        print(f"Throughput:    {passed / self.elapsed if self.elapsed else 0:.2f} req/s\n")
+
+        print(f"{'Test':<14} {'Phase':<6} {'Reqs':>5} {'Fail':>5} {'req/s':>7} {'p50':>8} {'p95':>8} {'p99':>8}")
+        print("-" * 66)
+        for row in summary:
+            color = Colors.RED if row['failed'] else Colors.NC
+            print(f"{row['test_id']:<14} {row['phase']:<6} {row['requests']:>5} "
+                  f"{color}{row['failed']:>5}{Colors.NC} {row['throughput']:>7.2f} "
+                  f"{row['p50']:>7.2f}s {row['p95']:>7.2f}s {row['p99']:>7.2f}s")
+        print()
+
+    def save_results(self, filename: str):
+        """Save summary and raw samples to JSON file"""
+        with open(filename, 'w') as f:
+            json.dump({
+                'timestamp': datetime.now().isoformat(),
+                'mode': 'load',
+                'config': {
+                    'users': self.users,
+                    'duration': self.duration,
+                    'iterations': self.iterations,
+                },
+                'elapsed': self.elapsed,
+                'summary': self.summarize(),
+                'samples': self.samples
+            }, f, indent=2)
+        print(f"Results saved to: {filename}")
+
+
 def main():
     parser = argparse.ArgumentParser(description='Test Cube.js metrics for performance issues')
     parser.add_argument('--url', help='Cube API URL')
     parser.add_argument('--token', help='Cube API Token')
-    parser.add_argument('--timeout', type=int, default=30, help='Request timeout in seconds (default: 30)')
+    parser.add_argument('--timeout', type=int, default=30, help='Per-request timeout in seconds (default: 30)')
+    parser.add_argument('--max-wait', type=float, default=300,
+                        help='Total seconds to keep polling "Continue wait" per query (default: 300)')
+    parser.add_argument('--no-poll', action='store_true', help='Treat the first "Continue wait" as a failure')
     parser.add_argument('--output', default='test_results.json', help='Output file for results')
+    parser.add_argument('--load', action='store_true', help='Run the test set as a concurrent load test')
+    parser.add_argument('--users', type=int, default=5, help='Load mode: concurrent virtual users (default: 5)')
+    parser.add_argument('--duration', type=float, help='Load mode: run for this many seconds')
+    parser.add_argument('--iterations', type=int,
+                        help='Load mode: passes over the test set per user (default: 1 if no --duration)')
+    parser.add_argument('--history', default=DEFAULT_DB, help='Benchmark history SQLite file to append the run to')
+    parser.add_argument('--no-history', action='store_true', help='Do not append this run to the history store')
 
     args = parser.parse_args()
 
@@ -188,148 +526,55 @@ def main():
         print("  python3 test_metrics.py --url <URL> --token <TOKEN>")
         sys.exit(1)
 
+    max_wait = 0 if args.no_poll else args.max_wait
+
+    if args.load:
+        client = CubeClient(api_url, api_token, timeout=args.timeout,
+                            max_concurrency=args.users, max_wait=max_wait)
+        iterations = args.iterations if args.iterations or args.duration else 1
+        load_tester = LoadTester(client, HIGH_RISK_TESTS, args.users, args.duration, iterations)
+
+        print(f"{Colors.BOLD}{'='*60}{Colors.NC}")
+        print(f"{Colors.BOLD}HIGH RISK METRICS LOAD TEST{Colors.NC}")
+        print(f"{Colors.BOLD}{'='*60}{Colors.NC}")
+        print(f"Users: {args.users}")
+        if args.duration:
+            print(f"Duration: {args.duration:g}s")
+        if iterations:
+            print(f"Iterations per user: {iterations}")
+        print(f"API URL: {api_url}")
+        print(f"{Colors.BOLD}{'='*60}{Colors.NC}")
+
+        load_tester.run()
+        load_tester.print_summary()
+        load_tester.save_results(args.output)
+        if not args.no_history:
+            run_id = record_run(load_tester.samples, 'load', api_url, args.history)
+            print(f"Appended to history as run {run_id} (compare with: python3 benchmark_history.py compare)")
+
+        failed_count = sum(1 for s in load_tester.samples if s['status'] != 'PASSED')
+        sys.exit(1 if failed_count > 0 else 0)
+
     # Create tester
-    tester = MetricTester(api_url, api_token, args.timeout)
+    tester = MetricTester(api_url, api_token, args.timeout, max_wait)
 
     print(f"{Colors.BOLD}{'='*60}{Colors.NC}")
     print(f"{Colors.BOLD}HIGH RISK METRICS TESTING{Colors.NC}")
     print(f"{Colors.BOLD}{'='*60}{Colors.NC}")
     print(f"Date Range: 2024-11-01 to 2025-10-31 (12 months)")
-    print(f"Timeout: {args.timeout}s")
+    print(f"Timeout: {args.timeout}s per request, {max_wait:g}s total with polling")
     print(f"API URL: {api_url}")
     print(f"{Colors.BOLD}{'='*60}{Colors.NC}")
 
-    # Test 1: MM001 - Gross Margin % (GL-based with JOIN)
-    tester.test_metric(
-        "MM001",
-        "Gross Margin % (GL-based COGS)",
-        "Uses gl_based_gross_margin_pct which requires JOIN to transaction_accounting_lines_cogs",
-        {
-            "measures": ["transaction_lines.gl_based_gross_margin_pct"],
-            "dimensions": ["transaction_lines.channel_type"],
-            "timeDimensions": [{
-                "dimension": "transaction_lines.transaction_date",
-                "granularity": "month",
-                "dateRange": ["2024-11-01", "2025-10-31"]
-            }]
-        }
-    )
-
-    # Test 2: GMROI001 - GMROI (GL-based)
-    tester.test_metric(
-        "GMROI001",
-        "GMROI (GL-based COGS)",
-        "Gross Margin Return on Investment using GL COGS (requires JOIN)",
-        {
-            "measures": ["transaction_lines.gl_based_gmroi"],
-            "dimensions": ["transaction_lines.category"],
-            "timeDimensions": [{
-                "dimension": "transaction_lines.transaction_date",
-                "granularity": "month",
-                "dateRange": ["2024-11-01", "2025-10-31"]
-            }]
-        }
-    )
-
-    # Test 3: LIFE004 - Sales Velocity (units per week)
-    tester.test_metric(
-        "LIFE004",
-        "Sales Velocity (units per week)",
-        "Complex calculated measure using MIN/MAX date aggregation",
-        {
-            "measures": ["transaction_lines.units_per_week"],
-            "dimensions": ["transaction_lines.category"],
-            "timeDimensions": [{
-                "dimension": "transaction_lines.transaction_date",
-                "granularity": "month",
-                "dateRange": ["2024-11-01", "2025-10-31"]
-            }]
-        }
-    )
-
-    # Test 4: RET004 - Return Rate Components
-    tester.test_metric(
-        "RET004",
-        "Return Rate Components",
-        "Customer credits vs revenue transactions (transaction level)",
-        {
-            "measures": ["transactions.customer_credits_aligned", "transactions.revenue_transaction_count_aligned"],
-            "dimensions": ["transactions.customer_type"],
-            "timeDimensions": [{
-                "dimension": "transactions.trandate",
-                "granularity": "month",
-                "dateRange": ["2024-11-01", "2025-10-31"]
-            }]
-        }
-    )
-
-    # Test 5: RET005 - Return Rate % (line-level)
-    tester.test_metric(
-        "RET005",
-        "Return Rate % (line level)",
-        "Calculated return_rate measure (units_returned / total units)",
-        {
-            "measures": ["transaction_lines.return_rate"],
-            "dimensions": ["transaction_lines.category"],
-            "timeDimensions": [{
-                "dimension": "transaction_lines.transaction_date",
-                "granularity": "month",
-                "dateRange": ["2024-11-01", "2025-10-31"]
-            }]
-        }
-    )
-
-    # Test 6: FD002 - Fulfillments per Order
-    tester.test_metric(
-        "FD002",
-        "Fulfillments per Order",
-        "Calculated measure: fulfillment_count / unique_orders",
-        {
-            "measures": ["fulfillments.fulfillments_per_order"],
-            "dimensions": ["fulfillments.status_name"],
-            "timeDimensions": [{
-                "dimension": "fulfillments.trandate",
-                "granularity": "month",
-                "dateRange": ["2024-11-01", "2025-10-31"]
-            }]
-        }
-    )
-
-    # Test 7: MM001 Components - Revenue + GL COGS separately
-    tester.test_metric(
-        "MM001_COMP",
-        "MM001 Components (Revenue + GL COGS)",
-        "Test component measures separately to isolate JOIN issue",
-        {
-            "measures": ["transaction_lines.total_revenue", "transaction_lines.gl_based_cogs"],
-            "dimensions": ["transaction_lines.channel_type"],
-            "timeDimensions": [{
-                "dimension": "transaction_lines.transaction_date",
-                "granularity": "month",
-                "dateRange": ["2024-11-01", "2025-10-31"]
-            }]
-        }
-    )
-
-    # Test 8: GL COGS Direct from COGS cube
-    tester.test_metric(
-        "COGS_DIRECT",
-        "GL COGS (Direct from COGS cube)",
-        "Query COGS cube directly (no JOIN) to test if COGS cube itself has issues",
-        {
-            "measures": ["transaction_accounting_lines_cogs.gl_cogs"],
-            "dimensions": ["transaction_accounting_lines_cogs.category"],
-            "timeDimensions": [{
-                "dimension": "transaction_accounting_lines_cogs.transaction_date",
-                "granularity": "month",
-                "dateRange": ["2024-11-01", "2025-10-31"]
-            }]
-        }
-    )
+    for test_id, name, description, query in HIGH_RISK_TESTS:
+        tester.test_metric(test_id, name, description, query)
 
     # Print summary and save results
     tester.print_summary()
     tester.save_results(args.output)
+    if not args.no_history:
+        run_id = record_run(tester.results, 'serial', api_url, args.history)
+        print(f"Appended to history as run {run_id} (compare with: python3 benchmark_history.py compare)")
 
     # Exit with error code if any tests failed
     failed_count = sum(1 for r in tester.results if r['status'] != 'PASSED')
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Order baskets check: the order_baskets cube over gpc.order_baskets vs its former aggregation
+
+The order_baskets cube used to GROUP BY transaction over every line on each
+query (REFERENCE_SQL below); it now reads the rows order_baskets.py keeps
+materialized. This check runs the former cube SQL and the current cube SQL
+(from model/cubes/order_baskets.yml) and compares them row for row.
+
+By default it builds a small synthetic export in a temporary directory
+(test_enriched_lines.synthetic_export, plus a b2b_customers table) and checks:
+- the --full build
+- a --since rebuild after b2b_customers gains entities (their orders turn 'B2B/Wholesale')
+- a --months rebuild
+With --local it checks the table already built under LOCAL_PARQUET_DIR.
+
+Usage:
+    python3 test_order_baskets.py
+    python3 order_baskets.py --full && python3 test_order_baskets.py --local
+"""
+
+import os
+import sys
+import tempfile
+import argparse
+from typing import List, Tuple
+
+from test_enriched_lines import compare, run, synthetic_export
+
+# ANSI color codes
+class Colors:
+    RED = '\033[0;31m'
+    GREEN = '\033[0;32m'
+    YELLOW = '\033[1;33m'
+    BLUE = '\033[0;34m'
+    BOLD = '\033[1m'
+    NC = '\033[0m'  # No Color
+
+# The order_baskets cube SQL before gpc.order_baskets (typed tables: trandate is a DATE, so
+# its PARSE_DATE is gone)
+REFERENCE_SQL = """
+SELECT
+  tl.transaction as order_id,
+  CAST(t.trandate AS TIMESTAMP) as trandate,
+  t.type,
+  tl.customer_email,
+  tl.billing_country,
+  CAST(COUNT(*) AS FLOAT64) as line_count,
+  CAST(SUM(CASE WHEN tl.quantity < 0 THEN ABS(tl.quantity) ELSE 0 END) AS FLOAT64) as units,
+  CAST(SUM(tl.amount * -1) AS FLOAT64) as order_total,
+  CASE
+    WHEN COUNT(*) = 1 THEN '1 item'
+    WHEN COUNT(*) = 2 THEN '2 items'
+    WHEN COUNT(*) = 3 THEN '3 items'
+    ELSE '4+ items'
+  END as line_count_bucket,
+  CASE
+    WHEN b2b.id IS NOT NULL THEN 'B2B/Wholesale'
+    ELSE 'Retail/D2C'
+  END as customer_type
+FROM {transaction_lines_denormalized_patched} tl
+JOIN {transactions_analysis} t ON tl.transaction = t.id
+LEFT JOIN {b2b_customers} b2b ON t.entity = b2b.id
+GROUP BY tl.transaction, CAST(t.trandate AS TIMESTAMP), t.type, tl.customer_email, tl.billing_country, customer_type"""
+
+# b2b_customers of the synthetic export: every 7th entity, then also those with entity % 7 = 3
+B2B_SQL = """
+    SELECT DISTINCT entity AS id, DATE '{modified}' AS lastmodifieddate
+    FROM gpc.transactions WHERE entity % 7 IN ({remainders})"""
+
+
+def write_b2b_customers(root: str, remainders: str, modified: str):
+    import duckdb
+    from local_engine import build_init_sql
+
+    conn = duckdb.connect()
+    conn.execute(build_init_sql(root))
+    sql = B2B_SQL.format(modified=modified, remainders=remainders)
+    conn.execute(f"COPY ({sql}) TO '{os.path.join(root, 'b2b_customers.parquet')}' (FORMAT PARQUET)")
+    conn.close()
+
+
+def check_baskets(root: str) -> Tuple[List[str], int]:
+    """(mismatches, B2B orders): current cube SQL over gpc.order_baskets vs REFERENCE_SQL"""
+    import duckdb
+    from cube_model import load_model
+    from local_engine import build_init_sql, discover_tables
+    from order_baskets import LOCAL_STAND_INS, source_tables
+
+    tables = discover_tables(root)
+    sources = source_tables({name: sql for name, sql in LOCAL_STAND_INS.items() if name not in tables})
+    conn = duckdb.connect()
+    conn.execute(build_init_sql(root))
+    try:
+        failures = compare(conn, REFERENCE_SQL.format(**sources), load_model().cubes['order_baskets'].sql)
+        b2b = conn.execute(f"SELECT COUNT(*) FROM ({REFERENCE_SQL.format(**sources)}) "
+                           "WHERE customer_type = 'B2B/Wholesale'").fetchone()[0]
+        return failures, b2b
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the materialized order baskets with the former cube SQL')
+    parser.add_argument('--local', action='store_true',
+                        help='Check the table already built under LOCAL_PARQUET_DIR instead of a synthetic export')
+    args = parser.parse_args()
+
+    print("=" * 80)
+    print("ORDER BASKETS vs FORMER CUBE AGGREGATION")
+    print("=" * 80)
+
+    failed = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.local:
+            from local_engine import parquet_dir
+            root = parquet_dir()
+            steps = [(f"existing table in {root}", None, None)]
+        else:
+            root = synthetic_export(tmp)
+            write_b2b_customers(root, '0', '2025-01-01')
+            print(f"Synthetic export in {root}")
+            steps = [
+                ('--full build', None, ['--full']),
+                ('--since 2025-04-10 rebuild after new b2b_customers', ('0, 3', '2025-04-10'),
+                 ['--since', '2025-04-10']),
+                ('--months 2025-02 rebuild', None, ['--months', '2025-02']),
+            ]
+
+        for name, b2b, build_args in steps:
+            if b2b:
+                write_b2b_customers(root, *b2b)
+            if build_args:
+                run(['order_baskets.py'] + build_args, dict(os.environ, LOCAL_PARQUET_DIR=root))
+            failures, b2b_orders = check_baskets(root)
+            failed += bool(failures)
+            status = f"{Colors.RED}✗{Colors.NC}" if failures else f"{Colors.GREEN}✓{Colors.NC}"
+            print(f"{status} {name} ({b2b_orders:,} B2B/Wholesale orders)")
+            for failure in failures[:6]:
+                print(f"    {Colors.RED}{failure}{Colors.NC}")
+
+    print()
+    if failed:
+        print(f"{Colors.RED}✗ {failed} of {len(steps)} checks failed{Colors.NC}")
+        sys.exit(1)
+    print(f"{Colors.GREEN}✓ Materialized baskets match the cube aggregation they replace{Colors.NC}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Offline checks for partition_refresh.py: which monthly partitions a run rebuilds
+
+- fingerprints: one month's edit changes only that month's checksum, row order doesn't matter
+  (DuckDB, same SQL as the local engine)
+- incremental selection: new, changed and emptied months are rebuilt, unchanged ones skipped;
+  the first run only records a baseline; --full rebuilds the whole build range
+- update window: months overlapping the last N days up to today are always rebuilt
+- selectors: one dateRange per run of consecutive months, naming only the rollups whose
+  build range covers them
+- model: every cube in SOURCES has monthly rollups with a parseable update_window
+
+Usage:
+    python3 test_partition_refresh.py
+"""
+
+import sys
+import tempfile
+from datetime import date
+from typing import Any, Dict, List, Optional
+
+from cube_model import PreAggregation, load_model
+from partition_refresh import SOURCES, RefreshPlan, fingerprint, interval_days, selectors
+
+# ANSI color codes
+class Colors:
+    RED = '\033[0;31m'
+    GREEN = '\033[0;32m'
+    YELLOW = '\033[1;33m'
+    BLUE = '\033[0;34m'
+    BOLD = '\033[1m'
+    NC = '\033[0m'  # No Color
+
+TODAY = date(2025, 3, 14)
+SOURCE = 'gpc.transactions'
+
+
+def rollup(name: str, start: str, end: Any) -> PreAggregation:
+    definition: Dict[str, Any] = {'name': name, 'partition_granularity': 'month',
+                                  'build_range_start': {'sql': f"SELECT '{start}'"}}
+    if end:
+        definition['build_range_end'] = {'sql': end if end.startswith('SELECT') else f"SELECT '{end}'"}
+    return PreAggregation('transactions', definition, 'test.yml')
+
+
+def plan(current: Dict[str, Any], previous: Dict[str, Any], window_days: int = 0, full: bool = False,
+         pre_aggs: Optional[List[PreAggregation]] = None) -> RefreshPlan:
+    pre_aggs = pre_aggs or [rollup('by_day', '2024-10-01', 'SELECT CURRENT_DATE')]
+    refresh = RefreshPlan('transactions', pre_aggs, window_days, today=TODAY)
+    refresh.current[SOURCE] = current
+    refresh.previous[SOURCE] = previous
+    refresh.compare(full)
+    return refresh
+
+
+class DuckDBEngine:
+    """In-memory DuckDB with the local engine's macros (fingerprint() only needs query + dialect)"""
+    dialect = 'duckdb'
+
+    def __init__(self, root: str):
+        import duckdb
+        from local_engine import build_init_sql
+
+        self.conn = duckdb.connect()
+        self.conn.execute(build_init_sql(root))
+
+    def query(self, sql: str) -> List[tuple]:
+        return self.conn.execute(sql).fetchall()
+
+
+def check_fingerprints() -> List[str]:
+    with tempfile.TemporaryDirectory() as root:
+        engine = DuckDBEngine(root)
+        engine.query("""
+            CREATE TABLE gpc.transactions AS
+            SELECT i AS id, DATE '2025-01-01' + INTERVAL (i % 90) DAY AS trandate,
+                   DATE '2025-04-01' AS lastmodifieddate
+            FROM range(1, 901) r(i)""")
+        before = fingerprint(engine, SOURCE, 'trandate', 'lastmodifieddate')
+        engine.query("UPDATE gpc.transactions SET lastmodifieddate = DATE '2025-04-02' WHERE id = 40")  # 2025-02-10
+        after = fingerprint(engine, SOURCE, 'trandate', 'lastmodifieddate')
+        engine.query("CREATE TABLE gpc.shuffled AS SELECT * FROM gpc.transactions ORDER BY random()")
+        shuffled = fingerprint(engine, 'gpc.shuffled', 'trandate', 'lastmodifieddate')
+        full_row = fingerprint(engine, SOURCE, 'trandate', None)
+
+    failures = []
+    if sorted(before) != ['2025-01', '2025-02', '2025-03'] or sum(c for c, _ in before.values()) != 900:
+        failures.append(f"fingerprinted months {before}")
+    changed = sorted(m for m in before if before[m] != after[m])
+    if changed != ['2025-02']:
+        failures.append(f"one edit in 2025-02 changed {changed}")
+    if shuffled != after:
+        failures.append("checksum depends on row order")
+    if set(full_row) != set(after) or any(full_row[m][0] != after[m][0] for m in after):
+        failures.append("full-row fingerprint counts differ")
+    return failures
+
+
+def check_incremental() -> List[str]:
+    previous = {'2024-11': (10, 'a'), '2024-12': (10, 'b'), '2025-01': (10, 'c'), '2025-02': (10, 'd')}
+    current = {'2024-11': (10, 'a'), '2024-12': (11, 'B'), '2025-01': (10, 'C'), '2025-03': (3, 'e'),
+               '2024-06': (5, 'x')}   # 2024-06: before the build range
+    failures = []
+    refresh = plan(current, previous)
+    expected = {
+        '2024-12': ['changed in gpc.transactions (+1 rows)'],
+        '2025-01': ['changed in gpc.transactions'],
+        '2025-02': ['emptied in gpc.transactions'],
+        '2025-03': ['new in gpc.transactions'],
+    }
+    if refresh.reasons != expected:
+        failures.append(f"rebuild {refresh.reasons}, expected {expected}")
+    if refresh.outside != ['2024-06']:
+        failures.append(f"months outside the build range {refresh.outside}, expected ['2024-06']")
+
+    first = plan(current, {})
+    if not first.baseline or first.rebuild:
+        failures.append(f"first run rebuilds {first.rebuild} instead of recording a baseline")
+    full = plan(current, previous, full=True)
+    if full.rebuild != ['2024-11', '2024-12', '2025-01', '2025-03']:
+        failures.append(f"--full rebuilds {full.rebuild}")
+    if plan(previous, previous).rebuild:
+        failures.append("unchanged fingerprints rebuilt")
+    return failures
+
+
+def check_update_window() -> List[str]:
+    failures = []
+    for value, days in (('60 day', 60), ('8 week', 56), ('2 months', 60), (None, 0)):
+        if interval_days(value) != days:
+            failures.append(f"interval_days({value!r}) = {interval_days(value)}, expected {days}")
+
+    fingerprints = {m: (1, m) for m in ('2024-11', '2024-12', '2025-01', '2025-02', '2025-03')}
+    # today 2025-03-14: 14 days reach back to 2025-03-01, 60 days to 2025-01-14, 45 days to 2025-01-29
+    for days, months in ((14, ['2025-03']), (60, ['2025-01', '2025-02', '2025-03']),
+                         (45, ['2025-01', '2025-02', '2025-03']), (0, [])):
+        refresh = plan(fingerprints, fingerprints, window_days=days)
+        if refresh.rebuild != months or any(r != ['update window'] for r in refresh.reasons.values()):
+            failures.append(f"update window {days} days rebuilds {refresh.reasons}, expected {months}")
+
+    changed = dict(fingerprints, **{'2024-11': (2, 'edited')})
+    refresh = plan(changed, fingerprints, window_days=14)
+    if refresh.rebuild != ['2024-11', '2025-03']:
+        failures.append(f"change + update window rebuilds {refresh.rebuild}")
+    if plan(fingerprints, {}, window_days=60).rebuild:
+        failures.append("baseline run rebuilds the update window")
+    return failures
+
+
+def check_selectors() -> List[str]:
+    batch = rollup('batch', '2024-10-01', '2025-01-31')
+    rolling = rollup('rolling', '2024-12-01', 'SELECT CURRENT_DATE')
+    fingerprints = {m: (1, m) for m in ('2024-10', '2024-11', '2024-12', '2025-01', '2025-02', '2025-03')}
+    edited = dict(fingerprints, **{m: (2, 'edited') for m in ('2024-10', '2024-12', '2025-01', '2025-03')})
+    refresh = plan(edited, fingerprints, pre_aggs=[batch, rolling])
+    got = sorted((tuple(s['preAggregations']), tuple(s['dateRange'])) for s in selectors(refresh, 'UTC'))
+    expected = sorted([
+        (('transactions.batch',), ('2024-10-01', '2024-10-31')),
+        (('transactions.batch', 'transactions.rolling'), ('2024-12-01', '2025-01-31')),
+        (('transactions.rolling',), ('2025-03-01', '2025-03-31')),
+    ])
+    if got != expected:
+        return [f"selectors {got}, expected {expected}"]
+    return []
+
+
+def check_model() -> List[str]:
+    model = load_model()
+    failures = []
+    for cube in SOURCES:
+        pre_aggs = [p for p in model.pre_aggregations(cube) if p.partition_granularity == 'month']
+        if not pre_aggs:
+            failures.append(f"{cube}: no monthly-partitioned rollups")
+            continue
+        try:
+            days = max(interval_days(p.update_window) for p in pre_aggs)
+        except ValueError as e:
+            failures.append(f"{cube}: {e}")
+            continue
+        if not days:
+            failures.append(f"{cube}: no update_window on its monthly rollups")
+    return failures
+
+
+def main():
+    print("=" * 80)
+    print("PARTITION REFRESH - incremental selection and update window (offline)")
+    print("=" * 80)
+
+    checks = [
+        ('month fingerprints', check_fingerprints),
+        ('changed, new and emptied months', check_incremental),
+        ('update window', check_update_window),
+        ('jobs selectors per covering rollups', check_selectors),
+        ('monthly rollups in the model', check_model),
+    ]
+    failed = 0
+    for name, check in checks:
+        failures = check()
+        failed += bool(failures)
+        status = f"{Colors.RED}✗{Colors.NC}" if failures else f"{Colors.GREEN}✓{Colors.NC}"
+        print(f"{status} {name}")
+        for failure in failures:
+            print(f"    {Colors.RED}{failure}{Colors.NC}")
+
+    print()
+    if failed:
+        print(f"{Colors.RED}✗ {failed} of {len(checks)} checks failed{Colors.NC}")
+        sys.exit(1)
+    print(f"{Colors.GREEN}✓ All {len(checks)} checks passed{Colors.NC}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Quantile sketch accuracy: merged gpc.quantile_sketches vs the exact distributions
+
+For every metric in gpc.quantile_sketches and every quantile in --quantiles,
+reads gpc.quantile_merge over the stored sketches and looks up the exact rank
+of that estimate among the metric's source rows:
+- each month, all segments merged
+- the last 12 months merged (the long-range case the sketches exist for)
+- each segment over the last 12 months
+
+The rank of an estimate is the interval [share of rows below it, share of rows
+at or below it]; the rank error is the distance from q to that interval, so
+discrete values (line counts, day counts) are exact when the right value is
+returned. Fails when any rank error exceeds --tolerance.
+
+Usage:
+    python3 quantile_sketches.py --full && python3 test_quantile_sketches.py      # local Parquet
+    python3 test_quantile_sketches.py --engine bigquery
+"""
+
+import sys
+import time
+import argparse
+from datetime import datetime
+from typing import List, Tuple
+
+from quantile_sketches import NO_SEGMENT, SKETCH_TABLE, BigQueryBuilder, LocalBuilder, rows_sql
+from test_hll_sketches import last_months_start
+
+# ANSI color codes
+class Colors:
+    RED = '\033[0;31m'
+    GREEN = '\033[0;32m'
+    YELLOW = '\033[1;33m'
+    BLUE = '\033[0;34m'
+    BOLD = '\033[1m'
+    NC = '\033[0m'  # No Color
+
+
+def ranks(query, metric: str, dialect: str, q: float, sketch_key: str, row_key: str,
+          window: str = '') -> List[Tuple[str, int, float, float, float]]:
+    """(case, rows, estimate, rank below, rank at or below) per key"""
+    sketch_where = f" AND {window.format(column='month')}" if window else ''
+    return query(
+        f"WITH estimates AS (\n"
+        f"  SELECT {sketch_key} AS k, gpc.quantile_merge(sketch, {q}) AS estimate\n"
+        f"  FROM gpc.{SKETCH_TABLE} WHERE metric = '{metric}'{sketch_where} GROUP BY 1\n"
+        f"), exact AS (\n"
+        f"  SELECT {row_key} AS k, value\n"
+        f"  FROM ({rows_sql(metric, dialect, window.format(column='day') if window else None)})\n"
+        f")\n"
+        f"SELECT k, COUNT(*), ANY_VALUE(estimate),\n"
+        f"  AVG(CASE WHEN value < estimate THEN 1 ELSE 0 END),\n"
+        f"  AVG(CASE WHEN value <= estimate THEN 1 ELSE 0 END)\n"
+        f"FROM exact JOIN estimates USING (k) GROUP BY k ORDER BY k")
+
+
+def compare(query, metric: str, dialect: str, q: float) -> List[Tuple[str, int, float, float]]:
+    """(case, rows, estimate, rank error) for one metric and quantile"""
+    results = ranks(query, metric, dialect, q, "FORMAT_DATE('%Y-%m', month)", "FORMAT_DATE('%Y-%m', day)")
+    if results:
+        start = last_months_start(max(r[0] for r in results))
+        window = f"FORMAT_DATE('%Y-%m', {{column}}) >= '{start}'"
+        results += [(f"{start}.. (12 months)",) + r[1:]
+                    for r in ranks(query, metric, dialect, q, "'all'", "'all'", window)]
+        results += [(f"12 months, {r[0]}",) + r[1:]
+                    for r in ranks(query, metric, dialect, q, 'segment',
+                                   f"COALESCE(CAST(segment AS STRING), '{NO_SEGMENT}')", window)]
+    return [(case, rows, estimate, max(below - q, q - at_or_below, 0.0))
+            for case, rows, estimate, below, at_or_below in results]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure quantile sketch rank error against exact distributions')
+    parser.add_argument('--engine', choices=['local', 'bigquery'], default='local',
+                        help='Engine holding gpc.quantile_sketches (default: local Parquet)')
+    parser.add_argument('--quantiles', default='0.5,0.9,0.99', help='Quantiles to check (default: 0.5,0.9,0.99)')
+    parser.add_argument('--tolerance', type=float, default=0.01,
+                        help='Allowed rank error, as a fraction of the rows (default: 0.01)')
+    parser.add_argument('--verbose', action='store_true', help='Print every case, not only the failures')
+    args = parser.parse_args()
+    quantiles = [float(q) for q in args.quantiles.split(',')]
+
+    print("=" * 80)
+    print(f"QUANTILE SKETCH ACCURACY - {args.engine} engine, quantiles {args.quantiles}")
+    print(f"Run: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    print("=" * 80)
+
+    if args.engine == 'bigquery':
+        client = BigQueryBuilder().client
+        query = lambda sql: [tuple(row.values()) for row in client.query(sql).result()]
+        dialect = 'bigquery'
+    else:
+        builder = LocalBuilder()
+        if SKETCH_TABLE not in builder.tables:
+            print(f"{Colors.RED}gpc.{SKETCH_TABLE} not built - run quantile_sketches.py --full first{Colors.NC}")
+            sys.exit(1)
+        query = lambda sql: builder.conn.execute(sql).fetchall()
+        dialect = 'duckdb'
+    metrics = [row[0] for row in query(f"SELECT DISTINCT metric FROM gpc.{SKETCH_TABLE} ORDER BY 1")]
+
+    failures = 0
+    for metric in metrics:
+        for q in quantiles:
+            start = time.time()
+            cases = compare(query, metric, dialect, q)
+            failed = [c for c in cases if c[3] > args.tolerance]
+            failures += len(failed)
+            for case, rows, estimate, error in cases:
+                if args.verbose or error > args.tolerance:
+                    color = Colors.RED if error > args.tolerance else Colors.NC
+                    print(f"  {color}{case:<40} rows {rows:>10,}  p{q * 100:g} {estimate:>12,.2f}  "
+                          f"rank error {error:.2%}{Colors.NC}")
+
+            mean = sum(c[3] for c in cases) / len(cases) if cases else 0.0
+            worst = max(cases, key=lambda c: c[3]) if cases else ('-', 0, 0.0, 0.0)
+            status = f"{Colors.RED}✗{Colors.NC}" if failed else f"{Colors.GREEN}✓{Colors.NC}"
+            print(f"{status} {Colors.BOLD}{metric}{Colors.NC} p{q * 100:g}: {len(cases)} cases, "
+                  f"mean rank error {mean:.2%}, worst {worst[3]:.2%} ({worst[0]}) ({time.time() - start:.1f}s)")
+
+    print()
+    if not metrics:
+        print(f"{Colors.YELLOW}No metrics to check{Colors.NC}")
+        sys.exit(1)
+    if failures:
+        print(f"{Colors.RED}✗ {failures} estimate(s) off by more than {args.tolerance:.2%} in rank{Colors.NC}")
+        sys.exit(1)
+    print(f"{Colors.GREEN}✓ All estimates within {args.tolerance:.2%} in rank{Colors.NC}")
+
+
+if __name__ == '__main__':
+    main()
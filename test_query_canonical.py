@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Offline checks for the query_rewrite chain: canonical form + ratio components
+
+cube.py's query_rewrite canonicalizes every query (query_canonical.py) and then,
+for tokens with ratio_components, replaces ratio measures with their components
+(ratio_measures.py). These checks run that chain on the model, without Cube:
+- the ratio rewrite still fires on canonical queries (no synthesized order pins the ratio)
+- canonical form keeps the member Cube sorts by default in front
+- complete_ratios() restores Cube's default row order (ratio desc) on the component rows
+- month-split pieces merge back in the same default order
+
+Usage:
+    python3 test_query_canonical.py
+"""
+
+import sys
+import copy
+from datetime import date
+from typing import Any, Dict, List
+
+from query_canonical import canonical_query, default_order, merge_results, split_query
+from ratio_measures import complete_ratios, default_ratios, rewrite_for_context, rewrite_query
+
+# ANSI color codes
+class Colors:
+    RED = '\033[0;31m'
+    GREEN = '\033[0;32m'
+    YELLOW = '\033[1;33m'
+    BLUE = '\033[0;34m'
+    BOLD = '\033[1m'
+    NC = '\033[0m'  # No Color
+
+AOV = 'transaction_lines.average_order_value'
+AOV_RETAIL = 'transaction_lines.average_order_value_retail'
+REVENUE = 'transaction_lines.total_revenue'
+ORDERS = 'transaction_lines.revenue_transaction_count'
+UNITS = 'transaction_lines.units_sold'
+CHANNEL = 'transaction_lines.channel_type'
+DATE = 'transaction_lines.transaction_date'
+
+RATIO_CONTEXT = {'ratio_components': True}
+
+
+def check_ratio_rewrite_after_canonical() -> List[str]:
+    failures = []
+    query = {'measures': [AOV], 'dimensions': [CHANNEL]}
+    rewritten = rewrite_for_context(query, RATIO_CONTEXT)
+    if AOV in rewritten.get('measures', []) or not {REVENUE, ORDERS} <= set(rewritten.get('measures', [])):
+        failures.append(f"{AOV} by channel not rewritten: {rewritten.get('measures')}")
+    if 'order' in rewritten:
+        failures.append(f"synthesized order sent to Cube: {rewritten['order']}")
+
+    plain = rewrite_for_context(query, {})
+    if plain.get('measures') != [AOV] or 'order' in plain:
+        failures.append(f"query without ratio_components changed: {plain}")
+
+    retail = rewrite_for_context({'measures': [AOV_RETAIL], 'dimensions': [CHANNEL]}, RATIO_CONTEXT)
+    if retail.get('measures') != [AOV_RETAIL]:
+        failures.append(f"filtered {AOV_RETAIL} rewritten: {retail.get('measures')}")
+
+    pinned = rewrite_for_context({'measures': [AOV], 'dimensions': [CHANNEL], 'limit': 3}, RATIO_CONTEXT)
+    if pinned.get('measures') != [AOV]:
+        failures.append(f"top-3 by default order must keep {AOV}: {pinned.get('measures')}")
+    return failures
+
+
+def check_ratio_order_forms() -> List[str]:
+    failures = []
+    for empty in ([], {}):
+        if rewrite_query({'measures': [AOV], 'order': empty, 'limit': 3})[1]:
+            failures.append(f"top-3 with order {empty!r} must keep {AOV}")
+        if not rewrite_query({'measures': [AOV], 'order': empty})[1]:
+            failures.append(f"order {empty!r} without limit must rewrite {AOV}")
+    for order in ({AOV: 'desc'}, [[AOV, 'desc']], [{AOV: 'desc'}]):
+        if rewrite_query({'measures': [AOV], 'order': order})[1]:
+            failures.append(f"{AOV} ordered by {order!r} must not be rewritten")
+    return failures
+
+
+def check_canonical_lead() -> List[str]:
+    failures = []
+    a = canonical_query({'measures': [ORDERS, AOV, REVENUE], 'dimensions': [CHANNEL]})
+    b = canonical_query({'measures': [ORDERS, REVENUE, AOV, REVENUE], 'dimensions': [CHANNEL]})
+    if a != b:
+        failures.append(f"equivalent queries differ: {a} vs {b}")
+    if a['measures'][0] != ORDERS or default_order(a) != [[ORDERS, 'desc']]:
+        failures.append(f"default-order measure not kept first: {a['measures']}")
+    for empty in ([], {}):
+        c = canonical_query({'measures': [UNITS, REVENUE], 'order': empty})
+        if c.get('measures') != [UNITS, REVENUE] or c.get('order'):
+            failures.append(f"order {empty!r} must keep the default-order measure first: {c}")
+    ordered = canonical_query({'measures': [REVENUE, AOV], 'order': {AOV: 'asc'}})
+    if ordered['measures'] != sorted([REVENUE, AOV]) or ordered['order'] != [[AOV, 'asc']]:
+        failures.append(f"explicit order not canonical: {ordered}")
+    relative = canonical_query({'measures': [REVENUE], 'timeDimensions': [{'dimension': DATE, 'dateRange': 'last month'}]},
+                               today=date(2025, 3, 14))
+    if relative['timeDimensions'][0]['dateRange'] != ['2025-02-01', '2025-02-28']:
+        failures.append(f"'last month' resolved to {relative['timeDimensions'][0]['dateRange']}")
+    return failures
+
+
+def check_complete_ratios_order() -> List[str]:
+    query = {'measures': [AOV], 'dimensions': [CHANNEL]}
+    result: Dict[str, Any] = {'data': [  # Cube's order for the components: total_revenue desc
+        {CHANNEL: 'D2C', REVENUE: '9000', ORDERS: '300'},
+        {CHANNEL: 'B2B_WHOLESALE', REVENUE: '5000', ORDERS: '20'},
+        {CHANNEL: 'OTHER', REVENUE: '0', ORDERS: '0'},
+        {CHANNEL: 'RETAIL', REVENUE: '2000', ORDERS: '40'},
+    ]}
+    empty_order = copy.deepcopy(result)
+    complete_ratios(query, result, default_ratios())
+    complete_ratios(dict(query, order=[]), empty_order, default_ratios())
+    channels = [row[CHANNEL] for row in result['data']]
+    failures = []
+    if channels != ['B2B_WHOLESALE', 'RETAIL', 'D2C', 'OTHER']:
+        failures.append(f"rows not in {AOV} desc order (NULLs last): {channels}")
+    if empty_order != result:
+        failures.append("order [] not sorted like a missing order")
+    if any(set(row) != {CHANNEL, AOV} for row in result['data']):
+        failures.append(f"components left on the rows: {result['data'][0]}")
+    return failures
+
+
+def check_split_merge_order() -> List[str]:
+    query = canonical_query({'measures': [UNITS, REVENUE], 'dimensions': [CHANNEL],
+                             'timeDimensions': [{'dimension': DATE, 'dateRange': ['2025-01-15', '2025-03-31']}]})
+    pieces = split_query(query, {REVENUE: 'sum', UNITS: 'sum'})
+    if not pieces or len(pieces) != 2:
+        return [f"expected core + one edge, got {pieces}"]
+    core = {'data': [{CHANNEL: 'D2C', UNITS: '10', REVENUE: '100'}, {CHANNEL: 'RETAIL', UNITS: '5', REVENUE: '900'}]}
+    edge = {'data': [{CHANNEL: 'RETAIL', UNITS: '8', REVENUE: '50'}, {CHANNEL: 'D2C', UNITS: '1', REVENUE: '10'}]}
+    merged = merge_results(query, [copy.deepcopy(core), copy.deepcopy(edge)])
+    rows = [(row[CHANNEL], row[UNITS]) for row in merged['data']]
+    if rows != [('RETAIL', '13'), ('D2C', '11')]:
+        return [f"merged rows not summed in {UNITS} desc order: {rows}"]
+    return []
+
+
+def main():
+    print("=" * 80)
+    print("QUERY REWRITE CHAIN - canonical form + ratio components (offline)")
+    print("=" * 80)
+
+    checks = [
+        ('ratio rewrite on canonical queries', check_ratio_rewrite_after_canonical),
+        ('ratio rewrite with empty and dict orders', check_ratio_order_forms),
+        ('canonical member order', check_canonical_lead),
+        ('ratio rows in default order', check_complete_ratios_order),
+        ('month split merge order', check_split_merge_order),
+    ]
+    failed = 0
+    for name, check in checks:
+        failures = check()
+        failed += bool(failures)
+        status = f"{Colors.RED}✗{Colors.NC}" if failures else f"{Colors.GREEN}✓{Colors.NC}"
+        print(f"{status} {name}")
+        for failure in failures:
+            print(f"    {Colors.RED}{failure}{Colors.NC}")
+
+    print()
+    if failed:
+        print(f"{Colors.RED}✗ {failed} of {len(checks)} checks failed{Colors.NC}")
+        sys.exit(1)
+    print(f"{Colors.GREEN}✓ All {len(checks)} checks passed{Colors.NC}")
+
+
+if __name__ == '__main__':
+    main()
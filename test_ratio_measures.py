@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Ratio rewrite check: ratio measures computed from components vs Cube's own values
+
+Model check (offline): no measure with its own filters (at any nesting depth,
+e.g. average_order_value_retail) is rewritten - its components alone would
+return the unfiltered ratio.
+
+Live check (--live): for every filtered ratio measure and every rewritten
+ratio of the same cubes, runs the query as-is and as rewrite_query() +
+complete_ratios(), by channel_type over --date-range, and compares the values.
+Use a token WITHOUT the ratio_components claim, so Cube answers the as-is
+query with its own SQL.
+
+Usage:
+    python3 test_ratio_measures.py                       # model check only
+    python3 test_ratio_measures.py --live --date-range 2024-10-01 2024-12-31
+"""
+
+import sys
+import argparse
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from cube_model import DEFAULT_MODEL_DIR, CubeModel, load_model
+from ratio_measures import TOKEN, complete_ratios, ratio_measures, rewrite_query
+
+# ANSI color codes
+class Colors:
+    RED = '\033[0;31m'
+    GREEN = '\033[0;32m'
+    YELLOW = '\033[1;33m'
+    BLUE = '\033[0;34m'
+    BOLD = '\033[1m'
+    NC = '\033[0m'  # No Color
+
+GROUP_BY = {'transaction_lines': 'transaction_lines.channel_type'}
+
+
+def filtered_measures(model: CubeModel) -> List[str]:
+    """type: number measures that have filters themselves or through a referenced number measure"""
+    def filtered(member, depth: int = 0) -> bool:
+        if member.definition.get('filters'):
+            return True
+        for match in TOKEN.finditer(member.sql):
+            ref = match.group(2)
+            if not ref or depth > 10:
+                continue
+            ref = ref[len('CUBE.'):] if ref.startswith('CUBE.') else ref
+            inner = model.member(ref if '.' in ref else f"{member.cube}.{ref}")
+            if inner is not None and inner.kind == 'measure' and inner.type == 'number' and filtered(inner, depth + 1):
+                return True
+        return False
+
+    return sorted(m.qualified for cube in model.cubes.values() for m in cube.measures.values()
+                  if m.type == 'number' and filtered(m))
+
+
+def values(result: Dict[str, Any], measure: str, key: Optional[str]) -> Dict[str, Optional[float]]:
+    rows = result.get('data') or []
+    return {str(row.get(key)) if key else '(all)': None if row.get(measure) is None else float(row[measure])
+            for row in rows}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check ratio measure rewrites against Cube')
+    parser.add_argument('--model', default=DEFAULT_MODEL_DIR, help='Model directory (default: ./model)')
+    parser.add_argument('--live', action='store_true', help='Also compare results from the Cube API')
+    parser.add_argument('--date-range', nargs=2, default=['2024-10-01', '2024-12-31'], metavar=('START', 'END'))
+    parser.add_argument('--tolerance', type=float, default=1e-6, help='Allowed relative difference (default: 1e-6)')
+    args = parser.parse_args()
+
+    model = load_model(args.model)
+    ratios = ratio_measures(model)
+    filtered = filtered_measures(model)
+
+    print("=" * 80)
+    print(f"RATIO MEASURE REWRITES - {len(ratios)} rewritten, {len(filtered)} with filters")
+    print(f"Run: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    print("=" * 80)
+
+    failures = 0
+    for measure in filtered:
+        rewritten = rewrite_query({'measures': [measure]}, ratios)[1]
+        failed = measure in ratios or bool(rewritten)
+        failures += failed
+        status = f"{Colors.RED}✗ rewritten{Colors.NC}" if failed else f"{Colors.GREEN}✓ kept{Colors.NC}"
+        print(f"{status} {measure}")
+
+    if args.live:
+        from cube_client import CubeClient
+
+        cubes = {m.split('.')[0] for m in filtered}
+        measures = filtered + sorted(m for m in ratios if m.split('.')[0] in cubes)
+        print()
+        with CubeClient.from_env() as client:
+            for measure in measures:
+                cube = measure.split('.')[0]
+                dimension = GROUP_BY.get(cube)
+                time_dimension = next((d.qualified for d in model.cubes[cube].dimensions.values()
+                                       if d.type == 'time'), None)
+                query: Dict[str, Any] = {'measures': [measure]}
+                if dimension:
+                    query['dimensions'] = [dimension]
+                if time_dimension:
+                    query['timeDimensions'] = [{'dimension': time_dimension, 'dateRange': args.date_range}]
+
+                expected = client.load_with_stats(query).data
+                rewritten, _ = rewrite_query(query, ratios)
+                actual = client.load_with_stats(rewritten).data
+                if 'error' in expected or 'error' in actual:
+                    failures += 1
+                    print(f"{Colors.RED}✗ {measure}: {expected.get('error') or actual.get('error')}{Colors.NC}")
+                    continue
+                complete_ratios(query, actual, ratios)
+
+                want, got = values(expected, measure, dimension), values(actual, measure, dimension)
+                mismatches = []
+                for key in sorted(set(want) | set(got)):
+                    a, b = want.get(key), got.get(key)
+                    if (a is None) != (b is None) or (a is not None and abs(a - b) > args.tolerance * max(abs(a), 1.0)):
+                        mismatches.append(f"{key}: {a} vs {b}")
+                failures += bool(mismatches)
+                if mismatches:
+                    print(f"{Colors.RED}✗ {measure}{Colors.NC}: {'; '.join(mismatches[:3])}")
+                else:
+                    kind = 'rewritten' if measure in ratios else 'kept'
+                    print(f"{Colors.GREEN}✓{Colors.NC} {measure} ({kind}, {len(want)} rows match)")
+
+    print()
+    if failures:
+        print(f"{Colors.RED}✗ {failures} check(s) failed{Colors.NC}")
+        sys.exit(1)
+    print(f"{Colors.GREEN}✓ Ratio rewrites match the measures they replace{Colors.NC}")
+
+
+if __name__ == '__main__':
+    main()
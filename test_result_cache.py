@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+Offline checks for the cube_client result cache (result_cache.py)
+
+Runs against a temporary SQLite file and a stub transport (no Cube API):
+- TTL is the shortest refresh_key `every` of the cubes a query touches (view members resolved),
+  CUBE_CACHE_TTL for cubes without one
+- cubes behind a live-tail lambda get the live TTL unless the dateRange ends before the tail
+- least recently used entries are evicted beyond max_bytes; expired entries are never served
+- entries are scoped by a hash of the API token: another token misses, the token isn't stored
+- error results and transport failures are not cached
+
+Usage:
+    python3 test_result_cache.py
+"""
+
+import os
+import sys
+import json
+import time
+import tempfile
+import threading
+from datetime import date
+from typing import Any, Callable, Dict, List
+
+from cube_client import CubeClient, CubeClientError
+from cube_model import load_model
+from result_cache import ResultCache, cube_ttls, parse_every, query_ttl
+
+# ANSI color codes
+class Colors:
+    RED = '\033[0;31m'
+    GREEN = '\033[0;32m'
+    YELLOW = '\033[1;33m'
+    BLUE = '\033[0;34m'
+    BOLD = '\033[1m'
+    NC = '\033[0m'  # No Color
+
+REVENUE = 'transaction_lines.total_revenue'
+
+TTL_MODEL = """
+cubes:
+  - name: hourly
+    sql_table: gpc.hourly
+    refresh_key:
+      every: 1 day
+    measures:
+      - name: total
+        sql: amount
+        type: sum
+    pre_aggregations:
+      - name: main
+        measures: [CUBE.total]
+        refresh_key:
+          every: 1 hour
+  - name: plain
+    sql_table: gpc.plain
+    measures:
+      - name: count
+        type: count
+  - name: live
+    sql_table: gpc.live
+    measures:
+      - name: count
+        type: count
+    dimensions:
+      - name: day
+        sql: day
+        type: time
+    pre_aggregations:
+      - name: batch
+        measures: [CUBE.count]
+        time_dimension: CUBE.day
+        granularity: day
+        refresh_key:
+          every: 1 day
+      - name: with_tail
+        type: rollup_lambda
+        rollups: [CUBE.batch]
+        union_with_source_data: true
+"""
+
+TTL_VIEW = """
+views:
+  - name: sales
+    cubes:
+      - join_path: hourly
+        includes: [total]
+"""
+
+
+class StubClient(CubeClient):
+    """CubeClient whose /load requests are answered by a function instead of HTTP; records every request"""
+
+    def __init__(self, answer: Callable[[Dict[str, Any]], Dict[str, Any]], api_token: str = 'token-a', **kwargs):
+        super().__init__('http://cube.invalid/cubejs-api/v1', api_token, **kwargs)
+        self.answer = answer
+        self.requests: List[Any] = []
+        self._requests_lock = threading.Lock()
+
+    def _request(self, query: Any, multi: bool = False) -> Dict[str, Any]:
+        with self._requests_lock:
+            self.requests.append((query, multi))
+        if multi:
+            return {'queryType': 'multi', 'results': [self.answer(q) for q in query]}
+        return self.answer(query)
+
+
+def ttl_model(root: str):
+    os.makedirs(os.path.join(root, 'cubes'))
+    os.makedirs(os.path.join(root, 'views'))
+    with open(os.path.join(root, 'cubes', 'ttl.yml'), 'w') as f:
+        f.write(TTL_MODEL)
+    with open(os.path.join(root, 'views', 'sales.yml'), 'w') as f:
+        f.write(TTL_VIEW)
+    return load_model(root)
+
+
+def check_every_ttls(tmp: str) -> List[str]:
+    failures = []
+    for every, seconds in (('1 day', 86400), ('24 hours', 86400), ('15 minute', 900), ('0 */6 * * *', None)):
+        if parse_every(every) != seconds:
+            failures.append(f"parse_every({every!r}) = {parse_every(every)}, expected {seconds}")
+
+    model = ttl_model(os.path.join(tmp, 'model'))
+    ttls = cube_ttls(model)
+    expected = {'hourly': (3600, False), 'plain': (None, False), 'live': (86400, True)}
+    if ttls != expected:
+        failures.append(f"cube_ttls {ttls}, expected {expected}")
+
+    today = date(2025, 3, 14)
+    cases = [
+        ({'measures': ['hourly.total']}, 3600, "shortest every (pre-aggregation 1 hour < cube 1 day)"),
+        ({'measures': ['sales.total']}, 3600, "view member resolved to its cube"),
+        ({'measures': ['plain.count']}, 1234, "no refresh_key: default TTL"),
+        ({'measures': ['hourly.total', 'plain.count']}, 1234, "shortest TTL of the cubes touched"),
+    ]
+    for query, want, name in cases:
+        got = query_ttl(query, ttls, model.resolve, default_ttl=1234, live_ttl=60, today=today)
+        if got != want:
+            failures.append(f"{name}: {got}s, expected {want}s")
+    return failures
+
+
+def check_live_tail_ttl(tmp: str) -> List[str]:
+    ttls = cube_ttls(ttl_model(os.path.join(tmp, 'model')))
+    today = date(2025, 3, 14)   # live tail starts 2025-03-12
+
+    def ttl(date_range) -> int:
+        query: Dict[str, Any] = {'measures': ['live.count']}
+        if date_range:
+            query['timeDimensions'] = [{'dimension': 'live.day', 'dateRange': date_range}]
+        return query_ttl(query, ttls, default_ttl=1234, live_ttl=60, today=today)
+
+    failures = []
+    cases = [
+        (None, 60, "no dateRange"),
+        (['2025-02-01', '2025-03-11'], 86400, "range ending before the tail"),
+        (['2025-02-01', '2025-03-12'], 60, "range ending on the first tail day"),
+        (['2025-02-01', '2025-03-31T23:59:59'], 60, "range ending after today"),
+        ('last 7 days', 60, "relative range (not resolved by query_ttl)"),
+    ]
+    for date_range, want, name in cases:
+        if ttl(date_range) != want:
+            failures.append(f"{name}: {ttl(date_range)}s, expected {want}s")
+    plain = query_ttl({'measures': ['plain.count']}, ttls, default_ttl=1234, live_ttl=60, today=today)
+    if plain != 1234:
+        failures.append(f"cube without a lambda got {plain}s")
+    return failures
+
+
+def check_lru_eviction(tmp: str) -> List[str]:
+    result = {'data': [{'x': 'y' * 80}]}
+    size = len(json.dumps(result))   # bytes an entry counts against max_bytes
+    cache = ResultCache(os.path.join(tmp, 'lru.sqlite'), max_bytes=2 * size + size // 2)   # room for two
+    failures = []
+    try:
+        for key in ('a', 'b'):
+            cache.put(key, {'q': key}, result, ttl=3600)
+            time.sleep(0.01)
+        if cache.get('a') is None:     # a is now more recently used than b
+            failures.append("fresh entry a not served")
+        time.sleep(0.01)
+        cache.put('c', {'q': 'c'}, result, ttl=3600)
+        kept = [key for key in ('a', 'b', 'c') if cache.get(key) is not None]
+        if kept != ['a', 'c']:
+            failures.append(f"after LRU eviction kept {kept}, expected ['a', 'c'] (b least recently used)")
+        if cache.stats()['bytes'] > cache.max_bytes:
+            failures.append(f"{cache.stats()['bytes']} bytes stored, limit {cache.max_bytes}")
+
+        cache.put('expired', {'q': 'expired'}, result, ttl=0)
+        if cache.get('expired') is not None:
+            failures.append("expired entry served")
+    finally:
+        cache.close()
+    return failures
+
+
+def check_token_scope(tmp: str) -> List[str]:
+    path = os.path.join(tmp, 'scope.sqlite')
+    query = {'measures': [REVENUE]}
+    clients = {token: StubClient(lambda q, token=token: {'data': [{REVENUE: token[-1]}]},
+                                 api_token=token, cache=ResultCache(path), split_months=False)
+               for token in ('secret-token-a', 'secret-token-b')}
+    a, b = clients['secret-token-a'], clients['secret-token-b']
+    failures = []
+    try:
+        first = a.load(query)
+        second = b.load(query)
+        again = a.load(query)
+        if len(a.requests) != 1 or len(b.requests) != 1:
+            failures.append(f"requests per token {len(a.requests)}, {len(b.requests)}, expected 1, 1")
+        if (first['data'][0][REVENUE], second['data'][0][REVENUE], again['data'][0][REVENUE]) != ('a', 'b', 'a'):
+            failures.append("a token was served another token's result")
+        if any(token in (client._cache_scope or '') for token, client in clients.items()):
+            failures.append("raw token in the cache scope")
+    finally:
+        for client in clients.values():
+            client.close()
+    with open(path, 'rb') as f:
+        if b'secret-token' in f.read():
+            failures.append("raw token written to the cache file")
+    return failures
+
+
+def check_errors_not_cached(tmp: str) -> List[str]:
+    answers = [{'error': 'Query error'}, CubeClientError('connection reset'), {'data': [{REVENUE: '1'}]}]
+
+    def answer(query):
+        value = answers[0] if len(answers) == 1 else answers.pop(0)
+        if isinstance(value, Exception):
+            raise value
+        return value
+
+    client = StubClient(answer, cache=ResultCache(os.path.join(tmp, 'errors.sqlite')), split_months=False)
+    query = {'measures': [REVENUE]}
+    failures = []
+    try:
+        if 'error' not in client.load(query):
+            failures.append("Cube error not returned")
+        try:
+            client.load(query)
+            failures.append("transport failure not raised")
+        except CubeClientError:
+            pass
+        if client.load(query).get('data') != [{REVENUE: '1'}]:
+            failures.append("result after the errors not returned")
+        client.load(query)
+        if len(client.requests) != 3:
+            failures.append(f"{len(client.requests)} requests, expected 3 (error, failure, result; then cached)")
+        if client.cache.stats()['entries'] != 1:
+            failures.append(f"{client.cache.stats()['entries']} cache entries, expected 1")
+    finally:
+        client.close()
+    return failures
+
+
+def main():
+    print("=" * 80)
+    print("RESULT CACHE - TTLs, eviction, scope and errors (offline)")
+    print("=" * 80)
+
+    checks = [
+        ('refresh_key every TTLs', check_every_ttls),
+        ('live-tail TTL', check_live_tail_ttl),
+        ('LRU eviction and expiry', check_lru_eviction),
+        ('token-hashed scope', check_token_scope),
+        ('errors not cached', check_errors_not_cached),
+    ]
+    failed = 0
+    for name, check in checks:
+        with tempfile.TemporaryDirectory() as tmp:
+            failures = check(tmp)
+        failed += bool(failures)
+        status = f"{Colors.RED}✗{Colors.NC}" if failures else f"{Colors.GREEN}✓{Colors.NC}"
+        print(f"{status} {name}")
+        for failure in failures:
+            print(f"    {Colors.RED}{failure}{Colors.NC}")
+
+    print()
+    if failed:
+        print(f"{Colors.RED}✗ {failed} of {len(checks)} checks failed{Colors.NC}")
+        sys.exit(1)
+    print(f"{Colors.GREEN}✓ All {len(checks)} checks passed{Colors.NC}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Space-Saving accuracy: merged sketches.SpaceSaving vs exact counts
+
+Splits skewed (Zipf) streams over several groups into batches, sketches each
+part separately (as cross_sell_affinity.py sketches each month) and merges
+the parts. Checks the guarantees the affinity table relies on, per group:
+- every kept counter brackets the true count: count - error <= true <= count
+- every key that was not kept has a true count <= the group's floor
+- every key whose true count exceeds the floor is kept (heavy hitters)
+- the floor stays <= total weight / capacity
+
+Usage:
+    python3 test_space_saving.py
+    python3 test_space_saving.py --capacity 20 --seeds 10
+"""
+
+import sys
+import argparse
+from collections import Counter
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from sketches import SpaceSaving
+
+# ANSI color codes
+class Colors:
+    RED = '\033[0;31m'
+    GREEN = '\033[0;32m'
+    YELLOW = '\033[1;33m'
+    BLUE = '\033[0;34m'
+    BOLD = '\033[1m'
+    NC = '\033[0m'  # No Color
+
+
+def stream(rng: np.random.Generator, groups: int, keys: int, size: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(groups, keys, weights) with Zipf-distributed keys and small integer weights"""
+    g = rng.integers(0, groups, size)
+    k = np.minimum(rng.zipf(1.3, size), keys) + g * 1000
+    w = rng.integers(1, 4, size)
+    return g, k, w
+
+
+def sketch_parts(capacity: int, g: np.ndarray, k: np.ndarray, w: np.ndarray, parts: int,
+                 batch: int) -> SpaceSaving:
+    """One sketch per part, each fed in batches, then merged"""
+    merged = SpaceSaving(capacity)
+    for part in np.array_split(np.arange(len(k)), parts):
+        sketch = SpaceSaving(capacity)
+        for start in range(0, len(part), batch):
+            rows = part[start:start + batch]
+            sketch.add(g[rows], k[rows], w[rows])
+        merged.merge(sketch)
+    return merged
+
+
+def check(sketch: SpaceSaving, exact: Dict[Tuple[int, int], int], totals: Dict[int, int]) -> List[str]:
+    failures = []
+    kept = {}
+    for group, key, count, error in zip(sketch.groups.tolist(), sketch.keys.tolist(),
+                                        sketch.counts.tolist(), sketch.errors.tolist()):
+        kept[(group, key)] = True
+        true = exact.get((group, key), 0)
+        if not count - error <= true <= count:
+            failures.append(f"group {group} key {key}: true {true} outside [{count - error}, {count}]")
+    for group, total in totals.items():
+        floor = sketch.floor(group)
+        if floor > total / sketch.capacity:
+            failures.append(f"group {group}: floor {floor} > total / capacity {total / sketch.capacity:.1f}")
+        if len(sketch.groups[sketch.groups == group]) > sketch.capacity:
+            failures.append(f"group {group}: more than {sketch.capacity} counters")
+    for (group, key), true in exact.items():
+        if (group, key) in kept:
+            continue
+        if true > sketch.floor(group):
+            failures.append(f"group {group} key {key}: heavy hitter ({true} > floor {sketch.floor(group)}) dropped")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check Space-Saving error bounds after merges')
+    parser.add_argument('--capacity', type=int, default=10, help='Counters per group (default: 10)')
+    parser.add_argument('--seeds', type=int, default=5, help='Random streams to check (default: 5)')
+    args = parser.parse_args()
+
+    print("=" * 80)
+    print(f"SPACE-SAVING MERGE BOUNDS - capacity {args.capacity}, {args.seeds} streams")
+    print("=" * 80)
+
+    cases = [(1, 5000), (4, 700), (12, 50)]  # (parts, batch size)
+    failed = 0
+    for seed in range(args.seeds):
+        rng = np.random.default_rng(seed)
+        g, k, w = stream(rng, groups=5, keys=300, size=20000)
+        exact = Counter()
+        for group, key, weight in zip(g.tolist(), k.tolist(), w.tolist()):
+            exact[(group, key)] += weight
+        totals = Counter()
+        for (group, _), count in exact.items():
+            totals[group] += count
+
+        for parts, batch in cases:
+            sketch = sketch_parts(args.capacity, g, k, w, parts, batch)
+            failures = check(sketch, exact, totals)
+            # On this skew the heaviest key of each group is far above the floor: it must be kept
+            for group in totals:
+                top = max((c, key) for (gr, key), c in exact.items() if gr == group)
+                found = [c for key, c, _ in sketch.top(group) if key == top[1]]
+                if not found:
+                    failures.append(f"group {group}: top key {top[1]} ({top[0]}) not kept")
+            failed += bool(failures)
+            worst = max([sketch.floor(group) / totals[group] for group in totals] + [0])
+            status = f"{Colors.RED}✗{Colors.NC}" if failures else f"{Colors.GREEN}✓{Colors.NC}"
+            print(f"{status} seed {seed}, {parts:>2} part(s), batches of {batch:>4}: "
+                  f"{len(sketch):,} counters, worst floor {worst:.2%} of group weight")
+            for failure in failures[:5]:
+                print(f"    {Colors.RED}{failure}{Colors.NC}")
+
+    print()
+    total = args.seeds * len(cases)
+    if failed:
+        print(f"{Colors.RED}✗ {failed} of {total} cases failed{Colors.NC}")
+        sys.exit(1)
+    print(f"{Colors.GREEN}✓ All {total} cases within the Space-Saving bounds{Colors.NC}")
+
+
+if __name__ == '__main__':
+    main()